@@ -1,27 +1,25 @@
 #!/bin/bash
-# Example script to prune the Stacktach RawData table
+# Example script to prune the Stacktach database
 
-# The following is one way you could keep your RawData table from growing
+# The following is one way you could keep your tables from growing
 # very large -- keep only the last N days worth of data, N being a number
 # convenient to your installation.
+#
+# On MySQL, partitioning the raw tables by time is much cheaper than
+# deleting old raws. See "Partitioning the Raw Tables" in docs/setup.rst.
 
 # Full path to where you have deployed the Stacktach app
 PATH_TO_ST='/path/to/stacktach'
 
-# Let us say we want to keep only 90 days' worth of RawData.
-# 90 days = 90 * (24*60*60) seconds = 7776000 seconds.
-KEEP_RAWDATA_DAYS=90
-KEEP_RAWDATA_SECS=$((KEEP_RAWDATA_DAYS*24*60*60))
+# Let us say we want to keep only 90 days' worth of data.
+KEEP_DAYS=90
 
-# Source the stacktach_config.sh script to populate the 
+# Source the stacktach_config.sh script to populate the
 # STACKTACH_DB_* variables among other things, and do the deed.
+# The raws, timings, lifecycles and KPI trackers are deleted a batch
+# of ids at a time, so this can run while the workers are busy.
 cd ${PATH_TO_ST} && \
 . ${PATH_TO_ST}/etc/stacktach_config.sh && \
-python manage.py dbshell <<EOF \
+python manage.py prune --keep ${KEEP_DAYS} --batch-size 1000 --sleep 0.1 \
      > /tmp/stacktach_prune.stdout \
     2> /tmp/stacktach_prune.stderr
-
-DELETE FROM stacktach_rawdata
-WHERE stacktach_rawdata.when < (UNIX_TIMESTAMP(NOW())-${KEEP_RAWDATA_SECS});
-
-EOF
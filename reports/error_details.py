@@ -25,6 +25,7 @@ sys.path.append(os.environ.get('STACKTACH_INSTALL_DIR', '/stacktach'))
 from stacktach import datetime_to_decimal as dt
 from stacktach import image_type
 from stacktach import models
+from stacktach import utils
 
 
 if __name__ != '__main__':
@@ -213,7 +214,7 @@ if __name__ == '__main__':
             image_type_num = 0
 
             for raw in raws:
-                _when = raw['when']
+                _when = dt.decimal_from_db(raw['when'])
                 _routing_key = raw['routing_key']
                 _old_state = raw['old_state']
                 _state = raw['state']
@@ -277,7 +278,8 @@ if __name__ == '__main__':
 
                 if err_id:
                     err = models.RawData.objects.get(id=err_id)
-                    queue, body = json.loads(err.json)
+                    queue, body = utils.load_raw_json(err.json,
+                                                      err.routing_key)
                     payload = body['payload']
 
                     # Add error information to failed request report
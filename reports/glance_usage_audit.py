@@ -106,7 +106,8 @@ def _verifier_audit_for_day(beginning, ending, exists_model):
     filters = {
         'raw__when__gte': beginning,
         'raw__when__lte': ending,
-        'audit_period_ending': F('audit_period_beginning') + period
+        'audit_period_ending': (F('audit_period_beginning') +
+                                models.db_interval(period))
 
     }
     exists = exists_model.objects.filter(**filters)
@@ -166,7 +167,7 @@ def _image_audit_for_period(beginning, ending):
     # Thus, we send it 'beginning' two times...
     old_images = models.ImageUsage.objects\
                          .raw(OLD_IMAGES_QUERY,
-                              [beginning, beginning])
+                              [models.db_timestamp(beginning)] * 2)
 
     old_images_dict = {}
     for image in old_images:
@@ -29,6 +29,7 @@ import usage_audit
 from stacktach import datetime_to_decimal as dt
 from stacktach import models
 from stacktach import stacklog
+from stacktach import utils
 
 
 class TenantManager(object):
@@ -122,7 +123,9 @@ class InstanceHoursReport(object):
             else:
                 flavor_class = 'standard'
             try:
-                payload = json.loads(exist.raw.json)[1]['payload']
+                raw = exist.raw
+                payload = utils.load_raw_json(
+                    raw.json, raw.routing_key)[1]['payload']
             except Exception:
                 print "Error loading raw notification data for %s" % exist.id
                 raise
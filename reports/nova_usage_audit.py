@@ -112,8 +112,8 @@ def _audit_launches_to_exists(launches, exists, beginning):
             for expected in launches:
                 found = False
                 for actual in exists[instance]:
-                    if int(expected['launched_at']) == \
-                            int(actual['launched_at']):
+                    if expected['launched_at'] // dt.MICROSECONDS == \
+                            actual['launched_at'] // dt.MICROSECONDS:
                     # HACK (apmelton): Truncate the decimal because we may not
                     #    have the milliseconds.
                         found = True
@@ -123,7 +123,7 @@ def _audit_launches_to_exists(launches, exists, beginning):
                     if reconciler:
                         args = (expected['id'], beginning)
                         rec = reconciler.missing_exists_for_instance(*args)
-                    launched_at = dt.dt_from_decimal(expected['launched_at'])
+                    launched_at = dt.dt_from_micros(expected['launched_at'])
                     msg = "Couldn't find exists for launch (%s, %s)"
                     msg = msg % (instance, launched_at)
                     cell, compute = cell_and_compute(instance, launched_at)
@@ -135,7 +135,7 @@ def _audit_launches_to_exists(launches, exists, beginning):
                 args = (launches[0]['id'], beginning)
                 rec = reconciler.missing_exists_for_instance(*args)
             msg = "No exists for instance (%s)" % instance
-            launched_at = dt.dt_from_decimal(launches[0]['launched_at'])
+            launched_at = dt.dt_from_micros(launches[0]['launched_at'])
             cell, compute = cell_and_compute(instance, launched_at)
             fails.append(['-', msg, 'Y' if rec else 'N',
                           cell, compute])
@@ -147,7 +147,8 @@ def _launch_audit_for_period(beginning, ending):
     new_launches = _get_new_launches(beginning, ending)
     for launch in new_launches:
         instance = launch.instance
-        l = {'id': launch.id, 'launched_at': launch.launched_at}
+        l = {'id': launch.id,
+             'launched_at': models.timestamp_micros(launch, 'launched_at')}
         if instance in launches_dict:
             launches_dict[instance].append(l)
         else:
@@ -158,15 +159,16 @@ def _launch_audit_for_period(beginning, ending):
     # Thus, we send it 'beginning' three times...
     old_launches = models.InstanceUsage.objects\
                          .raw(OLD_LAUNCHES_QUERY,
-                              [beginning, beginning, beginning])
+                              [models.db_timestamp(beginning)] * 3)
 
     old_launches_dict = {}
     for launch in old_launches:
         instance = launch.instance
-        l = {'id': launch.id, 'launched_at': launch.launched_at}
+        l = {'id': launch.id,
+             'launched_at': models.timestamp_micros(launch, 'launched_at')}
         if instance not in old_launches_dict or \
                 (old_launches_dict[instance]['launched_at'] <
-                 launch.launched_at):
+                 l['launched_at']):
             old_launches_dict[instance] = l
 
     # NOTE (apmelton)
@@ -174,14 +176,15 @@ def _launch_audit_for_period(beginning, ending):
     # Thus, we send it 'beginning' three times...
     old_recs = models.InstanceReconcile.objects\
                      .raw(OLD_RECONCILES_QUERY,
-                          [beginning, beginning, beginning])
+                          [models.db_timestamp(beginning)] * 3)
 
     for rec in old_recs:
         instance = rec.instance
-        l = {'id': rec.id, 'launched_at': rec.launched_at}
+        l = {'id': rec.id,
+             'launched_at': models.timestamp_micros(rec, 'launched_at')}
         if instance not in old_launches_dict or \
                 (old_launches_dict[instance]['launched_at'] <
-                 rec.launched_at):
+                 l['launched_at']):
             old_launches_dict[instance] = l
 
     for instance, launch in old_launches_dict.items():
@@ -195,8 +198,8 @@ def _launch_audit_for_period(beginning, ending):
     for exist in exists:
         instance = exist.instance
         e = {'id': exist.id,
-             'launched_at': exist.launched_at,
-             'deleted_at': exist.deleted_at}
+             'launched_at': models.timestamp_micros(exist, 'launched_at'),
+             'deleted_at': models.timestamp_micros(exist, 'deleted_at')}
         if instance in exists_dict:
             exists_dict[instance].append(e)
         else:
@@ -89,13 +89,14 @@ def _audit_for_exists(exists_query):
 def _verified_audit_base(base_query, exists_model):
     summary = {}
 
+    day = models.db_interval(60*60*24)
     periodic_range = Q(audit_period_ending=(F('audit_period_beginning') +
-                                            (60*60*24)))
+                                            day))
     periodic_exists = exists_model.objects.filter(base_query & periodic_range)
     summary['periodic'] = _audit_for_exists(periodic_exists)
 
     instant_range = Q(audit_period_ending__lt=(F('audit_period_beginning') +
-                                               (60*60*24)))
+                                               day))
     instant_exists = exists_model.objects.filter(base_query & instant_range)
     summary['instantaneous'] = _audit_for_exists(instant_exists)
 
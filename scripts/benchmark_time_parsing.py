@@ -0,0 +1,67 @@
+#!/usr/bin/python
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""
+    Usage: benchmark_time_parsing.py [count]
+
+    Times utils._parse_time against the strptime parser it replaced on
+    count (default 10000) timestamps of each shape notifications use.
+    Not part of the unit tests, which only check both give the same
+    answers.
+"""
+import datetime
+import os
+import sys
+import time
+
+sys.path.append(os.environ.get('STACKTACH_INSTALL_DIR', '/stacktach'))
+
+from stacktach import utils
+
+SHAPES = ["%Y-%m-%dT%H:%M:%SZ", "%Y-%m-%dT%H:%M:%S.%fZ",
+          "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M:%S.%f",
+          "%Y-%m-%d %H:%M:%S"]
+
+
+def _time_strings(count):
+    start = datetime.datetime(2013, 12, 31, 23, 59, 58)
+    times = []
+    for i in range(count):
+        when = start + datetime.timedelta(seconds=i * 3607,
+                                          microseconds=i * 7919)
+        times.extend([when.strftime(shape) for shape in SHAPES])
+    return times
+
+
+def _elapsed(parse, times):
+    start = time.time()
+    for when in times:
+        parse(when)
+    return time.time() - start
+
+
+if __name__ == '__main__':
+    count = 10000
+    if len(sys.argv) > 1:
+        count = int(sys.argv[1])
+    times = _time_strings(count)
+    strptime_elapsed = _elapsed(utils._strptime_time_to_unix, times)
+    parse_elapsed = _elapsed(utils._parse_time, times)
+    print "%d timestamps" % len(times)
+    print "strptime: %.4fs" % strptime_elapsed
+    print "parser:   %.4fs (%.1fx)" % (parse_elapsed,
+                                       strptime_elapsed / parse_elapsed)
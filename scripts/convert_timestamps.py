@@ -0,0 +1,98 @@
+#!/usr/bin/python
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""
+    Usage: convert_timestamps.py <forwards | backwards> [table ...]
+
+    Converts every time column (each models.TimestampField) between
+    DECIMAL(20,6) seconds and BIGINT microseconds. Stop the workers,
+    verifiers and web servers first. After going forwards, set
+    STACKTACH_TIMESTAMP_STORAGE=microseconds before starting them again;
+    after going backwards, unset it.
+
+    Each column is first widened to DECIMAL(26,6), which can hold both
+    representations, then scaled and finally changed to its new type.
+    Indexes are kept. Pass table names to only convert those tables.
+"""
+import os
+import sys
+
+sys.path.append(os.environ.get('STACKTACH_INSTALL_DIR', '/stacktach'))
+
+from django.db import models as django_models
+from django.db import transaction
+from south.db import db
+
+from stacktach import models
+
+
+def timestamp_columns(tables=None):
+    columns = []
+    for model in django_models.get_models(models):
+        table = model._meta.db_table
+        if tables and table not in tables:
+            continue
+        for field in model._meta.local_fields:
+            if isinstance(field, models.TimestampField):
+                columns.append((table, field.column, field.null))
+    return columns
+
+
+def _alter(table, column, field):
+    field.set_attributes_from_name(column)
+    db.alter_column(table, column, field)
+
+
+def _wide(null):
+    return django_models.DecimalField(max_digits=26, decimal_places=6,
+                                      null=null)
+
+
+def migrate_forwards(tables=None):
+    for table, column, null in timestamp_columns(tables):
+        print "%s.%s" % (table, column)
+        with transaction.commit_on_success():
+            _alter(table, column, _wide(null))
+            db.execute("UPDATE %s SET %s = %s * 1000000" %
+                       (db.quote_name(table), db.quote_name(column),
+                        db.quote_name(column)))
+            _alter(table, column, django_models.BigIntegerField(null=null))
+
+
+def migrate_backwards(tables=None):
+    for table, column, null in timestamp_columns(tables):
+        print "%s.%s" % (table, column)
+        with transaction.commit_on_success():
+            _alter(table, column, _wide(null))
+            db.execute("UPDATE %s SET %s = %s / 1000000" %
+                       (db.quote_name(table), db.quote_name(column),
+                        db.quote_name(column)))
+            _alter(table, column,
+                   django_models.DecimalField(max_digits=20,
+                                              decimal_places=6, null=null))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] not in ('forwards', 'backwards'):
+        print __doc__
+        sys.exit(2)
+
+    tables = sys.argv[2:]
+    if sys.argv[1] == 'forwards':
+        migrate_forwards(tables)
+    else:
+        migrate_backwards(tables)
@@ -25,7 +25,7 @@ def scrub(args, send_notif=lambda x: None):
         for raw in scrubber.raws():
             matches, body = scrubber.filter(raw)
             if matches and not body:
-                body = json.loads(raw['json'])[1]
+                body = utils.load_raw_json(raw['json'])[1]
             if matches and body:
                 scrubbed = scrubber.scrub(body)
                 count += 1
@@ -1,9 +1,10 @@
-import json
 import uuid
 
 from django.db.models import F
 
+from stacktach import archive
 from stacktach import models
+from stacktach import utils
 
 
 class ScrubberBase(object):
@@ -16,6 +17,20 @@ class ScrubberBase(object):
         """
         return [].__iter__()
 
+    def archived_raws(self, model, **filters):
+        """ Returns an iterable of the archived Raws of the given model
+            from between start and end, matching filters, in the same form
+            as raws(). Empty when there is no archive.
+        """
+        if not archive.enabled():
+            return
+        records = archive.iter_records(model, when__gte=self.start,
+                                       when__lte=self.end, **filters)
+        for record in records:
+            yield {'id': record['id'],
+                   'json': utils.decompress_raw_json(record['json']),
+                   'routing_key': record['routing_key']}
+
     def filter(self, raw_data):
         """ Returns whether or not the provided RawData needs to be scrubbed.
             If the implementing function parses the json body to determine
@@ -42,17 +57,37 @@ class ExistsCreatedAt(ScrubberBase):
         filters = {
             'raw__when__gte': self.start,
             'raw__when__lte': self.end,
-            'audit_period_ending__lt': F('audit_period_beginning') + (60*60*24)
+            'audit_period_ending__lt': (F('audit_period_beginning') +
+                                        models.db_interval(60*60*24))
         }
         exists = models.InstanceExists.objects.filter(**filters)
         exists = exists.select_related('raw')
+        seen = set()
         for exist in exists.iterator():
             rawdata = exist.raw
-            yield {'json': rawdata.json}
+            seen.add(rawdata.id)
+            yield {'json': utils.decompress_raw_json(rawdata.json),
+                   'routing_key': rawdata.routing_key}
+
+        # Archived raws have lost their link to the exists, so the audit
+        # period comes from the notification instead.
+        archived = self.archived_raws(models.RawData,
+                                      event='compute.instance.exists')
+        for raw in archived:
+            if raw['id'] in seen:
+                continue
+            payload = utils.load_raw_json(raw['json'])[1].get('payload', {})
+            beginning = payload.get('audit_period_beginning')
+            ending = payload.get('audit_period_ending')
+            if not beginning or not ending:
+                continue
+            if (utils.str_time_to_unix(ending) <
+                    utils.str_time_to_unix(beginning) + (60*60*24)):
+                yield raw
 
     def filter(self, raw_data):
         if '+00:00' in raw_data['json']:
-            body = json.loads(raw_data['json'])[1]
+            body = utils.load_raw_json(raw_data['json'])[1]
             created_at = body.get('payload', {}).get('created_at')
             if created_at and '+00:00' in created_at:
                 return True, body
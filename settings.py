@@ -41,6 +41,11 @@ DATABASES = {
     }
 }
 
+# How time columns are stored: 'decimal' for DECIMAL(20,6) seconds or
+# 'microseconds' for BIGINT microseconds. Switch an existing database
+# over with scripts/convert_timestamps.py.
+TIMESTAMP_STORAGE = os.environ.get('STACKTACH_TIMESTAMP_STORAGE', 'decimal')
+
 # Local time zone for this installation. Choices can be found here:
 # http://en.wikipedia.org/wiki/List_of_tz_zones_by_name
 # although not all choices may be available on all operating systems.
@@ -120,6 +125,7 @@ MIDDLEWARE_CLASSES = (
     #'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'stacktach.metrics.MetricsMiddleware',
 )
 
 ROOT_URLCONF = 'stacktach.urls'
@@ -142,6 +148,16 @@ INSTALLED_APPS = (
 
 SOUTH_TESTS_MIGRATE = False
 
+# Stats files written by the worker and verifier supervisors. The
+# /metrics/ page serves them along with the web server's own metrics.
+METRICS_FILES = [filename for filename in
+                 os.environ.get('STACKTACH_METRICS_FILES', '').split(',')
+                 if filename]
+
+# Where manage.py archive_raws puts old raws. Stacky and the scrubbers
+# look there for raws which are no longer in the database.
+ARCHIVE_DIR = os.environ.get('STACKTACH_ARCHIVE_DIR', '')
+
 ALLOWED_HOSTS = ['*']
 
 # A sample logging configuration. The only tangible logging
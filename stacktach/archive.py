@@ -0,0 +1,357 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+# A cold archive of old raws, in compressed segment files on local disk.
+#
+# Each model's raws are bucketed by the day (UTC) of their `when`:
+#
+#   <ARCHIVE_DIR>/RawData/20140310/1200-1899.seg
+#   <ARCHIVE_DIR>/RawData/20140310/1200-1899.idx
+#
+# A segment is a run of blocks, each a zlib compressed json list of up to
+# BLOCK_ROWS raws (their column values, by attname). Its index is a small
+# json file with the offset, length and id range of every block, and
+# which blocks hold each instance (or image uuid) and request_id. Both
+# files are written under temporary names and renamed when complete, the
+# index last, so readers (which only look for indexes) never see half a
+# segment. Segments are never changed once written.
+
+import decimal
+import glob
+import itertools
+import json
+import os
+import zlib
+
+from django.conf import settings
+
+from stacktach import cache
+from stacktach import datetime_to_decimal as dt
+from stacktach import models
+
+RAW_MODELS = {
+    'RawData': models.RawData,
+    'GlanceRawData': models.GlanceRawData,
+    'GenericRawData': models.GenericRawData,
+}
+
+BLOCK_ROWS = 1000
+SEGMENT_ROWS = 100000
+INDEXED_FIELDS = ('instance', 'uuid', 'request_id')
+INDEX_CACHE_SIZE = 64
+
+# Segments are immutable, so their indexes can be kept once loaded. An
+# index holds every instance and request_id in its segment, so only the
+# most recently used are kept.
+_INDEXES = cache.LRUCache(INDEX_CACHE_SIZE)
+
+
+def archive_dir():
+    return getattr(settings, 'ARCHIVE_DIR', '')
+
+
+def enabled():
+    return bool(archive_dir())
+
+
+def indexed_fields(model):
+    names = [field.name for field in model._meta.local_fields]
+    return [name for name in INDEXED_FIELDS if name in names]
+
+
+def day_of(when):
+    return dt.dt_from_decimal(when).date()
+
+
+def _model_dir(model, directory=None):
+    return os.path.join(directory or archive_dir(), model.__name__)
+
+
+def to_record(values):
+    """A raw's values() as stored in a segment. Timestamps are kept as
+    strings so they come back exactly."""
+    record = dict(values)
+    record['when'] = str(dt.decimal_from_db(record['when']))
+    return record
+
+
+def from_record(model, record):
+    """An unsaved model instance for an archived raw."""
+    fields = dict((str(key), value) for key, value in record.items())
+    fields['when'] = decimal.Decimal(fields['when'])
+    return model(**fields)
+
+
+class SegmentWriter(object):
+    """Writes one segment of a model's raws from a single day, which
+    must be added in id order."""
+
+    def __init__(self, model, day, directory=None):
+        self.model = model
+        self.day = day
+        self.directory = os.path.join(_model_dir(model, directory),
+                                      day.strftime('%Y%m%d'))
+        self.fields = indexed_fields(model)
+        self.rows = 0
+        self.first_id = None
+        self.last_id = None
+        self.block = []
+        self.index = {'blocks': [],
+                      'keys': dict((name, {}) for name in self.fields)}
+        self.tmp_name = None
+        self.file = None
+
+    def add(self, record):
+        if self.file is None:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            self.first_id = record['id']
+            self.tmp_name = os.path.join(self.directory,
+                                         '.%d.%d.tmp' % (self.first_id,
+                                                         os.getpid()))
+            self.file = open(self.tmp_name, 'wb')
+        self.block.append(record)
+        self.last_id = record['id']
+        self.rows += 1
+        if len(self.block) >= BLOCK_ROWS:
+            self._flush()
+
+    def _flush(self):
+        if not self.block:
+            return
+        number = len(self.index['blocks'])
+        for name in self.fields:
+            keys = self.index['keys'][name]
+            for record in self.block:
+                value = record.get(name)
+                if value:
+                    numbers = keys.setdefault(value, [])
+                    if not numbers or numbers[-1] != number:
+                        numbers.append(number)
+        data = zlib.compress(json.dumps(self.block))
+        self.index['blocks'].append([self.file.tell(), len(data),
+                                     self.block[0]['id'],
+                                     self.block[-1]['id']])
+        self.file.write(data)
+        self.block = []
+
+    def close(self):
+        """Finishes the segment and returns the path of its index, or
+        None if nothing was added."""
+        if self.file is None:
+            return None
+        self._flush()
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        self.file = None
+
+        base = os.path.join(self.directory,
+                            '%d-%d' % (self.first_id, self.last_id))
+        self.index['first_id'] = self.first_id
+        self.index['last_id'] = self.last_id
+        self.index['segment'] = os.path.basename(base) + '.seg'
+        os.rename(self.tmp_name, base + '.seg')
+        tmp_index = base + '.idx.tmp'
+        index_file = open(tmp_index, 'w')
+        try:
+            json.dump(self.index, index_file)
+        finally:
+            index_file.close()
+        os.rename(tmp_index, base + '.idx')
+        return base + '.idx'
+
+
+class Archiver(object):
+    """Writes a model's raws, in id order, to a segment per day, starting
+    a new one when a segment reaches SEGMENT_ROWS."""
+
+    def __init__(self, model, directory=None):
+        self.model = model
+        self.directory = directory
+        self.writers = {}
+
+    def add(self, values):
+        record = to_record(values)
+        day = day_of(decimal.Decimal(record['when']))
+        writer = self.writers.get(day)
+        if writer is None:
+            writer = SegmentWriter(self.model, day, self.directory)
+            self.writers[day] = writer
+        writer.add(record)
+        if writer.rows >= SEGMENT_ROWS:
+            writer.close()
+            del self.writers[day]
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+        self.writers = {}
+
+
+def index_paths(model, first_day=None, last_day=None, directory=None):
+    """The index files of model's segments, oldest day first, optionally
+    only those from first_day to last_day."""
+    paths = sorted(glob.glob(os.path.join(_model_dir(model, directory),
+                                          '*', '*.idx')))
+    if first_day is None and last_day is None:
+        return paths
+    selected = []
+    for path in paths:
+        day = os.path.basename(os.path.dirname(path))
+        if first_day and day < first_day.strftime('%Y%m%d'):
+            continue
+        if last_day and day > last_day.strftime('%Y%m%d'):
+            continue
+        selected.append(path)
+    return selected
+
+
+def id_range(path):
+    """The first and last ids in an index's segment, from its name."""
+    first_id, last_id = os.path.basename(path)[:-len('.idx')].split('-')
+    return int(first_id), int(last_id)
+
+
+def load_index(path):
+    index = _INDEXES.get(path)
+    if index is None:
+        index_file = open(path)
+        try:
+            index = json.load(index_file)
+        finally:
+            index_file.close()
+        _INDEXES.put(path, index)
+    return index
+
+
+def _read_blocks(path, index, numbers):
+    segment = open(os.path.join(os.path.dirname(path), index['segment']),
+                   'rb')
+    try:
+        for number in numbers:
+            offset, length, first_id, last_id = index['blocks'][number]
+            segment.seek(offset)
+            for record in json.loads(zlib.decompress(segment.read(length))):
+                yield record
+    finally:
+        segment.close()
+
+
+def last_archived_id(model, directory=None):
+    """The highest id archived for model, or 0."""
+    last_ids = [id_range(path)[1]
+                for path in index_paths(model, directory=directory)]
+    return max(last_ids or [0])
+
+
+def archived_ids(model, low_id, high_id, directory=None):
+    """The ids of the archived raws with low_id <= id <= high_id."""
+    ids = set()
+    for path in index_paths(model, directory=directory):
+        first_id, last_id = id_range(path)
+        if last_id < low_id or first_id > high_id:
+            continue
+        index = load_index(path)
+        numbers = [number for number, block in enumerate(index['blocks'])
+                   if block[3] >= low_id and block[2] <= high_id]
+        for record in _read_blocks(path, index, numbers):
+            if low_id <= record['id'] <= high_id:
+                ids.add(record['id'])
+    return ids
+
+
+def get(model, id, directory=None):
+    """The archived raw with id, as an unsaved model instance, or None."""
+    for path in index_paths(model, directory=directory):
+        first_id, last_id = id_range(path)
+        if not first_id <= id <= last_id:
+            continue
+        index = load_index(path)
+        numbers = [number for number, block in enumerate(index['blocks'])
+                   if block[2] <= id <= block[3]]
+        for record in _read_blocks(path, index, numbers):
+            if record['id'] == id:
+                return from_record(model, record)
+    return None
+
+
+def _matching_records(model, path, when__gte, when__lte, fields):
+    """The records in one segment which iter_records would yield."""
+    index = load_index(path)
+    numbers = range(len(index['blocks']))
+    for name in indexed_fields(model):
+        if name in fields:
+            blocks = index['keys'][name].get(fields[name], [])
+            numbers = [number for number in numbers if number in blocks]
+    for record in _read_blocks(path, index, numbers):
+        when = decimal.Decimal(record['when'])
+        if when__gte is not None and when < when__gte:
+            continue
+        if when__lte is not None and when > when__lte:
+            continue
+        matched = True
+        for name, value in fields.items():
+            if record.get(name) != value:
+                matched = False
+                break
+        if matched:
+            yield record
+
+
+def _paths_between(model, when__gte, when__lte, directory):
+    first_day = when__gte is not None and day_of(when__gte) or None
+    last_day = when__lte is not None and day_of(when__lte) or None
+    return index_paths(model, first_day, last_day, directory)
+
+
+def iter_records(model, when__gte=None, when__lte=None, directory=None,
+                 **fields):
+    """Yields the archived records of model matching fields (exact
+    values, by attname) with when__gte <= when <= when__lte. Only the
+    segments from those days are read and, when an indexed field is
+    given, only the blocks holding its value."""
+    for path in _paths_between(model, when__gte, when__lte, directory):
+        for record in _matching_records(model, path, when__gte, when__lte,
+                                        fields):
+            yield record
+
+
+def search(model, after=None, when__gte=None, when__lte=None,
+           directory=None, **fields):
+    """Yields the archived raws matching fields (see iter_records), as
+    unsaved model instances ordered by when then id. after, a (when, id)
+    pair, skips the raws up to and including that one.
+
+    A day's raws are in id order in its segments, not quite when order,
+    so only one day's matches are held at a time, to be sorted.
+    """
+    if after is not None and (when__gte is None or when__gte < after[0]):
+        when__gte = after[0]
+    paths = _paths_between(model, when__gte, when__lte, directory)
+    for day, day_paths in itertools.groupby(paths, os.path.dirname):
+        found = []
+        for path in day_paths:
+            for record in _matching_records(model, path, when__gte,
+                                            when__lte, fields):
+                found.append((decimal.Decimal(record['when']),
+                              record['id'], record))
+        found.sort(key=lambda item: item[:2])
+        for when, id, record in found:
+            if after is not None and (when, id) <= tuple(after):
+                continue
+            yield from_record(model, record)
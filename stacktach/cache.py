@@ -0,0 +1,184 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+import threading
+import time
+
+# Links in the recency list are [prev, next, key, value].
+_PREV, _NEXT, _KEY, _VALUE = 0, 1, 2, 3
+
+
+class LRUCache(object):
+    """A bounded, in-process mapping which evicts the least recently
+    used entry once it holds max_size entries.
+
+    Nothing here is shared between processes, so anything cached must
+    only ever be written by the process holding the cache. It is safe
+    to share between threads.
+    """
+
+    def __init__(self, max_size):
+        self._lock = threading.Lock()
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._links = {}
+        self._root = []
+        self._root[:] = [self._root, self._root, None, None]
+
+    def __len__(self):
+        return len(self._links)
+
+    def __contains__(self, key):
+        return key in self._links
+
+    def _unlink(self, link):
+        link[_PREV][_NEXT] = link[_NEXT]
+        link[_NEXT][_PREV] = link[_PREV]
+
+    def _append(self, link):
+        last = self._root[_PREV]
+        link[_PREV] = last
+        link[_NEXT] = self._root
+        last[_NEXT] = link
+        self._root[_PREV] = link
+
+    def get(self, key, default=None):
+        with self._lock:
+            link = self._links.get(key)
+            if link is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._unlink(link)
+            self._append(link)
+            return link[_VALUE]
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            link = self._links.get(key)
+            if link is not None:
+                link[_VALUE] = value
+                self._unlink(link)
+                self._append(link)
+                return
+
+            if len(self._links) >= self.max_size:
+                oldest = self._root[_NEXT]
+                self._unlink(oldest)
+                del self._links[oldest[_KEY]]
+                self.evictions += 1
+
+            link = [None, None, key, value]
+            self._append(link)
+            self._links[key] = link
+
+    def pop(self, key, default=None):
+        """Removes key, returning its value. Counts as a hit or miss."""
+        with self._lock:
+            link = self._links.pop(key, None)
+            if link is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._unlink(link)
+            return link[_VALUE]
+
+    def clear(self):
+        with self._lock:
+            self._links.clear()
+            self._root[:] = [self._root, self._root, None, None]
+
+    def stats(self):
+        return {'size': len(self._links),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions}
+
+
+class ExpiringIndex(object):
+    """A set of keys which are forgotten ttl seconds after their
+    timestamp, kept in step with a table by polling it.
+
+    loader(last_id, since) must return (id, key, when) rows added after
+    row last_id with a timestamp of at least since. The index polls at
+    most once every refresh_interval seconds, and only when asked about
+    a key it doesn't hold, so a miss means the key wasn't in the table
+    as of the last second or so.
+    """
+
+    def __init__(self, loader, ttl, refresh_interval=1, clock=time.time):
+        self._lock = threading.RLock()
+        self.loader = loader
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self.clock = clock
+        self.last_id = 0
+        self.refreshed_at = None
+        self.pruned_at = None
+        self.hits = 0
+        self.misses = 0
+        self._keys = {}
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, key, when):
+        when = float(when)
+        with self._lock:
+            if when > self._keys.get(key, 0):
+                self._keys[key] = when
+
+    def refresh(self):
+        with self._lock:
+            now = self.clock()
+            since = now - self.ttl
+            for row_id, key, when in self.loader(self.last_id, since):
+                self.last_id = max(self.last_id, row_id)
+                self.add(key, when)
+            self.refreshed_at = now
+
+            if (self.pruned_at is None or
+                    now - self.pruned_at >= self.ttl / 10.0):
+                for key, when in self._keys.items():
+                    if when < since:
+                        del self._keys[key]
+                self.pruned_at = now
+
+    def might_contain(self, key):
+        with self._lock:
+            if key in self._keys:
+                self.hits += 1
+                return True
+            if (self.refreshed_at is None or
+                    self.clock() - self.refreshed_at >=
+                    self.refresh_interval):
+                self.refresh()
+                if key in self._keys:
+                    self.hits += 1
+                    return True
+            self.misses += 1
+            return False
+
+    def stats(self):
+        return {'size': len(self._keys),
+                'hits': self.hits,
+                'misses': self.misses}
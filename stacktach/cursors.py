@@ -0,0 +1,206 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+# Keyset pagination. Rather than an offset, which the database has to
+# read and throw away that many rows to get to, a cursor holds the
+# ordering column's value and the id of the last row of a page, and the
+# next page is the rows after that in (column, id) order, which the
+# indexes find directly.
+#
+# Cursors are opaque to clients: urlsafe base64 of the ordering, value
+# and id. An empty cursor asks for the first page.
+#
+# NULLs are taken to sort before every value, as they do in MySQL and
+# sqlite.
+
+import base64
+import binascii
+import json
+
+from django.db.models import FieldDoesNotExist
+from django.db.models import Q
+
+from stacktach import datetime_to_decimal as dt
+from stacktach import models
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _encode_value(value):
+    if value is None or isinstance(value, (int, long)):
+        return value
+    return unicode(value)
+
+
+class Keyset(object):
+    """The (order_by, id) ordering of model, order_by being a field
+    name with an optional leading '-' for descending."""
+
+    def __init__(self, model, order_by):
+        self.order_by = order_by
+        self.descending = order_by.startswith('-')
+        name = order_by.lstrip('-')
+        try:
+            self.field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            raise InvalidCursor("No such field '%s'." % name)
+        self.is_id = self.field.primary_key
+
+    def order(self, query):
+        if self.is_id:
+            return query.order_by(self.order_by)
+        id_order = self.descending and '-id' or 'id'
+        return query.order_by(self.order_by, id_order)
+
+    def cursor(self, obj):
+        """The cursor for the rows after obj, a model instance or a
+        values() dict with id and the ordering column."""
+        if isinstance(obj, dict):
+            # values() hands back the column as it's stored.
+            value = obj[self.field.name]
+            if isinstance(self.field, models.TimestampField):
+                value = dt.decimal_from_db(value)
+            if value is not None:
+                value = self.field.to_python(value)
+            obj_id = obj['id']
+        else:
+            value = getattr(obj, self.field.attname)
+            obj_id = obj.id
+        data = json.dumps([self.order_by, _encode_value(value), obj_id])
+        return base64.urlsafe_b64encode(data)
+
+    def decode(self, cursor):
+        """The ordering column's value and the id a cursor was made
+        for."""
+        try:
+            order_by, value, last_id = json.loads(
+                base64.urlsafe_b64decode(str(cursor)))
+        except (TypeError, ValueError, binascii.Error):
+            raise InvalidCursor("Invalid cursor.")
+        if order_by != self.order_by:
+            raise InvalidCursor("The cursor is for ordering by %s." %
+                                order_by)
+        if value is not None:
+            value = self.field.to_python(value)
+        return value, last_id
+
+    def after(self, query, cursor):
+        """The rows of query after the one cursor was made for."""
+        value, last_id = self.decode(cursor)
+        if self.descending:
+            past, tied = 'lt', Q(id__lt=last_id)
+        else:
+            past, tied = 'gt', Q(id__gt=last_id)
+        if self.is_id:
+            return query.filter(tied)
+
+        name = self.field.name
+        null = Q(**{'%s__isnull' % name: True})
+        if value is None:
+            rows = null & tied
+            if not self.descending:
+                rows |= ~null
+        else:
+            rows = (Q(**{'%s__%s' % (name, past): value}) |
+                    (Q(**{name: value}) & tied))
+            if self.descending:
+                rows |= null
+        return query.filter(rows)
+
+
+# The rows Page.iterator() and read_in_chunks() read per query.
+ITERATOR_CHUNK_SIZE = 1000
+
+
+def read_in_chunks(query, keyset, size=ITERATOR_CHUNK_SIZE):
+    """Iterates the rows of query, a QuerySet (sliced or not), in
+    keyset's order, reading size rows per query, each chunk following
+    the last by keyset. MySQLdb reads all of a query's rows before
+    handing back the first, so QuerySet.iterator() alone doesn't keep
+    a big listing out of memory."""
+    low, high = query.query.low_mark, query.query.high_mark
+    base = query.all()
+    base.query.clear_limits()
+    base = keyset.order(base)
+    remaining = None
+    if high is not None:
+        remaining = high - low
+    rows = base[low:]
+    while True:
+        wanted = size
+        if remaining is not None:
+            wanted = min(size, remaining)
+        count = 0
+        last = None
+        for row in rows[:wanted]:
+            count += 1
+            last = row
+            yield row
+        if remaining is not None:
+            remaining -= count
+        if count < wanted or remaining == 0:
+            return
+        rows = keyset.after(base, keyset.cursor(last))
+
+
+class Page(object):
+    """Up to limit rows of a query (or a list), in keyset order.
+    Iterating it, or its iterator(), remembers the last row, for
+    next_cursor()."""
+
+    def __init__(self, query, keyset, limit):
+        self.query = query
+        self.keyset = keyset
+        self.limit = limit
+        self.count = 0
+        self.last = None
+
+    def __iter__(self):
+        return self._track(self.query)
+
+    def iterator(self):
+        """Iterates the page without caching its rows, reading them a
+        chunk at a time (see read_in_chunks)."""
+        if isinstance(self.query, list):
+            return self._track(self.query)
+        return self._track(read_in_chunks(self.query, self.keyset))
+
+    def _track(self, rows):
+        self.count = 0
+        for obj in rows:
+            self.count += 1
+            self.last = obj
+            yield obj
+
+    def next_cursor(self):
+        """The cursor for the next page, or None if this one wasn't full,
+        once the page has been iterated."""
+        if self.last is None or self.count < self.limit:
+            return None
+        return self.keyset.cursor(self.last)
+
+
+def page(query, model, order_by, cursor, limit):
+    """The Page of query, ordered by order_by then id, following
+    cursor."""
+    keyset = Keyset(model, order_by)
+    query = keyset.order(query)
+    if cursor:
+        query = keyset.after(query, cursor)
+    return Page(query[:limit], keyset, limit)
@@ -36,6 +36,49 @@ def dt_from_decimal(dec):
     return daittyme.replace(microsecond=micro)
 
 
+# Time columns can also be stored as whole microseconds (see
+# models.TimestampField). These convert between that and the decimals
+# everything else works with.
+
+MICROSECONDS = 1000000
+_CONTEXT = decimal.Context(prec=30)
+
+
+def dt_to_micros(utc):
+    return (calendar.timegm(utc.utctimetuple()) * MICROSECONDS +
+            utc.microsecond)
+
+
+def dt_from_micros(micros):
+    if micros is None:
+        return "n/a"
+    seconds, micro = divmod(micros, MICROSECONDS)
+    daittyme = datetime.datetime.utcfromtimestamp(seconds)
+    return daittyme.replace(microsecond=micro)
+
+
+def decimal_to_micros(dec):
+    if dec is None:
+        return None
+    return int(decimal.Decimal(dec).scaleb(6).to_integral_value())
+
+
+def micros_to_decimal(micros):
+    """The decimal a DECIMAL(20,6) column holding the same time would
+    give back, six decimal places and all."""
+    if micros is None:
+        return None
+    return decimal.Decimal(micros).scaleb(-6, _CONTEXT)
+
+
+def decimal_from_db(value):
+    """Values read without going through a model (values(), raw
+    cursors) are integers when the column stores microseconds."""
+    if isinstance(value, (int, long)):
+        return micros_to_decimal(value)
+    return value
+
+
 def sec_to_str(sec):
     sec = int(sec)
     if sec < 60:
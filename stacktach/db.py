@@ -14,24 +14,86 @@
 # KIND, either express or implied.  See the License for the
 # specific language governing permissions and limitations
 # under the License.
+import datetime
+
+from django.db import connection
+from django.db import IntegrityError
+from django.db import transaction
+
+from stacktach import datetime_to_decimal as dt
 from stacktach import stacklog
 from stacktach import models
+from stacktach import rollups
+from stacktach import sql_ingest
 
+INGEST_BACKENDS = ('orm', 'sql')
 
-def _safe_get(Model, **kwargs):
-    object = None
-    query = Model.objects.filter(**kwargs)
-    count = query.count()
-    if count > 1:
+# Whether nova and glance raws are written by sql_ingest rather than
+# saved through the ORM.
+SQL_INGEST = False
+
+
+def set_ingest_backend(name):
+    global SQL_INGEST
+    if name not in INGEST_BACKENDS:
+        raise ValueError("Unknown ingest backend %s" % name)
+    SQL_INGEST = name == 'sql'
+
+
+def _first(Model, query):
+    """The first of query's results, or None, in a single query. Warns
+    when there are several."""
+    objects = list(query[:2])
+    if len(objects) > 1:
         stacklog.warn('Multiple records found for %s get.' % Model.__name__)
-        object = query[0]
-    elif count < 1:
+    if objects:
+        return objects[0]
+    return None
+
+
+def _safe_get(Model, **kwargs):
+    object = _first(Model, Model.objects.filter(**kwargs))
+    if object is None:
         stacklog.warn('No records found for %s get.' % Model.__name__)
-    else:
-        object = query[0]
     return object
 
 
+def _get_or_new(Model, **kwargs):
+    """Like get_or_create, but with a single query. A new object is
+    returned unsaved, for the caller to fill in and save, and several
+    matches are warned about rather than raising."""
+    object = _first(Model, Model.objects.filter(**kwargs))
+    if object is not None:
+        return object, False
+    return Model(**kwargs), True
+
+
+# The most uuids in one uuid__in lookup, and rows in one bulk insert.
+_BATCH_SIZE = 500
+
+
+def _safe_get_by_uuid(Model, uuids):
+    """_safe_get(Model, uuid=uuid) for each of uuids, with a query per
+    _BATCH_SIZE of them. Returns what was found, by uuid."""
+    distinct = sorted(set(uuids))
+    found = {}
+    counts = {}
+    for start in range(0, len(distinct), _BATCH_SIZE):
+        query = Model.objects.filter(
+            uuid__in=distinct[start:start + _BATCH_SIZE]).order_by('id')
+        for object in query:
+            counts[object.uuid] = counts.get(object.uuid, 0) + 1
+            found.setdefault(object.uuid, object)
+    for uuid in uuids:
+        count = counts.get(uuid, 0)
+        if count > 1:
+            stacklog.warn('Multiple records found for %s get.' %
+                          Model.__name__)
+        elif count < 1:
+            stacklog.warn('No records found for %s get.' % Model.__name__)
+    return found
+
+
 def get_deployment(id):
     return _safe_get(models.Deployment, id=id)
 
@@ -40,22 +102,105 @@ def get_or_create_deployment(name):
     return models.Deployment.objects.get_or_create(name=name)
 
 
-def create_nova_rawdata(**kwargs):
+def claim_message(message_id):
+    """Records message_id as received. Returns False if it already was.
+    Meant to share a transaction with saving the notification."""
+    received = models.ReceivedMessage(
+        message_id=message_id,
+        when=dt.dt_to_decimal(datetime.datetime.utcnow()))
+    sid = transaction.savepoint()
+    try:
+        received.save(force_insert=True)
+    except IntegrityError:
+        transaction.savepoint_rollback(sid)
+        return False
+    transaction.savepoint_commit(sid)
+    return True
+
+
+def add_raw_name(Model, service, deployment_id, name):
+    """Adds name to Model (EventName or HostName) for service and the
+    deployment. Returns False if it was already there."""
+    raw_name, created = Model.objects.get_or_create(
+        service=service, deployment_id=deployment_id, name=name)
+    return created
+
+
+def claim_messages(message_ids):
+    """Records the (distinct) message_ids as received, in bulk. Returns
+    the set of those which already were."""
+    received = set(models.ReceivedMessage.objects
+                   .filter(message_id__in=message_ids)
+                   .values_list('message_id', flat=True))
+    when = dt.dt_to_decimal(datetime.datetime.utcnow())
+    models.ReceivedMessage.objects.bulk_create(
+        [models.ReceivedMessage(message_id=message_id, when=when)
+         for message_id in message_ids if message_id not in received])
+    return received
+
+
+def _split_nova_rawdata_kwargs(kwargs):
     imagemeta_fields = ['os_architecture', 'os_version',
                         'os_distro', 'rax_options']
     imagemeta_kwargs = \
         dict((k, v) for k, v in kwargs.iteritems() if k in imagemeta_fields)
     rawdata_kwargs = \
         dict((k, v) for k, v in kwargs.iteritems() if k not in imagemeta_fields)
+    return rawdata_kwargs, imagemeta_kwargs
+
+
+def _insert_nova_rawdata(values_list):
+    split = [_split_nova_rawdata_kwargs(values) for values in values_list]
+    return sql_ingest.insert_raws(models.RawData,
+                                  [rawdata for rawdata, imagemeta in split],
+                                  [imagemeta for rawdata, imagemeta in split])
+
+
+def create_nova_rawdata(**kwargs):
+    if SQL_INGEST:
+        rawdata = _insert_nova_rawdata([kwargs])[0]
+        transaction.commit_unless_managed()
+        return rawdata
+
+    rawdata_kwargs, imagemeta_kwargs = _split_nova_rawdata_kwargs(kwargs)
     rawdata = models.RawData(**rawdata_kwargs)
     rawdata.save()
 
-    imagemeta_kwargs.update({'raw_id': rawdata.id})
-    save(models.RawDataImageMeta(**imagemeta_kwargs))
+    # Raws stored without their payload have no image metadata either.
+    if imagemeta_kwargs:
+        imagemeta_kwargs.update({'raw_id': rawdata.id})
+        save(models.RawDataImageMeta(**imagemeta_kwargs))
 
     return rawdata
 
 
+# NOTE: Django's bulk_create doesn't hand back primary keys, and nova and
+# glance raws need theirs for RawDataImageMeta and post processing. Those
+# raws are inserted one by one, but the whole batch shares one transaction
+# and the rows that nothing points back to are bulk inserted.
+def create_nova_rawdata_batch(values_list):
+    if SQL_INGEST:
+        with transaction.commit_on_success():
+            return _insert_nova_rawdata(values_list)
+
+    raws = []
+    imagemetas = []
+    with transaction.commit_on_success():
+        for values in values_list:
+            rawdata_kwargs, imagemeta_kwargs = \
+                _split_nova_rawdata_kwargs(values)
+            rawdata = models.RawData(**rawdata_kwargs)
+            rawdata.save()
+            raws.append(rawdata)
+
+            if imagemeta_kwargs:
+                imagemeta_kwargs.update({'raw_id': rawdata.id})
+                imagemetas.append(
+                    models.RawDataImageMeta(**imagemeta_kwargs))
+        models.RawDataImageMeta.objects.bulk_create(imagemetas)
+    return raws
+
+
 def create_lifecycle(**kwargs):
     return models.Lifecycle(**kwargs)
 
@@ -72,6 +217,82 @@ def find_timings(**kwargs):
     return models.Timing.objects.select_related().filter(**kwargs)
 
 
+# Built when first used, once the connection's settings are known.
+_ROLLUP_UPSERT = []
+
+
+def _rollup_upsert():
+    """The INSERT of a TimingRollup which, if the hour's rollup is
+    already there, adds to it instead."""
+    if _ROLLUP_UPSERT:
+        return _ROLLUP_UPSERT[0]
+    qn = connection.ops.quote_name
+    table = qn(models.TimingRollup._meta.db_table)
+    if connection.vendor == 'mysql':
+        conflict = 'ON DUPLICATE KEY UPDATE'
+        new = 'VALUES(%s)'
+    else:
+        conflict = 'ON CONFLICT (%s, %s, %s) DO UPDATE SET' % (
+            qn('name'), qn('deployment_id'), qn('bucket'))
+        new = 'excluded.%s'
+
+    def assign(column, value):
+        return '%s = %s' % (qn(column), value % {
+            'old': '%s.%s' % (table, qn(column)),
+            'new': new % qn(column)})
+
+    columns = ('name', 'deployment_id', 'bucket', 'count', 'total',
+               'minimum', 'maximum', 'sketch')
+    values = "%s, %s, %s, %s, %s, %s, %s, ''"
+    updates = [
+        assign('count', '%(old)s + %(new)s'),
+        assign('total', '%(old)s + %(new)s'),
+        assign('minimum', 'CASE WHEN %(new)s < %(old)s THEN %(new)s '
+                          'ELSE %(old)s END'),
+        assign('maximum', 'CASE WHEN %(new)s > %(old)s THEN %(new)s '
+                          'ELSE %(old)s END'),
+    ]
+    _ROLLUP_UPSERT.append('INSERT INTO %s (%s) VALUES (%s) %s %s' % (
+        table, ', '.join(qn(column) for column in columns), values,
+        conflict, ', '.join(updates)))
+    return _ROLLUP_UPSERT[0]
+
+
+def add_timing_rollups(pending):
+    """Adds pending, unsaved TimingRollups of the Timings a worker has
+    completed since it last called this, to the TimingRollups for their
+    hours.
+
+    The count, total, minimum and maximum are added by an upsert, so
+    workers starting an hour's rollup at the same time neither lose
+    each other's Timings nor deadlock over the row that isn't there
+    yet. The sketch is merged afterwards, under the row lock the upsert
+    took. The rows are written in key order, so workers adding to the
+    same hours lock them in the same order."""
+    pending = sorted(pending, key=lambda rollup: (
+        rollup.name, rollup.deployment_id, rollup.bucket))
+    fields = models.TimingRollup._meta
+
+    def prep(rollup, name):
+        return fields.get_field(name).get_db_prep_save(
+            getattr(rollup, name), connection)
+
+    with transaction.commit_on_success():
+        cursor = connection.cursor()
+        for rollup in pending:
+            cursor.execute(_rollup_upsert(),
+                           [rollup.name, rollup.deployment_id,
+                            prep(rollup, 'bucket'), rollup.count,
+                            prep(rollup, 'total'), prep(rollup, 'minimum'),
+                            prep(rollup, 'maximum')])
+            query = models.TimingRollup.objects.select_for_update().filter(
+                name=rollup.name, deployment=rollup.deployment_id,
+                bucket=rollup.bucket)
+            id, sketch = query.values_list('id', 'sketch').get()
+            models.TimingRollup.objects.filter(id=id).update(
+                sketch=rollups.merge_sketch(sketch, rollup.sketch))
+
+
 def create_request_tracker(**kwargs):
     return models.RequestTracker(**kwargs)
 
@@ -80,16 +301,24 @@ def find_request_trackers(**kwargs):
     return models.RequestTracker.objects.filter(**kwargs)
 
 
+def find_new_request_trackers(last_id, since):
+    trackers = models.RequestTracker.objects.filter(id__gt=last_id,
+                                                    start__gte=since)
+    return [(tracker_id, request_id, dt.decimal_from_db(start))
+            for tracker_id, request_id, start in
+            trackers.values_list('id', 'request_id', 'start')]
+
+
 def create_instance_usage(**kwargs):
     return models.InstanceUsage(**kwargs)
 
 
 def get_or_create_instance_usage(**kwargs):
-    return models.InstanceUsage.objects.get_or_create(**kwargs)
+    return _get_or_new(models.InstanceUsage, **kwargs)
 
 
 def get_or_create_instance_delete(**kwargs):
-    return models.InstanceDeletes.objects.get_or_create(**kwargs)
+    return _get_or_new(models.InstanceDeletes, **kwargs)
 
 
 def get_instance_usage(**kwargs):
@@ -109,16 +338,51 @@ def create_instance_exists(**kwargs):
 
 
 def save(obj):
-    obj.save()
+    if obj.pk is None or obj._state.adding:
+        obj.save()
+        return
+    # The object came from the database, so its row is updated without
+    # django first querying whether it's still there. If it has gone
+    # (been pruned, say) it's inserted again, as django would have.
+    values = dict((field.name, field.pre_save(obj, False))
+                  for field in obj._meta.local_fields
+                  if not field.primary_key)
+    if not type(obj).objects.filter(pk=obj.pk).update(**values):
+        obj.save(force_insert=True)
+
+
+def update_rawdata(Model, id, **kwargs):
+    """Overwrites the columns in kwargs of the raw with id. Returns
+    False if there's no such raw any more."""
+    return Model.objects.filter(id=id).update(**kwargs) > 0
 
 
 def create_glance_rawdata(**kwargs):
+    if SQL_INGEST:
+        rawdata = sql_ingest.insert_raws(models.GlanceRawData, [kwargs])[0]
+        transaction.commit_unless_managed()
+        return rawdata
+
     rawdata = models.GlanceRawData(**kwargs)
     rawdata.save()
 
     return rawdata
 
 
+def create_glance_rawdata_batch(values_list):
+    if SQL_INGEST:
+        with transaction.commit_on_success():
+            return sql_ingest.insert_raws(models.GlanceRawData, values_list)
+
+    raws = []
+    with transaction.commit_on_success():
+        for values in values_list:
+            rawdata = models.GlanceRawData(**values)
+            rawdata.save()
+            raws.append(rawdata)
+    return raws
+
+
 def create_generic_rawdata(**kwargs):
     rawdata = models.GenericRawData(**kwargs)
     rawdata.save()
@@ -126,6 +390,13 @@ def create_generic_rawdata(**kwargs):
     return rawdata
 
 
+def create_generic_rawdata_batch(values_list):
+    raws = [models.GenericRawData(**values) for values in values_list]
+    with transaction.commit_on_success():
+        models.GenericRawData.objects.bulk_create(raws)
+    return raws
+
+
 def create_image_usage(**kwargs):
     usage = models.ImageUsage(**kwargs)
     usage.save()
@@ -147,9 +418,23 @@ def create_image_exists(**kwargs):
     return exists
 
 
+def create_image_exists_batch(values_list):
+    exists = [models.ImageExists(**values) for values in values_list]
+    models.ImageExists.objects.bulk_create(exists, batch_size=_BATCH_SIZE)
+    return exists
+
+
 def get_image_delete(**kwargs):
     return _safe_get(models.ImageDeletes, **kwargs)
 
 
 def get_image_usage(**kwargs):
     return _safe_get(models.ImageUsage, **kwargs)
+
+
+def get_image_deletes(uuids):
+    return _safe_get_by_uuid(models.ImageDeletes, uuids)
+
+
+def get_image_usages(uuids):
+    return _safe_get_by_uuid(models.ImageUsage, uuids)
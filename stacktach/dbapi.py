@@ -28,11 +28,14 @@ from django.http import HttpResponse
 from django.http import HttpResponseBadRequest
 from django.http import HttpResponseNotFound
 from django.http import HttpResponseServerError
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 
+from stacktach import cursors
 from stacktach import datetime_to_decimal as dt
 from stacktach import models
 from stacktach import stacklog
+from stacktach import streaming
 from stacktach import utils
 
 DEFAULT_LIMIT = 50
@@ -84,7 +87,10 @@ def api_call(func):
     @functools.wraps(func)
     def handled(*args, **kwargs):
         try:
-            return rsp(func(*args, **kwargs))
+            result = func(*args, **kwargs)
+            if isinstance(result, StreamingHttpResponse):
+                return result
+            return rsp(result)
         except NotFoundException, e:
             _log_api_exception(NotFoundException, e, args[0])
             return HttpResponseNotFound(json.dumps(e.to_dict()),
@@ -123,19 +129,23 @@ def _deletes_model_factory(service):
 
 @api_call
 def list_usage_launches(request):
-    return {'launches': list_usage_launches_with_service(request, 'nova')}
+    return list_usage_launches_with_service(request, 'nova', 'launches')
 
 @api_call
 def list_usage_images(request):
-    return { 'images': list_usage_launches_with_service(request, 'glance')}
+    return list_usage_launches_with_service(request, 'glance', 'images')
 
 
-def list_usage_launches_with_service(request, service):
+def list_usage_launches_with_service(request, service, key):
     model = _usage_model_factory(service)
+    stream = _get_stream_format(request)
+    columns = _get_columns(model['klass'], request)
     objects = get_db_objects(model['klass'], request,
-                             model['order_by'])
-    dicts = _convert_model_list(objects)
-    return dicts
+                             model['order_by'], values=_lookups(columns))
+    if stream:
+        return _stream_values_list(stream, key, objects, columns)
+    dicts = _convert_values_list(objects, columns)
+    return _with_next_cursor({key: dicts}, objects)
 
 
 def get_usage_launch_with_service(launch_id, service):
@@ -164,10 +174,14 @@ def list_usage_deletes_glance(request):
 
 def list_usage_deletes_with_service(request, service):
     model = _deletes_model_factory(service)
+    stream = _get_stream_format(request)
+    columns = _get_columns(model['klass'], request)
     objects = get_db_objects(model['klass'], request,
-                             model['order_by'])
-    dicts = _convert_model_list(objects)
-    return {'deletes': dicts}
+                             model['order_by'], values=_lookups(columns))
+    if stream:
+        return _stream_values_list(stream, 'deletes', objects, columns)
+    dicts = _convert_values_list(objects, columns)
+    return _with_next_cursor({'deletes': dicts}, objects)
 
 
 @api_call
@@ -183,7 +197,11 @@ def get_usage_delete_glance(request, delete_id):
 
 
 def _exists_extra_values(exist):
-    values = {'received': str(dt.dt_from_decimal(exist.raw.when))}
+    when = None
+    # The raw is gone once its partition has been dropped.
+    if exist.raw_id is not None:
+        when = exist.raw.when
+    values = {'received': str(dt.dt_from_decimal(when))}
     return values
 
 
@@ -200,10 +218,15 @@ def list_usage_exists_glance(request):
 def list_usage_exists_with_service(request, service):
     model = _exists_model_factory(service)
     custom_filters = _get_exists_filter_args(request)
+    stream = _get_stream_format(request)
+    columns = _get_columns(model['klass'], request, received=True)
     objects = get_db_objects(model['klass'], request, 'id',
-                             custom_filters=custom_filters)
-    dicts = _convert_model_list(objects, _exists_extra_values)
-    return {'exists': dicts}
+                             custom_filters=custom_filters,
+                             values=_lookups(columns))
+    if stream:
+        return _stream_values_list(stream, 'exists', objects, columns)
+    dicts = _convert_values_list(objects, columns)
+    return _with_next_cursor({'exists': dicts}, objects)
 
 
 @api_call
@@ -395,7 +418,11 @@ def _get_filter_args(klass, request, custom_filters=None):
 
 
 def get_db_objects(klass, request, default_order_by, direction='desc',
-                   custom_filters=None):
+                   custom_filters=None, values=None):
+    """A page of klass's rows, filtered, ordered and paged as the request
+    asks. With values, a list of lookups, the rows are values() dicts of
+    them, plus id and the ordering column, which cursors are made from.
+    """
     filter_args = _get_filter_args(klass, request,
                                    custom_filters=custom_filters)
     if custom_filters:
@@ -410,6 +437,13 @@ def get_db_objects(klass, request, default_order_by, direction='desc',
     order_by = request.GET.get('order_by', default_order_by)
     _check_has_field(klass, order_by)
 
+    if values is not None:
+        lookups = list(values)
+        for name in ('id', order_by):
+            if name not in lookups:
+                lookups.append(name)
+        objects = objects.values(*lookups)
+
     direction = request.GET.get('direction', direction)
     if direction == 'desc':
         order_by = '-%s' % order_by
@@ -422,8 +456,17 @@ def get_db_objects(klass, request, default_order_by, direction='desc',
     if limit:
         limit = int(limit)
 
-    if limit > HARD_LIMIT:
-        limit = HARD_LIMIT
+    hard_limit = streaming.hard_limit(request, HARD_LIMIT)
+    if limit > hard_limit:
+        limit = hard_limit
+
+    if 'cursor' in request.GET:
+        try:
+            return cursors.page(objects, klass, order_by,
+                                request.GET['cursor'], limit)
+        except cursors.InvalidCursor, e:
+            raise BadRequestException(message=str(e))
+
     if offset:
         start = int(offset)
     else:
@@ -443,14 +486,113 @@ def _convert_model(model, extra_values_func=None):
     return model_dict
 
 
-def _convert_model_list(model_list, extra_values_func=None):
+# The columns of each model's listings, by (model, received), made the
+# first time they're needed. See _columns_for().
+_COLUMNS = {}
+
+
+def _time_converter(null=None):
+    def convert(value):
+        if value is None:
+            return null
+        # values() hands back the column as it's stored.
+        return str(dt.dt_from_decimal(dt.decimal_from_db(value)))
+    return convert
+
+
+def _columns_for(klass, received=False):
+    """The (key, lookup, converter) of each column of klass's listings,
+    which between them make the dicts _convert_model would, from
+    values() rows. converter is None for values used as they are. With
+    received, there is also when the row's raw was received, from a
+    join."""
+    columns = _COLUMNS.get((klass, received))
+    if columns is not None:
+        return columns
+
+    columns = []
+    for field in klass._meta.fields:
+        # As model_to_dict.
+        if not field.editable:
+            continue
+        converter = None
+        if isinstance(field, models.TimestampField):
+            converter = _time_converter()
+        columns.append((field.name, field.name, converter))
+    if received:
+        # The raw is gone once its partition has been dropped.
+        columns.append(('received', 'raw__when',
+                        _time_converter(null='n/a')))
+    _COLUMNS[(klass, received)] = columns
+    return columns
+
+
+def _get_columns(klass, request, received=False):
+    """The columns of klass's listings, or just those in the request's
+    comma separated fields."""
+    columns = _columns_for(klass, received)
+    fields = request.GET.get('fields')
+    if not fields:
+        return columns
+
+    names = fields.split(',')
+    keys = [key for key, lookup, converter in columns]
+    for name in names:
+        if name not in keys:
+            raise BadRequestException("No such field '%s'." % name)
+    return [column for column in columns if column[0] in names]
+
+
+def _lookups(columns):
+    return [lookup for key, lookup, converter in columns]
+
+
+def _convert_values(values, columns):
+    converted = {}
+    for key, lookup, converter in columns:
+        value = values[lookup]
+        if converter is not None:
+            value = converter(value)
+        converted[key] = value
+    return converted
+
+
+def _convert_values_list(values_list, columns):
     converted = []
-    for item in model_list:
-        converted.append(_convert_model(item, extra_values_func))
+    for values in values_list:
+        converted.append(_convert_values(values, columns))
 
     return converted
 
 
+def _with_next_cursor(result, objects):
+    """Adds the cursor for the page after objects to result, when they
+    were paged by cursor."""
+    if isinstance(objects, cursors.Page):
+        result['next_cursor'] = objects.next_cursor()
+    return result
+
+
+def _get_stream_format(request):
+    try:
+        return streaming.get_format(request)
+    except ValueError, e:
+        raise BadRequestException(message=str(e))
+
+
+def _stream_values_list(format, key, objects, columns):
+    """The streamed response of objects, converted as they're read.
+    As JSON, it's the {key: [...]} object the listing would otherwise
+    return; the next_cursor, if any, comes after the list."""
+    dicts = (_convert_values(values, columns)
+             for values in streaming.iterate(objects))
+    if format == streaming.NDJSON:
+        return streaming.response(format, streaming.ndjson(dicts))
+    trailer = lambda: _with_next_cursor({}, objects)
+    return streaming.response(format,
+                              streaming.json_list(dicts, key, trailer))
+
+
 def _rawdata_factory(service):
     if service == "nova":
         rawdata = models.RawData.objects
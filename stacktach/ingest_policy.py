@@ -0,0 +1,182 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+# How much of each event type the worker stores.
+#
+#   full      a raw with the whole notification, as always.
+#   indexed   a raw with its columns (event, instance, state, when and so
+#             on) but no json, and no RawDataImageMeta.
+#   coalesce  a full raw for the first of an instance's events, which
+#             its later events from the same request overwrite, until
+#             the window (in seconds of their `when`) runs out. The raw
+#             ends up with the latest state.
+#
+# Either way, search and stacky see a raw for every event kept, with the
+# columns they filter and show. Notifications from an error queue, and
+# exists (which the verifier reads the payload of), are always stored in
+# full. Only events which aren't part of a .start/.end pair can be
+# coalesced, so timings are unaffected.
+
+import decimal
+
+from django.db import transaction
+
+from stacktach import cache
+from stacktach import db
+from stacktach import metrics
+from stacktach import models
+from stacktach import notification
+
+FULL = 'full'
+INDEXED = 'indexed'
+COALESCE = 'coalesce'
+POLICIES = (FULL, INDEXED, COALESCE)
+
+ALWAYS_FULL = ('compute.instance.exists', 'image.exists')
+
+# The most instances an IngestPolicy holds a raw to coalesce into.
+COALESCE_CACHE_SIZE = 10000
+
+RAW_MODELS = {
+    'nova': models.RawData,
+    'glance': models.GlanceRawData,
+}
+
+IMAGEMETA_FIELDS = ('os_architecture', 'os_version', 'os_distro',
+                    'rax_options')
+
+
+def _raw_model(exchange):
+    return RAW_MODELS.get(exchange, models.GenericRawData)
+
+
+class IngestPolicy(object):
+    """Saves notifications as policies, a dict of event type to policy,
+    says. Unlisted event types are stored in full."""
+
+    def __init__(self, policies, window=60,
+                 cache_size=COALESCE_CACHE_SIZE):
+        for event, policy in policies.items():
+            if policy not in POLICIES:
+                raise ValueError("Unknown ingest policy %s for %s" %
+                                 (policy, event))
+            if policy != FULL and event in ALWAYS_FULL:
+                raise ValueError("%s is always stored in full" % event)
+            if policy == COALESCE and \
+                    event.split('.')[-1] in ('start', 'end'):
+                raise ValueError("%s can't be coalesced" % event)
+        self.policies = dict(policies)
+        self.window = decimal.Decimal(window)
+        # (exchange, instance) -> (raw id, request_id, first when,
+        # latest when) of the raw being coalesced into.
+        self.held = cache.LRUCache(cache_size)
+
+    def policy(self, notif):
+        if 'error' in (notif.routing_key or ''):
+            return FULL
+        return self.policies.get(notif.event, FULL)
+
+    def _values(self, notif, policy):
+        values = notif.rawdata_values()
+        if policy == INDEXED:
+            values['json'] = ''
+            for name in IMAGEMETA_FIELDS:
+                values.pop(name, None)
+        return values
+
+    def _key(self, notif, exchange, policy):
+        if policy != COALESCE:
+            return None
+        if exchange == 'glance':
+            instance = notif.uuid
+        else:
+            instance = notif.instance
+        return instance and (exchange, instance)
+
+    def _coalesce(self, notif, exchange, key, values):
+        """Overwrites the held raw for key with values. Returns it, or
+        None if there's none to overwrite."""
+        held = self.held.get(key)
+        if held is None:
+            return None
+        raw_id, request_id, first_when, latest_when = held
+        when = values['when']
+        if request_id != notif.request_id or \
+                when - first_when > self.window or when < latest_when:
+            return None
+
+        fields = dict(values)
+        deployment = fields.pop('deployment')
+        for name in IMAGEMETA_FIELDS:
+            fields.pop(name, None)
+        model = _raw_model(exchange)
+        if not db.update_rawdata(model, raw_id, **fields):
+            self.held.pop(key)
+            return None
+        self.held.put(key, (raw_id, request_id, first_when, when))
+        metrics.incr('stacktach_coalesced_messages_total',
+                     labels={'exchange': exchange})
+
+        raw = model(id=raw_id, deployment_id=deployment.id, **fields)
+        raw._state.adding = False
+        setattr(raw, model._meta.get_field('deployment').get_cache_name(),
+                deployment)
+        # Post-processing has already seen this request start.
+        raw.coalesced = True
+        return raw
+
+    def _hold(self, key, notif, raw):
+        if key and raw.id is not None:
+            self.held.put(key, (raw.id, notif.request_id, raw.when,
+                                raw.when))
+
+    def save(self, notif, exchange):
+        """Stores notif and returns its raw."""
+        policy = self.policy(notif)
+        values = self._values(notif, policy)
+        key = self._key(notif, exchange, policy)
+        raw = None
+        if key:
+            raw = self._coalesce(notif, exchange, key, values)
+        if raw is None:
+            raw = notification.create_raw(values, exchange)
+            self._hold(key, notif, raw)
+        return raw
+
+    def save_batch(self, notifs, exchange):
+        """Stores notifs, all from exchange, in one transaction and
+        returns their raws in order. Events are only coalesced into
+        raws saved before the batch."""
+        raws = [None] * len(notifs)
+        new = []
+        with transaction.commit_on_success():
+            for i, notif in enumerate(notifs):
+                policy = self.policy(notif)
+                values = self._values(notif, policy)
+                key = self._key(notif, exchange, policy)
+                if key:
+                    raws[i] = self._coalesce(notif, exchange, key, values)
+                if raws[i] is None:
+                    new.append((i, notif, values, key))
+            created = []
+            if new:
+                created = notification.create_raws(
+                    [new_values for _, _, new_values, _ in new], exchange)
+        for (i, notif, values, key), raw in zip(new, created):
+            raws[i] = raw
+            self._hold(key, notif, raw)
+        return raws
@@ -0,0 +1,148 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+import datetime
+from optparse import make_option
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db import transaction
+from django.db.models import Max
+from django.db.models import Min
+
+from stacktach import archive
+from stacktach import datetime_to_decimal as dt
+from stacktach.management.commands import prune
+
+
+def archive_chunk(archiver, model, cutoff, low_id, high_id):
+    """Adds the raws older than cutoff with low_id <= id < high_id to
+    archiver. Returns how many there were, or None if the range only
+    holds newer raws."""
+    in_range = model.objects.filter(id__gte=low_id, id__lt=high_id)
+    count = 0
+    for values in in_range.filter(when__lt=cutoff).order_by('id').values():
+        archiver.add(values)
+        count += 1
+    if not count and in_range.exists():
+        return None
+    return count
+
+
+def archive_leftovers(archiver, model, cutoff, last_id, batch_size):
+    """Adds the raws older than cutoff, with ids up to the last archived
+    one, which aren't in the archive yet. They were too new the last time
+    round. The ones which are there were archived by a run that stopped
+    before deleting them. Returns how many were added."""
+    count = 0
+    after_id = 0
+    while True:
+        leftovers = list(model.objects.filter(id__gt=after_id,
+                                              id__lte=last_id,
+                                              when__lt=cutoff)
+                         .order_by('id').values()[:batch_size])
+        if not leftovers:
+            return count
+        after_id = leftovers[-1]['id']
+        archived = archive.archived_ids(model, leftovers[0]['id'], after_id)
+        for values in leftovers:
+            if values['id'] not in archived:
+                archiver.add(values)
+                count += 1
+
+
+def delete_archived(model, cutoff, last_id, batch_size):
+    """Deletes the raws up to last_id which are older than cutoff, all of
+    which must be in the archive, a batch per transaction. Returns how
+    many were deleted."""
+    deleted = 0
+    while True:
+        with transaction.commit_on_success():
+            expired = model.objects.filter(id__lte=last_id, when__lt=cutoff)
+            ids = list(expired.order_by('id')
+                       .values_list('id', flat=True)[:batch_size])
+            if not ids:
+                return deleted
+            prune.clear_references(model, ids)
+            prune._delete(model, ids)
+        deleted += len(ids)
+
+
+class Command(BaseCommand):
+    args = '[model ...]'
+    help = ("Moves the raws older than --keep days to segment files under "
+            "STACKTACH_ARCHIVE_DIR and deletes them from the database. "
+            "Models default to %s." % ', '.join(sorted(archive.RAW_MODELS)))
+    option_list = BaseCommand.option_list + (
+        make_option('--keep', type='int', default=90,
+                    help='Days of raws to keep in the database.'),
+        make_option('--batch-size', type='int', default=1000,
+                    help='Ids per batch read, and per delete transaction.'),
+        make_option('--sleep', type='float', default=0.1,
+                    help='Seconds to pause between batches.'),
+    )
+
+    def handle(self, *args, **options):
+        if not archive.enabled():
+            raise CommandError("STACKTACH_ARCHIVE_DIR isn't set")
+        for name in args:
+            if name not in archive.RAW_MODELS:
+                raise CommandError("Unknown model %s" % name)
+
+        cutoff = dt.dt_to_decimal(datetime.datetime.utcnow() -
+                                  datetime.timedelta(days=options['keep']))
+        for name in args or sorted(archive.RAW_MODELS.keys()):
+            self._archive(name, archive.RAW_MODELS[name], cutoff, options)
+
+    def _archive(self, name, model, cutoff, options):
+        ids = model.objects.aggregate(Min('id'), Max('id'))
+        if ids['id__min'] is None:
+            return
+        last_id = archive.last_archived_id(model)
+        archiver = archive.Archiver(model)
+        started = time.time()
+        try:
+            total = archive_leftovers(archiver, model, cutoff, last_id,
+                                      options['batch_size'])
+            low_id = max(ids['id__min'], last_id + 1)
+            while low_id <= ids['id__max']:
+                high_id = low_id + options['batch_size']
+                count = archive_chunk(archiver, model, cutoff, low_id,
+                                      high_id)
+                # As with prune, the first batch of newer raws is where
+                # to stop.
+                if count is None:
+                    break
+                total += count
+                last_id = high_id - 1
+                low_id = high_id
+                elapsed = time.time() - started
+                self.stdout.write("%s: %d archived, up to id %d, %.1f rows/s"
+                                  % (name, total, last_id,
+                                     total / max(elapsed, 0.001)))
+                time.sleep(options['sleep'])
+        finally:
+            # Whatever was added is complete, so it is safe to keep even
+            # if archiving stopped part way.
+            archiver.close()
+
+        # Only now that the segments are on disk are their raws deleted.
+        deleted = delete_archived(model, cutoff, last_id,
+                                  options['batch_size'])
+        self.stdout.write("%s: %d archived, %d deleted" %
+                          (name, total, deleted))
@@ -0,0 +1,94 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+from optparse import make_option
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db import transaction
+
+from stacktach import models
+from stacktach import utils
+
+RAW_MODELS = {
+    'RawData': models.RawData,
+    'GlanceRawData': models.GlanceRawData,
+    'GenericRawData': models.GenericRawData,
+}
+
+
+def convert_chunk(model, after_id, chunk_size, decompress=False):
+    """Compresses (or decompresses) the json of the chunk_size raws
+    following row after_id, in one transaction. Returns the last id
+    looked at, or None when there are no rows left, and the number of
+    rows changed."""
+    rows = list(model.objects.filter(id__gt=after_id).order_by('id')
+                .values_list('id', 'json')[:chunk_size])
+    if not rows:
+        return None, 0
+
+    convert = utils.compress_raw_json
+    if decompress:
+        convert = utils.decompress_raw_json
+
+    changed = 0
+    with transaction.commit_on_success():
+        for row_id, raw_json in rows:
+            converted = convert(raw_json)
+            if converted != raw_json:
+                model.objects.filter(id=row_id).update(json=converted)
+                changed += 1
+    return rows[-1][0], changed
+
+
+class Command(BaseCommand):
+    args = '[model ...]'
+    help = ("Compresses the json of raws already in the database, a chunk "
+            "at a time. Models default to %s." %
+            ', '.join(sorted(RAW_MODELS.keys())))
+    option_list = BaseCommand.option_list + (
+        make_option('--chunk-size', type='int', default=1000,
+                    help='Rows per transaction.'),
+        make_option('--sleep', type='float', default=0.5,
+                    help='Seconds to pause between chunks.'),
+        make_option('--start-id', type='int', default=0,
+                    help='Only convert rows after this id, to resume.'),
+        make_option('--decompress', action='store_true', default=False,
+                    help='Decompress instead.'),
+    )
+
+    def handle(self, *args, **options):
+        names = args or sorted(RAW_MODELS.keys())
+        for name in names:
+            if name not in RAW_MODELS:
+                raise CommandError("Unknown model %s" % name)
+
+        for name in names:
+            last_id = options['start_id']
+            total = 0
+            while True:
+                chunk_last_id, changed = convert_chunk(
+                    RAW_MODELS[name], last_id, options['chunk_size'],
+                    decompress=options['decompress'])
+                if chunk_last_id is None:
+                    break
+                last_id = chunk_last_id
+                total += changed
+                self.stdout.write("%s: %d rows converted, up to id %d" %
+                                  (name, total, last_id))
+                time.sleep(options['sleep'])
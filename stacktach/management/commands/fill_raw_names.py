@@ -0,0 +1,66 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+from django.core.management.base import BaseCommand
+
+from stacktach import db
+from stacktach import models
+
+SERVICE_MODELS = (
+    ('nova', models.RawData),
+    ('glance', models.GlanceRawData),
+    ('generic', models.GenericRawData),
+)
+
+NAME_FIELDS = (
+    (models.EventName, 'event'),
+    (models.HostName, 'host'),
+)
+
+
+def missing_names(Model, service, raws, field):
+    """The (deployment id, name) pairs in field of the raws which Model
+    (EventName or HostName) doesn't have for service."""
+    found = set(raws.exclude(**{field: None}).exclude(**{field: ''})
+                .values_list('deployment', field).distinct())
+    known = set(Model.objects.filter(service=service)
+                .values_list('deployment', 'name'))
+    return found - known
+
+
+def fill(Model, service, raws, field):
+    """Adds the names missing from Model for service. Returns how many
+    were added."""
+    added = 0
+    for deployment_id, name in sorted(missing_names(Model, service, raws,
+                                                    field)):
+        # A worker may have added it in the meantime.
+        if db.add_raw_name(Model, service, deployment_id, name):
+            added += 1
+    return added
+
+
+class Command(BaseCommand):
+    help = ("Adds the event names and hosts of the raws already saved to "
+            "the tables stacky lists them from. Run once after upgrading.")
+
+    def handle(self, *args, **options):
+        for service, raw_model in SERVICE_MODELS:
+            for Model, field in NAME_FIELDS:
+                added = fill(Model, service, raw_model.objects, field)
+                self.stdout.write("%s: %d %s names added" %
+                                  (service, added, field))
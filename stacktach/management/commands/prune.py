@@ -0,0 +1,139 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+import datetime
+from optparse import make_option
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db import transaction
+from django.db.models import Max
+from django.db.models import Min
+from django.db.models import Q
+
+from stacktach import datetime_to_decimal as dt
+from stacktach import models
+from stacktach import partitioning
+
+
+def _tables(cutoff):
+    """(name, model, expired rows, whether ids follow time) for each
+    table, in the order they're pruned. Lifecycles go last: the ones
+    whose last raw has been pruned are expired, wherever their id is."""
+    return [
+        ('RawData', models.RawData, Q(when__lt=cutoff), True),
+        ('GlanceRawData', models.GlanceRawData, Q(when__lt=cutoff), True),
+        ('GenericRawData', models.GenericRawData, Q(when__lt=cutoff), True),
+        ('ReceivedMessage', models.ReceivedMessage, Q(when__lt=cutoff),
+         True),
+        ('RequestTracker', models.RequestTracker, Q(start__lt=cutoff), True),
+        ('Timing', models.Timing,
+         Q(start_when__lt=cutoff) | Q(start_when=None, end_when__lt=cutoff),
+         True),
+        ('Lifecycle', models.Lifecycle, Q(last_raw=None), False),
+    ]
+
+TABLES = [name for name, model, expired, ordered in _tables(0)]
+
+
+def _delete(model, ids):
+    # Straight to a DELETE, rather than having django look for the rows
+    # that refer to these, which clear_references has already seen to.
+    query = model.objects.filter(id__in=ids)
+    query._raw_delete(query.db)
+
+
+def clear_references(model, ids):
+    """Sets the nullable foreign keys pointing at the rows with ids to
+    NULL and deletes the rows with a non-null one, a whole batch in one
+    statement per foreign key."""
+    for other, field in partitioning.references(model):
+        referring = other.objects.filter(**{'%s__in' % field.name: ids})
+        if field.null:
+            referring.update(**{field.name: None})
+        else:
+            other_ids = list(referring.values_list('id', flat=True))
+            if other_ids:
+                clear_references(other, other_ids)
+                _delete(other, other_ids)
+
+
+def prune_chunk(model, expired, low_id, high_id):
+    """Deletes the expired rows with low_id <= id < high_id, in one
+    transaction. Returns the number deleted, or None if the range only
+    holds rows which haven't expired."""
+    with transaction.commit_on_success():
+        in_range = model.objects.filter(id__gte=low_id, id__lt=high_id)
+        ids = list(in_range.filter(expired).values_list('id', flat=True))
+        if not ids:
+            if in_range.exists():
+                return None
+            return 0
+        clear_references(model, ids)
+        _delete(model, ids)
+    return len(ids)
+
+
+class Command(BaseCommand):
+    args = '[table ...]'
+    help = ("Deletes everything older than --keep days, a batch of ids at "
+            "a time. Tables default to %s." % ', '.join(TABLES))
+    option_list = BaseCommand.option_list + (
+        make_option('--keep', type='int', default=90,
+                    help='Days of data to keep.'),
+        make_option('--batch-size', type='int', default=1000,
+                    help='Ids per batch, and transaction.'),
+        make_option('--sleep', type='float', default=0.1,
+                    help='Seconds to pause between batches.'),
+        make_option('--start-id', type='int', default=0,
+                    help='Skip ids below this one.'),
+    )
+
+    def handle(self, *args, **options):
+        for name in args:
+            if name not in TABLES:
+                raise CommandError("Unknown table %s" % name)
+
+        cutoff = dt.dt_to_decimal(datetime.datetime.utcnow() -
+                                  datetime.timedelta(days=options['keep']))
+        for name, model, expired, ordered in _tables(cutoff):
+            if args and name not in args:
+                continue
+            self._prune(name, model, expired, ordered, options)
+
+    def _prune(self, name, model, expired, ordered, options):
+        ids = model.objects.aggregate(Min('id'), Max('id'))
+        if ids['id__min'] is None:
+            return
+        low_id = max(ids['id__min'], options['start_id'])
+        started = time.time()
+        total = 0
+        while low_id <= ids['id__max']:
+            high_id = low_id + options['batch_size']
+            deleted = prune_chunk(model, expired, low_id, high_id)
+            # Ids roughly follow time in the tables where that makes
+            # sense, so the first batch of live rows is where to stop.
+            if deleted is None and ordered:
+                break
+            total += deleted or 0
+            low_id = high_id
+            elapsed = time.time() - started
+            self.stdout.write("%s: %d deleted, up to id %d, %.1f rows/s" %
+                              (name, total, high_id - 1,
+                               total / max(elapsed, 0.001)))
+            time.sleep(options['sleep'])
@@ -0,0 +1,105 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+import datetime
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db import connection
+
+from stacktach import partitioning
+
+ACTIONS = ('enable', 'create', 'drop', 'list')
+
+
+class Command(BaseCommand):
+    args = '<enable|create|drop|list> [model ...]'
+    help = ("Manages the time partitions of the raw tables (MySQL only). "
+            "'enable' partitions the tables, 'create' adds partitions for "
+            "the coming days and 'drop' drops the expired ones. Models "
+            "default to %s." % ', '.join(sorted(partitioning.RAW_MODELS)))
+    option_list = BaseCommand.option_list + (
+        make_option('--period', default='daily',
+                    choices=sorted(partitioning.PERIODS.keys()),
+                    help='How much time each partition holds.'),
+        make_option('--ahead', type='int', default=7,
+                    help='Days of partitions to create ahead of time.'),
+        make_option('--keep', type='int', default=90,
+                    help='Days of raws to keep when dropping partitions.'),
+        make_option('--dry-run', action='store_true', default=False,
+                    help='Print the SQL instead of running it.'),
+    )
+
+    def handle(self, *args, **options):
+        if not args or args[0] not in ACTIONS:
+            raise CommandError("Usage: raw_partitions %s" % self.args)
+        if connection.vendor != 'mysql':
+            raise CommandError("Partitioning is only supported on MySQL")
+
+        names = args[1:] or sorted(partitioning.RAW_MODELS.keys())
+        for name in names:
+            if name not in partitioning.RAW_MODELS:
+                raise CommandError("Unknown model %s" % name)
+
+        self.options = options
+        self.period_days = partitioning.PERIODS[options['period']]
+        self.today = datetime.datetime.utcnow().date()
+        for name in names:
+            getattr(self, '_%s' % args[0])(partitioning.RAW_MODELS[name])
+
+    def _execute(self, statements):
+        cursor = connection.cursor()
+        for statement in statements:
+            self.stdout.write(statement)
+            if not self.options['dry_run']:
+                cursor.execute(statement)
+
+    def _enable(self, model):
+        table = model._meta.db_table
+        cursor = connection.cursor()
+        if partitioning.existing_partitions(cursor, table):
+            raise CommandError("%s is already partitioned" % table)
+        constraints = partitioning.foreign_key_constraints(cursor, table)
+        self._execute(partitioning.enable_sql(
+            model, constraints, self.period_days, self.options['ahead'],
+            self.today))
+
+    def _create(self, model):
+        table = model._meta.db_table
+        partitions = partitioning.existing_partitions(connection.cursor(),
+                                                      table)
+        try:
+            self._execute(partitioning.create_sql(
+                model, partitions, self.period_days, self.options['ahead'],
+                self.today))
+        except ValueError, e:
+            raise CommandError(str(e))
+
+    def _drop(self, model):
+        table = model._meta.db_table
+        partitions = partitioning.existing_partitions(connection.cursor(),
+                                                      table)
+        cutoff = self.today - datetime.timedelta(days=self.options['keep'])
+        for partition in partitioning.expired_partitions(partitions, cutoff):
+            self._execute(partitioning.drop_sql(model, partition))
+
+    def _list(self, model):
+        table = model._meta.db_table
+        for name, description in partitioning.existing_partitions(
+                connection.cursor(), table):
+            self.stdout.write("%s %s %s" % (table, name, description))
@@ -0,0 +1,215 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+import itertools
+import json
+import os
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from stacktach import db
+from stacktach import metrics
+from stacktach import replay
+from stacktach import stacklog
+from stacktach import views
+
+
+def parse_source(arg):
+    """'glance:recorded.json' is (glance, recorded.json). Plain file
+    names are nova's."""
+    exchange, sep, path = arg.partition(':')
+    if not sep:
+        return 'nova', arg
+    return exchange, path
+
+
+class Command(BaseCommand):
+    args = ('<export exchange | run [exchange:]file ... | '
+            'bench [exchange:]file ...>')
+    help = ("'export' prints recorded notifications from an exchange's "
+            "raws, one per line. 'run' saves and post-processes recorded "
+            "notifications like the worker does, as fast as it can, and "
+            "reports msgs/s, p50/p99 latency and queries per message for "
+            "each exchange and event type. 'bench' times how fast each "
+            "ingest backend writes the raws, without post-processing. Run "
+            "them against a scratch database: 'run' adds everything it "
+            "replays.")
+    option_list = BaseCommand.option_list + (
+        make_option('--limit', type='int', default=0,
+                    help='Notifications to export or replay from each '
+                         'source, 0 for all.'),
+        make_option('--deployment', default='replay',
+                    help='Deployment to save the replayed raws under.'),
+        make_option('--routing-key', default=replay.DEFAULT_ROUTING_KEY,
+                    help='Routing key for recorded bodies without one.'),
+        make_option('--batch-size', type='int', default=1,
+                    help='Save in batches of this many, like the worker '
+                         'with batch_size.'),
+        make_option('--lifecycle-cache-size', type='int', default=0,
+                    help='As the worker setting.'),
+        make_option('--kpi-index-ttl', type='int', default=0,
+                    help='As the worker setting.'),
+        make_option('--dedup-cache-size', type='int', default=0,
+                    help='As the worker setting.'),
+        make_option('--ingest-backend', default='orm',
+                    choices=db.INGEST_BACKENDS,
+                    help='As the worker setting.'),
+        make_option('--ingest-policy',
+                    help='A json file of the policy for each event type, '
+                         'as the worker setting.'),
+        make_option('--coalesce-window', type='int', default=60,
+                    help='As the worker setting.'),
+        make_option('--repeat', type='int', default=3,
+                    help='Times bench writes each recording with each '
+                         'backend, keeping the best.'),
+        make_option('--no-query-count', action='store_false',
+                    dest='count_queries', default=True,
+                    help="Don't count queries, which costs a little."),
+        make_option('--query-budgets',
+                    help='A json file of the most queries a message of '
+                         'each event type should take, with "*" for the '
+                         'rest. Fails if any are over budget.'),
+        make_option('--log-dir',
+                    help='Where to write replay.log, which gets the '
+                         'warnings the worker would log. Defaults to '
+                         '/var/log/stacktach.'),
+        make_option('--json', action='store_true', default=False,
+                    help='Print the report as json, for comparing runs.'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) < 2 or args[0] not in ('export', 'run', 'bench'):
+            raise CommandError("Usage: replay %s" % self.args)
+        getattr(self, '_%s' % args[0])(args[1:], options)
+
+    def _export(self, args, options):
+        for line in replay.export_lines(args[0], limit=options['limit']):
+            self.stdout.write(line)
+
+    def _read(self, arg, options):
+        """The exchange and (routing_key, body) messages of a source."""
+        exchange, path = parse_source(arg)
+        try:
+            recording = open(path)
+        except IOError, e:
+            raise CommandError(str(e))
+        try:
+            messages = replay.read_messages(recording,
+                                            options['routing_key'])
+            if options['limit']:
+                messages = itertools.islice(messages, options['limit'])
+            return exchange, list(messages)
+        finally:
+            recording.close()
+
+    def _bench(self, args, options):
+        deployment, new = db.get_or_create_deployment(options['deployment'])
+        self.stdout.write('%-10s %-8s %8s %10s' %
+                          ('exchange', 'backend', 'msgs', 'msgs/s'))
+        for arg in args:
+            exchange, messages = self._read(arg, options)
+            rates = {}
+            for backend in db.INGEST_BACKENDS:
+                best = min(replay.time_ingest(deployment, exchange, messages,
+                                              backend, options['batch_size'])
+                           for i in range(max(options['repeat'], 1)))
+                rates[backend] = len(messages) / max(best, 0.000001)
+                self.stdout.write('%-10s %-8s %8d %10.1f' %
+                                  (exchange, backend, len(messages),
+                                   rates[backend]))
+            self.stdout.write('%s: sql is %.2fx orm' %
+                              (exchange, rates['sql'] / rates['orm']))
+
+    def _run(self, args, options):
+        if options['log_dir']:
+            stacklog.set_default_logger_location(
+                os.path.join(options['log_dir'], '%s.log'))
+        stacklog.set_default_logger_name('replay')
+        log_listener = stacklog.LogListener(
+            stacklog.get_logger('replay', is_parent=True))
+        log_listener.start()
+        try:
+            self._replay(args, options)
+        finally:
+            log_listener.end()
+
+    def _load_json(self, path):
+        if not path:
+            return {}
+        try:
+            json_file = open(path)
+        except IOError, e:
+            raise CommandError(str(e))
+        try:
+            return json.load(json_file)
+        finally:
+            json_file.close()
+
+    def _replay(self, args, options):
+        budget = None
+        if options['query_budgets']:
+            if not options['count_queries']:
+                raise CommandError("--query-budgets needs the queries "
+                                   "counted")
+            budget = metrics.QueryBudget(
+                self._load_json(options['query_budgets']))
+        views.enable_lifecycle_cache(options['lifecycle_cache_size'])
+        views.enable_kpi_index(options['kpi_index_ttl'])
+        views.enable_dedup(options['dedup_cache_size'])
+        db.set_ingest_backend(options['ingest_backend'])
+        try:
+            views.enable_ingest_policy(
+                self._load_json(options['ingest_policy']),
+                options['coalesce_window'])
+        except ValueError, e:
+            raise CommandError(str(e))
+        deployment, new = db.get_or_create_deployment(options['deployment'])
+        replayer = replay.Replayer(deployment,
+                                   count_queries=options['count_queries'])
+        for arg in args:
+            exchange, path = parse_source(arg)
+            try:
+                recording = open(path)
+            except IOError, e:
+                raise CommandError(str(e))
+            try:
+                messages = replay.read_messages(recording,
+                                                options['routing_key'])
+                if options['limit']:
+                    messages = itertools.islice(messages, options['limit'])
+                replayer.replay(exchange, messages,
+                                batch_size=options['batch_size'])
+            finally:
+                recording.close()
+
+        report = replayer.report()
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.stdout.write(replay.format_report(report))
+        if budget is not None:
+            over = replay.over_budget(report, budget)
+            if over:
+                raise CommandError(
+                    "Over the query budget: %s" %
+                    ', '.join('%s %s (%.1f > %s)' %
+                              (group['exchange'], group['event'],
+                               group['queries_per_msg'],
+                               budget.limit(group['event']))
+                              for group in over))
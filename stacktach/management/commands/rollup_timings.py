@@ -0,0 +1,107 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+import datetime
+import decimal
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from stacktach import datetime_to_decimal as dt
+from stacktach import models
+from stacktach import rollups
+
+
+def _complete_timings(after, before):
+    timings = models.Timing.objects.filter(end_when__lt=before, diff__gte=0)\
+        .exclude(start_raw=None).exclude(end_raw=None)
+    if after is not None:
+        timings = timings.filter(end_when__gte=after)
+    return timings
+
+
+def rollup_chunk(timings, found, low_id, batch_size):
+    """Adds the timings with ids above low_id, up to batch_size of them,
+    to the TimingRollups in found. Returns the last id added, or None
+    when there are none left, and how many were added."""
+    rows = list(timings.filter(id__gt=low_id).order_by('id')
+                .values_list('id', 'name', 'end_raw__deployment',
+                             'end_when', 'diff')[:batch_size])
+    for id, name, deployment_id, when, seconds in rows:
+        # values_list hands back the columns as they're stored.
+        bucket = rollups.bucket_for(dt.decimal_from_db(when))
+        key = (name, deployment_id, bucket)
+        rollup = found.get(key)
+        if rollup is None:
+            rollup = found[key] = models.TimingRollup(
+                name=name, deployment_id=deployment_id, bucket=bucket)
+        rollups.add(rollup, dt.decimal_from_db(seconds))
+    if not rows:
+        return None, 0
+    return rows[-1][0], len(rows)
+
+
+def replace_rollups(found, after, before):
+    """Replaces the TimingRollups for the hours from after to before
+    with those in found, in one transaction. Whatever a worker added to
+    those hours since found was read is lost, so the workers should be
+    stopped."""
+    with transaction.commit_on_success():
+        old = models.TimingRollup.objects.filter(bucket__lt=before)
+        if after is not None:
+            old = old.filter(bucket__gte=after)
+        old.delete()
+        models.TimingRollup.objects.bulk_create(found.values(),
+                                                batch_size=500)
+
+
+class Command(BaseCommand):
+    help = ("Rebuilds the timing rollups stacky's summary reads from the "
+            "Timings, for the hours before the current one. Stop the "
+            "workers while it runs, or the Timings they add to those hours "
+            "meanwhile are lost or counted twice.")
+    option_list = BaseCommand.option_list + (
+        make_option('--after', type='string',
+                    help='Only rebuild the hours from this time on, in '
+                         'seconds since the epoch.'),
+        make_option('--batch-size', type='int', default=10000,
+                    help='Timings read per query.'),
+    )
+
+    def handle(self, *args, **options):
+        # The worker adds to the current hour's rollups as Timings
+        # complete, so it's left alone.
+        before = rollups.bucket_for(
+            dt.dt_to_decimal(datetime.datetime.utcnow()))
+        after = None
+        if options['after']:
+            after = rollups.bucket_for(decimal.Decimal(options['after']))
+        timings = _complete_timings(after, before)
+
+        found = {}
+        low_id = 0
+        count = 0
+        while low_id is not None:
+            low_id, added = rollup_chunk(timings, found, low_id,
+                                         options['batch_size'])
+            if added:
+                count += added
+                self.stdout.write("%d timings, up to id %d" %
+                                  (count, low_id))
+        replace_rollups(found, after, before)
+        self.stdout.write("%d rollups from %d timings" % (len(found), count))
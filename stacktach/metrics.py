@@ -0,0 +1,238 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+# Counters, gauges and histograms for the worker, verifier and web
+# processes. Each process keeps its own registry. The worker and
+# verifier children hand a snapshot of theirs to their supervisor
+# through the stats dict, the supervisors write them to a stats file,
+# and the web server's /metrics/ page serves its own registry along
+# with any stats files it's told about.
+
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.http import HttpResponse
+
+COUNTER = 'counter'
+GAUGE = 'gauge'
+HISTOGRAM = 'histogram'
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                   0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+WAIT_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0,
+                600.0, 1800.0, 3600.0)
+
+
+def _label_key(labels):
+    if not labels:
+        return ()
+    return tuple(sorted(labels.items()))
+
+
+class Registry(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _get(self, kind, name, labels, default):
+        key = (name, _label_key(labels))
+        metric = self._metrics.get(key)
+        if metric is None:
+            metric = [kind, default()]
+            self._metrics[key] = metric
+        return metric
+
+    def incr(self, name, labels=None, value=1):
+        with self._lock:
+            metric = self._get(COUNTER, name, labels, int)
+            metric[1] += value
+
+    def set(self, name, value, labels=None):
+        with self._lock:
+            metric = self._get(GAUGE, name, labels, int)
+            metric[1] = value
+
+    def observe(self, name, value, labels=None, buckets=LATENCY_BUCKETS):
+        with self._lock:
+            metric = self._get(HISTOGRAM, name, labels,
+                               lambda: [buckets, [0] * len(buckets), 0, 0])
+            bounds, counts = metric[1][0], metric[1][1]
+            for i, bound in enumerate(bounds):
+                if value <= bound:
+                    counts[i] += 1
+            metric[1][2] += value
+            metric[1][3] += 1
+
+    def timer(self, name, labels=None):
+        return _Timer(self, name, labels)
+
+    def snapshot(self):
+        """Returns the current values as plain lists and tuples, which
+        can be pickled into a multiprocessing stats dict."""
+        with self._lock:
+            snapshot = []
+            for (name, labels), (kind, value) in self._metrics.items():
+                if kind == HISTOGRAM:
+                    value = (tuple(value[0]), tuple(value[1]), value[2],
+                             value[3])
+                snapshot.append((kind, name, labels, value))
+        return sorted(snapshot)
+
+    def clear(self):
+        with self._lock:
+            self._metrics.clear()
+
+
+class _Timer(object):
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.registry.observe(self.name, time.time() - self.start,
+                              self.labels)
+
+
+class QueryBudget(object):
+    """The most queries a message of each event type should take. '*'
+    sets the budget for event types that aren't listed."""
+
+    def __init__(self, budgets=None):
+        self.budgets = dict(budgets or {})
+
+    def limit(self, event):
+        return self.budgets.get(event, self.budgets.get('*'))
+
+    def over(self, event, queries):
+        limit = self.limit(event)
+        return limit is not None and queries > limit
+
+
+REGISTRY = Registry()
+
+
+def incr(name, labels=None, value=1):
+    REGISTRY.incr(name, labels, value)
+
+
+def set(name, value, labels=None):
+    REGISTRY.set(name, value, labels)
+
+
+def observe(name, value, labels=None, buckets=LATENCY_BUCKETS):
+    REGISTRY.observe(name, value, labels, buckets)
+
+
+def timer(name, labels=None):
+    return REGISTRY.timer(name, labels)
+
+
+def snapshot():
+    return REGISTRY.snapshot()
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ['%s="%s"' % (key, str(value).replace('\\', '\\\\')
+                                         .replace('"', '\\"'))
+             for key, value in labels]
+    return '{%s}' % ','.join(pairs)
+
+
+def render(snapshots):
+    """Renders (extra_labels, snapshot) pairs in the Prometheus text
+    format. extra_labels, a dict, is added to every metric in its
+    snapshot, to tell apart the processes they came from."""
+    types = {}
+    samples = {}
+    for extra_labels, metric_snapshot in snapshots:
+        extra = _label_key(extra_labels)
+        for kind, name, labels, value in metric_snapshot:
+            types.setdefault(name, kind)
+            lines = samples.setdefault(name, [])
+            labels = tuple(extra) + tuple(labels)
+            if kind != HISTOGRAM:
+                lines.append('%s%s %s' % (name, _format_labels(labels),
+                                          value))
+                continue
+            bounds, counts, total, count = value
+            for bound, bucket_count in zip(bounds, counts):
+                bucket_labels = labels + (('le', bound),)
+                lines.append('%s_bucket%s %s' %
+                             (name, _format_labels(bucket_labels),
+                              bucket_count))
+            lines.append('%s_bucket%s %s' %
+                         (name, _format_labels(labels + (('le', '+Inf'),)),
+                          count))
+            lines.append('%s_sum%s %s' % (name, _format_labels(labels),
+                                          total))
+            lines.append('%s_count%s %s' % (name, _format_labels(labels),
+                                            count))
+    output = []
+    for name in sorted(samples.keys()):
+        output.append('# TYPE %s %s' % (name, types[name]))
+        output.extend(samples[name])
+    return '\n'.join(output) + '\n'
+
+
+def write_stats_file(filename, snapshots):
+    """Writes render(snapshots) to filename, replacing it atomically so
+    readers never see a partial file."""
+    tmp_filename = '%s.tmp' % filename
+    with open(tmp_filename, 'w') as stats_file:
+        stats_file.write(render(snapshots))
+    os.rename(tmp_filename, filename)
+
+
+def scrape(request):
+    """The /metrics/ page: this process's metrics followed by the
+    supervisors' stats files listed in settings.METRICS_FILES."""
+    output = [render([({}, snapshot())])]
+    for filename in getattr(settings, 'METRICS_FILES', []):
+        try:
+            with open(filename, 'r') as stats_file:
+                output.append(stats_file.read())
+        except IOError:
+            pass
+    return HttpResponse(''.join(output), content_type='text/plain')
+
+
+class MetricsMiddleware(object):
+    """Times every view, labelled with the view's name."""
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._metrics_view = "%s.%s" % (view_func.__module__,
+                                           view_func.__name__)
+        request._metrics_start = time.time()
+
+    def process_response(self, request, response):
+        start = getattr(request, '_metrics_start', None)
+        if start is not None:
+            labels = {'view': request._metrics_view,
+                      'status': response.status_code}
+            observe('stacktach_web_request_seconds', time.time() - start,
+                    labels)
+        return response
@@ -17,12 +17,146 @@
 import datetime
 import copy
 
+from django.conf import settings
 from django.db import models
 from django.db.models import Q
 
 from stacktach import datetime_to_decimal as dt
 
 
+def stores_microseconds():
+    return getattr(settings, 'TIMESTAMP_STORAGE', 'decimal') == 'microseconds'
+
+
+def db_timestamp(value):
+    """A Decimal time as it is stored, for raw SQL parameters."""
+    if stores_microseconds():
+        return dt.decimal_to_micros(value)
+    return value
+
+
+def db_interval(seconds):
+    """A number of seconds in the units the time columns are stored in,
+    for adding to F() expressions and raw SQL."""
+    if stores_microseconds():
+        return int(seconds) * dt.MICROSECONDS
+    return seconds
+
+
+def timestamp_micros(obj, name):
+    """The time in obj's field name as whole microseconds. Read from a
+    BIGINT column, this is the stored integer and no Decimal is built."""
+    micros = obj.__dict__.get(_micros_attname(name))
+    if micros is None:
+        micros = dt.decimal_to_micros(getattr(obj, name))
+    return micros
+
+
+def _micros_attname(attname):
+    return '_%s_micros' % attname
+
+
+class _TimestampDescriptor(object):
+    # Times read from a BIGINT column are kept as the integer, and only
+    # turned into a Decimal the first time the attribute is read.
+
+    def __init__(self, field):
+        self.field = field
+        self.micros_attname = _micros_attname(field.attname)
+
+    def __get__(self, obj, type=None):
+        if obj is None:
+            return self
+        try:
+            return obj.__dict__[self.field.attname]
+        except KeyError:
+            value = dt.micros_to_decimal(obj.__dict__[self.micros_attname])
+            obj.__dict__[self.field.attname] = value
+            return value
+
+    def __set__(self, obj, value):
+        obj.__dict__.pop(self.micros_attname, None)
+        obj.__dict__[self.field.attname] = value
+
+
+def _loading_timestamps(init):
+    """Wraps a model's __init__ so that time columns read from the
+    database are converted, and values given by callers are not.
+
+    Querysets (and select_related) build instances from positional
+    args. raw() queries that leave columns out build deferred instances
+    from keyword args.
+    """
+    def __init__(self, *args, **kwargs):
+        init(self, *args, **kwargs)
+        if args:
+            fields = self._meta.fields[:len(args)]
+        elif self._deferred:
+            fields = [field for field in self._meta.fields
+                      if field.attname in kwargs]
+        else:
+            return
+        for field in fields:
+            if isinstance(field, TimestampField):
+                field.from_db_value(self)
+    __init__._loads_timestamps = True
+    return __init__
+
+
+class TimestampField(models.DecimalField):
+    """Seconds since the epoch, as a Decimal with six decimal places.
+
+    The column is a DECIMAL(20,6) unless settings.TIMESTAMP_STORAGE is
+    'microseconds', in which case it is a BIGINT of microseconds. Model
+    instances hold Decimals either way, and anything assigned to the
+    field is taken to be seconds. Only values read from the database
+    are taken to be microseconds (see from_db_value).
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('max_digits', 20)
+        kwargs.setdefault('decimal_places', 6)
+        super(TimestampField, self).__init__(*args, **kwargs)
+
+    def contribute_to_class(self, cls, name):
+        super(TimestampField, self).contribute_to_class(cls, name)
+        setattr(cls, self.name, _TimestampDescriptor(self))
+        if not getattr(cls.__init__, '_loads_timestamps', False):
+            cls.__init__ = _loading_timestamps(cls.__init__)
+
+    def from_db_value(self, obj):
+        """Takes obj's value for the field as read from the database."""
+        value = obj.__dict__.get(self.attname)
+        if isinstance(value, (int, long)) and stores_microseconds():
+            del obj.__dict__[self.attname]
+            obj.__dict__[_micros_attname(self.attname)] = value
+
+    def db_type(self, connection):
+        if stores_microseconds():
+            return models.BigIntegerField().db_type(connection)
+        return super(TimestampField, self).db_type(connection)
+
+    def get_prep_value(self, value):
+        if not stores_microseconds():
+            return super(TimestampField, self).get_prep_value(value)
+        if value is None:
+            return value
+        return dt.decimal_to_micros(self.to_python(value))
+
+    def get_db_prep_save(self, value, connection):
+        if not stores_microseconds():
+            return super(TimestampField, self).get_db_prep_save(value,
+                                                                connection)
+        return self.get_prep_value(value)
+
+    def south_field_triple(self):
+        # Frozen as the DecimalField it started as. How the column is
+        # stored is up to scripts/convert_timestamps.py, not migrations.
+        from south.modelsinspector import introspector
+        args, kwargs = introspector(self)
+        return ('django.db.models.fields.DecimalField', args, kwargs)
+
+
 def routing_key_type(key):
     if key.endswith('error'):
         return 'E'
@@ -45,8 +179,7 @@ class GenericRawData(models.Model):
     json = models.TextField()
     routing_key = models.CharField(max_length=50, null=True,
                                    blank=True, db_index=True)
-    when = models.DecimalField(max_digits=20, decimal_places=6,
-                                               db_index=True)
+    when = TimestampField(db_index=True)
     publisher = models.CharField(max_length=100, null=True,
                                  blank=True, db_index=True)
     event = models.CharField(max_length=50, null=True,
@@ -70,12 +203,15 @@ class GenericRawData(models.Model):
     def uuid(self):
         return self.instance
 
+    def search_row(self, when, routing_key_status):
+        return [self.id, routing_key_status, str(when),
+                self.deployment.name, self.event, self.host,
+                self.instance, self.request_id]
+
     def search_results(self, results, when, routing_key_status):
         if not results:
             results = copy.deepcopy(self.result_titles)
-        results.append([self.id, routing_key_status, str(when),
-                        self.deployment.name, self.event, self.host,
-                        self.instance, self.request_id])
+        results.append(self.search_row(when, routing_key_status))
         return results
 
 
@@ -97,8 +233,7 @@ class RawData(models.Model):
     task = models.CharField(max_length=30, null=True,
                              blank=True, db_index=True)
     image_type = models.IntegerField(null=True, default=0, db_index=True)
-    when = models.DecimalField(max_digits=20, decimal_places=6,
-                                               db_index=True)
+    when = TimestampField(db_index=True)
     publisher = models.CharField(max_length=100, null=True,
                                  blank=True, db_index=True)
     event = models.CharField(max_length=50, null=True,
@@ -123,12 +258,15 @@ class RawData(models.Model):
     def get_name():
         return RawData.__name__
 
+    def search_row(self, when, routing_key_status):
+        return [self.id, routing_key_status, str(when),
+                self.deployment.name, self.event, self.host, self.state,
+                self.old_state, self.old_task]
+
     def search_results(self, results, when, routing_key_status):
         if not results:
             results = copy.deepcopy(self.result_titles)
-        results.append([self.id, routing_key_status, str(when),
-                        self.deployment.name, self.event, self.host, self.state,
-                        self.old_state, self.old_task])
+        results.append(self.search_row(when, routing_key_status))
         return results
 
 
@@ -140,6 +278,37 @@ class RawDataImageMeta(models.Model):
     rax_options = models.TextField(null=True, blank=True)
 
 
+class ReceivedMessage(models.Model):
+    """The message_ids of the notifications saved recently, so ones the
+    broker delivers again can be dropped. Kept for as long as the raws
+    are (see manage.py prune)."""
+    message_id = models.CharField(max_length=50, unique=True)
+    when = TimestampField(db_index=True)
+
+
+class EventName(models.Model):
+    """The event names seen in a service's raws (nova, glance or
+    generic) from each deployment, added as the raws are saved, so they
+    can be listed without scanning the raws."""
+    service = models.CharField(max_length=50)
+    deployment = models.ForeignKey(Deployment)
+    name = models.CharField(max_length=50)
+
+    class Meta:
+        unique_together = (('service', 'deployment', 'name'),)
+
+
+class HostName(models.Model):
+    """The hosts seen in a service's raws from each deployment, like
+    EventName."""
+    service = models.CharField(max_length=50)
+    deployment = models.ForeignKey(Deployment)
+    name = models.CharField(max_length=100)
+
+    class Meta:
+        unique_together = (('service', 'deployment', 'name'),)
+
+
 class Lifecycle(models.Model):
     """The Lifecycle table is the Master for a group of
     Timing detail records. There is one Lifecycle row for
@@ -159,8 +328,7 @@ class Lifecycle(models.Model):
 class InstanceUsage(models.Model):
     instance = models.CharField(max_length=50, null=True,
                                 blank=True, db_index=True)
-    launched_at = models.DecimalField(null=True, max_digits=20,
-                                      decimal_places=6, db_index=True)
+    launched_at = TimestampField(null=True, db_index=True)
     request_id =  models.CharField(max_length=50, null=True,
                                    blank=True, db_index=True)
     instance_type_id =  models.CharField(max_length=50,
@@ -208,10 +376,8 @@ class InstanceUsage(models.Model):
 class InstanceDeletes(models.Model):
     instance = models.CharField(max_length=50, null=True,
                                 blank=True, db_index=True)
-    launched_at = models.DecimalField(null=True, max_digits=20,
-                                      decimal_places=6, db_index=True)
-    deleted_at = models.DecimalField(null=True, max_digits=20,
-                                     decimal_places=6, db_index=True)
+    launched_at = TimestampField(null=True, db_index=True)
+    deleted_at = TimestampField(null=True, db_index=True)
     raw = models.ForeignKey(RawData, null=True)
 
     def deployment(self):
@@ -234,10 +400,8 @@ class InstanceReconcile(models.Model):
     row_updated = models.DateTimeField(auto_now=True)
     instance = models.CharField(max_length=50, null=True,
                                 blank=True, db_index=True)
-    launched_at = models.DecimalField(null=True, max_digits=20,
-                                      decimal_places=6, db_index=True)
-    deleted_at = models.DecimalField(null=True, max_digits=20,
-                                     decimal_places=6, db_index=True)
+    launched_at = TimestampField(null=True, db_index=True)
+    deleted_at = TimestampField(null=True, db_index=True)
     instance_type_id = models.CharField(max_length=50,
                                         null=True,
                                         blank=True,
@@ -285,15 +449,10 @@ class InstanceExists(models.Model):
 
     instance = models.CharField(max_length=50, null=True,
                                 blank=True, db_index=True)
-    launched_at = models.DecimalField(null=True, max_digits=20,
-                                      decimal_places=6, db_index=True)
-    deleted_at = models.DecimalField(null=True, max_digits=20,
-                                     decimal_places=6, db_index=True)
-    audit_period_beginning = models.DecimalField(null=True, max_digits=20,
-                                                 decimal_places=6,
-                                                 db_index=True)
-    audit_period_ending = models.DecimalField(null=True, max_digits=20,
-                                              decimal_places=6, db_index=True)
+    launched_at = TimestampField(null=True, db_index=True)
+    deleted_at = TimestampField(null=True, db_index=True)
+    audit_period_beginning = TimestampField(null=True, db_index=True)
+    audit_period_ending = TimestampField(null=True, db_index=True)
     message_id = models.CharField(max_length=50, null=True,
                                   blank=True, db_index=True)
     instance_type_id = models.CharField(max_length=50,
@@ -384,12 +543,29 @@ class Timing(models.Model):
     start_raw = models.ForeignKey(RawData, related_name='+', null=True)
     end_raw = models.ForeignKey(RawData, related_name='+', null=True)
 
-    start_when = models.DecimalField(null=True, max_digits=20,
-                                     decimal_places=6)
-    end_when = models.DecimalField(null=True, max_digits=20, decimal_places=6)
+    start_when = TimestampField(null=True)
+    end_when = TimestampField(null=True)
 
-    diff = models.DecimalField(null=True, max_digits=20, decimal_places=6,
-                               db_index=True)
+    diff = TimestampField(null=True, db_index=True)
+
+
+class TimingRollup(models.Model):
+    """The count, total, min and max of the diffs of an operation's
+    complete Timings, and a sketch of their distribution (see
+    rollups.QuantileSketch), for each deployment and hour. The worker
+    keeps them up to date, so summaries needn't read every Timing."""
+    name = models.CharField(max_length=50)
+    deployment = models.ForeignKey(Deployment)
+    # The start of the hour the Timings ended in.
+    bucket = TimestampField(db_index=True)
+    count = models.IntegerField(default=0)
+    total = TimestampField(default=0)
+    minimum = TimestampField(null=True)
+    maximum = TimestampField(null=True)
+    sketch = models.TextField(blank=True)
+
+    class Meta:
+        unique_together = (('name', 'deployment', 'bucket'),)
 
 
 class RequestTracker(models.Model):
@@ -399,9 +575,8 @@ class RequestTracker(models.Model):
     request_id = models.CharField(max_length=50, db_index=True)
     lifecycle = models.ForeignKey(Lifecycle)
     last_timing = models.ForeignKey(Timing, null=True, db_index=True)
-    start = models.DecimalField(max_digits=20, decimal_places=6, db_index=True)
-    duration = models.DecimalField(max_digits=20, decimal_places=6,
-                                   db_index=True)
+    start = TimestampField(db_index=True)
+    duration = TimestampField(db_index=True)
 
     # Not used ... but soon hopefully.
     completed = models.BooleanField(default=False, db_index=True)
@@ -412,7 +587,7 @@ class JsonReport(models.Model):
        via stacky/rest. All DateTimes are UTC."""
     period_start = models.DateTimeField(db_index=True)
     period_end = models.DateTimeField(db_index=True)
-    created = models.DecimalField(max_digits=20, decimal_places=6, db_index=True)
+    created = TimestampField(db_index=True)
     name = models.CharField(max_length=50, db_index=True)
     version = models.IntegerField(default=1)
     json = models.TextField()
@@ -458,7 +633,7 @@ class GlanceRawData(models.Model):
     json = models.TextField()
     routing_key = models.CharField(max_length=50, null=True, blank=True,
                                    db_index=True)
-    when = models.DecimalField(max_digits=20, decimal_places=6, db_index=True)
+    when = TimestampField(db_index=True)
     publisher = models.CharField(max_length=100, null=True,
                                  blank=True, db_index=True)
     event = models.CharField(max_length=50, null=True, blank=True,
@@ -481,19 +656,21 @@ class GlanceRawData(models.Model):
     def get_name():
         return GlanceRawData.__name__
 
+    def search_row(self, when, routing_key_status):
+        return [self.id, routing_key_status, str(when),
+                self.deployment.name, self.event, self.host,
+                self.status]
+
     def search_results(self, results, when, routing_key_status):
         if not results:
             results = copy.deepcopy(self.result_titles)
-        results.append([self.id, routing_key_status, str(when),
-                            self.deployment.name, self.event, self.host,
-                            self.status])
+        results.append(self.search_row(when, routing_key_status))
         return results
 
 
 class ImageUsage(models.Model):
     uuid = models.CharField(max_length=50, db_index=True)
-    created_at = models.DecimalField(max_digits=20,
-                                     decimal_places=6, db_index=True)
+    created_at = TimestampField(db_index=True)
     owner = models.CharField(max_length=50, db_index=True, null=True)
     size = models.BigIntegerField(max_length=20)
     last_raw = models.ForeignKey(GlanceRawData, null=True)
@@ -501,9 +678,7 @@ class ImageUsage(models.Model):
 
 class ImageDeletes(models.Model):
     uuid = models.CharField(max_length=50, db_index=True)
-    deleted_at = models.DecimalField(max_digits=20,
-                                     decimal_places=6, db_index=True,
-                                     null=True)
+    deleted_at = TimestampField(db_index=True, null=True)
     raw = models.ForeignKey(GlanceRawData, null=True)
 
     @staticmethod
@@ -533,22 +708,15 @@ class ImageExists(models.Model):
     ]
 
     uuid = models.CharField(max_length=50, db_index=True, null=True)
-    created_at = models.DecimalField(max_digits=20,
-                                     decimal_places=6, db_index=True,
-                                     null=True)
-    deleted_at = models.DecimalField(max_digits=20,
-                                     decimal_places=6, db_index=True,
-                                     null=True)
-    audit_period_beginning = models.DecimalField(max_digits=20,
-                                                 decimal_places=6,
-                                                 db_index=True)
-    audit_period_ending = models.DecimalField(max_digits=20,
-                                              decimal_places=6, db_index=True)
+    created_at = TimestampField(db_index=True, null=True)
+    deleted_at = TimestampField(db_index=True, null=True)
+    audit_period_beginning = TimestampField(db_index=True)
+    audit_period_ending = TimestampField(db_index=True)
     status = models.CharField(max_length=50, db_index=True,
                               choices=STATUS_CHOICES,
                               default=PENDING)
     fail_reason = models.CharField(max_length=300, null=True)
-    raw = models.ForeignKey(GlanceRawData, related_name='+')
+    raw = models.ForeignKey(GlanceRawData, related_name='+', null=True)
     usage = models.ForeignKey(ImageUsage, related_name='+', null=True)
     delete = models.ForeignKey(ImageDeletes, related_name='+', null=True)
     send_status = models.IntegerField(default=0, db_index=True)
@@ -74,19 +74,22 @@ class Notification(object):
     def message_id(self):
         return self.body.get('message_id', None)
 
+    def rawdata_values(self):
+        return dict(deployment=self.deployment,
+                    routing_key=self.routing_key,
+                    tenant=self.tenant,
+                    json=self.json,
+                    when=self.when,
+                    publisher=self.publisher,
+                    event=self.event,
+                    service=self.service,
+                    host=self.host,
+                    instance=self.instance,
+                    request_id=self.request_id,
+                    message_id=self.message_id)
+
     def save(self):
-        return db.create_generic_rawdata(deployment=self.deployment,
-                                         routing_key=self.routing_key,
-                                         tenant=self.tenant,
-                                         json=self.json,
-                                         when=self.when,
-                                         publisher=self.publisher,
-                                         event=self.event,
-                                         service=self.service,
-                                         host=self.host,
-                                         instance=self.instance,
-                                         request_id=self.request_id,
-                                         message_id=self.message_id)
+        return db.create_generic_rawdata(**self.rawdata_values())
 
 
 class GlanceNotification(Notification):
@@ -129,21 +132,24 @@ class GlanceNotification(Notification):
 
         return deleted_at and utils.str_time_to_unix(deleted_at)
 
+    def rawdata_values(self):
+        return dict(deployment=self.deployment,
+                    routing_key=self.routing_key,
+                    owner=self.owner,
+                    json=self.json,
+                    when=self.when,
+                    publisher=self.publisher,
+                    event=self.event,
+                    service=self.service,
+                    host=self.host,
+                    instance=self.instance,
+                    request_id=self.request_id,
+                    image_type=self.image_type,
+                    status=self.status,
+                    uuid=self.uuid)
+
     def save(self):
-        return db.create_glance_rawdata(deployment=self.deployment,
-                                        routing_key=self.routing_key,
-                                        owner=self.owner,
-                                        json=self.json,
-                                        when=self.when,
-                                        publisher=self.publisher,
-                                        event=self.event,
-                                        service=self.service,
-                                        host=self.host,
-                                        instance=self.instance,
-                                        request_id=self.request_id,
-                                        image_type=self.image_type,
-                                        status=self.status,
-                                        uuid=self.uuid)
+        return db.create_glance_rawdata(**self.rawdata_values())
 
     def save_exists(self, raw):
         if isinstance(self.payload, dict):
@@ -164,6 +170,7 @@ class GlanceNotification(Notification):
             audit_period_ending = None
             images = []
 
+        values_list = []
         for image in images:
             created_at = image['created_at']
             created_at = created_at and utils.str_time_to_unix(created_at)
@@ -181,19 +188,29 @@ class GlanceNotification(Notification):
                     'raw': raw,
                     'message_id': message_id
                 }
-                usage = db.get_image_usage(uuid=uuid)
-                values['usage'] = usage
                 values['created_at'] = created_at
                 if deleted_at:
-                    delete = db.get_image_delete(uuid=uuid)
-                    values['delete'] = delete
                     values['deleted_at'] = deleted_at
-
-                db.create_image_exists(**values)
+                values_list.append(values)
             else:
                 stacklog.warn("Ignoring exists without created_at. GlanceRawData(%s)"
                               % raw.id)
 
+        if not values_list:
+            return
+        # One owner can have thousands of images, so their usages and
+        # deletes are looked up together and the exists inserted in bulk.
+        usages = db.get_image_usages([exists['uuid']
+                                      for exists in values_list])
+        deleted = [exists['uuid'] for exists in values_list
+                   if 'deleted_at' in exists]
+        deletes = deleted and db.get_image_deletes(deleted) or {}
+        for values in values_list:
+            values['usage'] = usages.get(values['uuid'])
+            if 'deleted_at' in values:
+                values['delete'] = deletes.get(values['uuid'])
+        db.create_image_exists_batch(values_list)
+
     def save_usage(self, raw):
         values = {
             'uuid': self.uuid,
@@ -258,27 +275,30 @@ class NovaNotification(Notification):
         parts = self.publisher.split('.')
         return parts[0]
 
+    def rawdata_values(self):
+        return dict(deployment=self.deployment,
+                    routing_key=self.routing_key,
+                    tenant=self.tenant,
+                    json=self.json,
+                    when=self.when,
+                    publisher=self.publisher,
+                    event=self.event,
+                    service=self.service,
+                    host=self.host,
+                    instance=self.instance,
+                    request_id=self.request_id,
+                    image_type=self.image_type,
+                    state=self.state,
+                    old_state=self.old_state,
+                    task=self.task,
+                    old_task=self.old_task,
+                    os_architecture=self.os_architecture,
+                    os_distro=self.os_distro,
+                    os_version=self.os_version,
+                    rax_options=self.rax_options)
+
     def save(self):
-        return db.create_nova_rawdata(deployment=self.deployment,
-                                      routing_key=self.routing_key,
-                                      tenant=self.tenant,
-                                      json=self.json,
-                                      when=self.when,
-                                      publisher=self.publisher,
-                                      event=self.event,
-                                      service=self.service,
-                                      host=self.host,
-                                      instance=self.instance,
-                                      request_id=self.request_id,
-                                      image_type=self.image_type,
-                                      state=self.state,
-                                      old_state=self.old_state,
-                                      task=self.task,
-                                      old_task=self.old_task,
-                                      os_architecture=self.os_architecture,
-                                      os_distro=self.os_distro,
-                                      os_version=self.os_version,
-                                      rax_options=self.rax_options)
+        return db.create_nova_rawdata(**self.rawdata_values())
 
 
 def notification_factory(body, deployment, routing_key, json, exchange):
@@ -287,3 +307,25 @@ def notification_factory(body, deployment, routing_key, json, exchange):
     if exchange == "glance":
         return GlanceNotification(body, deployment, routing_key, json)
     return Notification(body, deployment, routing_key, json)
+
+
+def create_raw(values, exchange):
+    """Saves a raw from rawdata_values(), possibly altered."""
+    if exchange == 'nova':
+        return db.create_nova_rawdata(**values)
+    if exchange == "glance":
+        return db.create_glance_rawdata(**values)
+    return db.create_generic_rawdata(**values)
+
+
+def create_raws(values_list, exchange):
+    if exchange == 'nova':
+        return db.create_nova_rawdata_batch(values_list)
+    if exchange == "glance":
+        return db.create_glance_rawdata_batch(values_list)
+    return db.create_generic_rawdata_batch(values_list)
+
+
+def save_batch(notifications, exchange):
+    return create_raws([notif.rawdata_values() for notif in notifications],
+                       exchange)
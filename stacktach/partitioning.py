@@ -0,0 +1,210 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+# MySQL range partitioning of the raw tables on their `when` column, so
+# old raws can be dropped a partition at a time instead of deleted row
+# by row. Partitions are named after the day they start on (p20140301)
+# and hold the raws from then until the next partition starts. The last
+# partition, pmax, catches anything newer than that.
+#
+# MySQL doesn't allow foreign keys to or from a partitioned table, so
+# enabling partitioning drops those constraints. Django still treats
+# the columns as foreign keys. Before a partition is dropped, the
+# references to its raws are cleared: nullable foreign keys are set to
+# NULL and rows which can't exist without their raw (RawDataImageMeta)
+# are deleted.
+
+import calendar
+import datetime
+
+from django.db import models as django_models
+
+from stacktach import datetime_to_decimal as dt
+from stacktach import models
+
+RAW_MODELS = {
+    'RawData': models.RawData,
+    'GlanceRawData': models.GlanceRawData,
+    'GenericRawData': models.GenericRawData,
+}
+
+PERIODS = {'daily': 1, 'weekly': 7}
+
+MAX_PARTITION = 'pmax'
+
+
+def period_start(day, period_days):
+    """Weekly partitions start on a Monday."""
+    if period_days == 7:
+        return day - datetime.timedelta(days=day.weekday())
+    return day
+
+
+def bound(day):
+    """The value of `when` at midnight UTC on day, as partitioned on."""
+    seconds = calendar.timegm(day.timetuple())
+    if models.stores_microseconds():
+        return seconds * dt.MICROSECONDS
+    return seconds
+
+
+def bound_to_day(value):
+    value = int(value)
+    if models.stores_microseconds():
+        value = value // dt.MICROSECONDS
+    return datetime.datetime.utcfromtimestamp(value).date()
+
+
+def partition_name(day):
+    return 'p%s' % day.strftime('%Y%m%d')
+
+
+def _expression():
+    # RANGE partitioning needs an integer. A BIGINT column can be used
+    # as is, a DECIMAL one has to be rounded down.
+    if models.stores_microseconds():
+        return '`when`'
+    return 'FLOOR(`when`)'
+
+
+def _definitions(starts, period_days):
+    period = datetime.timedelta(days=period_days)
+    return ['PARTITION `%s` VALUES LESS THAN (%d)' %
+            (partition_name(start), bound(start + period))
+            for start in starts]
+
+
+def _starts(first, period_days, last):
+    starts = []
+    start = first
+    while start <= last:
+        starts.append(start)
+        start += datetime.timedelta(days=period_days)
+    return starts
+
+
+def references(model):
+    """The foreign key fields, on any stacktach model, pointing at model."""
+    fields = []
+    stacktach_models = [value for value in vars(models).values()
+                        if isinstance(value, type) and
+                        issubclass(value, django_models.Model)]
+    for other in sorted(stacktach_models, key=lambda m: m.__name__):
+        for field in other._meta.local_fields:
+            if (isinstance(field, django_models.ForeignKey) and
+                    field.rel.to is model):
+                fields.append((other, field))
+    return fields
+
+
+def foreign_key_constraints(cursor, table):
+    """The (table, constraint) names of the foreign keys to or from
+    table, which MySQL won't allow once it is partitioned."""
+    cursor.execute(
+        "SELECT DISTINCT TABLE_NAME, CONSTRAINT_NAME "
+        "FROM information_schema.KEY_COLUMN_USAGE "
+        "WHERE TABLE_SCHEMA = DATABASE() "
+        "AND REFERENCED_TABLE_NAME IS NOT NULL "
+        "AND (TABLE_NAME = %s OR REFERENCED_TABLE_NAME = %s) "
+        "ORDER BY TABLE_NAME, CONSTRAINT_NAME", [table, table])
+    return list(cursor.fetchall())
+
+
+def existing_partitions(cursor, table):
+    """The table's (name, upper bound) partitions, in order. The bound
+    of pmax is 'MAXVALUE'."""
+    cursor.execute(
+        "SELECT PARTITION_NAME, PARTITION_DESCRIPTION "
+        "FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s "
+        "AND PARTITION_NAME IS NOT NULL "
+        "ORDER BY PARTITION_ORDINAL_POSITION", [table])
+    return list(cursor.fetchall())
+
+
+def enable_sql(model, constraints, period_days, ahead_days, today):
+    """Partitions model's table. Everything up to the end of the current
+    period goes in the first partition, followed by partitions for the
+    next ahead_days and pmax. This rebuilds the table, so expect it to
+    take a while on a big one."""
+    table = model._meta.db_table
+    statements = ['ALTER TABLE `%s` DROP FOREIGN KEY `%s`' % constraint
+                  for constraint in constraints]
+    # Every unique key of a partitioned table must include the column
+    # it is partitioned on.
+    statements.append('ALTER TABLE `%s` DROP PRIMARY KEY, '
+                      'ADD PRIMARY KEY (`id`, `when`)' % table)
+    first = period_start(today, period_days)
+    last = today + datetime.timedelta(days=ahead_days)
+    definitions = _definitions(_starts(first, period_days, last),
+                               period_days)
+    definitions.append('PARTITION `%s` VALUES LESS THAN MAXVALUE' %
+                       MAX_PARTITION)
+    statements.append('ALTER TABLE `%s` PARTITION BY RANGE (%s) (%s)' %
+                      (table, _expression(), ', '.join(definitions)))
+    return statements
+
+
+def create_sql(model, partitions, period_days, ahead_days, today):
+    """Adds partitions, following on from the last one, until there is
+    one for ahead_days from today. Splitting the empty pmax is quick."""
+    table = model._meta.db_table
+    bounds = [int(description) for name, description in partitions
+              if description != 'MAXVALUE']
+    if not bounds:
+        raise ValueError("%s isn't partitioned" % table)
+
+    first = bound_to_day(max(bounds))
+    last = today + datetime.timedelta(days=ahead_days)
+    definitions = _definitions(_starts(first, period_days, last),
+                               period_days)
+    if not definitions:
+        return []
+
+    if MAX_PARTITION in [name for name, description in partitions]:
+        definitions.append('PARTITION `%s` VALUES LESS THAN MAXVALUE' %
+                           MAX_PARTITION)
+        return ['ALTER TABLE `%s` REORGANIZE PARTITION `%s` INTO (%s)' %
+                (table, MAX_PARTITION, ', '.join(definitions))]
+    return ['ALTER TABLE `%s` ADD PARTITION (%s)' %
+            (table, ', '.join(definitions))]
+
+
+def expired_partitions(partitions, cutoff):
+    """The partitions which only hold raws from before the day cutoff."""
+    cutoff_bound = bound(cutoff)
+    return [name for name, description in partitions
+            if description != 'MAXVALUE' and int(description) <= cutoff_bound]
+
+
+def drop_sql(model, partition):
+    """Clears the references to the raws in partition, then drops it."""
+    table = model._meta.db_table
+    statements = []
+    for other, field in references(model):
+        other_table = other._meta.db_table
+        join = ('`%s` JOIN `%s` PARTITION (`%s`) AS expired '
+                'ON `%s`.`%s` = expired.`id`' %
+                (other_table, table, partition, other_table, field.column))
+        if field.null:
+            statements.append('UPDATE %s SET `%s`.`%s` = NULL' %
+                              (join, other_table, field.column))
+        else:
+            statements.append('DELETE `%s` FROM %s' % (other_table, join))
+    statements.append('ALTER TABLE `%s` DROP PARTITION `%s`' %
+                      (table, partition))
+    return statements
@@ -0,0 +1,249 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+# Replays recorded notifications through the same code the worker uses
+# to save and post-process them, timing each one and counting its
+# queries, so ingest performance can be measured away from production.
+#
+# Recordings have a notification per line, either the json stored in a
+# raw's json column ([routing_key, body], possibly compressed) or just
+# the body as it came off the broker.
+
+import json
+import math
+import time
+
+from django.db import connection
+from django.db import transaction
+from django.db.models import Max
+
+from stacktach import db
+from stacktach import models
+from stacktach import notification
+from stacktach import utils
+from stacktach import views
+
+DEFAULT_ROUTING_KEY = 'monitor.info'
+
+# What duplicates dropped by dedup are reported as.
+DUPLICATE = '(duplicate)'
+
+# The raws recorded from each exchange, as the worker names them.
+EXCHANGE_MODELS = {
+    'nova': models.RawData,
+    'glance': models.GlanceRawData,
+}
+
+
+def read_messages(lines, routing_key=DEFAULT_ROUTING_KEY):
+    """Yields the (routing_key, body) of each recorded notification."""
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        key, body = utils.load_raw_json(line, routing_key)
+        yield key, body
+
+
+def export_lines(exchange, limit=None, after_id=0):
+    """Yields recorded notifications from exchange's raws, oldest first,
+    one json [routing_key, body] line each. Raws stored without their
+    payload are left out."""
+    model = EXCHANGE_MODELS.get(exchange, models.GenericRawData)
+    raws = model.objects.filter(id__gt=after_id).exclude(json='')\
+        .order_by('id')
+    if limit:
+        raws = raws[:limit]
+    for raw in raws.iterator():
+        yield json.dumps(list(utils.load_raw_json(raw.json,
+                                                  raw.routing_key)))
+
+
+def percentile(values, percent):
+    """The nearest-rank percentile of the sorted list values."""
+    if not values:
+        return 0.0
+    rank = int(math.ceil(percent / 100.0 * len(values))) - 1
+    return values[min(max(rank, 0), len(values) - 1)]
+
+
+class Stats(object):
+    """Latencies and query counts for one group of messages."""
+
+    def __init__(self):
+        self.latencies = []
+        self.queries = 0
+
+    def record(self, seconds, queries):
+        self.latencies.append(seconds)
+        self.queries += queries
+
+    def summary(self):
+        latencies = sorted(self.latencies)
+        count = len(latencies)
+        busy = sum(latencies)
+        return {'messages': count,
+                'msgs_per_sec': count / max(busy, 0.000001),
+                'p50_ms': percentile(latencies, 50) * 1000,
+                'p99_ms': percentile(latencies, 99) * 1000,
+                'queries_per_msg': self.queries / float(max(count, 1))}
+
+
+class Replayer(object):
+    """Saves and post-processes messages for one deployment, keeping
+    Stats per exchange and event type, and overall."""
+
+    def __init__(self, deployment, count_queries=True):
+        self.deployment = deployment
+        self.stats = {}
+        self.total = Stats()
+        self.elapsed = 0.0
+        if count_queries:
+            connection.use_debug_cursor = True
+
+    def _queries(self):
+        if connection.use_debug_cursor:
+            return len(connection.queries)
+        return 0
+
+    def _record(self, exchange, event, seconds, queries):
+        stats = self.stats.get((exchange, event))
+        if stats is None:
+            stats = self.stats[(exchange, event)] = Stats()
+        stats.record(seconds, queries)
+        self.total.record(seconds, queries)
+
+    def replay(self, exchange, messages, batch_size=1):
+        """Replays the (routing_key, body) messages. With a batch_size,
+        they're saved in batches like the worker does, and each message
+        is charged an equal share of its batch."""
+        started = time.time()
+        if batch_size > 1:
+            batch = []
+            for message in messages:
+                batch.append(message)
+                if len(batch) >= batch_size:
+                    self._replay_batch(exchange, batch)
+                    batch = []
+            if batch:
+                self._replay_batch(exchange, batch)
+        else:
+            for message in messages:
+                self._replay_one(exchange, message)
+        # As a worker does on its way out.
+        views.flush_rollups(force=True)
+        self.elapsed += time.time() - started
+
+    def _replay_one(self, exchange, args):
+        started = time.time()
+        # process_raw_data starts the query count afresh.
+        raw, notif = views.process_raw_data(self.deployment, args,
+                                            json.dumps(args), exchange)
+        if raw is None:
+            event = DUPLICATE
+        else:
+            views.POST_PROCESS_METHODS[raw.get_name()](raw, notif)
+            event = raw.event
+        self._record(exchange, event, time.time() - started,
+                     self._queries())
+
+    def _replay_batch(self, exchange, batch):
+        started = time.time()
+        results = views.process_raw_data_batch(
+            self.deployment, [(args, json.dumps(args)) for args in batch],
+            exchange)
+        for raw, notif in results:
+            views.POST_PROCESS_METHODS[raw.get_name()](raw, notif)
+        share = (time.time() - started) / len(batch)
+        queries = self._queries() / float(len(batch))
+        for raw, notif in results:
+            self._record(exchange, raw.event, share, queries)
+        for i in range(len(batch) - len(results)):
+            self._record(exchange, DUPLICATE, share, queries)
+
+    def report(self):
+        """The summary of every group, the total and the wall clock
+        rate, for comparing runs."""
+        groups = []
+        for (exchange, event), stats in sorted(self.stats.items()):
+            summary = stats.summary()
+            summary.update(exchange=exchange, event=event)
+            groups.append(summary)
+        total = self.total.summary()
+        total['wall_msgs_per_sec'] = (total['messages'] /
+                                      max(self.elapsed, 0.000001))
+        return {'groups': groups, 'total': total}
+
+
+def over_budget(report, budget):
+    """The groups in report whose queries per message are over their
+    event type's limit in the metrics.QueryBudget budget."""
+    return [group for group in report['groups']
+            if group['event'] != DUPLICATE and
+            budget.over(group['event'], group['queries_per_msg'])]
+
+
+def _raw_delete(query):
+    query._raw_delete(query.db)
+
+
+def time_ingest(deployment, exchange, messages, backend, batch_size=1):
+    """Seconds the ingest backend takes to write the raws for the
+    (routing_key, body) messages, without post-processing them. The raws
+    are deleted again afterwards, so each run starts from the same
+    tables."""
+    model = EXCHANGE_MODELS.get(exchange, models.GenericRawData)
+    notifs = [notification.notification_factory(body, deployment, key,
+                                                json.dumps([key, body]),
+                                                exchange)
+              for key, body in messages]
+    last_id = model.objects.aggregate(Max('id'))['id__max'] or 0
+    db.set_ingest_backend(backend)
+    try:
+        started = time.time()
+        if batch_size > 1:
+            for start in range(0, len(notifs), batch_size):
+                notification.save_batch(notifs[start:start + batch_size],
+                                        exchange)
+        else:
+            for notif in notifs:
+                notif.save()
+        return time.time() - started
+    finally:
+        with transaction.commit_on_success():
+            if model is models.RawData:
+                _raw_delete(models.RawDataImageMeta.objects.filter(
+                    raw__id__gt=last_id))
+            _raw_delete(model.objects.filter(id__gt=last_id))
+
+
+def format_report(report):
+    lines = ['%-10s %-45s %8s %10s %9s %9s %9s' %
+             ('exchange', 'event', 'msgs', 'msgs/s', 'p50 ms', 'p99 ms',
+              'queries')]
+    for group in report['groups']:
+        lines.append('%-10s %-45s %8d %10.1f %9.2f %9.2f %9.1f' %
+                     (group['exchange'], group['event'], group['messages'],
+                      group['msgs_per_sec'], group['p50_ms'],
+                      group['p99_ms'], group['queries_per_msg']))
+    total = report['total']
+    lines.append('%-10s %-45s %8d %10.1f %9.2f %9.2f %9.1f' %
+                 ('total', '', total['messages'], total['msgs_per_sec'],
+                  total['p50_ms'], total['p99_ms'],
+                  total['queries_per_msg']))
+    lines.append('%.1f msgs/s wall clock' % total['wall_msgs_per_sec'])
+    return '\n'.join(lines)
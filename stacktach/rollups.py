@@ -0,0 +1,164 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+# Rollups of how long each operation takes, a TimingRollup per operation
+# name, deployment and hour, which aggregate_lifecycle adds every
+# complete Timing to. Summaries over any number of hours and deployments
+# merge their rollups rather than reading the Timings.
+#
+# Percentiles come from a QuantileSketch, which counts durations in bins
+# whose bounds grow by a constant factor. Any quantile it gives is
+# within RELATIVE_ACCURACY of a duration that was added, and two
+# sketches merge by adding up their bins.
+
+import decimal
+import json
+import math
+
+BUCKET_SECONDS = 3600
+
+RELATIVE_ACCURACY = 0.01
+_GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+_LOG_GAMMA = math.log(_GAMMA)
+
+# The columns' precision. Anything shorter is counted as 0.
+_MIN_SECONDS = 0.000001
+
+
+def bucket_for(when):
+    """The start of the hour when, in seconds, is in."""
+    return when - when % BUCKET_SECONDS
+
+
+def percentile_rank(percent, count):
+    """The nearest-rank index of percent among count sorted values."""
+    rank = int(math.ceil(percent / 100.0 * count)) - 1
+    return min(max(rank, 0), count - 1)
+
+
+class QuantileSketch(object):
+    """Counts of durations in logarithmic bins. Bin i holds the
+    durations in (GAMMA ** (i - 1), GAMMA ** i]."""
+
+    def __init__(self, bins=None, zeros=0):
+        self.bins = bins or {}
+        self.zeros = zeros
+        self.count = zeros + sum(self.bins.values())
+
+    def add(self, seconds, count=1):
+        seconds = float(seconds)
+        if seconds < _MIN_SECONDS:
+            self.zeros += count
+        else:
+            index = int(math.ceil(math.log(seconds) / _LOG_GAMMA))
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.count += count
+
+    def merge(self, other):
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.zeros += other.zeros
+        self.count += other.count
+
+    def percentile(self, percent):
+        """The nearest-rank percentile of the durations added, or None
+        if there are none."""
+        if not self.count:
+            return None
+        rank = percentile_rank(percent, self.count)
+        seen = self.zeros
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if rank < seen:
+                # The middle of the bin, in relative terms.
+                return 2 * _GAMMA ** index / (_GAMMA + 1)
+
+    def dumps(self):
+        bins = dict((str(index), count)
+                    for index, count in self.bins.items())
+        return json.dumps({'zeros': self.zeros, 'bins': bins},
+                          sort_keys=True)
+
+    @classmethod
+    def loads(cls, text):
+        if not text:
+            return cls()
+        data = json.loads(text)
+        bins = dict((int(index), count)
+                    for index, count in data['bins'].items())
+        return cls(bins, data['zeros'])
+
+
+def merge_sketch(text, other):
+    """The dumped sketch text with the dumped sketch other merged into
+    it."""
+    sketch = QuantileSketch.loads(text)
+    sketch.merge(QuantileSketch.loads(other))
+    return sketch.dumps()
+
+
+def add(rollup, seconds):
+    """Adds a Timing's diff, in seconds, to rollup."""
+    sketch = QuantileSketch.loads(rollup.sketch)
+    sketch.add(seconds)
+    rollup.sketch = sketch.dumps()
+    rollup.count += 1
+    rollup.total += seconds
+    if rollup.minimum is None or seconds < rollup.minimum:
+        rollup.minimum = seconds
+    if rollup.maximum is None or seconds > rollup.maximum:
+        rollup.maximum = seconds
+
+
+class Summary(object):
+    """The rollups for one operation, merged."""
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.total = decimal.Decimal(0)
+        self.minimum = None
+        self.maximum = None
+        self.sketch = QuantileSketch()
+
+    def merge(self, rollup):
+        self.count += rollup.count
+        self.total += rollup.total
+        if self.minimum is None or rollup.minimum < self.minimum:
+            self.minimum = rollup.minimum
+        if self.maximum is None or rollup.maximum > self.maximum:
+            self.maximum = rollup.maximum
+        self.sketch.merge(QuantileSketch.loads(rollup.sketch))
+
+    def average(self):
+        return self.total / self.count
+
+
+def summarize(rollups):
+    """Merges rollups by operation name. Returns the Summary of each,
+    in name order."""
+    summaries = {}
+    for rollup in rollups:
+        if not rollup.count:
+            continue
+        summary = summaries.get(rollup.name)
+        if summary is None:
+            summary = summaries[rollup.name] = Summary(rollup.name)
+        summary.merge(rollup)
+    return [summaries[name] for name in sorted(summaries)]
@@ -0,0 +1,139 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+# The sql ingest backend, which writes nova and glance raws with
+# parameterized INSERTs on the connection's cursor rather than saving
+# model instances through the ORM.
+#
+# Post-processing needs each raw's id, which executemany can't hand back
+# on every database, so raws are inserted one statement each (with
+# RETURNING where the database has it). Their RawDataImageMeta rows only
+# need those ids, so they go in with a single executemany. The raws
+# handed back are built the way the ORM builds the rows it reads, from
+# their column values in order.
+
+from django.db import connection
+from django.db.models import AutoField
+from django.db.models import ForeignKey
+
+from stacktach import models
+
+
+class Table(object):
+    """The INSERT for a model's table, and how to get each of its
+    columns' values from the keyword arguments the model takes."""
+
+    def __init__(self, model):
+        self.model = model
+        self.fields = [field for field in model._meta.local_fields
+                       if not isinstance(field, AutoField)]
+        # Foreign keys hold the primary key of the row they point to.
+        self.prep_fields = [isinstance(field, ForeignKey) and
+                            field.rel.to._meta.pk or field
+                            for field in self.fields]
+        qn = connection.ops.quote_name
+        self.sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+            qn(model._meta.db_table),
+            ', '.join(qn(field.column) for field in self.fields),
+            ', '.join(['%s'] * len(self.fields)))
+        self.returning_sql = None
+        if connection.features.can_return_id_from_insert:
+            returning, params = connection.ops.return_insert_id()
+            self.returning_sql = '%s %s' % (
+                self.sql, returning % qn(model._meta.pk.column))
+
+    def row(self, values):
+        """The python value of every column in values, and the related
+        objects given for foreign keys."""
+        row = []
+        related = []
+        for field in self.fields:
+            if field.name in values:
+                value = values[field.name]
+            elif field.attname in values:
+                value = values[field.attname]
+            else:
+                value = field.get_default()
+            if isinstance(field, ForeignKey) and \
+                    isinstance(value, field.rel.to):
+                related.append((field, value))
+                value = value.pk
+            row.append(value)
+        return row, related
+
+    def params(self, row):
+        return [field.get_db_prep_save(value, connection)
+                for field, value in zip(self.prep_fields, row)]
+
+    def insert(self, cursor, row):
+        """Inserts the row and returns its id."""
+        if self.returning_sql:
+            cursor.execute(self.returning_sql, self.params(row))
+            return connection.ops.fetch_returned_insert_id(cursor)
+        cursor.execute(self.sql, self.params(row))
+        return connection.ops.last_insert_id(
+            cursor, self.model._meta.db_table, self.model._meta.pk.column)
+
+    def insert_many(self, cursor, rows):
+        cursor.executemany(self.sql, [self.params(row) for row in rows])
+
+    def instance(self, id, row, related):
+        """The saved model instance for a row inserted with id."""
+        # Keyword arguments, because positional ones are taken to have
+        # been read from the database (see models.TimestampField).
+        kwargs = dict(zip((field.attname for field in self.fields), row))
+        obj = self.model(id=id, **kwargs)
+        obj._state.adding = False
+        obj._state.db = connection.alias
+        for field, value in related:
+            setattr(obj, field.get_cache_name(), value)
+        return obj
+
+
+# Built when first used, once the connection's settings are known.
+_TABLES = {}
+
+
+def _table(model):
+    table = _TABLES.get(model)
+    if table is None:
+        table = _TABLES[model] = Table(model)
+    return table
+
+
+def insert_raws(model, values_list, imagemeta_list=None):
+    """Inserts model's raws, from the keyword arguments for each, and
+    returns them. imagemeta_list has the RawDataImageMeta arguments for
+    each nova raw, empty for those without any. Transactions are up to
+    the caller."""
+    raws = []
+    metas = []
+    table = _table(model)
+    if imagemeta_list is not None:
+        meta_table = _table(models.RawDataImageMeta)
+    cursor = connection.cursor()
+    for i, values in enumerate(values_list):
+        row, related = table.row(values)
+        id = table.insert(cursor, row)
+        raws.append(table.instance(id, row, related))
+        if imagemeta_list is not None and imagemeta_list[i]:
+            imagemeta = dict(imagemeta_list[i])
+            imagemeta['raw_id'] = id
+            metas.append(meta_table.row(imagemeta)[0])
+    if metas:
+        meta_table.insert_many(cursor, metas)
+    return raws
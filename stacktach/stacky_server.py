@@ -17,14 +17,19 @@
 from copy import deepcopy
 import decimal
 import datetime
+import itertools
 import json
 
 from django.db.models import Q
 from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
 
+import archive
+import cursors
 import datetime_to_decimal as dt
 import models
+import rollups
+import streaming
 import utils
 from django.core.exceptions import ObjectDoesNotExist, FieldError, ValidationError
 
@@ -41,8 +46,9 @@ def _get_limit(request):
     limit = request.GET.get('limit', DEFAULT_LIMIT)
     if limit:
         limit = int(limit)
-    if limit > HARD_LIMIT:
-        limit = HARD_LIMIT
+    hard_limit = streaming.hard_limit(request, HARD_LIMIT)
+    if limit > hard_limit:
+        limit = hard_limit
     return limit
 
 
@@ -60,9 +66,8 @@ def _get_query_range(request):
     return start, end
 
 
-def model_search(request, model, filters,
-                 related=False, order_by=None, excludes=None):
-
+def _model_query(model, filters, related=False, order_by=None,
+                 excludes=None):
     query = model
 
     if related:
@@ -82,12 +87,61 @@ def model_search(request, model, filters,
 
     if order_by:
         query = query.order_by(order_by)
+    return query
 
+
+def model_search(request, model, filters,
+                 related=False, order_by=None, excludes=None):
+    """A page of model's rows matching filters, by offset and limit or,
+    if the request has a cursor, the cursors.Page following it."""
+    query = _model_query(model, filters, related=related, order_by=order_by,
+                         excludes=excludes)
+    if 'cursor' in request.GET:
+        return cursors.page(query, model.model, order_by or 'id',
+                            request.GET['cursor'],
+                            _get_limit(request) or DEFAULT_LIMIT)
     start, end = _get_query_range(request)
     query = query[start:end]
     return query
 
 
+def archive_search(request, model, filters):
+    """Pages through the archived raws matching filters, then the ones
+    still in the database. The archived ones are older, so together they
+    are ordered by when. Pages by cursor, as model_search() does, if the
+    request has one."""
+    query = _model_query(model, filters, related=True)
+    if 'cursor' in request.GET:
+        return _archive_page(query, model.model, filters,
+                             request.GET['cursor'],
+                             _get_limit(request) or DEFAULT_LIMIT)
+
+    start, end = _get_query_range(request)
+    start = start or 0
+    page = []
+    archived = 0
+    for raw in archive.search(model.model, **filters):
+        if archived >= start:
+            page.append(raw)
+        archived += 1
+        if archived >= end:
+            break
+    db_start = max(start - archived, 0)
+    db_end = db_start + (end - start - len(page))
+    return page + list(query.order_by('when')[db_start:db_end])
+
+
+def _archive_page(query, model, filters, cursor, limit):
+    keyset = cursors.Keyset(model, 'when')
+    after = cursor and keyset.decode(cursor) or None
+    rows = list(itertools.islice(
+        archive.search(model, after=after, **filters), limit))
+    if len(rows) < limit:
+        rows.extend(cursors.page(query, model, 'when', cursor,
+                                 limit - len(rows)))
+    return cursors.Page(rows, keyset, limit)
+
+
 def _add_when_filters(request, filters):
     when_max = request.GET.get('when_max')
     if when_max:
@@ -98,23 +152,31 @@ def _add_when_filters(request, filters):
         filters['when__gte'] = decimal.Decimal(when_min)
 
 
-def get_event_names(service='nova'):
-    return _model_factory(service).values('event').distinct()
+def _raw_names(model, service, deployment=None):
+    """The names in model (EventName or HostName) for service, from
+    every deployment unless one is given."""
+    names = model.objects.filter(service=service)
+    if deployment:
+        names = names.filter(deployment=deployment)
+    return names.order_by('name').values_list('name', flat=True).distinct()
+
 
+def get_event_names(service='nova', deployment=None):
+    return [{'event': name}
+            for name in _raw_names(models.EventName, service, deployment)]
 
-def get_all_event_names():
+
+def get_all_event_names(deployment=None):
     services = ['nova', 'glance', 'generic']
     events = []
     for service in services:
-        events.extend(get_event_names(service))
+        events.extend(get_event_names(service, deployment))
     return events
 
-def get_host_names(service):
-    # TODO: We need to upgrade to Django 1.4 so we can get tenent id and
-    # host and just do distinct on host name.
-    # like: values('host', 'tenant_id').distinct('host')
-    # This will be more meaningful. Host by itself isn't really.
-    return _model_factory(service).values('host').distinct()
+
+def get_host_names(service, deployment=None):
+    return [{'host': name}
+            for name in _raw_names(models.HostName, service, deployment)]
 
 
 def routing_key_type(key):
@@ -168,6 +230,31 @@ def rsp(data, status=200, content_type="application/json"):
     return HttpResponse(data, content_type=content_type, status=status)
 
 
+def page_rsp(results, page):
+    """rsp() for results made from page, a model_search() result. When
+    paging by cursor, the cursor for the next page is sent in the
+    X-Next-Cursor header."""
+    response = rsp(json.dumps(results))
+    if isinstance(page, cursors.Page):
+        cursor = page.next_cursor()
+        if cursor:
+            response['X-Next-Cursor'] = cursor
+    return response
+
+
+def stream_rsp(request, header, page, row):
+    """The response streaming the table of header then row(obj) for each
+    of page's objects, as they're read, for requests asking for a
+    stream."""
+    try:
+        format = streaming.get_format(request)
+    except ValueError, e:
+        return error_response(400, 'Bad Request', str(e))
+    rows = (row(obj) for obj in streaming.iterate(page))
+    table = itertools.chain([header], rows)
+    return streaming.response(format, streaming.encode(format, table))
+
+
 def error_response(status, type, message):
     results = [["Error", "Message"], [type, message]]
     return rsp(json.dumps(results), status)
@@ -181,12 +268,26 @@ def do_deployments(request):
     return rsp(json.dumps(results))
 
 
+def _get_deployment(request):
+    deployment = request.GET.get('deployment')
+    if not deployment:
+        return None
+    try:
+        return int(deployment)
+    except ValueError:
+        raise ValueError("%s is not a deployment id" % deployment)
+
+
 def do_events(request):
     service = str(request.GET.get('service', 'all'))
+    try:
+        deployment = _get_deployment(request)
+    except ValueError, e:
+        return error_response(400, 'Bad Request', str(e))
     if service == 'all':
-        events = get_all_event_names()
+        events = get_all_event_names(deployment)
     else:
-        events = get_event_names(service=service)
+        events = get_event_names(service=service, deployment=deployment)
     results = [["Event Name"]]
     for event in events:
         results.append([event['event']])
@@ -195,7 +296,11 @@ def do_events(request):
 
 def do_hosts(request):
     service = str(request.GET.get('service', 'nova'))
-    hosts = get_host_names(service)
+    try:
+        deployment = _get_deployment(request)
+    except ValueError, e:
+        return error_response(400, 'Bad Request', str(e))
+    hosts = get_host_names(service, deployment)
     results = [["Host Name"]]
     for host in hosts:
         results.append([host['host']])
@@ -219,13 +324,19 @@ def do_uuid(request):
 
     _add_when_filters(request, filters)
 
-    related = model_search(request, model, filters,
-                           related=True, order_by='when')
+    if archive.enabled():
+        related = archive_search(request, model, filters)
+    else:
+        related = model_search(request, model, filters,
+                               related=True, order_by='when')
+    if streaming.requested(request):
+        return stream_rsp(request, model.model.result_titles[0],
+                          related, _search_row)
     for event in related:
         when = dt.dt_from_decimal(event.when)
         routing_key_status = routing_key_type(event.routing_key)
         result = event.search_results(result, when, routing_key_status)
-    return rsp(json.dumps(result))
+    return page_rsp(result, related)
 
 
 def do_timings_uuid(request):
@@ -258,48 +369,61 @@ def do_timings(request):
                            excludes=excludes, related=True,
                            order_by='diff')
 
-    results = [[name, "Time"]]
+    header = [name, "Time"]
+    if streaming.requested(request):
+        return stream_rsp(request, header, timings, _timing_row)
+    results = [header]
     for t in timings:
-        results.append([t.lifecycle.instance, sec_to_time(t.diff)])
-    return rsp(json.dumps(results))
+        results.append(_timing_row(t))
+    return page_rsp(results, timings)
+
+
+def _timing_row(timing):
+    return [timing.lifecycle.instance, sec_to_time(timing.diff)]
+
+
+def _get_percentiles(request):
+    percentiles = request.GET.get('percentiles')
+    if not percentiles:
+        return []
+    values = [float(value) for value in percentiles.split(',')]
+    for value in values:
+        if not 0 < value <= 100:
+            raise ValueError("%s is not a percentile" % value)
+    return values
 
 
 def do_summary(request):
-    events = get_event_names()
-    interesting = []
-    for e in events:
-        ev = e['event']
-        if ev.endswith('.start'):
-            interesting.append(ev[:-len('.start')])
-
-    results = [["Event", "N", "Min", "Max", "Avg"]]
-
-    for name in interesting:
-        model = models.Timing.objects
-        filters = {'name': name}
-        excludes = [
-            Q(start_raw=None) | Q(end_raw=None),
-            {'diff__lt': 0}
-        ]
-        timings = model_search(request, model, filters,
-                               excludes=excludes)
-        if not timings:
-            continue
+    """Count, min, max and average time of each operation, plus any
+    percentiles asked for, from the TimingRollups of the hours in the
+    end_when_min/end_when_max window."""
+    try:
+        percentiles = _get_percentiles(request)
+    except ValueError, e:
+        return error_response(400, 'Bad Request', str(e))
 
-        total, _min, _max = 0.0, None, None
-        num = len(timings)
-        for t in timings:
-            seconds = float(t.diff)
-            total += seconds
-            if _min is None:
-                _min = seconds
-            if _max is None:
-                _max = seconds
-            _min = min(_min, seconds)
-            _max = max(_max, seconds)
-
-        results.append([name, int(num), sec_to_time(_min),
-                        sec_to_time(_max), sec_to_time(int(total / num))])
+    filters = {}
+    if request.GET.get('end_when_min') is not None:
+        min_when = decimal.Decimal(request.GET['end_when_min'])
+        filters['bucket__gte'] = rollups.bucket_for(min_when)
+    if request.GET.get('end_when_max') is not None:
+        filters['bucket__lte'] = decimal.Decimal(request.GET['end_when_max'])
+    if request.GET.get('deployment') is not None:
+        filters['deployment'] = int(request.GET['deployment'])
+
+    header = ["Event", "N", "Min", "Max", "Avg"]
+    header.extend("p%g" % percent for percent in percentiles)
+    results = [header]
+    summaries = rollups.summarize(models.TimingRollup.objects
+                                  .filter(**filters).iterator())
+    for summary in summaries:
+        row = [summary.name, summary.count,
+               sec_to_time(float(summary.minimum)),
+               sec_to_time(float(summary.maximum)),
+               sec_to_time(int(summary.average()))]
+        for percent in percentiles:
+            row.append(sec_to_time(summary.sketch.percentile(percent)))
+        results.append(row)
     return rsp(json.dumps(results))
 
 
@@ -313,14 +437,21 @@ def do_request(request):
     filters = {'request_id': request_id}
     _add_when_filters(request, filters)
     events = model_search(request, model, filters, order_by='when')
-    results = [["#", "?", "When", "Deployment", "Event", "Host",
-                "State", "State'", "Task'"]]
+    header = ["#", "?", "When", "Deployment", "Event", "Host",
+              "State", "State'", "Task'"]
+    if streaming.requested(request):
+        return stream_rsp(request, header, events, _request_row)
+    results = [header]
     for e in events:
-        when = dt.dt_from_decimal(e.when)
-        results.append([e.id, routing_key_type(e.routing_key), str(when),
-                        e.deployment.name, e.event, e.host, e.state,
-                        e.old_state, e.old_task])
-    return rsp(json.dumps(results))
+        results.append(_request_row(e))
+    return page_rsp(results, events)
+
+
+def _request_row(e):
+    when = dt.dt_from_decimal(e.when)
+    return [e.id, routing_key_type(e.routing_key), str(when),
+            e.deployment.name, e.event, e.host, e.state,
+            e.old_state, e.old_task]
 
 
 def append_nova_raw_attributes(event, results):
@@ -383,6 +514,17 @@ def _append_raw_attributes(event, results, service):
         return append_generic_raw_attributes(event, results)
 
 
+def _get_event(model, event_id):
+    try:
+        return model.get(id=event_id)
+    except ObjectDoesNotExist:
+        if archive.enabled():
+            event = archive.get(model.model, event_id)
+            if event is not None:
+                return event
+        raise
+
+
 def do_show(request, event_id):
     service = str(request.GET.get('service', 'nova'))
     event_id = int(event_id)
@@ -390,10 +532,10 @@ def do_show(request, event_id):
     results = []
     model = _model_factory(service)
     try:
-        event = model.get(id=event_id)
+        event = _get_event(model, event_id)
         results = _append_raw_attributes(event, results, service)
         final = [results, ]
-        j = json.loads(event.json)
+        j = list(utils.load_raw_json(event.json, event.routing_key))
         final.append(json.dumps(j, indent=2))
         final.append(event.uuid)
         return rsp(json.dumps(final))
@@ -422,7 +564,7 @@ def do_watch(request, deployment_id):
     for d in get_deployments():
         deployment_map[d.id] = d
     events = get_event_names()
-    max_event_width = max([len(event['event']) for event in events])
+    max_event_width = max([len(event['event']) for event in events] or [0])
 
     base_events = model.order_by('when')
     if deployment_id > 0:
@@ -508,15 +650,22 @@ def do_jsonreports(request):
         'created__lte': _to
     }
     reports = model_search(request, model, filters)
-    results = [['Id', 'Start', 'End', 'Created', 'Name', 'Version']]
+    header = ['Id', 'Start', 'End', 'Created', 'Name', 'Version']
+    if streaming.requested(request):
+        return stream_rsp(request, header, reports, _jsonreport_row)
+    results = [header]
     for report in reports:
-        results.append([report.id,
-                        float(dt.dt_to_decimal(report.period_start)),
-                        float(dt.dt_to_decimal(report.period_end)),
-                        float(report.created),
-                        report.name,
-                        report.version])
-    return rsp(json.dumps(results))
+        results.append(_jsonreport_row(report))
+    return page_rsp(results, reports)
+
+
+def _jsonreport_row(report):
+    return [report.id,
+            float(dt.dt_to_decimal(report.period_start)),
+            float(dt.dt_to_decimal(report.period_end)),
+            float(report.created),
+            report.name,
+            report.version]
 
 
 def do_jsonreport(request, report_id):
@@ -536,11 +685,14 @@ def search(request):
     try:
 
         events = model_search(request, model, filters, order_by='-when')
+        if streaming.requested(request):
+            return stream_rsp(request, model.model.result_titles[0],
+                              events, _search_row)
         for event in events:
             when = dt.dt_from_decimal(event.when)
             routing_key_status = routing_key_type(event.routing_key)
             results = event.search_results(results, when, routing_key_status)
-        return rsp(json.dumps(results))
+        return page_rsp(results, events)
     except ObjectDoesNotExist:
         return error_response(404, 'Not Found', ["The requested object does not exist"])
     except FieldError:
@@ -548,6 +700,11 @@ def search(request):
                     "Note: The field names of database are case-sensitive." % field)
 
 
+def _search_row(event):
+    when = dt.dt_from_decimal(event.when)
+    return event.search_row(when, routing_key_type(event.routing_key))
+
+
 class BadRequestException(Exception):
     pass
 
@@ -604,6 +761,8 @@ def _create_query_filters(request):
     request_filters = deepcopy(request.GET)
     request_filters.pop('limit', None)
     request_filters.pop('offset', None)
+    request_filters.pop('cursor', None)
+    request_filters.pop('stream', None)
 
     _check_if_fields_searchable(request_filters)
     return _parse_fields_and_create_query_filters(request_filters)
@@ -615,21 +774,25 @@ def do_jsonreports_search(request):
         filters = _create_query_filters(request)
         reports = model_search(request, model.objects, filters,
                                order_by='-id')
-        results = [['Id', 'Start', 'End', 'Created', 'Name', 'Version']]
+        header = ['Id', 'Start', 'End', 'Created', 'Name', 'Version']
+        if streaming.requested(request):
+            return stream_rsp(request, header, reports, _jsonreport_search_row)
+        results = [header]
         for report in reports:
-                results.append([report.id,
-                                datetime.datetime.strftime(
-                                    report.period_start, UTC_FORMAT),
-                                datetime.datetime.strftime(
-                                    report.period_end, UTC_FORMAT),
-                                datetime.datetime.strftime(
-                                    dt.dt_from_decimal(report.created),
-                                    UTC_FORMAT),
-                                report.name,
-                                report.version])
+            results.append(_jsonreport_search_row(report))
     except BadRequestException as be:
         return error_response(400, 'Bad Request', str(be))
     except ValidationError as ve:
         return error_response(400, 'Bad Request', ve.messages[0])
 
-    return rsp(json.dumps(results))
+    return page_rsp(results, reports)
+
+
+def _jsonreport_search_row(report):
+    return [report.id,
+            datetime.datetime.strftime(report.period_start, UTC_FORMAT),
+            datetime.datetime.strftime(report.period_end, UTC_FORMAT),
+            datetime.datetime.strftime(dt.dt_from_decimal(report.created),
+                                       UTC_FORMAT),
+            report.name,
+            report.version]
@@ -0,0 +1,164 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+# Streamed responses, for listings too big to build in memory. A request
+# asks for one with stream=json, for the same document the listing would
+# otherwise return, or stream=ndjson, for one JSON value per line. The
+# rows are read a chunk at a time, by keyset where the ordering allows
+# (see cursors.read_in_chunks), and encoded and sent as they're read,
+# so neither django nor the database driver holds them all at once.
+#
+# The response has started by the time the rows are read, so anything
+# that can fail a request has to be checked before streaming.
+
+import json
+
+from django.db.models.query import QuerySet
+from django.http import StreamingHttpResponse
+
+from stacktach import cursors
+
+JSON = 'json'
+NDJSON = 'ndjson'
+
+CONTENT_TYPES = {
+    JSON: 'application/json',
+    NDJSON: 'application/x-ndjson',
+}
+
+# The most rows a streamed listing returns, in place of the usual limit.
+HARD_LIMIT = 100000
+
+# Encoded rows are sent in chunks of about this many bytes.
+CHUNK_SIZE = 64 * 1024
+
+
+def requested(request):
+    return bool(request.GET.get('stream'))
+
+
+def get_format(request):
+    """The stream format the request asks for, or None. Raises
+    ValueError for formats there's no such thing as."""
+    format = request.GET.get('stream')
+    if not format:
+        return None
+    if format not in CONTENT_TYPES:
+        raise ValueError("stream must be one of %s." %
+                         ', '.join(sorted(CONTENT_TYPES)))
+    return format
+
+
+def hard_limit(request, limit):
+    """The hard limit on the rows in a listing, which is HARD_LIMIT
+    rather than limit when they're streamed."""
+    if requested(request):
+        return HARD_LIMIT
+    return limit
+
+
+def _keyset_for(query):
+    """The cursors.Keyset of query's ordering, or None if it isn't
+    ordered by one of the model's own fields."""
+    order_by = query.query.order_by
+    if not order_by:
+        order_by = query.model._meta.ordering or ['id']
+    if len(order_by) != 1 or not isinstance(order_by[0], basestring):
+        return None
+    try:
+        return cursors.Keyset(query.model, order_by[0])
+    except cursors.InvalidCursor:
+        return None
+
+
+def _read_by_offset(query, size):
+    low, high = query.query.low_mark, query.query.high_mark
+    start = 0
+    while high is None or low + start < high:
+        count = 0
+        for row in query[start:start + size]:
+            count += 1
+            yield row
+        if count < size:
+            return
+        start += size
+
+
+def iterate(objects):
+    """Iterates objects, reading the rows of QuerySets and
+    cursors.Pages cursors.ITERATOR_CHUNK_SIZE at a time."""
+    if isinstance(objects, cursors.Page):
+        return objects.iterator()
+    if isinstance(objects, QuerySet):
+        keyset = _keyset_for(objects)
+        if keyset is None:
+            return _read_by_offset(objects, cursors.ITERATOR_CHUNK_SIZE)
+        return cursors.read_in_chunks(objects, keyset)
+    return iter(objects)
+
+
+def json_list(items, key=None, trailer=None):
+    """Encodes a JSON list of items, bit by bit. With a key, the list is
+    that key's value in an object, which also gets the keys of the dict
+    trailer() returns once the items have all been encoded."""
+    if key is not None:
+        yield '{%s: ' % json.dumps(key)
+    yield '['
+    separator = ''
+    for item in items:
+        yield separator
+        yield json.dumps(item)
+        separator = ', '
+    yield ']'
+    if key is not None:
+        if trailer is not None:
+            for name, value in sorted(trailer().items()):
+                yield ', %s: %s' % (json.dumps(name), json.dumps(value))
+        yield '}'
+
+
+def ndjson(items):
+    for item in items:
+        yield json.dumps(item)
+        yield '\n'
+
+
+def encode(format, items):
+    """Encodes items as a JSON list, or as NDJSON."""
+    if format == NDJSON:
+        return ndjson(items)
+    return json_list(items)
+
+
+def _chunked(parts):
+    chunk = []
+    size = 0
+    for part in parts:
+        chunk.append(part)
+        size += len(part)
+        if size >= CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk = []
+            size = 0
+    if chunk:
+        yield ''.join(chunk)
+
+
+def response(format, parts):
+    """A StreamingHttpResponse of the encoded parts, in format."""
+    return StreamingHttpResponse(_chunked(parts),
+                                 content_type=CONTENT_TYPES[format])
@@ -36,6 +36,7 @@ web_urls = (
         'stacktach.views.latest_raw', name='latest_raw'),
     url(r'^(?P<deployment_id>\d+)/instance_status/$',
         'stacktach.views.instance_status', name='instance_status'),
+    url(r'^metrics/$', 'stacktach.metrics.scrape', name='metrics'),
 )
 
 stacky_urls = (
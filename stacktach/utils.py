@@ -14,13 +14,85 @@
 # KIND, either express or implied.  See the License for the
 # specific language governing permissions and limitations
 # under the License.
+import base64
+import calendar
 import datetime
+import decimal
+import json
+import re
 import uuid
+import zlib
 
 from stacktach import datetime_to_decimal as dt
 
 
+# The OpenStack timestamp shapes str_time_to_unix sees almost all of the
+# time. Anything else goes through the strptime formats below.
+_TIME_RE = re.compile(r'(\d{4})-(\d{2})-(\d{2})([T ])(\d{2}):(\d{2}):(\d{2})'
+                      r'(?:\.(\d{1,6}))?(Z?)$')
+_DECIMAL_CONTEXT = decimal.Context(prec=30)
+_MICROSECONDS = decimal.Decimal("1000000.0")
+
+# Recently parsed timestamps. Audit period bounds and the like repeat a
+# lot, so this is emptied when it fills up rather than tracking usage.
+_PARSED_TIMES = {}
+_MAX_PARSED_TIMES = 1000
+
+
 def str_time_to_unix(when):
+    parsed = _PARSED_TIMES.get(when)
+    if parsed is None:
+        parsed = _parse_time(when)
+        if parsed is None:
+            parsed = _strptime_time_to_unix(when)
+        if len(_PARSED_TIMES) >= _MAX_PARSED_TIMES:
+            _PARSED_TIMES.clear()
+        _PARSED_TIMES[when] = parsed
+    return parsed
+
+
+def _parse_time(when):
+    """Parses the timestamp without strptime, returning the same decimal
+    dt.dt_to_decimal would, or None if it isn't one of the usual shapes.
+    """
+    match = _TIME_RE.match(when)
+    if match is None:
+        return None
+    (year, month, day, separator, hour, minute, second,
+     fraction, zulu) = match.groups()
+
+    # Only accept what the matching strptime formats would.
+    if 'Z' in when:
+        if separator != 'T' or not zulu:
+            return None
+    elif 'T' in when:
+        if separator != 'T':
+            return None
+    elif separator != ' ':
+        return None
+
+    microsecond = 0
+    if fraction:
+        microsecond = int(fraction.ljust(6, '0'))
+    try:
+        utc = datetime.datetime(int(year), int(month), int(day), int(hour),
+                                int(minute), int(second), microsecond)
+    except ValueError:
+        return None
+    seconds = calendar.timegm(utc.utctimetuple())
+    if seconds < 0:
+        return _DECIMAL_CONTEXT.add(
+            decimal.Decimal(str(seconds)),
+            _DECIMAL_CONTEXT.divide(decimal.Decimal(str(microsecond)),
+                                    _MICROSECONDS))
+    # Same digits and exponent as the sum above, without the arithmetic.
+    if not microsecond:
+        return decimal.Decimal(str(seconds))
+    return decimal.Decimal("%d.%s" % (seconds,
+                                      ("%06d" % microsecond).rstrip('0')))
+
+
+def _strptime_time_to_unix(when):
     if 'Z' in when:
         when = _try_parse(when, ["%Y-%m-%dT%H:%M:%SZ", "%Y-%m-%dT%H:%M:%S.%fZ"])
     elif 'T' in when:
@@ -45,6 +117,44 @@ def _try_parse(when, formats):
     print "Bad DATE ", last_exception
 
 
+# Compressed json columns hold this marker followed by the base64 of the
+# zlib compressed json. json never starts with a letter, so anything
+# without the marker is stored as is.
+COMPRESSED_JSON_PREFIX = 'z1:'
+
+
+def compress_raw_json(raw_json):
+    if raw_json.startswith(COMPRESSED_JSON_PREFIX):
+        return raw_json
+    if isinstance(raw_json, unicode):
+        raw_json = raw_json.encode('utf-8')
+    return COMPRESSED_JSON_PREFIX + base64.b64encode(zlib.compress(raw_json))
+
+
+def decompress_raw_json(stored_json):
+    """Returns the json text of a raw's json column, compressed or not."""
+    if not stored_json.startswith(COMPRESSED_JSON_PREFIX):
+        return stored_json
+    compressed = base64.b64decode(stored_json[len(COMPRESSED_JSON_PREFIX):])
+    return zlib.decompress(compressed).decode('utf-8')
+
+
+def load_raw_json(raw_json, routing_key=None):
+    """Returns the (routing_key, body) pair kept in a raw's json column.
+
+    Rows are stored either as the json encoded [routing_key, body] list or,
+    when the worker keeps the original message, as the broker body alone.
+    In the latter case the routing key comes from the raw's own column.
+    Either can be compressed, see compress_raw_json. Raws stored without
+    their payload (see ingest_policy) have an empty body."""
+    if not raw_json:
+        return routing_key, {}
+    loaded = json.loads(decompress_raw_json(raw_json))
+    if isinstance(loaded, list):
+        return loaded[0], loaded[1]
+    return routing_key, loaded
+
+
 def is_uuid_like(val):
     try:
         converted = str(uuid.UUID(val))
@@ -16,21 +16,174 @@
 # under the License.
 
 import datetime
-import json
 import pprint
+import threading
+import time
 
 from django import db
+from django.db import DatabaseError
+from django.db import IntegrityError
+from django.db import transaction
 from django.shortcuts import render_to_response
 
+from stacktach import cache
 from stacktach import datetime_to_decimal as dt
 from stacktach import db as stackdb
+from stacktach import ingest_policy
+from stacktach import metrics
 from stacktach import models
+from stacktach import rollups
 from stacktach import stacklog
 from stacktach import utils
 from stacktach import notification
 
 STACKDB = stackdb
 
+# Per-process cache of instance -> Lifecycle and (instance, operation)
+# -> open Timing for aggregate_lifecycle. Only safe when this process
+# is the only one handling events for the instances it sees.
+LIFECYCLE_CACHE = None
+
+
+def enable_lifecycle_cache(max_size):
+    global LIFECYCLE_CACHE
+    if max_size > 0:
+        LIFECYCLE_CACHE = cache.LRUCache(max_size)
+    else:
+        LIFECYCLE_CACHE = None
+
+# Per-process index of the request_ids with a RequestTracker, so
+# update_kpi can skip the lookup for requests that aren't tracked.
+KPI_INDEX = None
+
+
+def _load_request_trackers(last_id, since):
+    return STACKDB.find_new_request_trackers(last_id, since)
+
+
+def enable_kpi_index(ttl):
+    global KPI_INDEX
+    if ttl > 0:
+        KPI_INDEX = cache.ExpiringIndex(_load_request_trackers, ttl)
+    else:
+        KPI_INDEX = None
+
+
+# Per-process set of the message_ids saved recently, in front of the
+# ReceivedMessage table, so notifications the broker delivers again are
+# dropped before anything is written.
+RECENT_MESSAGES = None
+
+
+def enable_dedup(max_size):
+    global RECENT_MESSAGES
+    if max_size > 0:
+        RECENT_MESSAGES = cache.LRUCache(max_size)
+    else:
+        RECENT_MESSAGES = None
+
+
+# Per-process TimingRollups of the Timings completed since they were
+# last written, by (name, deployment_id, bucket). aggregate_lifecycle
+# adds to them and flush_rollups() writes them, so an .end event costs
+# no rollup queries, and workers queue on each hour's row once a flush
+# rather than once a Timing. The post-processing lanes share them.
+PENDING_ROLLUPS = {}
+PENDING_ROLLUPS_LOCK = threading.Lock()
+
+# How often, in seconds, flush_rollups() writes the pending rollups.
+ROLLUP_FLUSH_SECONDS = 10
+_rollups_flushed_at = [time.time()]
+
+
+def _add_rollup(name, deployment_id, end_when, diff):
+    key = (name, deployment_id, rollups.bucket_for(end_when))
+    with PENDING_ROLLUPS_LOCK:
+        rollup = PENDING_ROLLUPS.get(key)
+        if rollup is None:
+            rollup = PENDING_ROLLUPS[key] = models.TimingRollup(
+                name=name, deployment_id=deployment_id, bucket=key[2])
+        rollups.add(rollup, diff)
+
+
+def flush_rollups(force=False):
+    """Writes the pending TimingRollups, if ROLLUP_FLUSH_SECONDS have
+    passed since they were last written, or force."""
+    now = time.time()
+    if not force and now - _rollups_flushed_at[0] < ROLLUP_FLUSH_SECONDS:
+        return
+    _rollups_flushed_at[0] = now
+    with PENDING_ROLLUPS_LOCK:
+        pending = PENDING_ROLLUPS.values()
+        PENDING_ROLLUPS.clear()
+    if not pending:
+        return
+    try:
+        STACKDB.add_timing_rollups(pending)
+    except DatabaseError, e:
+        # The rollups are only for stacky's summary, and manage.py
+        # rollup_timings can rebuild them, so they aren't kept for
+        # another try.
+        log_warn("Couldn't add %d pending TimingRollups: %s" %
+                 (len(pending), e))
+
+
+# How much of each event type is stored, see ingest_policy. None
+# stores everything in full.
+INGEST_POLICY = None
+
+
+def enable_ingest_policy(policies, window=60):
+    global INGEST_POLICY
+    if policies:
+        INGEST_POLICY = ingest_policy.IngestPolicy(policies, window)
+    else:
+        INGEST_POLICY = None
+
+
+# Per-process set of the event names and hosts this process has added
+# to the EventName and HostName tables, so only the first raw with each
+# costs a query.
+RAW_NAMES_CACHE_SIZE = 10000
+RAW_NAMES = cache.LRUCache(RAW_NAMES_CACHE_SIZE)
+
+# The service each exchange's names are listed under by stacky.
+RAW_NAME_SERVICES = {
+    'nova': 'nova',
+    'glance': 'glance',
+}
+
+
+def _record_names(raws, exchange):
+    service = RAW_NAME_SERVICES.get(exchange, 'generic')
+    for raw in raws:
+        for Model, name in ((models.EventName, raw.event),
+                            (models.HostName, raw.host)):
+            if not name:
+                continue
+            key = (Model.__name__, service, raw.deployment_id, name)
+            if key in RAW_NAMES:
+                continue
+            STACKDB.add_raw_name(Model, service, raw.deployment_id, name)
+            RAW_NAMES.put(key, True)
+
+
+def _save(notif, exchange):
+    if INGEST_POLICY is None:
+        return notif.save()
+    return INGEST_POLICY.save(notif, exchange)
+
+
+def _save_batch(notifs, exchange):
+    if INGEST_POLICY is None:
+        return notification.save_batch(notifs, exchange)
+    return INGEST_POLICY.save_batch(notifs, exchange)
+
+
+def _count_duplicates(exchange, count=1):
+    metrics.incr('stacktach_duplicate_messages_total',
+                 labels={'exchange': exchange}, value=count)
+
 
 def log_warn(msg):
     global LOG
@@ -46,6 +199,10 @@ def start_kpi_tracking(lifecycle, raw):
     if raw.event != "compute.instance.update":
         return
 
+    # Coalesced into a raw whose tracker was started when it was saved.
+    if getattr(raw, 'coalesced', False) is True:
+        return
+
     if "api" not in raw.service:
         return
 
@@ -55,6 +212,8 @@ def start_kpi_tracking(lifecycle, raw):
                                              last_timing=None,
                                              duration=str(0.0))
     STACKDB.save(tracker)
+    if KPI_INDEX is not None:
+        KPI_INDEX.add(raw.request_id, raw.when)
 
 
 def update_kpi(timing, raw):
@@ -68,6 +227,9 @@ def update_kpi(timing, raw):
 
     Until then, we'll take the lazy route and be aware of these
     potential fence-post issues."""
+    if KPI_INDEX is not None and not KPI_INDEX.might_contain(raw.request_id):
+        return
+
     trackers = STACKDB.find_request_trackers(request_id=raw.request_id)
     if len(trackers) == 0:
         return
@@ -94,15 +256,20 @@ def aggregate_lifecycle(raw):
     # While we hope only one lifecycle ever exists it's quite
     # likely we get multiple due to the workers and threads.
     lifecycle = None
-    lifecycles = STACKDB.find_lifecycles(instance=raw.instance)
-    if len(lifecycles) > 0:
-        lifecycle = lifecycles[0]
+    if LIFECYCLE_CACHE is not None:
+        lifecycle = LIFECYCLE_CACHE.get(raw.instance)
+    if not lifecycle:
+        lifecycles = STACKDB.find_lifecycles(instance=raw.instance)
+        if len(lifecycles) > 0:
+            lifecycle = lifecycles[0]
     if not lifecycle:
         lifecycle = STACKDB.create_lifecycle(instance=raw.instance)
     lifecycle.last_raw = raw
     lifecycle.last_state = raw.state
     lifecycle.last_task_state = raw.old_task
     STACKDB.save(lifecycle)
+    if LIFECYCLE_CACHE is not None:
+        LIFECYCLE_CACHE.put(raw.instance, lifecycle)
 
     event = raw.event
     parts = event.split('.')
@@ -124,16 +291,20 @@ def aggregate_lifecycle(raw):
     # *shouldn't* happen).
     start = step == 'start'
     timing = None
-    timings = STACKDB.find_timings(name=name, lifecycle=lifecycle)
+    timing_key = (raw.instance, name)
     if not start:
-        for t in timings:
-            try:
-                if t.end_raw == None and t.start_raw != None:
-                    timing = t
-                    break
-            except models.RawData.DoesNotExist:
-                # Our raw data was removed.
-                pass
+        if LIFECYCLE_CACHE is not None:
+            timing = LIFECYCLE_CACHE.pop(timing_key)
+        if timing is None:
+            timings = STACKDB.find_timings(name=name, lifecycle=lifecycle)
+            for t in timings:
+                try:
+                    if t.end_raw == None and t.start_raw != None:
+                        timing = t
+                        break
+                except models.RawData.DoesNotExist:
+                    # Our raw data was removed.
+                    pass
 
     if timing is None:
         timing = STACKDB.create_timing(name=name, lifecycle=lifecycle)
@@ -161,6 +332,10 @@ def aggregate_lifecycle(raw):
             # Looks like a valid pair ...
             update_kpi(timing, raw)
     STACKDB.save(timing)
+    if start and LIFECYCLE_CACHE is not None:
+        LIFECYCLE_CACHE.put(timing_key, timing)
+    if not start and timing.start_when and timing.diff >= 0:
+        _add_rollup(name, raw.deployment_id, timing.end_when, timing.diff)
 
 
 INSTANCE_EVENT = {
@@ -378,16 +553,101 @@ def aggregate_glance_usage(raw, body):
 
 
 def process_raw_data(deployment, args, json_args, exchange):
-    """This is called directly by the worker to add the event to the db."""
+    """This is called directly by the worker to add the event to the db.
+    The raw is None if the notification is a duplicate."""
     db.reset_queries()
 
     routing_key, body = args
     notif = notification.notification_factory(body, deployment, routing_key,
                                               json_args, exchange)
-    raw = notif.save()
+    raw = _save_once(notif, exchange)
+    if raw is not None:
+        _record_names([raw], exchange)
     return raw, notif
 
 
+def _save_once(notif, exchange):
+    """Saves notif unless its message_id has been seen before, when
+    dedup is enabled. Returns the raw, or None for a duplicate."""
+    raw = _save_if_new(notif, exchange)
+    if raw is None:
+        _count_duplicates(exchange)
+    return raw
+
+
+def _save_if_new(notif, exchange):
+    """_save_once(), without counting duplicates."""
+    message_id = notif.message_id
+    if RECENT_MESSAGES is None or not message_id:
+        return _save(notif, exchange)
+    if message_id in RECENT_MESSAGES:
+        return None
+
+    raw = None
+    with transaction.commit_on_success():
+        if STACKDB.claim_message(message_id):
+            raw = _save(notif, exchange)
+    RECENT_MESSAGES.put(message_id, True)
+    return raw
+
+
+def process_raw_data_batch(deployment, messages, exchange):
+    """Batched version of process_raw_data(). messages is a list of
+    (args, json_args) tuples, all from the same exchange. The raws are
+    written in a single transaction and returned, in order, as
+    (raw, notification) pairs. Duplicates are left out."""
+    db.reset_queries()
+
+    notifs = []
+    for (routing_key, body), json_args in messages:
+        notifs.append(notification.notification_factory(
+            body, deployment, routing_key, json_args, exchange))
+    if RECENT_MESSAGES is None:
+        raws = _save_batch(notifs, exchange)
+        _record_names(raws, exchange)
+        return zip(raws, notifs)
+
+    received = len(notifs)
+    try:
+        with transaction.commit_on_success():
+            notifs = _new_notifications(notifs)
+            raws = notifs and _save_batch(notifs, exchange)
+    except IntegrityError:
+        # Another worker saved one of them in the meantime.
+        results = [(_save_if_new(notif, exchange), notif)
+                   for notif in notifs]
+        results = [(raw, notif) for raw, notif in results if raw is not None]
+    else:
+        for notif in notifs:
+            if notif.message_id:
+                RECENT_MESSAGES.put(notif.message_id, True)
+        results = zip(raws or [], notifs)
+    # Only once the retry, if any, has settled what was a duplicate.
+    if len(results) < received:
+        _count_duplicates(exchange, received - len(results))
+    _record_names([raw for raw, notif in results], exchange)
+    return results
+
+
+def _new_notifications(notifs):
+    """The notifications whose message_ids haven't been seen before,
+    claiming them. Those without one are always new."""
+    new = []
+    claimed = set()
+    for notif in notifs:
+        message_id = notif.message_id
+        if message_id and (message_id in claimed or
+                           message_id in RECENT_MESSAGES):
+            continue
+        if message_id:
+            claimed.add(message_id)
+        new.append(notif)
+    received = claimed and STACKDB.claim_messages(list(claimed))
+    if received:
+        new = [notif for notif in new if notif.message_id not in received]
+    return new
+
+
 def post_process_rawdata(raw, notification):
     aggregate_lifecycle(raw)
     aggregate_usage(raw, notification)
@@ -401,6 +661,13 @@ def post_process_genericrawdata(raw, notification):
     pass
 
 
+POST_PROCESS_METHODS = {
+    'RawData': post_process_rawdata,
+    'GlanceRawData': post_process_glancerawdata,
+    'GenericRawData': post_process_genericrawdata
+}
+
+
 def _post_process_raw_data(rows, highlight=None):
     deployments = models.Deployment.objects.all()
     dep_dict = dict((dep.id, dep) for dep in deployments)
@@ -474,7 +741,7 @@ def details(request, deployment_id, column, row_id):
 def expand(request, deployment_id, row_id):
     c = _default_context(request, deployment_id)
     row = models.RawData.objects.get(pk=row_id)
-    payload = json.loads(row.json)
+    payload = list(utils.load_raw_json(row.json, row.routing_key))
     pp = pprint.PrettyPrinter()
     c['payload'] = pp.pformat(payload)
     return render_to_response('expand.html', c)
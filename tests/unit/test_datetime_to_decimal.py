@@ -33,3 +33,29 @@ class DatetimeToDecimalTestCase(StacktachBaseTestCase):
         expected_datetime = datetime.datetime.utcfromtimestamp(expected_decimal)
         actual_datetime = datetime_to_decimal.dt_from_decimal(expected_decimal)
         self.assertEqual(actual_datetime, expected_datetime)
+
+    def test_micros_round_trip(self):
+        utc_datetime = datetime.datetime(2013, 5, 15, 11, 51, 11, 123000)
+        micros = datetime_to_decimal.dt_to_micros(utc_datetime)
+        self.assertEqual(micros, 1368618671123000)
+        self.assertEqual(datetime_to_decimal.dt_from_micros(micros),
+                         utc_datetime)
+
+    def test_micros_to_decimal_keeps_six_places(self):
+        dec = datetime_to_decimal.micros_to_decimal(1368618671123000)
+        self.assertEqual(str(dec), '1368618671.123000')
+        self.assertEqual(str(datetime_to_decimal.micros_to_decimal(0)),
+                         '0.000000')
+
+    def test_decimal_to_micros(self):
+        dec = decimal.Decimal('1368618671.123')
+        self.assertEqual(datetime_to_decimal.decimal_to_micros(dec),
+                         1368618671123000)
+        self.assertEqual(datetime_to_decimal.decimal_to_micros(None), None)
+
+    def test_decimal_from_db(self):
+        dec = decimal.Decimal('1368618671.123000')
+        self.assertEqual(datetime_to_decimal.decimal_from_db(dec), dec)
+        self.assertEqual(
+            datetime_to_decimal.decimal_from_db(1368618671123000L), dec)
+        self.assertEqual(datetime_to_decimal.decimal_from_db(None), None)
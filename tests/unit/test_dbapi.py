@@ -15,15 +15,20 @@
 # specific language governing permissions and limitations
 # under the License.
 import datetime
+import decimal
 import json
 
+from django.conf import settings
 from django.db.models import Count
 from django.db.models import FieldDoesNotExist
 from django.db import transaction
+from django.db.models.query import QuerySet
 import mox
 
+from stacktach import cursors
 from stacktach import dbapi
 from stacktach import models
+from stacktach import streaming
 from stacktach import utils as stacktach_utils
 from tests.unit import StacktachBaseTestCase
 import utils
@@ -253,6 +258,52 @@ class DBAPITestCase(StacktachBaseTestCase):
 
         self.mox.VerifyAll()
 
+    def test_get_db_objects_stream_hard_limit(self):
+        fake_model = self.make_fake_model()
+        fake_request = self.mox.CreateMockAnything()
+        fake_request.GET = {'limit': str(streaming.HARD_LIMIT + 1),
+                            'stream': 'ndjson'}
+        self.mox.StubOutWithMock(dbapi, '_get_filter_args')
+        dbapi._get_filter_args(fake_model, fake_request,
+                               custom_filters=None).AndReturn({})
+        self.mox.StubOutWithMock(dbapi, '_check_has_field')
+        dbapi._check_has_field(fake_model, 'id')
+        result = self.mox.CreateMockAnything()
+        fake_model.objects.all().AndReturn(result)
+        result.order_by('-id').AndReturn(result)
+        s = slice(None, streaming.HARD_LIMIT, None)
+        result.__getitem__(s).AndReturn(result)
+        self.mox.ReplayAll()
+
+        query_result = dbapi.get_db_objects(fake_model, fake_request, 'id')
+        self.assertEquals(query_result, result)
+
+        self.mox.VerifyAll()
+
+    def test_get_db_objects_values(self):
+        fake_model = self.make_fake_model()
+        fake_request = self.mox.CreateMockAnything()
+        fake_request.GET = {}
+        self.mox.StubOutWithMock(dbapi, '_get_filter_args')
+        dbapi._get_filter_args(fake_model, fake_request,
+                               custom_filters=None).AndReturn({})
+        self.mox.StubOutWithMock(dbapi, '_check_has_field')
+        dbapi._check_has_field(fake_model, 'launched_at')
+        result = self.mox.CreateMockAnything()
+        fake_model.objects.all().AndReturn(result)
+        result.values('instance', 'id', 'launched_at').AndReturn(result)
+        result.order_by('-launched_at').AndReturn(result)
+        s = slice(None, dbapi.DEFAULT_LIMIT, None)
+        result.__getitem__(s).AndReturn(result)
+        self.mox.ReplayAll()
+
+        query_result = dbapi.get_db_objects(fake_model, fake_request,
+                                            'launched_at',
+                                            values=['instance', 'id'])
+        self.assertEquals(query_result, result)
+
+        self.mox.VerifyAll()
+
     def test_get_db_objects_offset(self):
         fake_model = self.make_fake_model()
         fake_request = self.mox.CreateMockAnything()
@@ -293,6 +344,48 @@ class DBAPITestCase(StacktachBaseTestCase):
 
         self.mox.VerifyAll()
 
+    def test_get_db_objects_cursor(self):
+        fake_model = self.make_fake_model()
+        fake_request = self.mox.CreateMockAnything()
+        fake_request.GET = {'cursor': 'abc', 'limit': '2'}
+        self.mox.StubOutWithMock(dbapi, '_get_filter_args')
+        dbapi._get_filter_args(fake_model, fake_request,
+                               custom_filters=None).AndReturn({})
+        self.mox.StubOutWithMock(dbapi, '_check_has_field')
+        dbapi._check_has_field(fake_model, 'id')
+        result = self.mox.CreateMockAnything()
+        fake_model.objects.all().AndReturn(result)
+        self.mox.StubOutWithMock(cursors, 'page')
+        page = self.mox.CreateMockAnything()
+        cursors.page(result, fake_model, '-id', 'abc', 2).AndReturn(page)
+        self.mox.ReplayAll()
+
+        query_result = dbapi.get_db_objects(fake_model, fake_request, 'id')
+        self.assertEquals(query_result, page)
+
+        self.mox.VerifyAll()
+
+    def test_get_db_objects_invalid_cursor(self):
+        fake_model = self.make_fake_model()
+        fake_request = self.mox.CreateMockAnything()
+        fake_request.GET = {'cursor': 'abc'}
+        self.mox.StubOutWithMock(dbapi, '_get_filter_args')
+        dbapi._get_filter_args(fake_model, fake_request,
+                               custom_filters=None).AndReturn({})
+        self.mox.StubOutWithMock(dbapi, '_check_has_field')
+        dbapi._check_has_field(fake_model, 'id')
+        result = self.mox.CreateMockAnything()
+        fake_model.objects.all().AndReturn(result)
+        self.mox.StubOutWithMock(cursors, 'page')
+        cursors.page(result, fake_model, '-id', 'abc', dbapi.DEFAULT_LIMIT)\
+            .AndRaise(cursors.InvalidCursor("Invalid cursor."))
+        self.mox.ReplayAll()
+
+        self.assertRaises(dbapi.BadRequestException, dbapi.get_db_objects,
+                          fake_model, fake_request, 'id')
+
+        self.mox.VerifyAll()
+
     def test_get_db_objects_with_filter(self):
         fake_model = self.make_fake_model()
         fake_request = self.mox.CreateMockAnything()
@@ -348,13 +441,112 @@ class DBAPITestCase(StacktachBaseTestCase):
         fake_request.GET = {}
         self.mox.StubOutWithMock(dbapi, 'get_db_objects')
         objects = self.mox.CreateMockAnything()
+        columns = [('id', 'id', None), ('received', 'raw__when', None)]
+        self.mox.StubOutWithMock(dbapi, '_get_columns')
+        dbapi._get_columns(models.InstanceExists, fake_request, received=True)\
+            .AndReturn(columns)
+        dbapi.get_db_objects(models.InstanceExists, fake_request, 'id',
+                             custom_filters={},
+                             values=dbapi._lookups(columns))\
+            .AndReturn(objects)
+        self.mox.StubOutWithMock(dbapi, '_convert_values_list')
+        dbapi._convert_values_list(objects, columns)
+        self.mox.ReplayAll()
+        resp = dbapi.list_usage_exists(fake_request)
+        self.assertEqual(resp.status_code, 200)
+        self.mox.VerifyAll()
+
+    def test_list_usage_exists_with_cursor(self):
+        fake_request = self.mox.CreateMockAnything()
+        fake_request.GET = {'cursor': ''}
+        self.mox.StubOutWithMock(dbapi, 'get_db_objects')
+        keyset = self.mox.CreateMockAnything()
+        objects = cursors.Page([], keyset, 1)
+        objects.last = self.mox.CreateMockAnything()
+        objects.count = 1
+        columns = [('id', 'id', None), ('received', 'raw__when', None)]
+        self.mox.StubOutWithMock(dbapi, '_get_columns')
+        dbapi._get_columns(models.InstanceExists, fake_request, received=True)\
+            .AndReturn(columns)
+        dbapi.get_db_objects(models.InstanceExists, fake_request, 'id',
+                             custom_filters={},
+                             values=dbapi._lookups(columns))\
+            .AndReturn(objects)
+        self.mox.StubOutWithMock(dbapi, '_convert_values_list')
+        dbapi._convert_values_list(objects, columns)\
+            .AndReturn([{'id': 1}])
+        keyset.cursor(objects.last).AndReturn('next')
+        self.mox.ReplayAll()
+        resp = dbapi.list_usage_exists(fake_request)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(json.loads(resp.content),
+                         {'exists': [{'id': 1}], 'next_cursor': 'next'})
+        self.mox.VerifyAll()
+
+    def test_list_usage_exists_streamed(self):
+        fake_request = self.mox.CreateMockAnything()
+        fake_request.GET = {'cursor': '', 'stream': 'json'}
+        self.mox.StubOutWithMock(dbapi, 'get_db_objects')
+        keyset = self.mox.CreateMockAnything()
+        query = self.mox.CreateMockAnything()
+        objects = cursors.Page(query, keyset, 2)
+        exists = [{'id': 2}, {'id': 1}]
+        columns = [('id', 'id', None), ('received', 'raw__when', None)]
+        self.mox.StubOutWithMock(dbapi, '_get_columns')
+        dbapi._get_columns(models.InstanceExists, fake_request, received=True)\
+            .AndReturn(columns)
         dbapi.get_db_objects(models.InstanceExists, fake_request, 'id',
-                             custom_filters={}).AndReturn(objects)
-        self.mox.StubOutWithMock(dbapi, '_convert_model_list')
-        dbapi._convert_model_list(objects, dbapi._exists_extra_values)
+                             custom_filters={},
+                             values=dbapi._lookups(columns))\
+            .AndReturn(objects)
+        self.mox.StubOutWithMock(cursors, 'read_in_chunks')
+        cursors.read_in_chunks(query, keyset).AndReturn(iter(exists))
+        self.mox.StubOutWithMock(dbapi, '_convert_values')
+        dbapi._convert_values(exists[0], columns).AndReturn({'id': 2})
+        dbapi._convert_values(exists[1], columns).AndReturn({'id': 1})
+        keyset.cursor(exists[1]).AndReturn('next')
         self.mox.ReplayAll()
         resp = dbapi.list_usage_exists(fake_request)
         self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp['Content-Type'], 'application/json')
+        self.assertEqual(json.loads(''.join(resp.streaming_content)),
+                         {'exists': [{'id': 2}, {'id': 1}],
+                          'next_cursor': 'next'})
+        self.mox.VerifyAll()
+
+    def test_list_usage_launches_ndjson(self):
+        fake_request = self.mox.CreateMockAnything()
+        fake_request.GET = {'stream': 'ndjson'}
+        self.mox.StubOutWithMock(dbapi, 'get_db_objects')
+        objects = self.mox.CreateMock(QuerySet)
+        usages = [{'id': 1}, {'id': 2}]
+        columns = dbapi._columns_for(models.InstanceUsage)
+        dbapi.get_db_objects(models.InstanceUsage, fake_request,
+                             'launched_at', values=dbapi._lookups(columns))\
+            .AndReturn(objects)
+        self.mox.StubOutWithMock(streaming, 'iterate')
+        streaming.iterate(objects).AndReturn(iter(usages))
+        self.mox.StubOutWithMock(dbapi, '_convert_values')
+        dbapi._convert_values(usages[0], columns).AndReturn({'id': 1})
+        dbapi._convert_values(usages[1], columns).AndReturn({'id': 2})
+        self.mox.ReplayAll()
+        resp = dbapi.list_usage_launches(fake_request)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(''.join(resp.streaming_content),
+                         '{"id": 1}\n{"id": 2}\n')
+        self.mox.VerifyAll()
+
+    def test_list_usage_deletes_bad_stream(self):
+        fake_request = self.mox.CreateMockAnything()
+        fake_request.GET = {'stream': 'xml'}
+        fake_request.method = 'GET'
+        fake_request.path = '/db/usage/deletes'
+        fake_request.body = ''
+        self.mox.StubOutWithMock(dbapi, 'get_db_objects')
+        self.mox.ReplayAll()
+        resp = dbapi.list_usage_deletes(fake_request)
+        self.assertEqual(resp.status_code, 400)
         self.mox.VerifyAll()
 
     def test_list_usage_exists_no_custom_filters_for_glance(self):
@@ -362,10 +554,16 @@ class DBAPITestCase(StacktachBaseTestCase):
         fake_request.GET = {}
         self.mox.StubOutWithMock(dbapi, 'get_db_objects')
         objects = self.mox.CreateMockAnything()
+        columns = [('id', 'id', None), ('received', 'raw__when', None)]
+        self.mox.StubOutWithMock(dbapi, '_get_columns')
+        dbapi._get_columns(models.ImageExists, fake_request, received=True)\
+            .AndReturn(columns)
         dbapi.get_db_objects(models.ImageExists, fake_request, 'id',
-                             custom_filters={}).AndReturn(objects)
-        self.mox.StubOutWithMock(dbapi, '_convert_model_list')
-        dbapi._convert_model_list(objects, dbapi._exists_extra_values)
+                             custom_filters={},
+                             values=dbapi._lookups(columns))\
+            .AndReturn(objects)
+        self.mox.StubOutWithMock(dbapi, '_convert_values_list')
+        dbapi._convert_values_list(objects, columns)
         self.mox.ReplayAll()
         resp = dbapi.list_usage_exists_glance(fake_request)
         self.assertEqual(resp.status_code, 200)
@@ -379,10 +577,16 @@ class DBAPITestCase(StacktachBaseTestCase):
         unix_date = stacktach_utils.str_time_to_unix(date)
         custom_filters = {'received_min': {'raw__when__gte': unix_date}}
         objects = self.mox.CreateMockAnything()
+        columns = [('id', 'id', None), ('received', 'raw__when', None)]
+        self.mox.StubOutWithMock(dbapi, '_get_columns')
+        dbapi._get_columns(models.InstanceExists, fake_request, received=True)\
+            .AndReturn(columns)
         dbapi.get_db_objects(models.InstanceExists, fake_request, 'id',
-                             custom_filters=custom_filters).AndReturn(objects)
-        self.mox.StubOutWithMock(dbapi, '_convert_model_list')
-        dbapi._convert_model_list(objects, dbapi._exists_extra_values)
+                             custom_filters=custom_filters,
+                             values=dbapi._lookups(columns))\
+            .AndReturn(objects)
+        self.mox.StubOutWithMock(dbapi, '_convert_values_list')
+        dbapi._convert_values_list(objects, columns)
         self.mox.ReplayAll()
         resp = dbapi.list_usage_exists(fake_request)
         self.assertEqual(resp.status_code, 200)
@@ -396,10 +600,16 @@ class DBAPITestCase(StacktachBaseTestCase):
         custom_filters = {'received_max': {'raw__when__lte': unix_date}}
         objects = self.mox.CreateMockAnything()
         self.mox.StubOutWithMock(dbapi, 'get_db_objects')
+        columns = [('id', 'id', None), ('received', 'raw__when', None)]
+        self.mox.StubOutWithMock(dbapi, '_get_columns')
+        dbapi._get_columns(models.InstanceExists, fake_request, received=True)\
+            .AndReturn(columns)
         dbapi.get_db_objects(models.InstanceExists, fake_request, 'id',
-                             custom_filters=custom_filters).AndReturn(objects)
-        self.mox.StubOutWithMock(dbapi, '_convert_model_list')
-        dbapi._convert_model_list(objects, dbapi._exists_extra_values)
+                             custom_filters=custom_filters,
+                             values=dbapi._lookups(columns))\
+            .AndReturn(objects)
+        self.mox.StubOutWithMock(dbapi, '_convert_values_list')
+        dbapi._convert_values_list(objects, columns)
         self.mox.ReplayAll()
 
         resp = dbapi.list_usage_exists(fake_request)
@@ -940,10 +1150,13 @@ class DBAPITestCase(StacktachBaseTestCase):
         self.mox.StubOutWithMock(dbapi, 'get_db_objects')
         mock_objects = self.mox.CreateMockAnything()
         launches = {'a': 1}
-        self.mox.StubOutWithMock(dbapi, '_convert_model_list')
-        dbapi._convert_model_list(mock_objects).AndReturn(launches)
-        dbapi.get_db_objects(models.InstanceUsage, fake_request,
-                             'launched_at').AndReturn(mock_objects)
+        columns = dbapi._columns_for(models.InstanceUsage)
+        self.mox.StubOutWithMock(dbapi, '_convert_values_list')
+        dbapi._convert_values_list(mock_objects, columns)\
+            .AndReturn(launches)
+        dbapi.get_db_objects(models.InstanceUsage, fake_request, 'launched_at',
+                             values=dbapi._lookups(columns))\
+            .AndReturn(mock_objects)
         self.mox.ReplayAll()
 
         resp = dbapi.list_usage_launches(fake_request)
@@ -958,10 +1171,13 @@ class DBAPITestCase(StacktachBaseTestCase):
         self.mox.StubOutWithMock(dbapi, 'get_db_objects')
         mock_objects = self.mox.CreateMockAnything()
         launches = {'a': 1}
-        self.mox.StubOutWithMock(dbapi, '_convert_model_list')
-        dbapi._convert_model_list(mock_objects).AndReturn(launches)
-        dbapi.get_db_objects(models.ImageUsage, fake_request,
-                             'created_at').AndReturn(mock_objects)
+        columns = dbapi._columns_for(models.ImageUsage)
+        self.mox.StubOutWithMock(dbapi, '_convert_values_list')
+        dbapi._convert_values_list(mock_objects, columns)\
+            .AndReturn(launches)
+        dbapi.get_db_objects(models.ImageUsage, fake_request, 'created_at',
+                             values=dbapi._lookups(columns))\
+            .AndReturn(mock_objects)
         self.mox.ReplayAll()
 
         resp = dbapi.list_usage_images(fake_request)
@@ -976,10 +1192,13 @@ class DBAPITestCase(StacktachBaseTestCase):
         self.mox.StubOutWithMock(dbapi, 'get_db_objects')
         mock_objects = self.mox.CreateMockAnything()
         launches = {'a': 1}
-        self.mox.StubOutWithMock(dbapi, '_convert_model_list')
-        dbapi._convert_model_list(mock_objects).AndReturn(launches)
-        dbapi.get_db_objects(models.InstanceUsage, fake_request,
-                             'launched_at').AndReturn(mock_objects)
+        columns = dbapi._columns_for(models.InstanceUsage)
+        self.mox.StubOutWithMock(dbapi, '_convert_values_list')
+        dbapi._convert_values_list(mock_objects, columns)\
+            .AndReturn(launches)
+        dbapi.get_db_objects(models.InstanceUsage, fake_request, 'launched_at',
+                             values=dbapi._lookups(columns))\
+            .AndReturn(mock_objects)
         self.mox.ReplayAll()
 
         resp = dbapi.list_usage_launches(fake_request)
@@ -1064,10 +1283,13 @@ class DBAPITestCase(StacktachBaseTestCase):
         self.mox.StubOutWithMock(dbapi, 'get_db_objects')
         mock_objects = self.mox.CreateMockAnything()
         deletes = {'a': 1}
-        self.mox.StubOutWithMock(dbapi, '_convert_model_list')
-        dbapi._convert_model_list(mock_objects).AndReturn(deletes)
+        columns = dbapi._columns_for(models.InstanceDeletes)
+        self.mox.StubOutWithMock(dbapi, '_convert_values_list')
+        dbapi._convert_values_list(mock_objects, columns)\
+            .AndReturn(deletes)
         dbapi.get_db_objects(models.InstanceDeletes, fake_request,
-                             'launched_at').AndReturn(mock_objects)
+                             'launched_at', values=dbapi._lookups(columns))\
+            .AndReturn(mock_objects)
         self.mox.ReplayAll()
 
         resp = dbapi.list_usage_deletes(fake_request)
@@ -1082,10 +1304,13 @@ class DBAPITestCase(StacktachBaseTestCase):
         self.mox.StubOutWithMock(dbapi, 'get_db_objects')
         mock_objects = self.mox.CreateMockAnything()
         deletes = {'a': 1}
-        self.mox.StubOutWithMock(dbapi, '_convert_model_list')
-        dbapi._convert_model_list(mock_objects).AndReturn(deletes)
+        columns = dbapi._columns_for(models.InstanceDeletes)
+        self.mox.StubOutWithMock(dbapi, '_convert_values_list')
+        dbapi._convert_values_list(mock_objects, columns)\
+            .AndReturn(deletes)
         dbapi.get_db_objects(models.InstanceDeletes, fake_request,
-                             'launched_at').AndReturn(mock_objects)
+                             'launched_at', values=dbapi._lookups(columns))\
+            .AndReturn(mock_objects)
         self.mox.ReplayAll()
 
         resp = dbapi.list_usage_deletes(fake_request)
@@ -1100,10 +1325,13 @@ class DBAPITestCase(StacktachBaseTestCase):
         self.mox.StubOutWithMock(dbapi, 'get_db_objects')
         mock_objects = self.mox.CreateMockAnything()
         deletes = {'a': 1}
-        self.mox.StubOutWithMock(dbapi, '_convert_model_list')
-        dbapi._convert_model_list(mock_objects).AndReturn(deletes)
-        dbapi.get_db_objects(models.ImageDeletes, fake_request,
-                             'deleted_at').AndReturn(mock_objects)
+        columns = dbapi._columns_for(models.ImageDeletes)
+        self.mox.StubOutWithMock(dbapi, '_convert_values_list')
+        dbapi._convert_values_list(mock_objects, columns)\
+            .AndReturn(deletes)
+        dbapi.get_db_objects(models.ImageDeletes, fake_request, 'deleted_at',
+                             values=dbapi._lookups(columns))\
+            .AndReturn(mock_objects)
         self.mox.ReplayAll()
 
         resp = dbapi.list_usage_deletes_glance(fake_request)
@@ -1426,6 +1654,103 @@ class DBAPITestCase(StacktachBaseTestCase):
         self.mox.VerifyAll()
 
 
+class DBAPIColumnsTestCase(StacktachBaseTestCase):
+    storage = 'decimal'
+
+    def setUp(self):
+        self.mox = mox.Mox()
+        self.old_storage = getattr(settings, 'TIMESTAMP_STORAGE', 'decimal')
+        settings.TIMESTAMP_STORAGE = self.storage
+
+    def tearDown(self):
+        self.mox.UnsetStubs()
+        settings.TIMESTAMP_STORAGE = self.old_storage
+
+    def _stored(self, value):
+        return models.db_timestamp(decimal.Decimal(value))
+
+    def _request(self, **params):
+        request = self.mox.CreateMockAnything()
+        request.GET = params
+        return request
+
+    def test_columns_for(self):
+        usage = models.InstanceUsage(id=1, instance=INSTANCE_ID_1,
+                                     launched_at=decimal.Decimal('1.5'),
+                                     instance_type_id='3')
+        columns = dbapi._columns_for(models.InstanceUsage)
+        values = {}
+        for key, lookup, converter in columns:
+            values[lookup] = getattr(usage, lookup)
+        self.assertEqual(dbapi._convert_values(values, columns),
+                         dbapi._convert_model(usage))
+
+    def test_columns_for_stored_values(self):
+        columns = dbapi._columns_for(models.InstanceUsage)
+        values = {}
+        for key, lookup, converter in columns:
+            values[lookup] = None
+        values['launched_at'] = self._stored('1.5')
+        converted = dbapi._convert_values(values, columns)
+        self.assertEqual(converted['launched_at'],
+                         '1970-01-01 00:00:01.500000')
+        self.assertEqual(converted['instance'], None)
+
+    def test_columns_for_received(self):
+        columns = dbapi._columns_for(models.InstanceExists, received=True)
+        self.assertEqual(columns[-1][:2], ('received', 'raw__when'))
+        received = columns[-1][2]
+        self.assertEqual(received(None), 'n/a')
+        self.assertEqual(received(self._stored('1.5')),
+                         '1970-01-01 00:00:01.500000')
+
+    def test_columns_for_are_kept(self):
+        self.assertTrue(dbapi._columns_for(models.ImageUsage) is
+                        dbapi._columns_for(models.ImageUsage))
+
+    def test_get_columns(self):
+        columns = dbapi._get_columns(models.InstanceExists, self._request(),
+                                     received=True)
+        self.assertEqual(columns, dbapi._columns_for(models.InstanceExists,
+                                                     received=True))
+
+    def test_get_columns_fields(self):
+        request = self._request(fields='received,instance')
+        columns = dbapi._get_columns(models.InstanceExists, request,
+                                     received=True)
+        self.assertEqual([column[0] for column in columns],
+                         ['instance', 'received'])
+        self.assertEqual(dbapi._lookups(columns), ['instance', 'raw__when'])
+
+    def test_get_columns_unknown_field(self):
+        request = self._request(fields='instance,json')
+        self.assertRaises(dbapi.BadRequestException, dbapi._get_columns,
+                          models.InstanceUsage, request)
+
+    def test_list_usage_launches_stored_values(self):
+        request = self._request(fields='instance,launched_at')
+        request.method = 'GET'
+        self.mox.StubOutWithMock(dbapi, 'get_db_objects')
+        rows = [{'instance': INSTANCE_ID_1,
+                 'launched_at': self._stored('1.5')}]
+        dbapi.get_db_objects(models.InstanceUsage, request, 'launched_at',
+                             values=['instance', 'launched_at'])\
+            .AndReturn(rows)
+        self.mox.ReplayAll()
+
+        resp = dbapi.list_usage_launches(request)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(json.loads(resp.content),
+                         {'launches': [{
+                             'instance': INSTANCE_ID_1,
+                             'launched_at': '1970-01-01 00:00:01.500000'}]})
+        self.mox.VerifyAll()
+
+
+class MicrosecondDBAPIColumnsTestCase(DBAPIColumnsTestCase):
+    storage = 'microseconds'
+
+
 class StacktachRepairScenarioApi(StacktachBaseTestCase):
     def setUp(self):
         self.mox = mox.Mox()
@@ -108,6 +108,8 @@ class GlanceVerifierTestCase(StacktachBaseTestCase):
         exist = self.mox.CreateMockAnything()
         exist.uuid = IMAGE_UUID_1
         exist.usage = self.mox.CreateMockAnything()
+        exist.created_at = decimal.Decimal('1.1')
+        exist.usage.created_at = decimal.Decimal('1.1')
         exist.owner = IMAGE_OWNER_1
         exist.usage.owner = IMAGE_OWNER_2
         self.mox.ReplayAll()
@@ -129,6 +131,8 @@ class GlanceVerifierTestCase(StacktachBaseTestCase):
         exist.size = SIZE_1
 
         exist.usage = self.mox.CreateMockAnything()
+        exist.created_at = decimal.Decimal('1.1')
+        exist.usage.created_at = decimal.Decimal('1.1')
         exist.usage.size = SIZE_2
         self.mox.ReplayAll()
 
@@ -18,9 +18,12 @@
 # FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
 # IN THE SOFTWARE.
 from datetime import datetime
+import decimal
 
+from django.conf import settings
 import unittest
 import mox
+from stacktach import models
 from stacktach.models import RawData, GlanceRawData, GenericRawData
 from stacktach.models import ImageDeletes, InstanceExists, ImageExists
 from tests.unit.utils import IMAGE_UUID_1
@@ -39,6 +42,74 @@ class ModelsTestCase(StacktachBaseTestCase):
         self.assertEquals(GenericRawData.get_name(), 'GenericRawData')
 
 
+class TimestampFieldTestCase(unittest.TestCase):
+    def setUp(self):
+        self.storage = getattr(settings, 'TIMESTAMP_STORAGE', 'decimal')
+        self.field = RawData._meta.get_field('when')
+
+    def tearDown(self):
+        settings.TIMESTAMP_STORAGE = self.storage
+
+    def test_decimal_storage(self):
+        settings.TIMESTAMP_STORAGE = 'decimal'
+        when = decimal.Decimal('1368618671.123')
+        self.assertEqual(self.field.get_prep_value(when), when)
+        self.assertEqual(models.db_timestamp(when), when)
+        self.assertEqual(RawData(when=10).when, 10)
+
+    def test_microsecond_storage(self):
+        settings.TIMESTAMP_STORAGE = 'microseconds'
+        when = decimal.Decimal('1368618671.123')
+        self.assertEqual(self.field.get_prep_value(when), 1368618671123000)
+        self.assertEqual(self.field.get_prep_value(None), None)
+        self.assertEqual(self.field.get_db_prep_save(when, None),
+                         1368618671123000)
+        self.assertEqual(models.db_timestamp(when), 1368618671123000)
+
+    def test_microsecond_storage_reads_decimals(self):
+        settings.TIMESTAMP_STORAGE = 'microseconds'
+        raw = _loaded_raw(1368618671123000L)
+        self.assertEqual(models.timestamp_micros(raw, 'when'),
+                         1368618671123000L)
+        self.assertEqual(str(raw.when), '1368618671.123000')
+        raw.when = decimal.Decimal('1.5')
+        self.assertEqual(raw.when, decimal.Decimal('1.5'))
+        self.assertEqual(models.timestamp_micros(raw, 'when'), 1500000)
+
+    def test_microsecond_storage_leaves_assigned_ints_alone(self):
+        settings.TIMESTAMP_STORAGE = 'microseconds'
+        raw = RawData(when=10)
+        self.assertEqual(raw.when, 10)
+        self.assertEqual(models.timestamp_micros(raw, 'when'), 10000000)
+        self.assertEqual(self.field.get_prep_value(raw.when), 10000000)
+        raw.when = 0
+        self.assertEqual(raw.when, 0)
+        self.assertEqual(self.field.get_prep_value(raw.when), 0)
+        self.assertEqual(models.db_timestamp(10), 10000000)
+
+    def test_decimal_storage_reads_decimals(self):
+        settings.TIMESTAMP_STORAGE = 'decimal'
+        raw = _loaded_raw(decimal.Decimal('1368618671.123000'))
+        self.assertEqual(raw.when, decimal.Decimal('1368618671.123'))
+        self.assertEqual(models.timestamp_micros(raw, 'when'),
+                         1368618671123000L)
+
+    def test_db_interval(self):
+        settings.TIMESTAMP_STORAGE = 'decimal'
+        self.assertEqual(models.db_interval(60*60*24), 86400)
+        settings.TIMESTAMP_STORAGE = 'microseconds'
+        self.assertEqual(models.db_interval(60*60*24), 86400000000)
+
+
+def _loaded_raw(when):
+    # Querysets build instances from the row's columns, in field order.
+    row = [None] * len(RawData._meta.fields)
+    for i, field in enumerate(RawData._meta.fields):
+        if field.attname == 'when':
+            row[i] = when
+    return RawData(*row)
+
+
 class ImageDeletesTestCase(unittest.TestCase):
     def setUp(self):
         self.mox = mox.Mox()
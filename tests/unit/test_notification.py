@@ -571,21 +571,21 @@ class GlanceExistsNotificationTestCase(StacktachBaseTestCase):
         routing_key = "glance_monitor.info"
         json_body = json.dumps([routing_key, body])
 
-        self.mox.StubOutWithMock(db, 'create_image_exists')
-        self.mox.StubOutWithMock(db, 'get_image_usage')
-
-        for i in range(0, 2):
-            db.get_image_usage(uuid=uuid).AndReturn(None)
-            db.create_image_exists(
-                created_at=utils.str_time_to_unix(created_at),
-                owner=TENANT_ID_1,
-                raw=raw,
-                audit_period_beginning=utils.str_time_to_unix(audit_period_beginning),
-                audit_period_ending=utils.str_time_to_unix(audit_period_ending),
-                size=size,
-                uuid=uuid,
-                usage=None,
-                message_id="d14cfa51-6a0e-4cf8-9130-804738be96d2").AndReturn(raw)
+        self.mox.StubOutWithMock(db, 'create_image_exists_batch')
+        self.mox.StubOutWithMock(db, 'get_image_usages')
+
+        db.get_image_usages([uuid, uuid]).AndReturn({})
+        values = dict(
+            created_at=utils.str_time_to_unix(created_at),
+            owner=TENANT_ID_1,
+            raw=raw,
+            audit_period_beginning=utils.str_time_to_unix(audit_period_beginning),
+            audit_period_ending=utils.str_time_to_unix(audit_period_ending),
+            size=size,
+            uuid=uuid,
+            usage=None,
+            message_id="d14cfa51-6a0e-4cf8-9130-804738be96d2")
+        db.create_image_exists_batch([values, values])
 
         self.mox.ReplayAll()
 
@@ -636,25 +636,25 @@ class GlanceExistsNotificationTestCase(StacktachBaseTestCase):
         deployment = "1"
         routing_key = "glance_monitor.info"
         json_body = json.dumps([routing_key, body])
-        self.mox.StubOutWithMock(db, 'create_image_exists')
-        self.mox.StubOutWithMock(db, 'get_image_usage')
-        self.mox.StubOutWithMock(db, 'get_image_delete')
-
-        for i in range(0, 2):
-            db.get_image_usage(uuid=uuid).AndReturn(None)
-            db.get_image_delete(uuid=uuid).AndReturn(delete)
-            db.create_image_exists(
-                created_at=utils.str_time_to_unix(created_at),
-                owner=TENANT_ID_1,
-                raw=raw,
-                audit_period_beginning=utils.str_time_to_unix(audit_period_beginning),
-                audit_period_ending=utils.str_time_to_unix(audit_period_ending),
-                size=size,
-                uuid=uuid,
-                usage=None,
-                delete=delete,
-                deleted_at=utils.str_time_to_unix(deleted_at),
-                message_id="d14cfa51-6a0e-4cf8-9130-804738be96d2").AndReturn(raw)
+        self.mox.StubOutWithMock(db, 'create_image_exists_batch')
+        self.mox.StubOutWithMock(db, 'get_image_usages')
+        self.mox.StubOutWithMock(db, 'get_image_deletes')
+
+        db.get_image_usages([uuid, uuid]).AndReturn({})
+        db.get_image_deletes([uuid, uuid]).AndReturn({uuid: delete})
+        values = dict(
+            created_at=utils.str_time_to_unix(created_at),
+            owner=TENANT_ID_1,
+            raw=raw,
+            audit_period_beginning=utils.str_time_to_unix(audit_period_beginning),
+            audit_period_ending=utils.str_time_to_unix(audit_period_ending),
+            size=size,
+            uuid=uuid,
+            usage=None,
+            delete=delete,
+            deleted_at=utils.str_time_to_unix(deleted_at),
+            message_id="d14cfa51-6a0e-4cf8-9130-804738be96d2")
+        db.create_image_exists_batch([values, values])
 
         self.mox.ReplayAll()
 
@@ -177,6 +177,8 @@ class NovaVerifierVerifyForLaunchTestCase(StacktachBaseTestCase):
         exist.instance = INSTANCE_ID_1
 
         exist.usage = self.mox.CreateMockAnything()
+        exist.launched_at = decimal.Decimal('1.1')
+        exist.usage.launched_at = decimal.Decimal('1.1')
         exist.usage.tenant = TENANT_ID_2
         self.mox.ReplayAll()
 
@@ -201,6 +203,8 @@ class NovaVerifierVerifyForLaunchTestCase(StacktachBaseTestCase):
         exist.instance = INSTANCE_ID_1
 
         exist.usage = self.mox.CreateMockAnything()
+        exist.launched_at = decimal.Decimal('1.1')
+        exist.usage.launched_at = decimal.Decimal('1.1')
         exist.usage.rax_options = RAX_OPTIONS_2
         self.mox.ReplayAll()
 
@@ -225,6 +229,8 @@ class NovaVerifierVerifyForLaunchTestCase(StacktachBaseTestCase):
         exist.instance = INSTANCE_ID_1
 
         exist.usage = self.mox.CreateMockAnything()
+        exist.launched_at = decimal.Decimal('1.1')
+        exist.usage.launched_at = decimal.Decimal('1.1')
         exist.usage.os_distro = OS_DISTRO_2
         self.mox.ReplayAll()
 
@@ -249,6 +255,8 @@ class NovaVerifierVerifyForLaunchTestCase(StacktachBaseTestCase):
         exist.os_architecture = OS_ARCH_1
 
         exist.usage = self.mox.CreateMockAnything()
+        exist.launched_at = decimal.Decimal('1.1')
+        exist.usage.launched_at = decimal.Decimal('1.1')
         exist.usage.os_architecture = OS_ARCH_2
         self.mox.ReplayAll()
 
@@ -272,6 +280,8 @@ class NovaVerifierVerifyForLaunchTestCase(StacktachBaseTestCase):
         exist.instance = INSTANCE_ID_1
 
         exist.usage = self.mox.CreateMockAnything()
+        exist.launched_at = decimal.Decimal('1.1')
+        exist.usage.launched_at = decimal.Decimal('1.1')
         exist.usage.os_version = OS_VERSION_2
         self.mox.ReplayAll()
 
@@ -1049,6 +1059,36 @@ class NovaVerifierSendVerifiedNotificationTestCase(StacktachBaseTestCase):
         self.mox.VerifyAll()
 
 
+    def test_send_verified_notification_original_body(self):
+        connection = self.mox.CreateMockAnything()
+        exchange = self.mox.CreateMockAnything()
+        exist = self.mox.CreateMockAnything()
+        exist.id = 1
+        exist.raw = self.mox.CreateMockAnything()
+        exist.raw.routing_key = 'monitor.info'
+        exist.raw.json = json.dumps({'event_type': 'test',
+                                     'message_id': 'some_uuid'})
+        self.mox.StubOutWithMock(kombu.pools, 'producers')
+        self.mox.StubOutWithMock(kombu.common, 'maybe_declare')
+        models.InstanceExists.objects.get(id=exist.id).AndReturn(exist)
+        producer = self.mox.CreateMockAnything()
+        producer.channel = self.mox.CreateMockAnything()
+        kombu.pools.producers[connection].AndReturn(producer)
+        producer.acquire(block=True).AndReturn(producer)
+        producer.__enter__().AndReturn(producer)
+        kombu.common.maybe_declare(exchange, producer.channel)
+        self.mox.StubOutWithMock(uuid, 'uuid4')
+        uuid.uuid4().AndReturn('some_other_uuid')
+        message = {'event_type': NOVA_VERIFIER_EVENT_TYPE,
+                   'message_id': 'some_other_uuid',
+                   'original_message_id': 'some_uuid'}
+        producer.publish(message, 'monitor.info')
+        producer.__exit__(None, None, None)
+        self.mox.ReplayAll()
+
+        self.verifier.send_verified_notification(exist, exchange, connection)
+        self.mox.VerifyAll()
+
 class NovaVerifierValidityTestCase(StacktachBaseTestCase):
     def setUp(self):
         self.mox = mox.Mox()
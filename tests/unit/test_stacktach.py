@@ -15,10 +15,16 @@
 # specific language governing permissions and limitations
 # under the License.
 import datetime
+import decimal
 import json
+import time
 
 import mox
 
+from django.db import DatabaseError
+from django.db import IntegrityError
+from django.db import transaction
+
 import utils
 from utils import BANDWIDTH_PUBLIC_OUTBOUND
 from utils import INSTANCE_FLAVOR_ID_1
@@ -33,11 +39,14 @@ from utils import REQUEST_ID_1
 from utils import TENANT_ID_1
 from utils import INSTANCE_TYPE_ID_1
 from utils import DUMMY_TIME
+from utils import DECIMAL_DUMMY_TIME
 from utils import EARLIER_DUMMY_TIME
 from utils import LATER_DUMMY_TIME
 from utils import INSTANCE_TYPE_ID_2
+from stacktach import cache
 from stacktach import stacklog, models
 from stacktach import notification
+from stacktach import rollups
 from stacktach import views
 from tests.unit import StacktachBaseTestCase
 
@@ -72,6 +81,8 @@ class StacktachRawParsingTestCase(StacktachBaseTestCase):
         notification.notification_factory(dict, deployment, routing_key,
                                           json_args, exchange).AndReturn(
             mock_notification)
+        self.mox.StubOutWithMock(views, '_record_names')
+        views._record_names([mock_record], exchange)
         self.mox.ReplayAll()
 
         self.assertEquals(
@@ -100,6 +111,271 @@ class StacktachRawParsingTestCase(StacktachBaseTestCase):
         views.process_raw_data(deployment, args, json_args, exchange)
         self.mox.VerifyAll()
 
+    def test_process_raw_data_batch(self):
+        deployment = self.mox.CreateMockAnything()
+        routing_key = 'monitor.info'
+        body1 = {'timestamp': '2013-1-25 13:38:23.123'}
+        body2 = {'timestamp': '2013-1-25 13:38:24.123'}
+        args1 = (routing_key, body1)
+        args2 = (routing_key, body2)
+        messages = [(args1, json.dumps(args1)), (args2, json.dumps(args2))]
+        exchange = 'nova'
+        notif1 = self.mox.CreateMockAnything()
+        notif2 = self.mox.CreateMockAnything()
+        record1 = self.mox.CreateMockAnything()
+        record2 = self.mox.CreateMockAnything()
+        self.mox.StubOutWithMock(notification, 'notification_factory')
+        self.mox.StubOutWithMock(notification, 'save_batch')
+        notification.notification_factory(body1, deployment, routing_key,
+                                          json.dumps(args1), exchange)\
+            .AndReturn(notif1)
+        notification.notification_factory(body2, deployment, routing_key,
+                                          json.dumps(args2), exchange)\
+            .AndReturn(notif2)
+        notification.save_batch([notif1, notif2], exchange)\
+            .AndReturn([record1, record2])
+        self.mox.StubOutWithMock(views, '_record_names')
+        views._record_names([record1, record2], exchange)
+        self.mox.ReplayAll()
+
+        results = views.process_raw_data_batch(deployment, messages, exchange)
+        self.assertEqual(results, [(record1, notif1), (record2, notif2)])
+        self.mox.VerifyAll()
+
+    def _named_raw(self, event, host):
+        raw = self.mox.CreateMockAnything()
+        raw.event = event
+        raw.host = host
+        raw.deployment_id = 1
+        return raw
+
+    def test_record_names(self):
+        self.mox.stubs.Set(views, 'RAW_NAMES', cache.LRUCache(10))
+        raws = [self._named_raw('image.upload', 'glance.example.com'),
+                self._named_raw('image.upload', 'glance.example.com'),
+                self._named_raw('image.update', None)]
+        views.STACKDB.add_raw_name(models.EventName, 'glance', 1,
+                                   'image.upload').AndReturn(True)
+        views.STACKDB.add_raw_name(models.HostName, 'glance', 1,
+                                   'glance.example.com').AndReturn(True)
+        views.STACKDB.add_raw_name(models.EventName, 'glance', 1,
+                                   'image.update').AndReturn(False)
+        self.mox.ReplayAll()
+
+        views._record_names(raws, 'glance')
+        views._record_names(raws, 'glance')
+
+        self.mox.VerifyAll()
+
+    def test_record_names_generic(self):
+        self.mox.stubs.Set(views, 'RAW_NAMES', cache.LRUCache(10))
+        raws = [self._named_raw('volume.create.end', None)]
+        views.STACKDB.add_raw_name(models.EventName, 'generic', 1,
+                                   'volume.create.end').AndReturn(True)
+        self.mox.ReplayAll()
+
+        views._record_names(raws, 'cinder')
+
+        self.mox.VerifyAll()
+
+
+class StacktachIngestPolicyTestCase(StacktachBaseTestCase):
+    def setUp(self):
+        self.mox = mox.Mox()
+
+    def tearDown(self):
+        self.mox.UnsetStubs()
+        views.enable_ingest_policy({})
+
+    def test_enable_ingest_policy(self):
+        views.enable_ingest_policy({'compute.instance.update': 'coalesce'},
+                                   30)
+        self.assertEqual(views.INGEST_POLICY.window, 30)
+        views.enable_ingest_policy({})
+        self.assertEqual(views.INGEST_POLICY, None)
+
+    def test_process_raw_data_with_policy(self):
+        views.enable_ingest_policy({'compute.instance.update': 'indexed'})
+        self.mox.StubOutWithMock(views.INGEST_POLICY, 'save')
+        deployment = self.mox.CreateMockAnything()
+        body = {'event_type': 'compute.instance.update'}
+        args = ('monitor.info', body)
+        notif = self.mox.CreateMockAnything()
+        notif.message_id = None
+        self.mox.StubOutWithMock(notification, 'notification_factory')
+        notification.notification_factory(
+            body, deployment, 'monitor.info', json.dumps(args),
+            'nova').AndReturn(notif)
+        raw = self.mox.CreateMockAnything()
+        views.INGEST_POLICY.save(notif, 'nova').AndReturn(raw)
+        self.mox.StubOutWithMock(views, '_record_names')
+        views._record_names([raw], 'nova')
+        self.mox.ReplayAll()
+
+        self.assertEqual(views.process_raw_data(
+            deployment, args, json.dumps(args), 'nova'), (raw, notif))
+        self.mox.VerifyAll()
+
+    def test_start_kpi_tracking_coalesced(self):
+        lifecycle = self.mox.CreateMockAnything()
+        raw = self.mox.CreateMockAnything()
+        raw.event = 'compute.instance.update'
+        raw.coalesced = True
+        self.mox.ReplayAll()
+        views.start_kpi_tracking(lifecycle, raw)
+        self.mox.VerifyAll()
+
+
+class StacktachDedupTestCase(StacktachBaseTestCase):
+    def setUp(self):
+        self.mox = mox.Mox()
+        views.STACKDB = self.mox.CreateMockAnything()
+        self.mox.StubOutWithMock(notification, 'notification_factory')
+        self.mox.StubOutWithMock(transaction, 'commit_on_success')
+        self.mox.StubOutWithMock(views, '_record_names')
+        views.enable_dedup(10)
+        self.deployment = self.mox.CreateMockAnything()
+
+    def tearDown(self):
+        self.mox.UnsetStubs()
+        views.enable_dedup(0)
+
+    def _mock_transaction(self, exc=None):
+        tran = self.mox.CreateMockAnything()
+        tran.__enter__().AndReturn(tran)
+        if exc:
+            tran.__exit__(exc, mox.IgnoreArg(), mox.IgnoreArg())
+        else:
+            tran.__exit__(None, None, None)
+        transaction.commit_on_success().AndReturn(tran)
+
+    def _message(self, message_id):
+        body = {'message_id': message_id}
+        args = ('monitor.info', body)
+        notif = self.mox.CreateMockAnything()
+        notif.message_id = message_id
+        notification.notification_factory(
+            body, self.deployment, 'monitor.info', json.dumps(args),
+            'nova').AndReturn(notif)
+        return args, notif
+
+    def test_process_raw_data_drops_redelivery(self):
+        args, notif = self._message(MESSAGE_ID_1)
+        self._mock_transaction()
+        views.STACKDB.claim_message(MESSAGE_ID_1).AndReturn(True)
+        raw = self.mox.CreateMockAnything()
+        notif.save().AndReturn(raw)
+        views._record_names([raw], 'nova')
+        again_args, again = self._message(MESSAGE_ID_1)
+        self.mox.ReplayAll()
+
+        self.assertEqual(views.process_raw_data(
+            self.deployment, args, json.dumps(args), 'nova'), (raw, notif))
+        self.assertEqual(views.process_raw_data(
+            self.deployment, again_args, json.dumps(again_args), 'nova'),
+            (None, again))
+        self.mox.VerifyAll()
+
+    def test_process_raw_data_already_in_db(self):
+        args, notif = self._message(MESSAGE_ID_1)
+        self._mock_transaction()
+        views.STACKDB.claim_message(MESSAGE_ID_1).AndReturn(False)
+        self.mox.ReplayAll()
+
+        self.assertEqual(views.process_raw_data(
+            self.deployment, args, json.dumps(args), 'nova'), (None, notif))
+        self.assertTrue(MESSAGE_ID_1 in views.RECENT_MESSAGES)
+        self.mox.VerifyAll()
+
+    def test_process_raw_data_without_message_id(self):
+        args, notif = self._message(None)
+        raw = self.mox.CreateMockAnything()
+        notif.save().AndReturn(raw)
+        views._record_names([raw], 'nova')
+        self.mox.ReplayAll()
+
+        self.assertEqual(views.process_raw_data(
+            self.deployment, args, json.dumps(args), 'nova'), (raw, notif))
+        self.mox.VerifyAll()
+
+    def test_process_raw_data_batch_drops_duplicates(self):
+        views.RECENT_MESSAGES.put('msg-0', True)
+        messages = []
+        notifs = []
+        for message_id in ('msg-0', 'msg-1', 'msg-2', 'msg-1', 'msg-3'):
+            args, notif = self._message(message_id)
+            messages.append((args, json.dumps(args)))
+            notifs.append(notif)
+        self.mox.StubOutWithMock(notification, 'save_batch')
+        self._mock_transaction()
+        views.STACKDB.claim_messages(mox.SameElementsAs(
+            ['msg-1', 'msg-2', 'msg-3'])).AndReturn(set(['msg-2']))
+        raws = [self.mox.CreateMockAnything(), self.mox.CreateMockAnything()]
+        notification.save_batch([notifs[1], notifs[4]], 'nova')\
+            .AndReturn(raws)
+        views._record_names(raws, 'nova')
+        self.mox.ReplayAll()
+
+        results = views.process_raw_data_batch(self.deployment, messages,
+                                               'nova')
+
+        self.assertEqual(results, [(raws[0], notifs[1]),
+                                   (raws[1], notifs[4])])
+        self.assertTrue('msg-3' in views.RECENT_MESSAGES)
+        self.mox.VerifyAll()
+
+    def test_process_raw_data_batch_counts_duplicates_once(self):
+        messages = []
+        notifs = []
+        for message_id in ('msg-1', 'msg-1', 'msg-2'):
+            args, notif = self._message(message_id)
+            messages.append((args, json.dumps(args)))
+            notifs.append(notif)
+        self.mox.StubOutWithMock(notification, 'save_batch')
+        self.mox.StubOutWithMock(views, '_count_duplicates')
+        self._mock_transaction(exc=IntegrityError)
+        views.STACKDB.claim_messages(mox.SameElementsAs(
+            ['msg-1', 'msg-2'])).AndReturn(set())
+        notification.save_batch([notifs[0], notifs[2]], 'nova')\
+            .AndRaise(IntegrityError())
+        self._mock_transaction()
+        views.STACKDB.claim_message('msg-1').AndReturn(False)
+        self._mock_transaction()
+        views.STACKDB.claim_message('msg-2').AndReturn(True)
+        raw = self.mox.CreateMockAnything()
+        notifs[2].save().AndReturn(raw)
+        views._count_duplicates('nova', 2)
+        views._record_names([raw], 'nova')
+        self.mox.ReplayAll()
+
+        results = views.process_raw_data_batch(self.deployment, messages,
+                                               'nova')
+
+        self.assertEqual(results, [(raw, notifs[2])])
+        self.mox.VerifyAll()
+
+    def test_process_raw_data_batch_race(self):
+        args1, notif1 = self._message('msg-1')
+        args2, notif2 = self._message('msg-2')
+        messages = [(args1, json.dumps(args1)), (args2, json.dumps(args2))]
+        self._mock_transaction(exc=IntegrityError)
+        views.STACKDB.claim_messages(mox.IgnoreArg())\
+            .AndRaise(IntegrityError())
+        self._mock_transaction()
+        views.STACKDB.claim_message('msg-1').AndReturn(False)
+        self._mock_transaction()
+        views.STACKDB.claim_message('msg-2').AndReturn(True)
+        raw = self.mox.CreateMockAnything()
+        notif2.save().AndReturn(raw)
+        views._record_names([raw], 'nova')
+        self.mox.ReplayAll()
+
+        results = views.process_raw_data_batch(self.deployment, messages,
+                                               'nova')
+
+        self.assertEqual(results, [(raw, notif2)])
+        self.mox.VerifyAll()
+
 
 class StacktachLifecycleTestCase(StacktachBaseTestCase):
     def setUp(self):
@@ -108,6 +384,9 @@ class StacktachLifecycleTestCase(StacktachBaseTestCase):
 
     def tearDown(self):
         self.mox.UnsetStubs()
+        views.enable_lifecycle_cache(0)
+        views.enable_kpi_index(0)
+        views.PENDING_ROLLUPS.clear()
 
     def test_start_kpi_tracking_not_update(self):
         raw = self.mox.CreateMockAnything()
@@ -160,6 +439,48 @@ class StacktachLifecycleTestCase(StacktachBaseTestCase):
         views.update_kpi(None, raw)
         self.mox.VerifyAll()
 
+    def test_update_kpi_not_in_index(self):
+        views.enable_kpi_index(3600)
+        raw = self.mox.CreateMockAnything()
+        raw.request_id = REQUEST_ID_1
+        views.STACKDB.find_new_request_trackers(0, mox.IgnoreArg())\
+                     .AndReturn([])
+        self.mox.ReplayAll()
+        views.update_kpi(None, raw)
+        views.update_kpi(None, raw)
+        self.mox.VerifyAll()
+
+    def test_update_kpi_in_index(self):
+        views.enable_kpi_index(3600)
+        end = utils.decimal_utc()
+        raw = self.mox.CreateMockAnything()
+        raw.request_id = REQUEST_ID_1
+        views.KPI_INDEX.add(REQUEST_ID_1, end)
+        views.STACKDB.find_request_trackers(request_id=REQUEST_ID_1)\
+                     .AndReturn([])
+        self.mox.ReplayAll()
+        views.update_kpi(None, raw)
+        self.mox.VerifyAll()
+
+    def test_start_kpi_tracking_adds_to_index(self):
+        views.enable_kpi_index(3600)
+        lifecycle = self.mox.CreateMockAnything()
+        tracker = self.mox.CreateMockAnything()
+        when = utils.decimal_utc()
+        raw = utils.create_raw(self.mox, when, 'compute.instance.update',
+                               host='nova.example.com', service='api')
+        views.STACKDB.create_request_tracker(lifecycle=lifecycle,
+                                             request_id=REQUEST_ID_1,
+                                             start=when,
+                                             last_timing=None,
+                                             duration=str(0.0))\
+                     .AndReturn(tracker)
+        views.STACKDB.save(tracker)
+        self.mox.ReplayAll()
+        views.start_kpi_tracking(lifecycle, raw)
+        self.assertTrue(views.KPI_INDEX.might_contain(REQUEST_ID_1))
+        self.mox.VerifyAll()
+
     def test_update_kpi(self):
         lifecycle = self.mox.CreateMockAnything()
         end = utils.decimal_utc()
@@ -203,8 +524,6 @@ class StacktachLifecycleTestCase(StacktachBaseTestCase):
                      .AndReturn(lifecycle)
         views.STACKDB.save(lifecycle)
 
-        views.STACKDB.find_timings(name=event_name, lifecycle=lifecycle)\
-                     .AndReturn([])
         timing = utils.create_timing(self.mox, event_name, lifecycle)
         views.STACKDB.create_timing(lifecycle=lifecycle, name=event_name)\
                      .AndReturn(timing)
@@ -226,12 +545,13 @@ class StacktachLifecycleTestCase(StacktachBaseTestCase):
         event_name = 'compute.instance.create'
         start_event = '%s.end' % event_name
         end_event = '%s.end' % event_name
-        start_when = datetime.datetime.utcnow()
-        end_when = datetime.datetime.utcnow()
+        start_when = DECIMAL_DUMMY_TIME
+        end_when = DECIMAL_DUMMY_TIME + 30
         start_raw = utils.create_raw(self.mox, start_when, start_event,
                                           state='building')
         end_raw = utils.create_raw(self.mox, end_when, end_event,
                                         old_task='build')
+        end_raw.deployment_id = 1
 
         lifecycle = utils.create_lifecycle(self.mox, INSTANCE_ID_1,
                                                 'active', '', start_raw)
@@ -261,7 +581,126 @@ class StacktachLifecycleTestCase(StacktachBaseTestCase):
         self.assertEqual(timing.end_raw, end_raw)
         self.assertEqual(timing.end_when, end_when)
         self.assertEqual(timing.diff, end_when-start_when)
+        rollup = views.PENDING_ROLLUPS[
+            (event_name, 1, rollups.bucket_for(end_when))]
+        self.assertEqual(rollup.count, 1)
+        self.assertEqual(rollup.total, 30)
+
+        self.mox.VerifyAll()
+
+    def test_flush_rollups(self):
+        views._add_rollup('compute.instance.create', 1,
+                          DECIMAL_DUMMY_TIME, decimal.Decimal(30))
+        views._add_rollup('compute.instance.create', 1,
+                          DECIMAL_DUMMY_TIME, decimal.Decimal(10))
+        pending = views.PENDING_ROLLUPS.values()
+        views.STACKDB.add_timing_rollups(pending)
+        self.mox.ReplayAll()
+
+        views.flush_rollups(force=True)
+        self.assertEqual(len(pending), 1)
+        self.assertEqual(pending[0].count, 2)
+        self.assertEqual(pending[0].total, 40)
+        self.assertEqual(views.PENDING_ROLLUPS, {})
+        self.mox.VerifyAll()
+
+    def test_flush_rollups_not_due(self):
+        views._add_rollup('compute.instance.create', 1,
+                          DECIMAL_DUMMY_TIME, decimal.Decimal(30))
+        self.mox.StubOutWithMock(views, '_rollups_flushed_at')
+        views._rollups_flushed_at = [time.time()]
+        self.mox.ReplayAll()
+
+        views.flush_rollups()
+        self.assertEqual(len(views.PENDING_ROLLUPS), 1)
+        self.mox.VerifyAll()
+
+    def test_flush_rollups_fails(self):
+        views._add_rollup('compute.instance.create', 1,
+                          DECIMAL_DUMMY_TIME, decimal.Decimal(30))
+        views.STACKDB.add_timing_rollups(mox.IgnoreArg())\
+                     .AndRaise(DatabaseError('Deadlock found'))
+        self.mox.StubOutWithMock(views, "log_warn")
+        views.log_warn("Couldn't add 1 pending TimingRollups: "
+                       "Deadlock found")
+        self.mox.ReplayAll()
+
+        views.flush_rollups(force=True)
+        self.assertEqual(views.PENDING_ROLLUPS, {})
+        self.mox.VerifyAll()
+
+    def test_aggregate_lifecycle_end_cached(self):
+        views.enable_lifecycle_cache(10)
+        event_name = 'compute.instance.create'
+        start_event = '%s.start' % event_name
+        end_event = '%s.end' % event_name
+        start_when = DECIMAL_DUMMY_TIME
+        end_when = DECIMAL_DUMMY_TIME + 30
+        start_raw = utils.create_raw(self.mox, start_when, start_event,
+                                     state='building')
+        end_raw = utils.create_raw(self.mox, end_when, end_event,
+                                   old_task='build')
+        end_raw.deployment_id = 1
+
+        views.STACKDB.find_lifecycles(instance=INSTANCE_ID_1).AndReturn([])
+        lifecycle = self.mox.CreateMockAnything()
+        lifecycle.instance = INSTANCE_ID_1
+        views.STACKDB.create_lifecycle(instance=INSTANCE_ID_1)\
+                     .AndReturn(lifecycle)
+        views.STACKDB.save(lifecycle)
+        timing = utils.create_timing(self.mox, event_name, lifecycle)
+        views.STACKDB.create_timing(lifecycle=lifecycle, name=event_name)\
+                     .AndReturn(timing)
+        views.STACKDB.save(timing)
+
+        # The .end is handled without reading anything back.
+        views.STACKDB.save(lifecycle)
+        self.mox.StubOutWithMock(views, "update_kpi")
+        views.update_kpi(timing, end_raw)
+        views.STACKDB.save(timing)
+
+        self.mox.ReplayAll()
+        views.aggregate_lifecycle(start_raw)
+        views.aggregate_lifecycle(end_raw)
+        self.assertEqual(lifecycle.last_raw, end_raw)
+        self.assertEqual(timing.start_raw, start_raw)
+        self.assertEqual(timing.end_raw, end_raw)
+        self.assertEqual(timing.diff, end_when-start_when)
+        stats = views.LIFECYCLE_CACHE.stats()
+        self.assertEqual(stats['hits'], 2)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['size'], 1)
+        self.mox.VerifyAll()
+
+    def test_aggregate_lifecycle_end_cache_miss(self):
+        views.enable_lifecycle_cache(10)
+        event_name = 'compute.instance.create'
+        end_event = '%s.end' % event_name
+        start_when = DECIMAL_DUMMY_TIME
+        end_when = DECIMAL_DUMMY_TIME + 30
+        start_raw = utils.create_raw(self.mox, start_when,
+                                     '%s.start' % event_name)
+        end_raw = utils.create_raw(self.mox, end_when, end_event)
+        end_raw.deployment_id = 1
+
+        lifecycle = utils.create_lifecycle(self.mox, INSTANCE_ID_1,
+                                           'active', '', start_raw)
+        views.STACKDB.find_lifecycles(instance=INSTANCE_ID_1)\
+                     .AndReturn([lifecycle])
+        views.STACKDB.save(lifecycle)
+        timing = utils.create_timing(self.mox, event_name, lifecycle,
+                                     start_raw=start_raw,
+                                     start_when=start_when)
+        views.STACKDB.find_timings(name=event_name, lifecycle=lifecycle)\
+                     .AndReturn([timing])
+        self.mox.StubOutWithMock(views, "update_kpi")
+        views.update_kpi(timing, end_raw)
+        views.STACKDB.save(timing)
 
+        self.mox.ReplayAll()
+        views.aggregate_lifecycle(end_raw)
+        self.assertEqual(timing.end_raw, end_raw)
+        self.assertEqual(views.LIFECYCLE_CACHE.stats()['misses'], 2)
         self.mox.VerifyAll()
 
     def test_aggregate_lifecycle_update(self):
@@ -0,0 +1,200 @@
+# Copyright (c) 2013 - Rackspace Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+import decimal
+import os
+import shutil
+import tempfile
+
+import mox
+
+from stacktach import archive
+from stacktach import cache
+from stacktach import models
+from tests.unit import StacktachBaseTestCase
+
+# 2014-03-10 00:00:00 UTC
+MARCH_10 = 1394409600
+DAY = 60 * 60 * 24
+
+
+def _values(id, when, instance, request_id='req-1'):
+    return {'id': id, 'deployment_id': 1, 'tenant': None,
+            'json': '["monitor.info", {}]', 'routing_key': 'monitor.info',
+            'state': 'active', 'old_state': None, 'old_task': None,
+            'task': None, 'image_type': 0, 'when': when,
+            'publisher': 'compute.host', 'event': 'compute.instance.update',
+            'service': 'compute', 'host': 'host', 'instance': instance,
+            'request_id': request_id}
+
+
+class ArchiveTestCase(StacktachBaseTestCase):
+    def setUp(self):
+        self.mox = mox.Mox()
+        self.directory = tempfile.mkdtemp()
+        self.block_rows = archive.BLOCK_ROWS
+        archive.BLOCK_ROWS = 2
+        archive._INDEXES.clear()
+
+    def tearDown(self):
+        self.mox.UnsetStubs()
+        archive.BLOCK_ROWS = self.block_rows
+        archive._INDEXES.clear()
+        shutil.rmtree(self.directory)
+
+    def _archive(self, rows):
+        archiver = archive.Archiver(models.RawData, self.directory)
+        for values in rows:
+            archiver.add(values)
+        archiver.close()
+
+    def _rows(self):
+        return [_values(1, decimal.Decimal('%d.5' % MARCH_10), 'inst-1'),
+                _values(2, decimal.Decimal(MARCH_10 + 10), 'inst-2'),
+                _values(3, decimal.Decimal(MARCH_10 + 20), 'inst-1', 'req-2'),
+                _values(4, decimal.Decimal(MARCH_10 + DAY), 'inst-1')]
+
+    def test_segments_are_bucketed_by_day(self):
+        self._archive(self._rows())
+
+        paths = archive.index_paths(models.RawData,
+                                    directory=self.directory)
+        self.assertEqual(
+            [os.path.relpath(path, self.directory) for path in paths],
+            [os.path.join('RawData', '20140310', '1-3.idx'),
+             os.path.join('RawData', '20140311', '4-4.idx')])
+        index = archive.load_index(paths[0])
+        self.assertEqual(len(index['blocks']), 2)
+        self.assertEqual(index['keys']['instance'],
+                         {'inst-1': [0, 1], 'inst-2': [0]})
+        self.assertEqual(index['keys']['request_id'],
+                         {'req-1': [0], 'req-2': [1]})
+        self.assertFalse([name for name in os.listdir(os.path.dirname(
+            paths[0])) if name.endswith('.tmp')])
+
+    def test_get(self):
+        self._archive(self._rows())
+
+        raw = archive.get(models.RawData, 3, directory=self.directory)
+        self.assertTrue(isinstance(raw, models.RawData))
+        self.assertEqual(raw.id, 3)
+        self.assertEqual(raw.deployment_id, 1)
+        self.assertEqual(raw.when, decimal.Decimal(MARCH_10 + 20))
+        self.assertEqual(raw.request_id, 'req-2')
+        self.assertEqual(archive.get(models.RawData, 5,
+                                     directory=self.directory), None)
+
+    def test_when_is_kept_exactly(self):
+        self._archive(self._rows())
+
+        raw = archive.get(models.RawData, 1, directory=self.directory)
+        self.assertEqual(str(raw.when), '%d.5' % MARCH_10)
+
+    def test_search(self):
+        self._archive(self._rows())
+
+        found = archive.search(models.RawData, directory=self.directory,
+                               instance='inst-1')
+        self.assertEqual([raw.id for raw in found], [1, 3, 4])
+        found = archive.search(models.RawData, directory=self.directory,
+                               instance='inst-1', request_id='req-1')
+        self.assertEqual([raw.id for raw in found], [1, 4])
+
+    def test_search_when_range(self):
+        self._archive(self._rows())
+
+        found = archive.search(models.RawData, directory=self.directory,
+                               instance='inst-1',
+                               when__gte=decimal.Decimal(MARCH_10 + 1),
+                               when__lte=decimal.Decimal(MARCH_10 + 20))
+        self.assertEqual([raw.id for raw in found], [3])
+
+    def test_search_after(self):
+        self._archive(self._rows())
+
+        found = archive.search(models.RawData, directory=self.directory,
+                               instance='inst-1',
+                               after=(decimal.Decimal('%d.5' % MARCH_10), 1))
+        self.assertEqual([raw.id for raw in found], [3, 4])
+        found = archive.search(models.RawData, directory=self.directory,
+                               after=(decimal.Decimal(MARCH_10 + 20), 3))
+        self.assertEqual([raw.id for raw in found], [4])
+
+    def test_search_orders_each_day_by_when(self):
+        rows = self._rows()
+        rows[0]['when'] = decimal.Decimal(MARCH_10 + 30)
+        self._archive(rows)
+
+        found = archive.search(models.RawData, directory=self.directory)
+        self.assertEqual([raw.id for raw in found], [2, 3, 1, 4])
+
+    def test_search_reads_a_day_at_a_time(self):
+        self._archive(self._rows())
+        path = os.path.join(self.directory, 'RawData', '20140310', '1-3.idx')
+        index = archive.load_index(path)
+        self.mox.StubOutWithMock(archive, 'load_index')
+        archive.load_index(path).AndReturn(index)
+        self.mox.ReplayAll()
+
+        found = archive.search(models.RawData, directory=self.directory)
+        self.assertEqual(found.next().id, 1)
+        self.mox.VerifyAll()
+
+    def test_get_only_loads_the_index_holding_the_id(self):
+        self._archive(self._rows())
+        self.mox.StubOutWithMock(archive, 'load_index')
+        path = os.path.join(self.directory, 'RawData', '20140311', '4-4.idx')
+        archive.load_index(path).AndReturn({'segment': '4-4.seg',
+                                            'blocks': [[0, 0, 4, 4]]})
+        self.mox.StubOutWithMock(archive, '_read_blocks')
+        archive._read_blocks(path, mox.IgnoreArg(), [0]).AndReturn(
+            [archive.to_record(_values(4, decimal.Decimal(MARCH_10),
+                                       'inst-1'))])
+        self.mox.ReplayAll()
+
+        raw = archive.get(models.RawData, 4, directory=self.directory)
+        self.assertEqual(raw.id, 4)
+        self.mox.VerifyAll()
+
+    def test_index_cache_is_bounded(self):
+        self._archive(self._rows())
+        archive._INDEXES = cache.LRUCache(1)
+        try:
+            for path in archive.index_paths(models.RawData,
+                                            directory=self.directory):
+                archive.load_index(path)
+            self.assertEqual(len(archive._INDEXES), 1)
+        finally:
+            archive._INDEXES = cache.LRUCache(archive.INDEX_CACHE_SIZE)
+
+    def test_archived_ids(self):
+        self._archive(self._rows())
+
+        self.assertEqual(archive.archived_ids(models.RawData, 2, 10,
+                                              directory=self.directory),
+                         set([2, 3, 4]))
+        self.assertEqual(archive.last_archived_id(models.RawData,
+                                                  directory=self.directory),
+                         4)
+
+    def test_last_archived_id_empty(self):
+        self.assertEqual(archive.last_archived_id(models.RawData,
+                                                  directory=self.directory),
+                         0)
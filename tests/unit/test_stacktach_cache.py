@@ -0,0 +1,120 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+from stacktach import cache
+from tests.unit import StacktachBaseTestCase
+
+
+class LRUCacheTestCase(StacktachBaseTestCase):
+    def test_get_and_put(self):
+        lru = cache.LRUCache(2)
+        lru.put('a', 1)
+        self.assertEqual(lru.get('a'), 1)
+        self.assertEqual(lru.get('b'), None)
+        self.assertEqual(lru.hits, 1)
+        self.assertEqual(lru.misses, 1)
+
+    def test_put_evicts_least_recently_used(self):
+        lru = cache.LRUCache(2)
+        lru.put('a', 1)
+        lru.put('b', 2)
+        lru.get('a')
+        lru.put('c', 3)
+        self.assertTrue('a' in lru)
+        self.assertFalse('b' in lru)
+        self.assertTrue('c' in lru)
+        self.assertEqual(len(lru), 2)
+        self.assertEqual(lru.evictions, 1)
+
+    def test_put_existing_key(self):
+        lru = cache.LRUCache(2)
+        lru.put('a', 1)
+        lru.put('b', 2)
+        lru.put('a', 3)
+        lru.put('c', 4)
+        self.assertEqual(lru.get('a'), 3)
+        self.assertFalse('b' in lru)
+
+    def test_pop(self):
+        lru = cache.LRUCache(2)
+        lru.put('a', 1)
+        self.assertEqual(lru.pop('a'), 1)
+        self.assertEqual(lru.pop('a'), None)
+        self.assertEqual(len(lru), 0)
+        self.assertEqual(lru.stats(), {'size': 0, 'max_size': 2, 'hits': 1,
+                                       'misses': 1, 'evictions': 0})
+
+    def test_clear(self):
+        lru = cache.LRUCache(2)
+        lru.put('a', 1)
+        lru.clear()
+        self.assertEqual(len(lru), 0)
+        lru.put('b', 2)
+        self.assertEqual(lru.get('b'), 2)
+
+
+class ExpiringIndexTestCase(StacktachBaseTestCase):
+    def setUp(self):
+        self.now = 1000.0
+        self.loads = []
+        self.rows = []
+
+    def _clock(self):
+        return self.now
+
+    def _loader(self, last_id, since):
+        self.loads.append((last_id, since))
+        rows = [row for row in self.rows if row[0] > last_id]
+        return [row for row in rows if row[2] >= since]
+
+    def _index(self):
+        return cache.ExpiringIndex(self._loader, 100, clock=self._clock)
+
+    def test_cold_index_loads_recent_rows(self):
+        self.rows = [(1, 'old', 800.0), (2, 'req-1', 950.0)]
+        index = self._index()
+        self.assertTrue(index.might_contain('req-1'))
+        self.assertFalse(index.might_contain('old'))
+        self.assertEqual(self.loads, [(0, 900.0)])
+        self.assertEqual(index.last_id, 2)
+
+    def test_miss_polls_once_per_interval(self):
+        index = self._index()
+        self.assertFalse(index.might_contain('req-1'))
+        self.rows = [(1, 'req-1', 1000.0)]
+        self.assertFalse(index.might_contain('req-1'))
+        self.assertEqual(len(self.loads), 1)
+        self.now += 1
+        self.assertTrue(index.might_contain('req-1'))
+        self.assertEqual(self.loads, [(0, 900.0), (0, 901.0)])
+        self.assertEqual(index.stats(), {'size': 1, 'hits': 1,
+                                         'misses': 2})
+
+    def test_add_skips_the_poll(self):
+        index = self._index()
+        index.add('req-1', 990)
+        self.assertTrue(index.might_contain('req-1'))
+        self.assertEqual(self.loads, [])
+
+    def test_refresh_expires_old_keys(self):
+        index = self._index()
+        index.add('req-1', 950.0)
+        index.add('req-2', 1000.0)
+        self.now = 1060.0
+        index.refresh()
+        self.assertFalse('req-1' in index._keys)
+        self.assertTrue('req-2' in index._keys)
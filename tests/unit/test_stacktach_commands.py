@@ -0,0 +1,345 @@
+# Copyright (c) 2013 - Rackspace Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+import decimal
+
+import mox
+
+from django.db import transaction
+from django.db.models import Q
+
+from stacktach import archive
+from stacktach import db
+from stacktach import models
+from stacktach import rollups
+from stacktach import utils
+from stacktach.management.commands import archive_raws
+from stacktach.management.commands import compress_raw_json
+from stacktach.management.commands import fill_raw_names
+from stacktach.management.commands import prune
+from stacktach.management.commands import rollup_timings
+from tests.unit import StacktachBaseTestCase
+
+
+class CompressRawJsonTestCase(StacktachBaseTestCase):
+    def setUp(self):
+        self.mox = mox.Mox()
+        self.model = self.mox.CreateMockAnything()
+        self.model.objects = self.mox.CreateMockAnything()
+
+    def tearDown(self):
+        self.mox.UnsetStubs()
+
+    def _mock_transaction(self):
+        self.mox.StubOutWithMock(transaction, 'commit_on_success')
+        tran = self.mox.CreateMockAnything()
+        tran.__enter__().AndReturn(tran)
+        tran.__exit__(mox.IgnoreArg(), mox.IgnoreArg(), mox.IgnoreArg())
+        transaction.commit_on_success().AndReturn(tran)
+
+    def _mock_rows(self, after_id, chunk_size, rows):
+        query = self.mox.CreateMockAnything()
+        self.model.objects.filter(id__gt=after_id).AndReturn(query)
+        query.order_by('id').AndReturn(query)
+        values = self.mox.CreateMockAnything()
+        query.values_list('id', 'json').AndReturn(values)
+        values.__getslice__(0, chunk_size).AndReturn(rows)
+
+    def test_convert_chunk(self):
+        raw_json = '["monitor.info", {}]'
+        compressed = utils.compress_raw_json(raw_json)
+        self._mock_rows(10, 2, [(11, raw_json), (12, compressed)])
+        self._mock_transaction()
+        update = self.mox.CreateMockAnything()
+        self.model.objects.filter(id=11).AndReturn(update)
+        update.update(json=compressed)
+        self.mox.ReplayAll()
+
+        last_id, changed = compress_raw_json.convert_chunk(self.model, 10, 2)
+        self.assertEqual(last_id, 12)
+        self.assertEqual(changed, 1)
+        self.mox.VerifyAll()
+
+    def test_convert_chunk_decompress(self):
+        raw_json = '["monitor.info", {}]'
+        compressed = utils.compress_raw_json(raw_json)
+        self._mock_rows(0, 10, [(1, compressed)])
+        self._mock_transaction()
+        update = self.mox.CreateMockAnything()
+        self.model.objects.filter(id=1).AndReturn(update)
+        update.update(json=raw_json)
+        self.mox.ReplayAll()
+
+        last_id, changed = compress_raw_json.convert_chunk(
+            self.model, 0, 10, decompress=True)
+        self.assertEqual(last_id, 1)
+        self.assertEqual(changed, 1)
+        self.mox.VerifyAll()
+
+    def test_convert_chunk_no_rows_left(self):
+        self._mock_rows(12, 2, [])
+        self.mox.ReplayAll()
+
+        last_id, changed = compress_raw_json.convert_chunk(self.model, 12, 2)
+        self.assertEqual(last_id, None)
+        self.assertEqual(changed, 0)
+        self.mox.VerifyAll()
+
+
+class FillRawNamesTestCase(StacktachBaseTestCase):
+    def setUp(self):
+        self.mox = mox.Mox()
+        self.model = self.mox.CreateMockAnything()
+        self.model.objects = self.mox.CreateMockAnything()
+        self.raws = self.mox.CreateMockAnything()
+
+    def tearDown(self):
+        self.mox.UnsetStubs()
+
+    def test_fill(self):
+        self.raws.exclude(host=None).AndReturn(self.raws)
+        self.raws.exclude(host='').AndReturn(self.raws)
+        self.raws.values_list('deployment', 'host').AndReturn(self.raws)
+        self.raws.distinct().AndReturn([(1, 'compute-1'), (1, 'compute-2'),
+                                        (2, 'compute-1')])
+        known = self.mox.CreateMockAnything()
+        self.model.objects.filter(service='nova').AndReturn(known)
+        known.values_list('deployment', 'name').AndReturn([(1, 'compute-1')])
+        self.mox.StubOutWithMock(db, 'add_raw_name')
+        db.add_raw_name(self.model, 'nova', 1, 'compute-2').AndReturn(True)
+        db.add_raw_name(self.model, 'nova', 2, 'compute-1').AndReturn(False)
+        self.mox.ReplayAll()
+
+        added = fill_raw_names.fill(self.model, 'nova', self.raws, 'host')
+
+        self.assertEqual(added, 1)
+        self.mox.VerifyAll()
+
+
+class PruneTestCase(StacktachBaseTestCase):
+    def setUp(self):
+        self.mox = mox.Mox()
+        for model in (models.Lifecycle, models.Timing,
+                      models.RequestTracker):
+            self.mox.StubOutWithMock(model, 'objects')
+            model.objects = self.mox.CreateMockAnything()
+
+    def tearDown(self):
+        self.mox.UnsetStubs()
+
+    def _mock_transaction(self):
+        self.mox.StubOutWithMock(transaction, 'commit_on_success')
+        tran = self.mox.CreateMockAnything()
+        tran.__enter__().AndReturn(tran)
+        tran.__exit__(mox.IgnoreArg(), mox.IgnoreArg(), mox.IgnoreArg())
+        transaction.commit_on_success().AndReturn(tran)
+
+    def _mock_delete(self, model, ids):
+        query = self.mox.CreateMockAnything()
+        query.db = 'default'
+        model.objects.filter(id__in=ids).AndReturn(query)
+        query._raw_delete('default')
+
+    def _mock_clear_lifecycles(self, ids):
+        trackers = self.mox.CreateMockAnything()
+        models.RequestTracker.objects.filter(lifecycle__in=ids)\
+              .AndReturn(trackers)
+        trackers.values_list('id', flat=True).AndReturn([5])
+        self._mock_delete(models.RequestTracker, [5])
+        timings = self.mox.CreateMockAnything()
+        models.Timing.objects.filter(lifecycle__in=ids).AndReturn(timings)
+        timings.values_list('id', flat=True).AndReturn([7])
+        last_timings = self.mox.CreateMockAnything()
+        models.RequestTracker.objects.filter(last_timing__in=[7])\
+              .AndReturn(last_timings)
+        last_timings.update(last_timing=None)
+        self._mock_delete(models.Timing, [7])
+
+    def test_clear_references_cascades(self):
+        self._mock_clear_lifecycles([1, 2])
+        self.mox.ReplayAll()
+
+        prune.clear_references(models.Lifecycle, [1, 2])
+        self.mox.VerifyAll()
+
+    def _mock_range(self, model, expired, ids):
+        in_range = self.mox.CreateMockAnything()
+        model.objects.filter(id__gte=1, id__lt=11).AndReturn(in_range)
+        matching = self.mox.CreateMockAnything()
+        in_range.filter(expired).AndReturn(matching)
+        matching.values_list('id', flat=True).AndReturn(ids)
+        return in_range
+
+    def test_prune_chunk(self):
+        expired = Q(last_raw=None)
+        self._mock_transaction()
+        self._mock_range(models.Lifecycle, expired, [1, 2])
+        self._mock_clear_lifecycles([1, 2])
+        self._mock_delete(models.Lifecycle, [1, 2])
+        self.mox.ReplayAll()
+
+        deleted = prune.prune_chunk(models.Lifecycle, expired, 1, 11)
+        self.assertEqual(deleted, 2)
+        self.mox.VerifyAll()
+
+    def test_prune_chunk_only_live_rows(self):
+        expired = Q(last_raw=None)
+        self._mock_transaction()
+        in_range = self._mock_range(models.Lifecycle, expired, [])
+        in_range.exists().AndReturn(True)
+        self.mox.ReplayAll()
+
+        deleted = prune.prune_chunk(models.Lifecycle, expired, 1, 11)
+        self.assertEqual(deleted, None)
+        self.mox.VerifyAll()
+
+    def test_prune_chunk_empty_range(self):
+        expired = Q(last_raw=None)
+        self._mock_transaction()
+        in_range = self._mock_range(models.Lifecycle, expired, [])
+        in_range.exists().AndReturn(False)
+        self.mox.ReplayAll()
+
+        deleted = prune.prune_chunk(models.Lifecycle, expired, 1, 11)
+        self.assertEqual(deleted, 0)
+        self.mox.VerifyAll()
+
+
+class ArchiveRawsTestCase(StacktachBaseTestCase):
+    def setUp(self):
+        self.mox = mox.Mox()
+        self.model = self.mox.CreateMockAnything()
+        self.model.objects = self.mox.CreateMockAnything()
+        self.archiver = self.mox.CreateMockAnything()
+
+    def tearDown(self):
+        self.mox.UnsetStubs()
+
+    def test_archive_chunk(self):
+        in_range = self.mox.CreateMockAnything()
+        self.model.objects.filter(id__gte=1, id__lt=3).AndReturn(in_range)
+        expired = self.mox.CreateMockAnything()
+        in_range.filter(when__lt=100).AndReturn(expired)
+        expired.order_by('id').AndReturn(expired)
+        expired.values().AndReturn([{'id': 1}, {'id': 2}])
+        self.archiver.add({'id': 1})
+        self.archiver.add({'id': 2})
+        self.mox.ReplayAll()
+
+        count = archive_raws.archive_chunk(self.archiver, self.model, 100,
+                                           1, 3)
+
+        self.assertEqual(count, 2)
+        self.mox.VerifyAll()
+
+    def test_archive_chunk_only_newer_raws(self):
+        in_range = self.mox.CreateMockAnything()
+        self.model.objects.filter(id__gte=1, id__lt=3).AndReturn(in_range)
+        expired = self.mox.CreateMockAnything()
+        in_range.filter(when__lt=100).AndReturn(expired)
+        expired.order_by('id').AndReturn(expired)
+        expired.values().AndReturn([])
+        in_range.exists().AndReturn(True)
+        self.mox.ReplayAll()
+
+        count = archive_raws.archive_chunk(self.archiver, self.model, 100,
+                                           1, 3)
+
+        self.assertEqual(count, None)
+        self.mox.VerifyAll()
+
+    def _mock_leftovers(self, after_id, rows):
+        leftovers = self.mox.CreateMockAnything()
+        self.model.objects.filter(id__gt=after_id, id__lte=10,
+                                  when__lt=100).AndReturn(leftovers)
+        leftovers.order_by('id').AndReturn(leftovers)
+        leftovers.values().AndReturn(leftovers)
+        leftovers.__getslice__(0, 1000).AndReturn(rows)
+
+    def test_archive_leftovers_skips_archived(self):
+        self.mox.StubOutWithMock(archive, 'archived_ids')
+        self._mock_leftovers(0, [{'id': 4}, {'id': 7}])
+        archive.archived_ids(self.model, 4, 7).AndReturn(set([4]))
+        self.archiver.add({'id': 7})
+        self._mock_leftovers(7, [])
+        self.mox.ReplayAll()
+
+        count = archive_raws.archive_leftovers(self.archiver, self.model,
+                                               100, 10, 1000)
+
+        self.assertEqual(count, 1)
+        self.mox.VerifyAll()
+
+
+class RollupTimingsTestCase(StacktachBaseTestCase):
+    def setUp(self):
+        self.mox = mox.Mox()
+        self.timings = self.mox.CreateMockAnything()
+
+    def tearDown(self):
+        self.mox.UnsetStubs()
+
+    def _mock_rows(self, low_id, batch_size, rows):
+        query = self.mox.CreateMockAnything()
+        self.timings.filter(id__gt=low_id).AndReturn(query)
+        query.order_by('id').AndReturn(query)
+        values = self.mox.CreateMockAnything()
+        query.values_list('id', 'name', 'end_raw__deployment', 'end_when',
+                          'diff').AndReturn(values)
+        values.__getslice__(0, batch_size).AndReturn(rows)
+
+    def test_rollup_chunk(self):
+        self._mock_rows(10, 3, [
+            (11, 'compute.instance.create', 1, decimal.Decimal('3700.5'),
+             decimal.Decimal(10)),
+            (12, 'compute.instance.create', 1, decimal.Decimal(7100),
+             decimal.Decimal(20)),
+            (14, 'compute.instance.create', 1, decimal.Decimal(7300),
+             decimal.Decimal(5))])
+        self.mox.ReplayAll()
+
+        found = {}
+        last_id, added = rollup_timings.rollup_chunk(self.timings, found,
+                                                     10, 3)
+
+        self.assertEqual(last_id, 14)
+        self.assertEqual(added, 3)
+        first = found[('compute.instance.create', 1, decimal.Decimal(3600))]
+        self.assertEqual(first.count, 2)
+        self.assertEqual(first.total, 30)
+        self.assertEqual(first.maximum, 20)
+        second = found[('compute.instance.create', 1, decimal.Decimal(7200))]
+        self.assertEqual(second.count, 1)
+        self.assertEqual(
+            rollups.QuantileSketch.loads(second.sketch).count, 1)
+        self.mox.VerifyAll()
+
+    def test_rollup_chunk_no_rows_left(self):
+        self._mock_rows(14, 3, [])
+        self.mox.ReplayAll()
+
+        found = {}
+        last_id, added = rollup_timings.rollup_chunk(self.timings, found,
+                                                     14, 3)
+
+        self.assertEqual(last_id, None)
+        self.assertEqual(added, 0)
+        self.assertEqual(found, {})
+        self.mox.VerifyAll()
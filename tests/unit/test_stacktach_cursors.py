@@ -0,0 +1,247 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+import base64
+import decimal
+import json
+
+import mox
+
+from django.conf import settings
+
+from stacktach import cursors
+from stacktach import models
+from tests.unit import StacktachBaseTestCase
+
+
+class KeysetTestCase(StacktachBaseTestCase):
+    storage = 'decimal'
+
+    def setUp(self):
+        self.mox = mox.Mox()
+        self.query = self.mox.CreateMockAnything()
+        self.old_storage = getattr(settings, 'TIMESTAMP_STORAGE', 'decimal')
+        settings.TIMESTAMP_STORAGE = self.storage
+
+    def tearDown(self):
+        self.mox.UnsetStubs()
+        settings.TIMESTAMP_STORAGE = self.old_storage
+
+    def _usage(self, id, launched_at):
+        return models.InstanceUsage(id=id, launched_at=launched_at)
+
+    def _expect_filter(self, expected):
+        self.query.filter(mox.Func(lambda q: str(q) == expected))\
+            .AndReturn(self.query)
+
+    def test_unknown_field(self):
+        self.assertRaises(cursors.InvalidCursor, cursors.Keyset,
+                          models.InstanceUsage, 'nonexistent')
+
+    def test_order(self):
+        self.query.order_by('-launched_at', '-id').AndReturn(self.query)
+        self.query.order_by('id').AndReturn(self.query)
+        self.mox.ReplayAll()
+
+        cursors.Keyset(models.InstanceUsage, '-launched_at').order(
+            self.query)
+        cursors.Keyset(models.InstanceUsage, 'id').order(self.query)
+        self.mox.VerifyAll()
+
+    def test_after_descending(self):
+        keyset = cursors.Keyset(models.InstanceUsage, '-launched_at')
+        cursor = keyset.cursor(self._usage(7, decimal.Decimal('10.5')))
+        self._expect_filter(
+            "(OR: ('launched_at__lt', Decimal('10.5')), "
+            "(AND: ('launched_at', Decimal('10.5')), ('id__lt', 7)), "
+            "('launched_at__isnull', True))")
+        self.mox.ReplayAll()
+
+        keyset.after(self.query, cursor)
+        self.mox.VerifyAll()
+
+    def test_after_ascending(self):
+        keyset = cursors.Keyset(models.InstanceUsage, 'launched_at')
+        cursor = keyset.cursor(self._usage(7, decimal.Decimal('10.5')))
+        self._expect_filter(
+            "(OR: ('launched_at__gt', Decimal('10.5')), "
+            "(AND: ('launched_at', Decimal('10.5')), ('id__gt', 7)))")
+        self.mox.ReplayAll()
+
+        keyset.after(self.query, cursor)
+        self.mox.VerifyAll()
+
+    def test_after_null_descending(self):
+        keyset = cursors.Keyset(models.InstanceUsage, '-launched_at')
+        cursor = keyset.cursor(self._usage(7, None))
+        self._expect_filter(
+            "(AND: ('launched_at__isnull', True), ('id__lt', 7))")
+        self.mox.ReplayAll()
+
+        keyset.after(self.query, cursor)
+        self.mox.VerifyAll()
+
+    def test_after_null_ascending(self):
+        keyset = cursors.Keyset(models.InstanceUsage, 'launched_at')
+        cursor = keyset.cursor(self._usage(7, None))
+        self._expect_filter(
+            "(OR: (AND: ('launched_at__isnull', True), ('id__gt', 7)), "
+            "(NOT (AND: ('launched_at__isnull', True))))")
+        self.mox.ReplayAll()
+
+        keyset.after(self.query, cursor)
+        self.mox.VerifyAll()
+
+    def test_after_id(self):
+        keyset = cursors.Keyset(models.InstanceExists, '-id')
+        cursor = keyset.cursor(models.InstanceExists(id=12))
+        self._expect_filter("(AND: ('id__lt', 12))")
+        self.mox.ReplayAll()
+
+        keyset.after(self.query, cursor)
+        self.mox.VerifyAll()
+
+    def test_after_invalid_cursor(self):
+        keyset = cursors.Keyset(models.InstanceUsage, 'launched_at')
+        self.assertRaises(cursors.InvalidCursor, keyset.after, self.query,
+                          'not a cursor')
+
+    def test_after_cursor_for_other_ordering(self):
+        keyset = cursors.Keyset(models.InstanceUsage, 'launched_at')
+        cursor = base64.urlsafe_b64encode(json.dumps(['-id', None, 7]))
+        self.assertRaises(cursors.InvalidCursor, keyset.after, self.query,
+                          cursor)
+
+    def test_cursor_for_values(self):
+        keyset = cursors.Keyset(models.InstanceUsage, '-launched_at')
+        values = {'id': 7, 'instance': 'uuid',
+                  'launched_at': models.db_timestamp(decimal.Decimal('10.5'))}
+        usage = self._usage(7, decimal.Decimal('10.5'))
+        self.assertEqual(keyset.decode(keyset.cursor(values)),
+                         keyset.decode(keyset.cursor(usage)))
+
+    def test_cursor_for_values_null(self):
+        keyset = cursors.Keyset(models.InstanceUsage, '-launched_at')
+        self.assertEqual(keyset.cursor({'id': 7, 'launched_at': None}),
+                         keyset.cursor(self._usage(7, None)))
+
+
+class MicrosecondKeysetTestCase(KeysetTestCase):
+    storage = 'microseconds'
+
+
+class PageTestCase(StacktachBaseTestCase):
+    def setUp(self):
+        self.mox = mox.Mox()
+        self.query = self.mox.CreateMockAnything()
+
+    def tearDown(self):
+        self.mox.UnsetStubs()
+
+    def test_page(self):
+        usages = [models.InstanceUsage(id=3, launched_at=decimal.Decimal(5)),
+                  models.InstanceUsage(id=2, launched_at=decimal.Decimal(4))]
+        self.query.order_by('-launched_at', '-id').AndReturn(self.query)
+        self.query.__getslice__(0, 2).AndReturn(usages)
+        self.mox.ReplayAll()
+
+        page = cursors.page(self.query, models.InstanceUsage,
+                            '-launched_at', '', 2)
+
+        self.assertEqual(list(page), usages)
+        self.assertEqual(page.next_cursor(),
+                         page.keyset.cursor(usages[1]))
+        self.mox.VerifyAll()
+
+    def test_last_page(self):
+        usages = [models.InstanceUsage(id=3, launched_at=decimal.Decimal(5))]
+        self.query.order_by('-launched_at', '-id').AndReturn(self.query)
+        self.query.filter(mox.IgnoreArg()).AndReturn(self.query)
+        self.query.__getslice__(0, 2).AndReturn(usages)
+        self.mox.ReplayAll()
+
+        keyset = cursors.Keyset(models.InstanceUsage, '-launched_at')
+        cursor = keyset.cursor(models.InstanceUsage(
+            id=4, launched_at=decimal.Decimal(5)))
+        page = cursors.page(self.query, models.InstanceUsage,
+                            '-launched_at', cursor, 2)
+
+        self.assertEqual(list(page), usages)
+        self.assertEqual(page.next_cursor(), None)
+        self.mox.VerifyAll()
+
+    def test_iterator(self):
+        usages = [models.InstanceUsage(id=3, launched_at=decimal.Decimal(5)),
+                  models.InstanceUsage(id=2, launched_at=decimal.Decimal(4))]
+        self.query.order_by('-launched_at', '-id').AndReturn(self.query)
+        self.query.__getslice__(0, 2).AndReturn(self.query)
+        self.mox.StubOutWithMock(cursors, 'read_in_chunks')
+        cursors.read_in_chunks(self.query, mox.IsA(cursors.Keyset))\
+            .AndReturn(iter(usages))
+        self.mox.ReplayAll()
+
+        page = cursors.page(self.query, models.InstanceUsage,
+                            '-launched_at', '', 2)
+
+        self.assertEqual(list(page.iterator()), usages)
+        self.assertEqual(page.next_cursor(),
+                         page.keyset.cursor(usages[1]))
+        self.mox.VerifyAll()
+
+    def _sliced(self, low, high):
+        self.query.query = self.mox.CreateMockAnything()
+        self.query.query.low_mark = low
+        self.query.query.high_mark = high
+        base = self.mox.CreateMockAnything()
+        base.query = self.mox.CreateMockAnything()
+        self.query.all().AndReturn(base)
+        base.query.clear_limits()
+        return base
+
+    def test_read_in_chunks(self):
+        base = self._sliced(0, 3)
+        keyset = self.mox.CreateMockAnything()
+        keyset.order(base).AndReturn(base)
+        rows = self.mox.CreateMockAnything()
+        base.__getslice__(0, mox.IgnoreArg()).AndReturn(rows)
+        rows.__getslice__(0, 2).AndReturn([1, 2])
+        keyset.cursor(2).AndReturn('after-2')
+        after = self.mox.CreateMockAnything()
+        keyset.after(base, 'after-2').AndReturn(after)
+        after.__getslice__(0, 1).AndReturn([3])
+        self.mox.ReplayAll()
+
+        self.assertEqual(list(cursors.read_in_chunks(self.query, keyset, 2)),
+                         [1, 2, 3])
+        self.mox.VerifyAll()
+
+    def test_read_in_chunks_unsliced(self):
+        base = self._sliced(0, None)
+        keyset = self.mox.CreateMockAnything()
+        keyset.order(base).AndReturn(base)
+        rows = self.mox.CreateMockAnything()
+        base.__getslice__(0, mox.IgnoreArg()).AndReturn(rows)
+        rows.__getslice__(0, 2).AndReturn([1, 2])
+        keyset.cursor(2).AndReturn('after-2')
+        after = self.mox.CreateMockAnything()
+        keyset.after(base, 'after-2').AndReturn(after)
+        after.__getslice__(0, 2).AndReturn([3])
+        self.mox.ReplayAll()
+
+        self.assertEqual(list(cursors.read_in_chunks(self.query, keyset, 2)),
+                         [1, 2, 3])
+        self.mox.VerifyAll()
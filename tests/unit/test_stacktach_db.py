@@ -18,11 +18,19 @@
 # FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
 # IN THE SOFTWARE.
 
+import decimal
+
 import mox
 
+from django.db import DatabaseError
+from django.db import IntegrityError
+from django.db import transaction
+
 from stacktach import db
 from stacktach import stacklog
 from stacktach import models
+from stacktach import rollups
+from stacktach import sql_ingest
 from tests.unit import StacktachBaseTestCase
 
 
@@ -70,9 +78,8 @@ class StacktachDBTestCase(StacktachBaseTestCase):
         filters = {'field1': 'value1', 'field2': 'value2'}
         results = self.mox.CreateMockAnything()
         Model.objects.filter(**filters).AndReturn(results)
-        results.count().AndReturn(1)
         object = self.mox.CreateMockAnything()
-        results[0].AndReturn(object)
+        results.__getslice__(0, 2).AndReturn([object])
         self.mox.ReplayAll()
         returned = db._safe_get(Model, **filters)
         self.assertEqual(returned, object)
@@ -85,8 +92,7 @@ class StacktachDBTestCase(StacktachBaseTestCase):
         filters = {'field1': 'value1', 'field2': 'value2'}
         results = self.mox.CreateMockAnything()
         Model.objects.filter(**filters).AndReturn(results)
-        results.count().AndReturn(0)
-        log = self.mox.CreateMockAnything()
+        results.__getslice__(0, 2).AndReturn([])
         self.setup_mock_log()
         self.log.warn('No records found for Model get.')
         self.mox.ReplayAll()
@@ -101,11 +107,11 @@ class StacktachDBTestCase(StacktachBaseTestCase):
         filters = {'field1': 'value1', 'field2': 'value2'}
         results = self.mox.CreateMockAnything()
         Model.objects.filter(**filters).AndReturn(results)
-        results.count().AndReturn(2)
+        object = self.mox.CreateMockAnything()
+        other = self.mox.CreateMockAnything()
+        results.__getslice__(0, 2).AndReturn([object, other])
         self.setup_mock_log()
         self.log.warn('Multiple records found for Model get.')
-        object = self.mox.CreateMockAnything()
-        results[0].AndReturn(object)
         self.mox.ReplayAll()
         returned = db._safe_get(Model, **filters)
         self.assertEqual(returned, object)
@@ -174,30 +180,77 @@ class StacktachDBTestCase(StacktachBaseTestCase):
                                 db.find_request_trackers,
                                 select_related=False)
 
+    def test_find_new_request_trackers(self):
+        results = self.mox.CreateMockAnything()
+        models.RequestTracker.objects.filter(id__gt=10, start__gte=100.0)\
+              .AndReturn(results)
+        rows = [(11, 'req-1', 101.0)]
+        results.values_list('id', 'request_id', 'start').AndReturn(rows)
+        self.mox.ReplayAll()
+        returned = db.find_new_request_trackers(10, 100.0)
+        self.assertEqual(returned, rows)
+        self.mox.VerifyAll()
+
     def _test_db_get_or_create_func(self, Model, func):
         params = {'field1': 'value1', 'field2': 'value2'}
+        results = self.mox.CreateMockAnything()
+        Model.objects.filter(**params).AndReturn(results)
         object = self.mox.CreateMockAnything()
-        Model.objects.get_or_create(**params).AndReturn(object)
+        results.__getslice__(0, 2).AndReturn([object])
         self.mox.ReplayAll()
         returned = func(**params)
-        self.assertEqual(returned, object)
+        self.assertEqual(returned, (object, False))
+        self.mox.VerifyAll()
+
+    def _test_db_get_or_create_func_new(self, Model, func):
+        params = {'field1': 'value1', 'field2': 'value2'}
+        results = self.mox.CreateMockAnything()
+        Model.objects.filter(**params).AndReturn(results)
+        results.__getslice__(0, 2).AndReturn([])
+        object = self.mox.CreateMockAnything()
+        Model(**params).AndReturn(object)
+        self.mox.ReplayAll()
+        returned = func(**params)
+        self.assertEqual(returned, (object, True))
         self.mox.VerifyAll()
 
     def test_get_or_create_instance_usage(self):
         self._test_db_get_or_create_func(models.InstanceUsage,
                                          db.get_or_create_instance_usage)
 
+    def test_get_or_create_instance_usage_new(self):
+        self._test_db_get_or_create_func_new(models.InstanceUsage,
+                                             db.get_or_create_instance_usage)
+
+    def test_get_or_create_instance_usage_multiple(self):
+        models.InstanceUsage.__name__ = 'InstanceUsage'
+        params = {'instance': 'uuid', 'request_id': 'req'}
+        results = self.mox.CreateMockAnything()
+        models.InstanceUsage.objects.filter(**params).AndReturn(results)
+        usage = self.mox.CreateMockAnything()
+        other = self.mox.CreateMockAnything()
+        results.__getslice__(0, 2).AndReturn([usage, other])
+        self.setup_mock_log()
+        self.log.warn('Multiple records found for InstanceUsage get.')
+        self.mox.ReplayAll()
+        returned = db.get_or_create_instance_usage(**params)
+        self.assertEqual(returned, (usage, False))
+        self.mox.VerifyAll()
+
     def test_get_or_create_instance_delete(self):
         self._test_db_get_or_create_func(models.InstanceDeletes,
                                          db.get_or_create_instance_delete)
 
+    def test_get_or_create_instance_delete_new(self):
+        self._test_db_get_or_create_func_new(models.InstanceDeletes,
+                                             db.get_or_create_instance_delete)
+
     def test_get_instance_usage(self):
         filters = {'field1': 'value1', 'field2': 'value2'}
         results = self.mox.CreateMockAnything()
         models.InstanceUsage.objects.filter(**filters).AndReturn(results)
-        results.count().AndReturn(1)
         usage = self.mox.CreateMockAnything()
-        results[0].AndReturn(usage)
+        results.__getslice__(0, 2).AndReturn([usage])
         self.mox.ReplayAll()
         returned = db.get_instance_usage(**filters)
         self.assertEqual(returned, usage)
@@ -207,9 +260,8 @@ class StacktachDBTestCase(StacktachBaseTestCase):
         filters = {'field1': 'value1', 'field2': 'value2'}
         results = self.mox.CreateMockAnything()
         models.InstanceDeletes.objects.filter(**filters).AndReturn(results)
-        results.count().AndReturn(1)
         usage = self.mox.CreateMockAnything()
-        results[0].AndReturn(usage)
+        results.__getslice__(0, 2).AndReturn([usage])
         self.mox.ReplayAll()
         returned = db.get_instance_delete(**filters)
         self.assertEqual(returned, usage)
@@ -217,7 +269,360 @@ class StacktachDBTestCase(StacktachBaseTestCase):
 
     def test_save(self):
         o = self.mox.CreateMockAnything()
+        o.pk = None
         o.save()
         self.mox.ReplayAll()
         db.save(o)
         self.mox.VerifyAll()
+
+    def _loaded_object(self):
+        o = models.ReceivedMessage(id=1, message_id='msg-1',
+                                   when=decimal.Decimal('1.5'))
+        o._state.adding = False
+        self.mox.StubOutWithMock(models.ReceivedMessage, 'objects')
+        self.mox.StubOutWithMock(o, 'save')
+        return o
+
+    def _update(self):
+        query = self.mox.CreateMockAnything()
+        models.ReceivedMessage.objects.filter(pk=1).AndReturn(query)
+        return query.update(message_id='msg-1', when=decimal.Decimal('1.5'))
+
+    def test_save_loaded(self):
+        o = self._loaded_object()
+        self._update().AndReturn(1)
+        self.mox.ReplayAll()
+        db.save(o)
+        self.mox.VerifyAll()
+
+    def test_save_loaded_row_gone(self):
+        o = self._loaded_object()
+        self._update().AndReturn(0)
+        o.save(force_insert=True)
+        self.mox.ReplayAll()
+        db.save(o)
+        self.mox.VerifyAll()
+
+    def test_save_loaded_error(self):
+        o = self._loaded_object()
+        self._update().AndRaise(DatabaseError('deadlock'))
+        self.mox.ReplayAll()
+        self.assertRaises(DatabaseError, db.save, o)
+        self.mox.VerifyAll()
+
+    def test_get_image_usages(self):
+        self.mox.StubOutWithMock(models, 'ImageUsage',
+                                 use_mock_anything=True)
+        models.ImageUsage.__name__ = 'ImageUsage'
+        models.ImageUsage.objects = self.mox.CreateMockAnything()
+        self.mox.StubOutWithMock(stacklog, 'warn')
+        first = self.mox.CreateMockAnything()
+        first.uuid = 'uuid-1'
+        second = self.mox.CreateMockAnything()
+        second.uuid = 'uuid-1'
+        other = self.mox.CreateMockAnything()
+        other.uuid = 'uuid-2'
+        query = self.mox.CreateMockAnything()
+        models.ImageUsage.objects.filter(
+            uuid__in=['uuid-1', 'uuid-2', 'uuid-3']).AndReturn(query)
+        query.order_by('id').AndReturn([first, other, second])
+        stacklog.warn('Multiple records found for ImageUsage get.')
+        stacklog.warn('No records found for ImageUsage get.')
+        self.mox.ReplayAll()
+
+        usages = db.get_image_usages(['uuid-1', 'uuid-2', 'uuid-3'])
+
+        self.assertEqual(usages, {'uuid-1': first, 'uuid-2': other})
+        self.mox.VerifyAll()
+
+    def test_create_image_exists_batch(self):
+        self.mox.StubOutWithMock(models, 'ImageExists',
+                                 use_mock_anything=True)
+        models.ImageExists.objects = self.mox.CreateMockAnything()
+        exists = self.mox.CreateMockAnything()
+        models.ImageExists(uuid='uuid-1', size=1).AndReturn(exists)
+        models.ImageExists.objects.bulk_create([exists], batch_size=500)
+        self.mox.ReplayAll()
+
+        self.assertEqual(
+            db.create_image_exists_batch([{'uuid': 'uuid-1', 'size': 1}]),
+            [exists])
+        self.mox.VerifyAll()
+
+    def _stub_received_message(self):
+        self.mox.StubOutWithMock(models, 'ReceivedMessage',
+                                 use_mock_anything=True)
+        models.ReceivedMessage.objects = self.mox.CreateMockAnything()
+        self.mox.StubOutWithMock(transaction, 'savepoint')
+        self.mox.StubOutWithMock(transaction, 'savepoint_commit')
+        self.mox.StubOutWithMock(transaction, 'savepoint_rollback')
+
+    def test_claim_message(self):
+        self._stub_received_message()
+        received = self.mox.CreateMockAnything()
+        models.ReceivedMessage(message_id='msg-1', when=mox.IgnoreArg())\
+            .AndReturn(received)
+        transaction.savepoint().AndReturn('s1')
+        received.save(force_insert=True)
+        transaction.savepoint_commit('s1')
+        self.mox.ReplayAll()
+
+        self.assertTrue(db.claim_message('msg-1'))
+        self.mox.VerifyAll()
+
+    def test_claim_message_already_received(self):
+        self._stub_received_message()
+        received = self.mox.CreateMockAnything()
+        models.ReceivedMessage(message_id='msg-1', when=mox.IgnoreArg())\
+            .AndReturn(received)
+        transaction.savepoint().AndReturn('s1')
+        received.save(force_insert=True).AndRaise(IntegrityError())
+        transaction.savepoint_rollback('s1')
+        self.mox.ReplayAll()
+
+        self.assertFalse(db.claim_message('msg-1'))
+        self.mox.VerifyAll()
+
+    def test_add_raw_name(self):
+        self.mox.StubOutWithMock(models, 'EventName', use_mock_anything=True)
+        models.EventName.objects = self.mox.CreateMockAnything()
+        name = self.mox.CreateMockAnything()
+        models.EventName.objects.get_or_create(
+            service='nova', deployment_id=1,
+            name='compute.instance.update').AndReturn((name, True))
+        self.mox.ReplayAll()
+
+        self.assertTrue(db.add_raw_name(models.EventName, 'nova', 1,
+                                        'compute.instance.update'))
+        self.mox.VerifyAll()
+
+    def test_add_raw_name_already_added(self):
+        self.mox.StubOutWithMock(models, 'HostName', use_mock_anything=True)
+        models.HostName.objects = self.mox.CreateMockAnything()
+        name = self.mox.CreateMockAnything()
+        models.HostName.objects.get_or_create(
+            service='nova', deployment_id=1,
+            name='compute-1').AndReturn((name, False))
+        self.mox.ReplayAll()
+
+        self.assertFalse(db.add_raw_name(models.HostName, 'nova', 1,
+                                         'compute-1'))
+        self.mox.VerifyAll()
+
+    def test_claim_messages(self):
+        self._stub_received_message()
+        query = self.mox.CreateMockAnything()
+        models.ReceivedMessage.objects.filter(
+            message_id__in=['msg-1', 'msg-2']).AndReturn(query)
+        query.values_list('message_id', flat=True).AndReturn(['msg-1'])
+        received = self.mox.CreateMockAnything()
+        models.ReceivedMessage(message_id='msg-2', when=mox.IgnoreArg())\
+            .AndReturn(received)
+        models.ReceivedMessage.objects.bulk_create([received])
+        self.mox.ReplayAll()
+
+        self.assertEqual(db.claim_messages(['msg-1', 'msg-2']),
+                         set(['msg-1']))
+        self.mox.VerifyAll()
+
+    def _stub_transaction(self):
+        self.mox.StubOutWithMock(transaction, 'commit_on_success')
+        context = self.mox.CreateMockAnything()
+        transaction.commit_on_success().AndReturn(context)
+        context.__enter__().AndReturn(context)
+        context.__exit__(None, None, None).AndReturn(None)
+
+    def test_create_nova_rawdata_batch(self):
+        self.mox.StubOutWithMock(models, 'RawDataImageMeta',
+                                 use_mock_anything=True)
+        models.RawDataImageMeta.objects = self.mox.CreateMockAnything()
+        self._stub_transaction()
+        values = {'event': 'compute.instance.update',
+                  'os_architecture': 'x86', 'os_version': '1',
+                  'os_distro': 'linux', 'rax_options': '2'}
+        raw = self.mox.CreateMockAnything()
+        raw.id = 1
+        models.RawData(event='compute.instance.update').AndReturn(raw)
+        raw.save()
+        imagemeta = self.mox.CreateMockAnything()
+        models.RawDataImageMeta(raw_id=1, os_architecture='x86',
+                                os_version='1', os_distro='linux',
+                                rax_options='2').AndReturn(imagemeta)
+        models.RawDataImageMeta.objects.bulk_create([imagemeta])
+        self.mox.ReplayAll()
+        raws = db.create_nova_rawdata_batch([values])
+        self.assertEqual(raws, [raw])
+        self.mox.VerifyAll()
+
+    def test_create_nova_rawdata_indexed(self):
+        self.mox.StubOutWithMock(models, 'RawDataImageMeta',
+                                 use_mock_anything=True)
+        raw = self.mox.CreateMockAnything()
+        models.RawData(event='compute.instance.update', json='')\
+            .AndReturn(raw)
+        raw.save()
+        self.mox.ReplayAll()
+        self.assertEqual(db.create_nova_rawdata(
+            event='compute.instance.update', json=''), raw)
+        self.mox.VerifyAll()
+
+    def test_update_rawdata(self):
+        query = self.mox.CreateMockAnything()
+        models.RawData.objects.filter(id=5).AndReturn(query)
+        query.update(state='active').AndReturn(0)
+        self.mox.ReplayAll()
+        self.assertFalse(db.update_rawdata(models.RawData, 5,
+                                           state='active'))
+        self.mox.VerifyAll()
+
+    def _pending_rollup(self, *diffs):
+        rollup = models.TimingRollup(name='compute.instance.create',
+                                     deployment_id=1,
+                                     bucket=decimal.Decimal(3600))
+        for diff in diffs:
+            rollups.add(rollup, decimal.Decimal(diff))
+        return rollup
+
+    def _stub_timing_rollup(self, sketch):
+        self.mox.StubOutWithMock(db, '_rollup_upsert')
+        db._rollup_upsert().AndReturn('UPSERT')
+        self.mox.StubOutWithMock(db.connection, 'cursor')
+        cursor = self.mox.CreateMockAnything()
+        db.connection.cursor().AndReturn(cursor)
+        cursor.execute('UPSERT', ['compute.instance.create', 1,
+                                  u'3600.000000', 2, u'30.000000',
+                                  u'10.000000', u'20.000000'])
+        meta = models.TimingRollup._meta
+        self.mox.StubOutWithMock(models, 'TimingRollup',
+                                 use_mock_anything=True)
+        models.TimingRollup._meta = meta
+        models.TimingRollup.objects = self.mox.CreateMockAnything()
+        query = self.mox.CreateMockAnything()
+        models.TimingRollup.objects.select_for_update().AndReturn(query)
+        query.filter(name='compute.instance.create', deployment=1,
+                     bucket=decimal.Decimal(3600)).AndReturn(query)
+        query.values_list('id', 'sketch').AndReturn(query)
+        query.get().AndReturn((5, sketch))
+        update = self.mox.CreateMockAnything()
+        models.TimingRollup.objects.filter(id=5).AndReturn(update)
+        saved = {}
+
+        def save_sketch(sketch):
+            saved['sketch'] = sketch
+            return True
+        update.update(sketch=mox.IgnoreArg()).WithSideEffects(save_sketch)
+        return saved
+
+    def test_add_timing_rollups(self):
+        pending = self._pending_rollup(10, 20)
+        saved = self._stub_timing_rollup('')
+        self._stub_transaction()
+        self.mox.ReplayAll()
+
+        db.add_timing_rollups([pending])
+        sketch = rollups.QuantileSketch.loads(saved['sketch'])
+        self.assertEqual(sketch.count, 2)
+        self.mox.VerifyAll()
+
+    def test_add_timing_rollups_raced(self):
+        # Another worker's upsert started the hour first, so ours adds to
+        # its row and the sketch keeps all the Timings.
+        pending = self._pending_rollup(10, 20)
+        other = rollups.QuantileSketch()
+        other.add(decimal.Decimal(15))
+        saved = self._stub_timing_rollup(other.dumps())
+        self._stub_transaction()
+        self.mox.ReplayAll()
+
+        db.add_timing_rollups([pending])
+        sketch = rollups.QuantileSketch.loads(saved['sketch'])
+        self.assertEqual(sketch.count, 3)
+        self.mox.VerifyAll()
+
+    def test_add_timing_rollups_in_key_order(self):
+        early = self._pending_rollup(10)
+        late = self._pending_rollup(10)
+        late.bucket = decimal.Decimal(7200)
+        self.mox.StubOutWithMock(db, '_rollup_upsert')
+        db._rollup_upsert().MultipleTimes().AndReturn('UPSERT')
+        self.mox.StubOutWithMock(db.connection, 'cursor')
+        cursor = self.mox.CreateMockAnything()
+        db.connection.cursor().AndReturn(cursor)
+        buckets = []
+        cursor.execute('UPSERT', mox.IgnoreArg()).MultipleTimes()\
+            .WithSideEffects(lambda sql, params: buckets.append(params[2]))
+        self.mox.StubOutWithMock(models.TimingRollup, 'objects')
+        query = self.mox.CreateMockAnything()
+        models.TimingRollup.objects.select_for_update().MultipleTimes()\
+            .AndReturn(query)
+        query.filter(name=mox.IgnoreArg(), deployment=1,
+                     bucket=mox.IgnoreArg()).MultipleTimes().AndReturn(query)
+        query.values_list('id', 'sketch').MultipleTimes().AndReturn(query)
+        query.get().MultipleTimes().AndReturn((5, ''))
+        models.TimingRollup.objects.filter(id=5).MultipleTimes()\
+            .AndReturn(query)
+        query.update(sketch=mox.IgnoreArg()).MultipleTimes()
+        self._stub_transaction()
+        self.mox.ReplayAll()
+
+        db.add_timing_rollups([late, early])
+        self.assertEqual(buckets, [u'3600.000000', u'7200.000000'])
+        self.mox.VerifyAll()
+
+    def test_create_nova_rawdata_batch_sql(self):
+        self._stub_transaction()
+        self.mox.StubOutWithMock(sql_ingest, 'insert_raws')
+        values = {'event': 'compute.instance.update',
+                  'os_architecture': 'x86', 'os_version': '1',
+                  'os_distro': 'linux', 'rax_options': '2'}
+        raw = self.mox.CreateMockAnything()
+        sql_ingest.insert_raws(
+            models.RawData, [{'event': 'compute.instance.update'}],
+            [{'os_architecture': 'x86', 'os_version': '1',
+              'os_distro': 'linux', 'rax_options': '2'}]).AndReturn([raw])
+        self.mox.ReplayAll()
+        db.set_ingest_backend('sql')
+        try:
+            raws = db.create_nova_rawdata_batch([values])
+        finally:
+            db.set_ingest_backend('orm')
+        self.assertEqual(raws, [raw])
+        self.mox.VerifyAll()
+
+    def test_create_glance_rawdata_sql(self):
+        self.mox.StubOutWithMock(models, 'GlanceRawData',
+                                 use_mock_anything=True)
+        self.mox.StubOutWithMock(sql_ingest, 'insert_raws')
+        self.mox.StubOutWithMock(transaction, 'commit_unless_managed')
+        raw = self.mox.CreateMockAnything()
+        sql_ingest.insert_raws(models.GlanceRawData,
+                               [{'uuid': 'image'}]).AndReturn([raw])
+        transaction.commit_unless_managed()
+        self.mox.ReplayAll()
+        db.set_ingest_backend('sql')
+        try:
+            returned = db.create_glance_rawdata(uuid='image')
+        finally:
+            db.set_ingest_backend('orm')
+        self.assertEqual(returned, raw)
+        self.mox.VerifyAll()
+
+    def test_set_ingest_backend_unknown(self):
+        self.assertRaises(ValueError, db.set_ingest_backend, 'bogus')
+        self.assertFalse(db.SQL_INGEST)
+
+    def test_create_generic_rawdata_batch(self):
+        self.mox.StubOutWithMock(models, 'GenericRawData',
+                                 use_mock_anything=True)
+        models.GenericRawData.objects = self.mox.CreateMockAnything()
+        raw1 = self.mox.CreateMockAnything()
+        raw2 = self.mox.CreateMockAnything()
+        models.GenericRawData(event='event.one').AndReturn(raw1)
+        models.GenericRawData(event='event.two').AndReturn(raw2)
+        self._stub_transaction()
+        models.GenericRawData.objects.bulk_create([raw1, raw2])
+        self.mox.ReplayAll()
+        raws = db.create_generic_rawdata_batch([{'event': 'event.one'},
+                                                {'event': 'event.two'}])
+        self.assertEqual(raws, [raw1, raw2])
+        self.mox.VerifyAll()
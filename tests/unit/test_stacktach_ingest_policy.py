@@ -0,0 +1,198 @@
+# Copyright (c) 2013 - Rackspace Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+import decimal
+
+import mox
+
+from django.db import transaction
+
+from stacktach import db
+from stacktach import ingest_policy
+from stacktach import metrics
+from stacktach import models
+from stacktach import notification
+from tests.unit import StacktachBaseTestCase
+from utils import INSTANCE_ID_1
+from utils import REQUEST_ID_1
+from utils import REQUEST_ID_2
+
+UPDATE = 'compute.instance.update'
+
+
+class IngestPolicyTestCase(StacktachBaseTestCase):
+    def setUp(self):
+        self.mox = mox.Mox()
+        self.mox.StubOutWithMock(db, 'update_rawdata')
+        self.mox.StubOutWithMock(notification, 'create_raw')
+        self.mox.StubOutWithMock(notification, 'create_raws')
+        self.mox.StubOutWithMock(metrics, 'incr')
+        self.deployment = models.Deployment(id=1, name='east')
+        self.policy = ingest_policy.IngestPolicy({
+            UPDATE: ingest_policy.COALESCE,
+            'compute.instance.rebuild.start': ingest_policy.INDEXED})
+
+    def tearDown(self):
+        self.mox.UnsetStubs()
+
+    def _notif(self, event=UPDATE, when='10', request_id=REQUEST_ID_1,
+               routing_key='monitor.info'):
+        notif = self.mox.CreateMockAnything()
+        notif.event = event
+        notif.routing_key = routing_key
+        notif.instance = INSTANCE_ID_1
+        notif.request_id = request_id
+        values = {'deployment': self.deployment, 'event': event,
+                  'instance': INSTANCE_ID_1, 'request_id': request_id,
+                  'when': decimal.Decimal(when), 'json': '["a", {}]',
+                  'state': 'active', 'os_architecture': 'x86',
+                  'os_version': '1', 'os_distro': 'linux',
+                  'rax_options': '2'}
+        notif.rawdata_values().AndReturn(values)
+        return notif, values
+
+    def _raw(self, id, when):
+        raw = self.mox.CreateMockAnything()
+        raw.id = id
+        raw.when = decimal.Decimal(when)
+        return raw
+
+    def test_unknown_policy(self):
+        self.assertRaises(ValueError, ingest_policy.IngestPolicy,
+                          {UPDATE: 'sample'})
+
+    def test_exists_always_full(self):
+        self.assertRaises(ValueError, ingest_policy.IngestPolicy,
+                          {'compute.instance.exists': 'indexed'})
+
+    def test_start_end_not_coalesced(self):
+        self.assertRaises(ValueError, ingest_policy.IngestPolicy,
+                          {'compute.instance.create.end': 'coalesce'})
+
+    def test_error_queue_stored_in_full(self):
+        notif, values = self._notif(routing_key='monitor.error')
+        raw = self._raw(1, '10')
+        notification.create_raw(values, 'nova').AndReturn(raw)
+        self.mox.ReplayAll()
+
+        self.assertEqual(self.policy.save(notif, 'nova'), raw)
+        self.assertEqual(self.policy.held.get(('nova', INSTANCE_ID_1)),
+                         None)
+        self.mox.VerifyAll()
+
+    def test_indexed(self):
+        notif, values = self._notif(event='compute.instance.rebuild.start')
+        raw = self._raw(1, '10')
+        notification.create_raw(
+            {'deployment': self.deployment,
+             'event': 'compute.instance.rebuild.start',
+             'instance': INSTANCE_ID_1, 'request_id': REQUEST_ID_1,
+             'when': decimal.Decimal('10'), 'json': '',
+             'state': 'active'}, 'nova').AndReturn(raw)
+        self.mox.ReplayAll()
+
+        self.assertEqual(self.policy.save(notif, 'nova'), raw)
+        self.mox.VerifyAll()
+
+    def test_coalesce(self):
+        first, first_values = self._notif(when='10')
+        raw = self._raw(5, '10')
+        notification.create_raw(first_values, 'nova').AndReturn(raw)
+        second, second_values = self._notif(when='20')
+        db.update_rawdata(
+            models.RawData, 5, event=UPDATE, instance=INSTANCE_ID_1,
+            request_id=REQUEST_ID_1, when=decimal.Decimal('20'),
+            json='["a", {}]', state='active').AndReturn(True)
+        metrics.incr('stacktach_coalesced_messages_total',
+                     labels={'exchange': 'nova'})
+        self.mox.ReplayAll()
+
+        self.assertEqual(self.policy.save(first, 'nova'), raw)
+        coalesced = self.policy.save(second, 'nova')
+
+        self.assertEqual(coalesced.id, 5)
+        self.assertEqual(coalesced.when, decimal.Decimal('20'))
+        self.assertEqual(coalesced.deployment, self.deployment)
+        self.assertTrue(coalesced.coalesced)
+        self.assertFalse(coalesced._state.adding)
+        self.mox.VerifyAll()
+
+    def test_coalesce_other_request(self):
+        first, first_values = self._notif(when='10')
+        raw = self._raw(5, '10')
+        notification.create_raw(first_values, 'nova').AndReturn(raw)
+        second, second_values = self._notif(when='20',
+                                            request_id=REQUEST_ID_2)
+        other = self._raw(6, '20')
+        notification.create_raw(second_values, 'nova').AndReturn(other)
+        self.mox.ReplayAll()
+
+        self.policy.save(first, 'nova')
+        self.assertEqual(self.policy.save(second, 'nova'), other)
+        self.assertEqual(self.policy.held.get(('nova', INSTANCE_ID_1))[0], 6)
+        self.mox.VerifyAll()
+
+    def test_coalesce_window_expired(self):
+        first, first_values = self._notif(when='10')
+        raw = self._raw(5, '10')
+        notification.create_raw(first_values, 'nova').AndReturn(raw)
+        second, second_values = self._notif(when='71')
+        other = self._raw(6, '71')
+        notification.create_raw(second_values, 'nova').AndReturn(other)
+        self.mox.ReplayAll()
+
+        self.policy.save(first, 'nova')
+        self.assertEqual(self.policy.save(second, 'nova'), other)
+        self.mox.VerifyAll()
+
+    def test_coalesce_raw_gone(self):
+        self.policy.held.put(('nova', INSTANCE_ID_1),
+                             (5, REQUEST_ID_1, decimal.Decimal('10'),
+                              decimal.Decimal('10')))
+        notif, values = self._notif(when='20')
+        db.update_rawdata(
+            models.RawData, 5, event=UPDATE, instance=INSTANCE_ID_1,
+            request_id=REQUEST_ID_1, when=decimal.Decimal('20'),
+            json='["a", {}]', state='active').AndReturn(False)
+        raw = self._raw(6, '20')
+        notification.create_raw(values, 'nova').AndReturn(raw)
+        self.mox.ReplayAll()
+
+        self.assertEqual(self.policy.save(notif, 'nova'), raw)
+        self.assertEqual(self.policy.held.get(('nova', INSTANCE_ID_1))[0], 6)
+        self.mox.VerifyAll()
+
+    def test_save_batch(self):
+        self.mox.StubOutWithMock(transaction, 'commit_on_success')
+        context = self.mox.CreateMockAnything()
+        transaction.commit_on_success().AndReturn(context)
+        context.__enter__().AndReturn(context)
+        first, first_values = self._notif(when='10')
+        second, second_values = self._notif(when='20')
+        context.__exit__(None, None, None).AndReturn(None)
+        raws = [self._raw(5, '10'), self._raw(6, '20')]
+        notification.create_raws([first_values, second_values], 'nova')\
+            .AndReturn(raws)
+        self.mox.ReplayAll()
+
+        self.assertEqual(self.policy.save_batch([first, second], 'nova'),
+                         raws)
+        self.assertEqual(self.policy.held.get(('nova', INSTANCE_ID_1))[0], 6)
+        self.mox.VerifyAll()
@@ -0,0 +1,113 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+import os
+import shutil
+import tempfile
+
+import mox
+
+from stacktach import metrics
+from tests.unit import StacktachBaseTestCase
+
+
+class MetricsTestCase(StacktachBaseTestCase):
+    def setUp(self):
+        self.mox = mox.Mox()
+        self.registry = metrics.Registry()
+
+    def tearDown(self):
+        self.mox.UnsetStubs()
+
+    def test_counter_and_gauge(self):
+        self.registry.incr('messages')
+        self.registry.incr('messages', value=2)
+        self.registry.incr('messages', {'event': 'a'})
+        self.registry.set('depth', 5)
+        self.registry.set('depth', 3)
+        self.assertEqual(self.registry.snapshot(), [
+            (metrics.COUNTER, 'messages', (), 3),
+            (metrics.COUNTER, 'messages', (('event', 'a'),), 1),
+            (metrics.GAUGE, 'depth', (), 3)])
+
+    def test_histogram(self):
+        self.registry.observe('latency', 0.5, buckets=(0.1, 1.0))
+        self.registry.observe('latency', 2.0, buckets=(0.1, 1.0))
+        self.assertEqual(self.registry.snapshot(), [
+            (metrics.HISTOGRAM, 'latency', (), ((0.1, 1.0), (0, 1), 2.5, 2))])
+
+    def test_timer(self):
+        with self.registry.timer('latency'):
+            pass
+        kind, name, labels, value = self.registry.snapshot()[0]
+        self.assertEqual(name, 'latency')
+        self.assertEqual(value[3], 1)
+
+    def test_query_budget(self):
+        budget = metrics.QueryBudget({'compute.instance.exists': 4, '*': 10})
+        self.assertEqual(budget.limit('compute.instance.exists'), 4)
+        self.assertEqual(budget.limit('compute.instance.update'), 10)
+        self.assertTrue(budget.over('compute.instance.exists', 5))
+        self.assertFalse(budget.over('compute.instance.exists', 4))
+        self.assertFalse(metrics.QueryBudget().over('any', 100))
+
+    def test_render(self):
+        self.registry.incr('messages', {'event': 'a"b'})
+        self.registry.observe('latency', 0.5, buckets=(1.0,))
+        rendered = metrics.render([({'exchange': 'nova'},
+                                    self.registry.snapshot())])
+        self.assertEqual(rendered.split('\n'), [
+            '# TYPE latency histogram',
+            'latency_bucket{exchange="nova",le="1.0"} 1',
+            'latency_bucket{exchange="nova",le="+Inf"} 1',
+            'latency_sum{exchange="nova"} 0.5',
+            'latency_count{exchange="nova"} 1',
+            '# TYPE messages counter',
+            'messages{exchange="nova",event="a\\"b"} 1',
+            ''])
+
+    def test_write_stats_file(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmp_dir, 'stats.txt')
+            self.registry.set('depth', 1)
+            metrics.write_stats_file(filename,
+                                     [({}, self.registry.snapshot())])
+            with open(filename) as stats_file:
+                self.assertEqual(stats_file.read(),
+                                 '# TYPE depth gauge\ndepth 1\n')
+            self.assertEqual(os.listdir(tmp_dir), ['stats.txt'])
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_middleware(self):
+        self.mox.StubOutWithMock(metrics, 'observe')
+        metrics.observe('stacktach_web_request_seconds', mox.IsA(float),
+                        {'view': 'tests.unit.test_stacktach_metrics.a_view',
+                         'status': 200})
+        request = self.mox.CreateMockAnything()
+        response = self.mox.CreateMockAnything()
+        response.status_code = 200
+        self.mox.ReplayAll()
+        middleware = metrics.MetricsMiddleware()
+        middleware.process_view(request, a_view, [], {})
+        self.assertEqual(middleware.process_response(request, response),
+                         response)
+        self.mox.VerifyAll()
+
+
+def a_view(request):
+    pass
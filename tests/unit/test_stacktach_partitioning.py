@@ -0,0 +1,122 @@
+# Copyright (c) 2013 - Rackspace Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+import datetime
+
+from django.conf import settings
+
+from stacktach import models
+from stacktach import partitioning
+from tests.unit import StacktachBaseTestCase
+
+# Midnight UTC on 2014-03-10 and 2014-03-11.
+MARCH_10 = 1394409600
+MARCH_11 = 1394496000
+
+
+class PartitioningTestCase(StacktachBaseTestCase):
+    def setUp(self):
+        self.storage = getattr(settings, 'TIMESTAMP_STORAGE', 'decimal')
+        settings.TIMESTAMP_STORAGE = 'decimal'
+
+    def tearDown(self):
+        settings.TIMESTAMP_STORAGE = self.storage
+
+    def test_period_start(self):
+        wednesday = datetime.date(2014, 3, 12)
+        self.assertEqual(partitioning.period_start(wednesday, 1), wednesday)
+        self.assertEqual(partitioning.period_start(wednesday, 7),
+                         datetime.date(2014, 3, 10))
+
+    def test_bound_microseconds(self):
+        day = datetime.date(2014, 3, 10)
+        self.assertEqual(partitioning.bound(day), MARCH_10)
+        settings.TIMESTAMP_STORAGE = 'microseconds'
+        self.assertEqual(partitioning.bound(day), MARCH_10 * 1000000)
+        self.assertEqual(partitioning.bound_to_day(MARCH_10 * 1000000), day)
+
+    def test_enable_sql(self):
+        constraints = [('stacktach_rawdata', 'deployment_id_refs_id_1'),
+                       ('stacktach_timing', 'start_raw_id_refs_id_2')]
+        statements = partitioning.enable_sql(
+            models.RawData, constraints, 1, 1, datetime.date(2014, 3, 9))
+        self.assertEqual(statements, [
+            'ALTER TABLE `stacktach_rawdata` '
+            'DROP FOREIGN KEY `deployment_id_refs_id_1`',
+            'ALTER TABLE `stacktach_timing` '
+            'DROP FOREIGN KEY `start_raw_id_refs_id_2`',
+            'ALTER TABLE `stacktach_rawdata` DROP PRIMARY KEY, '
+            'ADD PRIMARY KEY (`id`, `when`)',
+            'ALTER TABLE `stacktach_rawdata` PARTITION BY RANGE '
+            '(FLOOR(`when`)) ('
+            'PARTITION `p20140309` VALUES LESS THAN (%d), '
+            'PARTITION `p20140310` VALUES LESS THAN (%d), '
+            'PARTITION `pmax` VALUES LESS THAN MAXVALUE)' %
+            (MARCH_10, MARCH_11)])
+
+    def test_create_sql_splits_pmax(self):
+        partitions = [('p20140309', str(MARCH_10)), ('pmax', 'MAXVALUE')]
+        statements = partitioning.create_sql(
+            models.RawData, partitions, 1, 1, datetime.date(2014, 3, 9))
+        self.assertEqual(statements, [
+            'ALTER TABLE `stacktach_rawdata` REORGANIZE PARTITION `pmax` '
+            'INTO (PARTITION `p20140310` VALUES LESS THAN (%d), '
+            'PARTITION `pmax` VALUES LESS THAN MAXVALUE)' % MARCH_11])
+
+    def test_create_sql_nothing_to_add(self):
+        partitions = [('p20140310', str(MARCH_11)), ('pmax', 'MAXVALUE')]
+        statements = partitioning.create_sql(
+            models.RawData, partitions, 1, 0, datetime.date(2014, 3, 9))
+        self.assertEqual(statements, [])
+
+    def test_create_sql_not_partitioned(self):
+        self.assertRaises(ValueError, partitioning.create_sql,
+                          models.RawData, [], 1, 1, datetime.date(2014, 3, 9))
+
+    def test_expired_partitions(self):
+        partitions = [('p20140309', str(MARCH_10)),
+                      ('p20140310', str(MARCH_11)),
+                      ('pmax', 'MAXVALUE')]
+        expired = partitioning.expired_partitions(partitions,
+                                                  datetime.date(2014, 3, 10))
+        self.assertEqual(expired, ['p20140309'])
+
+    def test_drop_sql(self):
+        statements = partitioning.drop_sql(models.RawData, 'p20140309')
+        join = ('JOIN `stacktach_rawdata` PARTITION (`p20140309`) AS expired '
+                'ON `%s`.`%s` = expired.`id`')
+        self.assertTrue(
+            ('DELETE `stacktach_rawdataimagemeta` FROM '
+             '`stacktach_rawdataimagemeta` ' +
+             join % ('stacktach_rawdataimagemeta', 'raw_id')) in statements)
+        self.assertTrue(
+            ('UPDATE `stacktach_timing` ' +
+             join % ('stacktach_timing', 'end_raw_id') +
+             ' SET `stacktach_timing`.`end_raw_id` = NULL') in statements)
+        updated = [statement.split('`')[1] for statement in statements
+                   if statement.startswith('UPDATE')]
+        self.assertEqual(sorted(set(updated)),
+                         ['stacktach_instancedeletes',
+                          'stacktach_instanceexists',
+                          'stacktach_lifecycle',
+                          'stacktach_timing'])
+        self.assertEqual(statements[-1],
+                         'ALTER TABLE `stacktach_rawdata` '
+                         'DROP PARTITION `p20140309`')
@@ -0,0 +1,139 @@
+# Copyright (c) 2013 - Rackspace Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+import json
+
+import mox
+
+from stacktach import metrics
+from stacktach import replay
+from stacktach import utils
+from stacktach import views
+from tests.unit import StacktachBaseTestCase
+
+
+class ReplayTestCase(StacktachBaseTestCase):
+    def setUp(self):
+        self.mox = mox.Mox()
+        self.post_process = views.POST_PROCESS_METHODS['RawData']
+
+    def tearDown(self):
+        views.POST_PROCESS_METHODS['RawData'] = self.post_process
+        self.mox.UnsetStubs()
+
+    def test_read_messages(self):
+        body = {'event_type': 'compute.instance.update'}
+        lines = [json.dumps(['monitor.error', body]) + '\n',
+                 '\n',
+                 json.dumps(body),
+                 utils.compress_raw_json(json.dumps(['monitor.info', body]))]
+
+        messages = list(replay.read_messages(lines, 'notifications.info'))
+
+        self.assertEqual(messages, [('monitor.error', body),
+                                    ('notifications.info', body),
+                                    ('monitor.info', body)])
+
+    def test_percentile(self):
+        values = range(1, 101)
+        self.assertEqual(replay.percentile(values, 50), 50)
+        self.assertEqual(replay.percentile(values, 99), 99)
+        self.assertEqual(replay.percentile([3], 99), 3)
+        self.assertEqual(replay.percentile([1, 2], 50), 1)
+        self.assertEqual(replay.percentile([], 50), 0.0)
+
+    def test_stats_summary(self):
+        stats = replay.Stats()
+        stats.record(0.001, 4)
+        stats.record(0.003, 6)
+
+        summary = stats.summary()
+
+        self.assertEqual(summary['messages'], 2)
+        self.assertAlmostEqual(summary['msgs_per_sec'], 500.0)
+        self.assertAlmostEqual(summary['p50_ms'], 1.0)
+        self.assertAlmostEqual(summary['p99_ms'], 3.0)
+        self.assertEqual(summary['queries_per_msg'], 5.0)
+
+    def test_replay_groups_by_exchange_and_event(self):
+        self.mox.StubOutWithMock(views, 'process_raw_data')
+        views.POST_PROCESS_METHODS['RawData'] = self.mox.CreateMockAnything()
+        deployment = self.mox.CreateMockAnything()
+        args = ('monitor.info', {'event_type': 'compute.instance.update'})
+        raw = self.mox.CreateMockAnything()
+        raw.event = 'compute.instance.update'
+        notif = self.mox.CreateMockAnything()
+        for i in range(2):
+            views.process_raw_data(deployment, args, json.dumps(args),
+                                   'nova').AndReturn((raw, notif))
+            raw.get_name().AndReturn('RawData')
+            views.POST_PROCESS_METHODS['RawData'](raw, notif)
+        self.mox.ReplayAll()
+
+        replayer = replay.Replayer(deployment, count_queries=False)
+        replayer.replay('nova', [args, args])
+        report = replayer.report()
+
+        self.assertEqual(len(report['groups']), 1)
+        group = report['groups'][0]
+        self.assertEqual(group['exchange'], 'nova')
+        self.assertEqual(group['event'], 'compute.instance.update')
+        self.assertEqual(group['messages'], 2)
+        self.assertEqual(report['total']['messages'], 2)
+        self.assertTrue('2 ' in replay.format_report(report))
+        self.mox.VerifyAll()
+
+    def test_replay_batches(self):
+        self.mox.StubOutWithMock(views, 'process_raw_data_batch')
+        views.POST_PROCESS_METHODS['RawData'] = self.mox.CreateMockAnything()
+        deployment = self.mox.CreateMockAnything()
+        args = ('monitor.info', {'event_type': 'compute.instance.exists'})
+        raw = self.mox.CreateMockAnything()
+        raw.event = 'compute.instance.exists'
+        notif = self.mox.CreateMockAnything()
+        views.process_raw_data_batch(
+            deployment, [(args, json.dumps(args))] * 2,
+            'nova').AndReturn([(raw, notif), (raw, notif)])
+        views.process_raw_data_batch(
+            deployment, [(args, json.dumps(args))],
+            'nova').AndReturn([(raw, notif)])
+        raw.get_name().MultipleTimes().AndReturn('RawData')
+        views.POST_PROCESS_METHODS['RawData'](raw, notif).MultipleTimes()
+        self.mox.ReplayAll()
+
+        replayer = replay.Replayer(deployment, count_queries=False)
+        replayer.replay('nova', [args] * 3, batch_size=2)
+
+        self.assertEqual(replayer.report()['total']['messages'], 3)
+        self.mox.VerifyAll()
+
+    def test_over_budget(self):
+        report = {'groups': [
+            {'exchange': 'nova', 'event': 'compute.instance.exists',
+             'queries_per_msg': 6.0},
+            {'exchange': 'nova', 'event': 'compute.instance.update',
+             'queries_per_msg': 3.0},
+            {'exchange': 'nova', 'event': replay.DUPLICATE,
+             'queries_per_msg': 2.0}]}
+        budget = metrics.QueryBudget({'compute.instance.exists': 5, '*': 1})
+        over = replay.over_budget(report, budget)
+        self.assertEqual([group['event'] for group in over],
+                         ['compute.instance.exists',
+                          'compute.instance.update'])
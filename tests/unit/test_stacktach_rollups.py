@@ -0,0 +1,125 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+import decimal
+import random
+
+from stacktach import models
+from stacktach import rollups
+from tests.unit import StacktachBaseTestCase
+
+
+class QuantileSketchTestCase(StacktachBaseTestCase):
+    def _exact(self, values, percent):
+        values = sorted(values)
+        return values[rollups.percentile_rank(percent, len(values))]
+
+    def test_percentile_within_accuracy(self):
+        rand = random.Random(1)
+        values = [rand.expovariate(0.1) for i in range(5000)]
+        sketch = rollups.QuantileSketch()
+        for value in values:
+            sketch.add(value)
+        self.assertEqual(sketch.count, 5000)
+        for percent in (1, 50, 90, 99, 99.9, 100):
+            exact = self._exact(values, percent)
+            self.assertTrue(abs(sketch.percentile(percent) - exact) <=
+                            exact * rollups.RELATIVE_ACCURACY)
+
+    def test_percentile_empty(self):
+        self.assertEqual(rollups.QuantileSketch().percentile(50), None)
+
+    def test_zeros(self):
+        sketch = rollups.QuantileSketch()
+        sketch.add(0)
+        sketch.add(0)
+        sketch.add(10)
+        self.assertEqual(sketch.zeros, 2)
+        self.assertEqual(sketch.percentile(50), 0.0)
+        self.assertTrue(abs(sketch.percentile(100) - 10) <= 0.1)
+
+    def test_merge(self):
+        first = rollups.QuantileSketch()
+        second = rollups.QuantileSketch()
+        both = rollups.QuantileSketch()
+        for value in range(1, 100):
+            both.add(value)
+            if value % 2:
+                first.add(value)
+            else:
+                second.add(value)
+        first.merge(second)
+        self.assertEqual(first.count, both.count)
+        self.assertEqual(first.bins, both.bins)
+
+    def test_dumps_and_loads(self):
+        sketch = rollups.QuantileSketch()
+        sketch.add(0)
+        sketch.add(1.5)
+        sketch.add(300)
+        loaded = rollups.QuantileSketch.loads(sketch.dumps())
+        self.assertEqual(loaded.bins, sketch.bins)
+        self.assertEqual(loaded.zeros, 1)
+        self.assertEqual(loaded.count, 3)
+        self.assertEqual(rollups.QuantileSketch.loads('').count, 0)
+
+
+class RollupsTestCase(StacktachBaseTestCase):
+    def _rollup(self, name, *diffs):
+        rollup = models.TimingRollup(name=name, deployment_id=1,
+                                     bucket=decimal.Decimal(3600))
+        for diff in diffs:
+            rollups.add(rollup, decimal.Decimal(diff))
+        return rollup
+
+    def test_bucket_for(self):
+        self.assertEqual(rollups.bucket_for(decimal.Decimal('7199.5')),
+                         decimal.Decimal(3600))
+        self.assertEqual(rollups.bucket_for(decimal.Decimal(7200)),
+                         decimal.Decimal(7200))
+
+    def test_add(self):
+        rollup = self._rollup('compute.instance.create', 20, 10, 30)
+        self.assertEqual(rollup.count, 3)
+        self.assertEqual(rollup.total, 60)
+        self.assertEqual(rollup.minimum, 10)
+        self.assertEqual(rollup.maximum, 30)
+        self.assertEqual(rollups.QuantileSketch.loads(rollup.sketch).count,
+                         3)
+
+    def test_merge_sketch(self):
+        merged = rollups.merge_sketch(
+            self._rollup('compute.instance.create', 20, 10).sketch,
+            self._rollup('compute.instance.create', 30).sketch)
+        self.assertEqual(rollups.QuantileSketch.loads(merged).count, 3)
+        self.assertEqual(rollups.merge_sketch('', merged), merged)
+
+    def test_summarize(self):
+        summaries = rollups.summarize([
+            self._rollup('compute.instance.resize', 10, 20),
+            self._rollup('compute.instance.create', 5),
+            self._rollup('compute.instance.delete'),
+            self._rollup('compute.instance.resize', 60)])
+        self.assertEqual([summary.name for summary in summaries],
+                         ['compute.instance.create',
+                          'compute.instance.resize'])
+        resize = summaries[1]
+        self.assertEqual(resize.count, 3)
+        self.assertEqual(resize.minimum, 10)
+        self.assertEqual(resize.maximum, 60)
+        self.assertEqual(resize.average(), 30)
+        self.assertEqual(resize.sketch.count, 3)
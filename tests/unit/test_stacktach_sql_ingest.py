@@ -0,0 +1,115 @@
+# Copyright (c) 2013 - Rackspace Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+import decimal
+
+import mox
+
+from django.conf import settings
+from django.db.backends.sqlite3.base import DatabaseOperations
+
+from stacktach import models
+from stacktach import sql_ingest
+from tests.unit import StacktachBaseTestCase
+
+META_SQL = ('INSERT INTO "stacktach_rawdataimagemeta" ("raw_id", '
+            '"os_architecture", "os_distro", "os_version", "rax_options") '
+            'VALUES (%s, %s, %s, %s, %s)')
+
+
+class SqlIngestTestCase(StacktachBaseTestCase):
+    def setUp(self):
+        self.mox = mox.Mox()
+        self.storage = getattr(settings, 'TIMESTAMP_STORAGE', 'decimal')
+        settings.TIMESTAMP_STORAGE = 'decimal'
+        self.mox.StubOutWithMock(sql_ingest, 'connection')
+        sql_ingest.connection.alias = 'default'
+        sql_ingest.connection.ops = DatabaseOperations(None)
+        sql_ingest.connection.features = self.mox.CreateMockAnything()
+        sql_ingest.connection.features.can_return_id_from_insert = False
+        self.mox.StubOutWithMock(sql_ingest, '_TABLES')
+        sql_ingest._TABLES = {}
+
+    def tearDown(self):
+        settings.TIMESTAMP_STORAGE = self.storage
+        self.mox.UnsetStubs()
+
+    def test_table_sql(self):
+        table = sql_ingest.Table(models.RawDataImageMeta)
+        self.assertEqual(table.sql, META_SQL)
+        self.assertEqual(table.returning_sql, None)
+
+    def test_row(self):
+        table = sql_ingest.Table(models.RawData)
+        deployment = models.Deployment(id=3, name='east')
+        row, related = table.row({'deployment': deployment,
+                                  'when': decimal.Decimal('1.5'),
+                                  'event': 'compute.instance.update'})
+        values = dict((field.attname, value)
+                      for field, value in zip(table.fields, row))
+        self.assertEqual(values['deployment_id'], 3)
+        self.assertEqual(values['event'], 'compute.instance.update')
+        self.assertEqual(values['image_type'], 0)
+        self.assertEqual(values['host'], None)
+        self.assertEqual(related, [(models.RawData._meta.get_field(
+            'deployment'), deployment)])
+
+    def test_insert_raws(self):
+        deployment = models.Deployment(id=3, name='east')
+        cursor = self.mox.CreateMockAnything()
+        sql_ingest.connection.cursor().AndReturn(cursor)
+        cursor.execute(mox.StrContains('INSERT INTO "stacktach_rawdata"'),
+                       mox.IsA(list))
+        cursor.lastrowid = 7
+        cursor.executemany(META_SQL, [[7, 'x86', None, None, None]])
+        self.mox.ReplayAll()
+
+        raws = sql_ingest.insert_raws(
+            models.RawData,
+            [{'deployment': deployment, 'when': decimal.Decimal('1.5'),
+              'instance': 'uuid', 'json': '[]'}],
+            [{'os_architecture': 'x86'}])
+
+        self.assertEqual(len(raws), 1)
+        self.assertEqual(raws[0].id, 7)
+        self.assertEqual(raws[0].instance, 'uuid')
+        self.assertEqual(raws[0].when, decimal.Decimal('1.5'))
+        self.assertEqual(raws[0].deployment, deployment)
+        self.assertFalse(raws[0]._state.adding)
+        self.mox.VerifyAll()
+
+    def test_insert_raws_returning(self):
+        sql_ingest.connection.features.can_return_id_from_insert = True
+        ops = sql_ingest.connection.ops
+        self.mox.StubOutWithMock(ops, 'return_insert_id')
+        self.mox.StubOutWithMock(ops, 'fetch_returned_insert_id')
+        ops.return_insert_id().AndReturn(('RETURNING %s', ()))
+        cursor = self.mox.CreateMockAnything()
+        sql_ingest.connection.cursor().AndReturn(cursor)
+        cursor.execute(mox.StrContains('%s) RETURNING "id"'), mox.IsA(list))
+        ops.fetch_returned_insert_id(cursor).AndReturn(9)
+        self.mox.ReplayAll()
+
+        raws = sql_ingest.insert_raws(models.GlanceRawData,
+                                      [{'uuid': 'image', 'json': '[]'}])
+
+        self.assertEqual(raws[0].id, 9)
+        self.assertEqual(raws[0].uuid, 'image')
+        self.mox.VerifyAll()
@@ -0,0 +1,130 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+import json
+
+from django.db.models.query import QuerySet
+import mox
+
+from stacktach import cursors
+from stacktach import models
+from stacktach import streaming
+from tests.unit import StacktachBaseTestCase
+
+
+class StreamingTestCase(StacktachBaseTestCase):
+    def setUp(self):
+        self.mox = mox.Mox()
+
+    def tearDown(self):
+        self.mox.UnsetStubs()
+
+    def _request(self, **params):
+        request = self.mox.CreateMockAnything()
+        request.GET = params
+        return request
+
+    def test_get_format(self):
+        self.assertEqual(streaming.get_format(self._request()), None)
+        self.assertEqual(streaming.get_format(self._request(stream='json')),
+                         streaming.JSON)
+        self.assertEqual(
+            streaming.get_format(self._request(stream='ndjson')),
+            streaming.NDJSON)
+
+    def test_get_format_unknown(self):
+        self.assertRaises(ValueError, streaming.get_format,
+                          self._request(stream='xml'))
+
+    def test_hard_limit(self):
+        self.assertEqual(streaming.hard_limit(self._request(), 1000), 1000)
+        self.assertEqual(
+            streaming.hard_limit(self._request(stream='json'), 1000),
+            streaming.HARD_LIMIT)
+
+    def test_iterate(self):
+        self.assertEqual(list(streaming.iterate([1, 2])), [1, 2])
+
+    def test_iterate_query_set(self):
+        objects = models.InstanceUsage.objects.order_by('-launched_at')[:10]
+        self.mox.StubOutWithMock(cursors, 'read_in_chunks')
+        cursors.read_in_chunks(objects, mox.IsA(cursors.Keyset))\
+            .AndReturn(iter([1, 2]))
+        self.mox.ReplayAll()
+        self.assertEqual(list(streaming.iterate(objects)), [1, 2])
+        self.mox.VerifyAll()
+
+    def test_keyset_for(self):
+        usages = models.InstanceUsage.objects
+        keyset = streaming._keyset_for(usages.order_by('-launched_at'))
+        self.assertEqual(keyset.order_by, '-launched_at')
+        self.assertEqual(streaming._keyset_for(usages.all()).order_by, 'id')
+        self.assertEqual(streaming._keyset_for(
+            usages.order_by('launched_at', 'instance')), None)
+        self.assertEqual(streaming._keyset_for(
+            usages.order_by('tenant__name')), None)
+
+    def test_iterate_by_offset(self):
+        objects = self.mox.CreateMock(QuerySet)
+        objects.query = self.mox.CreateMockAnything()
+        objects.query.low_mark = 0
+        objects.query.high_mark = 3
+        self.mox.StubOutWithMock(streaming, '_keyset_for')
+        streaming._keyset_for(objects).AndReturn(None)
+        self.mox.StubOutWithMock(cursors, 'ITERATOR_CHUNK_SIZE')
+        cursors.ITERATOR_CHUNK_SIZE = 2
+        objects.__getitem__(slice(0, 2)).AndReturn([1, 2])
+        objects.__getitem__(slice(2, 4)).AndReturn([3])
+        self.mox.ReplayAll()
+        self.assertEqual(list(streaming.iterate(objects)), [1, 2, 3])
+        self.mox.VerifyAll()
+
+    def test_json_list(self):
+        parts = streaming.json_list(iter([{'id': 1}, {'id': 2}]))
+        self.assertEqual(json.loads(''.join(parts)), [{'id': 1}, {'id': 2}])
+
+    def test_json_list_empty(self):
+        self.assertEqual(''.join(streaming.json_list(iter([]))), '[]')
+
+    def test_json_list_with_key_and_trailer(self):
+        seen = []
+
+        def items():
+            for id in (1, 2):
+                seen.append(id)
+                yield {'id': id}
+
+        def trailer():
+            # Only asked for once the items have been encoded.
+            self.assertEqual(seen, [1, 2])
+            return {'next_cursor': 'abc'}
+
+        parts = streaming.json_list(items(), 'exists', trailer)
+        self.assertEqual(json.loads(''.join(parts)),
+                         {'exists': [{'id': 1}, {'id': 2}],
+                          'next_cursor': 'abc'})
+
+    def test_ndjson(self):
+        parts = streaming.ndjson(iter([[1, 'a'], [2, 'b']]))
+        self.assertEqual(''.join(parts), '[1, "a"]\n[2, "b"]\n')
+
+    def test_response(self):
+        self.mox.stubs.Set(streaming, 'CHUNK_SIZE', 4)
+        resp = streaming.response(streaming.NDJSON,
+                                  iter(['ab', 'cd', 'ef']))
+        self.assertEqual(resp['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(list(resp.streaming_content), ['abcd', 'ef'])
@@ -14,6 +14,7 @@
 # KIND, either express or implied.  See the License for the
 # specific language governing permissions and limitations
 # under the License.
+import datetime
 import mox
 import decimal
 
@@ -87,3 +88,82 @@ class StacktachUtilsTestCase(StacktachBaseTestCase):
         with self.assertRaises(Exception):
             stacktach_utils.str_time_to_unix("invalid date"),
             decimal.Decimal('1368618671')
+
+    def test_str_time_to_unix_memoizes(self):
+        stacktach_utils._PARSED_TIMES.clear()
+        first = stacktach_utils.str_time_to_unix("2013-05-15T11:51:11Z")
+        self.assertTrue(
+            stacktach_utils.str_time_to_unix("2013-05-15T11:51:11Z") is first)
+
+    def _time_strings(self):
+        start = datetime.datetime(2013, 12, 31, 23, 59, 58)
+        times = []
+        for i in range(200):
+            when = start + datetime.timedelta(seconds=i * 3607,
+                                              microseconds=i * 7919)
+            times.extend([when.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                          when.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+                          when.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3],
+                          when.strftime("%Y-%m-%dT%H:%M:%S"),
+                          when.strftime("%Y-%m-%d %H:%M:%S.%f"),
+                          when.strftime("%Y-%m-%d %H:%M:%S")])
+        # Shapes only strptime handles.
+        times.extend(["2013-5-1 1:2:3", "1969-12-31 23:59:59.25",
+                      "1970-01-01 00:00:00", "2012-02-29T00:00:00Z"])
+        return times
+
+    def test_parse_time_matches_strptime(self):
+        for when in self._time_strings():
+            expected = stacktach_utils._strptime_time_to_unix(when)
+            actual = stacktach_utils.str_time_to_unix(when)
+            self.assertEqual(str(actual), str(expected), when)
+
+    def test_parse_time_rejects_what_strptime_rejects(self):
+        for when in ["2013-05-15 11:51:11Z", "2013-02-30T11:51:11Z",
+                     "2013-05-15T24:00:00"]:
+            self.assertEqual(stacktach_utils._parse_time(when), None)
+            self.assertRaises(Exception,
+                              stacktach_utils._strptime_time_to_unix, when)
+
+    def test_parse_time_parses_usual_shapes(self):
+        for when in self._time_strings()[:-4]:
+            expected = stacktach_utils._strptime_time_to_unix(when)
+            actual = stacktach_utils._parse_time(when)
+            self.assertEqual(str(actual), str(expected), when)
+
+    def test_load_raw_json_routing_key_and_body(self):
+        raw_json = '["monitor.info", {"event_type": "compute.instance.exists"}]'
+        routing_key, body = stacktach_utils.load_raw_json(raw_json,
+                                                          'monitor.error')
+        self.assertEqual(routing_key, 'monitor.info')
+        self.assertEqual(body, {'event_type': 'compute.instance.exists'})
+
+    def test_load_raw_json_original_body(self):
+        raw_json = '{"event_type": "compute.instance.exists"}'
+        routing_key, body = stacktach_utils.load_raw_json(raw_json,
+                                                          'monitor.info')
+        self.assertEqual(routing_key, 'monitor.info')
+        self.assertEqual(body, {'event_type': 'compute.instance.exists'})
+
+    def test_load_raw_json_compressed(self):
+        raw_json = '["monitor.info", {"event_type": "compute.instance.exists"}]'
+        compressed = stacktach_utils.compress_raw_json(raw_json)
+        self.assertTrue(compressed.startswith('z1:'))
+        routing_key, body = stacktach_utils.load_raw_json(compressed)
+        self.assertEqual(routing_key, 'monitor.info')
+        self.assertEqual(body, {'event_type': 'compute.instance.exists'})
+
+    def test_load_raw_json_without_payload(self):
+        routing_key, body = stacktach_utils.load_raw_json('', 'monitor.info')
+        self.assertEqual(routing_key, 'monitor.info')
+        self.assertEqual(body, {})
+
+    def test_compress_raw_json_round_trip(self):
+        raw_json = u'{"display_name": "caf\u00e9"}'
+        compressed = stacktach_utils.compress_raw_json(raw_json)
+        self.assertEqual(stacktach_utils.compress_raw_json(compressed),
+                         compressed)
+        self.assertEqual(stacktach_utils.decompress_raw_json(compressed),
+                         raw_json)
+        self.assertEqual(stacktach_utils.decompress_raw_json(raw_json),
+                         raw_json)
@@ -23,11 +23,15 @@ import datetime
 import decimal
 import json
 from django.core.exceptions import FieldError
+from django.core.exceptions import ObjectDoesNotExist
 
 import mox
 
+from stacktach import archive
+from stacktach import cursors
 from stacktach import datetime_to_decimal as dt
 from stacktach import models
+from stacktach import rollups
 from stacktach import stacky_server
 import utils
 from utils import INSTANCE_ID_1, INSTANCE_TYPE_ID_1
@@ -98,39 +102,56 @@ class StackyServerTestCase(StacktachBaseTestCase):
         raw.tenant = 'tenant'
         return raw
 
-    def test_get_event_names(self):
-        model = self.mox.CreateMockAnything()
+    def _mock_raw_names(self, model_name, service, names, deployment=None):
+        self.mox.StubOutWithMock(models, model_name, use_mock_anything=True)
+        model = getattr(models, model_name)
+        model.objects = self.mox.CreateMockAnything()
         result = self.mox.CreateMockAnything()
-        self.mox.StubOutWithMock(stacky_server, '_model_factory')
-        stacky_server._model_factory('nova').AndReturn(model)
-        model.values('event').AndReturn(result)
-        result.distinct().AndReturn(result)
+        model.objects.filter(service=service).AndReturn(result)
+        if deployment:
+            result.filter(deployment=deployment).AndReturn(result)
+        result.order_by('name').AndReturn(result)
+        result.values_list('name', flat=True).AndReturn(result)
+        result.distinct().AndReturn(names)
+
+    def test_get_event_names(self):
+        self._mock_raw_names('EventName', 'nova',
+                             ['compute.instance.create.end',
+                              'compute.instance.update'])
         self.mox.ReplayAll()
 
         event_names = stacky_server.get_event_names()
-        self.assertEqual(event_names, result)
+        self.assertEqual(event_names,
+                         [{'event': 'compute.instance.create.end'},
+                          {'event': 'compute.instance.update'}])
+
+        self.mox.VerifyAll()
+
+    def test_get_event_names_for_deployment(self):
+        self._mock_raw_names('EventName', 'glance', ['image.upload'],
+                             deployment=2)
+        self.mox.ReplayAll()
+
+        event_names = stacky_server.get_event_names('glance', 2)
+        self.assertEqual(event_names, [{'event': 'image.upload'}])
 
         self.mox.VerifyAll()
 
     def test_get_host_names_for_nova(self):
-        result = self.mox.CreateMockAnything()
-        models.RawData.objects.values('host').AndReturn(result)
-        result.distinct().AndReturn(result)
+        self._mock_raw_names('HostName', 'nova', ['compute-1'])
         self.mox.ReplayAll()
 
-        event_names = stacky_server.get_host_names('nova')
-        self.assertEqual(event_names, result)
+        host_names = stacky_server.get_host_names('nova')
+        self.assertEqual(host_names, [{'host': 'compute-1'}])
 
         self.mox.VerifyAll()
 
     def test_get_host_names_for_glance(self):
-        result = self.mox.CreateMockAnything()
-        models.GlanceRawData.objects.values('host').AndReturn(result)
-        result.distinct().AndReturn(result)
+        self._mock_raw_names('HostName', 'glance', ['glance-api-1'])
         self.mox.ReplayAll()
 
-        event_names = stacky_server.get_host_names('glance')
-        self.assertEqual(event_names, result)
+        host_names = stacky_server.get_host_names('glance')
+        self.assertEqual(host_names, [{'host': 'glance-api-1'}])
 
         self.mox.VerifyAll()
 
@@ -256,7 +277,8 @@ class StackyServerTestCase(StacktachBaseTestCase):
         event2 = {'event': 'some.event.2'}
         events = [event1, event2]
         self.mox.StubOutWithMock(stacky_server, 'get_event_names')
-        stacky_server.get_event_names(service='nova').AndReturn(events)
+        stacky_server.get_event_names(service='nova', deployment=None)\
+            .AndReturn(events)
         self.mox.ReplayAll()
 
         resp = stacky_server.do_events(fake_request)
@@ -276,9 +298,9 @@ class StackyServerTestCase(StacktachBaseTestCase):
         event2 = {'event': 'some.event.2'}
         events = [event1, event2]
         self.mox.StubOutWithMock(stacky_server, 'get_event_names')
-        stacky_server.get_event_names('nova').AndReturn(events)
-        stacky_server.get_event_names('glance').AndReturn(events)
-        stacky_server.get_event_names('generic').AndReturn(events)
+        stacky_server.get_event_names('nova', None).AndReturn(events)
+        stacky_server.get_event_names('glance', None).AndReturn(events)
+        stacky_server.get_event_names('generic', None).AndReturn(events)
         self.mox.ReplayAll()
 
         resp = stacky_server.do_events(fake_request)
@@ -293,12 +315,12 @@ class StackyServerTestCase(StacktachBaseTestCase):
 
     def test_do_hosts(self):
         fake_request = self.mox.CreateMockAnything()
-        fake_request.GET = {'service': 'service'}
+        fake_request.GET = {'service': 'service', 'deployment': '1'}
         host1 = {'host': 'www.demo.com'}
         host2 = {'host': 'www.example.com'}
         hosts = [host1, host2]
         self.mox.StubOutWithMock(stacky_server, 'get_host_names')
-        stacky_server.get_host_names('service').AndReturn(hosts)
+        stacky_server.get_host_names('service', 1).AndReturn(hosts)
         self.mox.ReplayAll()
 
         resp = stacky_server.do_hosts(fake_request)
@@ -311,6 +333,26 @@ class StackyServerTestCase(StacktachBaseTestCase):
         self.assertEqual(json_resp[2], ['www.example.com'])
         self.mox.VerifyAll()
 
+    def test_do_hosts_bad_deployment(self):
+        fake_request = self.mox.CreateMockAnything()
+        fake_request.GET = {'service': 'nova', 'deployment': 'east'}
+        self.mox.ReplayAll()
+
+        resp = stacky_server.do_hosts(fake_request)
+        self.assertEqual(resp.status_code, 400)
+
+        self.mox.VerifyAll()
+
+    def test_do_events_bad_deployment(self):
+        fake_request = self.mox.CreateMockAnything()
+        fake_request.GET = {'service': 'nova', 'deployment': 'east'}
+        self.mox.ReplayAll()
+
+        resp = stacky_server.do_events(fake_request)
+        self.assertEqual(resp.status_code, 400)
+
+        self.mox.VerifyAll()
+
     def test_do_uuid(self):
         search_result = [["#", "?", "When", "Deployment", "Event", "Host",
                           "State", "State'", "Task'"], [1, " ",
@@ -604,36 +646,73 @@ class StackyServerTestCase(StacktachBaseTestCase):
         self.assertEqual(json_resp[2], [INSTANCE_ID_2, '0d 00:00:20'])
         self.mox.VerifyAll()
 
+    def _rollup(self, name, *diffs):
+        rollup = models.TimingRollup(name=name, deployment_id=1,
+                                     bucket=decimal.Decimal(3600))
+        for diff in diffs:
+            rollups.add(rollup, decimal.Decimal(diff))
+        return rollup
+
     def test_do_summary(self):
         fake_request = self.mox.CreateMockAnything()
-        self.mox.StubOutWithMock(stacky_server, 'get_event_names')
-        events = [{'event': 'test.start'}, {'event': 'test.end'}]
-        stacky_server.get_event_names().AndReturn(events)
-        fake_request.GET = {'name': 'test.event'}
+        fake_request.GET = {}
+        found = [self._rollup('test', 10, 20), self._rollup('other', 5),
+                 self._rollup('test', 30)]
+        self.mox.StubOutWithMock(models, 'TimingRollup',
+                                 use_mock_anything=True)
+        models.TimingRollup.objects = self.mox.CreateMockAnything()
         results = self.mox.CreateMockAnything()
-        models.Timing.objects.filter(name='test').AndReturn(results)
-        results.exclude(mox.IgnoreArg()).AndReturn(results)
-        results.exclude(diff__lt=0).AndReturn(results)
-        timing1 = self.mox.CreateMockAnything()
-        timing1.lifecycle = self.mox.CreateMockAnything()
-        timing1.lifecycle.instance = INSTANCE_ID_1
-        timing1.diff = 10
-        timing2 = self.mox.CreateMockAnything()
-        timing2.lifecycle = self.mox.CreateMockAnything()
-        timing2.lifecycle.instance = INSTANCE_ID_2
-        timing2.diff = 20
-        results[None:50].AndReturn(results)
-        results.__len__().AndReturn(2)
-        results.__iter__().AndReturn([timing1, timing2].__iter__())
+        models.TimingRollup.objects.filter().AndReturn(results)
+        results.iterator().AndReturn(iter(found))
         self.mox.ReplayAll()
 
         resp = stacky_server.do_summary(fake_request)
         self.assertEqual(resp.status_code, 200)
         json_resp = json.loads(resp.content)
-        self.assertEqual(len(json_resp), 2)
+        self.assertEqual(len(json_resp), 3)
         self.assertEqual(json_resp[0], ["Event", "N", "Min", "Max", "Avg"])
-        self.assertEqual(json_resp[1], [u'test', 2, u'0d 00:00:10.0',
-                                        u'0d 00:00:20.0', u'0d 00:00:15'])
+        self.assertEqual(json_resp[1], [u'other', 1, u'0d 00:00:05.0',
+                                        u'0d 00:00:05.0', u'0d 00:00:05'])
+        self.assertEqual(json_resp[2], [u'test', 3, u'0d 00:00:10.0',
+                                        u'0d 00:00:30.0', u'0d 00:00:20'])
+
+        self.mox.VerifyAll()
+
+    def test_do_summary_with_percentiles(self):
+        fake_request = self.mox.CreateMockAnything()
+        fake_request.GET = {'percentiles': '50,99',
+                            'end_when_min': '3700', 'end_when_max': '7200',
+                            'deployment': '1'}
+        found = [self._rollup('test', *range(1, 101))]
+        self.mox.StubOutWithMock(models, 'TimingRollup',
+                                 use_mock_anything=True)
+        models.TimingRollup.objects = self.mox.CreateMockAnything()
+        results = self.mox.CreateMockAnything()
+        models.TimingRollup.objects.filter(
+            bucket__gte=decimal.Decimal(3600),
+            bucket__lte=decimal.Decimal(7200),
+            deployment=1).AndReturn(results)
+        results.iterator().AndReturn(iter(found))
+        self.mox.ReplayAll()
+
+        resp = stacky_server.do_summary(fake_request)
+        self.assertEqual(resp.status_code, 200)
+        json_resp = json.loads(resp.content)
+        self.assertEqual(json_resp[0], ["Event", "N", "Min", "Max", "Avg",
+                                        "p50", "p99"])
+        self.assertEqual(json_resp[1], [u'test', 100, u'0d 00:00:01.0',
+                                        u'0d 00:01:40.0', u'0d 00:00:50',
+                                        u'0d 00:00:49.90', u'0d 00:01:38.50'])
+
+        self.mox.VerifyAll()
+
+    def test_do_summary_bad_percentile(self):
+        fake_request = self.mox.CreateMockAnything()
+        fake_request.GET = {'percentiles': '50,101'}
+        self.mox.ReplayAll()
+
+        resp = stacky_server.do_summary(fake_request)
+        self.assertEqual(resp.status_code, 400)
 
         self.mox.VerifyAll()
 
@@ -703,6 +782,45 @@ class StackyServerTestCase(StacktachBaseTestCase):
         self.assertEqual(json_resp[1][8], None)
         self.mox.VerifyAll()
 
+    def test_do_request_ndjson(self):
+        fake_request = self.mox.CreateMockAnything()
+        fake_request.GET = {'request_id': REQUEST_ID_1, 'stream': 'ndjson',
+                            'limit': '5000'}
+        raw = self._create_raw()
+        results = self.mox.CreateMockAnything()
+        models.RawData.objects.filter(request_id=REQUEST_ID_1).AndReturn(results)
+        results.order_by('when').AndReturn(results)
+        results[None:5000].AndReturn(results)
+        results.__iter__().AndReturn([raw].__iter__())
+        self.mox.ReplayAll()
+
+        resp = stacky_server.do_request(fake_request)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp['Content-Type'], 'application/x-ndjson')
+        lines = ''.join(resp.streaming_content).splitlines()
+        self.assertEqual([json.loads(line) for line in lines],
+                         [["#", "?", "When", "Deployment", "Event", "Host",
+                           "State", "State'", "Task'"],
+                          [1, " ", str(dt.dt_from_decimal(raw.when)),
+                           "deployment", "test.start", "example.com",
+                           "active", None, None]])
+        self.mox.VerifyAll()
+
+    def test_do_request_bad_stream(self):
+        fake_request = self.mox.CreateMockAnything()
+        fake_request.GET = {'request_id': REQUEST_ID_1, 'stream': 'xml'}
+        results = self.mox.CreateMockAnything()
+        models.RawData.objects.filter(request_id=REQUEST_ID_1).AndReturn(results)
+        results.order_by('when').AndReturn(results)
+        results[None:50].AndReturn(results)
+        self.mox.ReplayAll()
+
+        resp = stacky_server.do_request(fake_request)
+
+        self.assertEqual(resp.status_code, 400)
+        self.mox.VerifyAll()
+
     def test_do_request_bad_request_id(self):
         fake_request = self.mox.CreateMockAnything()
         fake_request.GET = {'request_id': "obviouslybaduuid"}
@@ -811,6 +929,101 @@ class StackyServerTestCase(StacktachBaseTestCase):
         self._assert_on_show_nova(json_resp, raw)
         self.mox.VerifyAll()
 
+    def test_do_show_falls_back_to_the_archive(self):
+        fake_request = self.mox.CreateMockAnything()
+        fake_request.GET = {}
+        self.mox.StubOutWithMock(archive, 'enabled')
+        self.mox.StubOutWithMock(archive, 'get')
+        raw = self._create_raw()
+        models.RawData.objects.model = models.RawData
+        models.RawData.objects.get(id=1).AndRaise(ObjectDoesNotExist())
+        archive.enabled().AndReturn(True)
+        archive.get(models.RawData, 1).AndReturn(raw)
+        self.mox.ReplayAll()
+
+        resp = stacky_server.do_show(fake_request, 1)
+
+        self.assertEqual(resp.status_code, 200)
+        json_resp = json.loads(resp.content)
+        self._assert_on_show_nova(json_resp, raw)
+        self.mox.VerifyAll()
+
+    def test_do_show_not_in_the_archive_either(self):
+        fake_request = self.mox.CreateMockAnything()
+        fake_request.GET = {}
+        self.mox.StubOutWithMock(archive, 'enabled')
+        self.mox.StubOutWithMock(archive, 'get')
+        models.RawData.objects.model = models.RawData
+        models.RawData.objects.get(id=1).AndRaise(ObjectDoesNotExist())
+        archive.enabled().AndReturn(True)
+        archive.get(models.RawData, 1).AndReturn(None)
+        self.mox.ReplayAll()
+
+        resp = stacky_server.do_show(fake_request, 1)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content, stacky_server.rsp({}).content)
+        self.mox.VerifyAll()
+
+    def test_do_uuid_pages_through_the_archive(self):
+        fake_request = self.mox.CreateMockAnything()
+        fake_request.GET = {'uuid': INSTANCE_ID_1, 'offset': '1',
+                            'limit': '2'}
+        self.mox.StubOutWithMock(archive, 'enabled')
+        self.mox.StubOutWithMock(archive, 'search')
+        archived = [self._create_raw(), self._create_raw()]
+        raw = self._create_raw()
+        models.RawData.objects.model = models.RawData
+        archive.enabled().AndReturn(True)
+        archive.search(models.RawData,
+                       instance=INSTANCE_ID_1).AndReturn(archived)
+        result = self.mox.CreateMockAnything()
+        models.RawData.objects.select_related().AndReturn(result)
+        result.filter(instance=INSTANCE_ID_1).AndReturn(result)
+        result.order_by('when').AndReturn(result)
+        result.__getslice__(0, 1).AndReturn([raw])
+        archived[1].search_results([], mox.IgnoreArg(), ' ').AndReturn(['a'])
+        raw.search_results(['a'], mox.IgnoreArg(), ' ').AndReturn(['a', 'b'])
+        self.mox.ReplayAll()
+
+        resp = stacky_server.do_uuid(fake_request)
+
+        self.assertEqual(json.loads(resp.content), ['a', 'b'])
+        self.mox.VerifyAll()
+
+    def test_do_uuid_pages_through_the_archive_by_cursor(self):
+        fake_request = self.mox.CreateMockAnything()
+        fake_request.GET = {'uuid': INSTANCE_ID_1, 'cursor': 'abc',
+                            'limit': '2'}
+        self.mox.StubOutWithMock(archive, 'enabled')
+        self.mox.StubOutWithMock(archive, 'search')
+        self.mox.StubOutWithMock(cursors, 'Keyset')
+        self.mox.StubOutWithMock(cursors, 'page')
+        archived = self._create_raw()
+        raw = self._create_raw()
+        models.RawData.objects.model = models.RawData
+        archive.enabled().AndReturn(True)
+        result = self.mox.CreateMockAnything()
+        models.RawData.objects.select_related().AndReturn(result)
+        result.filter(instance=INSTANCE_ID_1).AndReturn(result)
+        keyset = self.mox.CreateMockAnything()
+        cursors.Keyset(models.RawData, 'when').AndReturn(keyset)
+        keyset.decode('abc').AndReturn((archived.when, 1))
+        archive.search(models.RawData, after=(archived.when, 1),
+                       instance=INSTANCE_ID_1).AndReturn(iter([archived]))
+        cursors.page(result, models.RawData, 'when', 'abc', 1)\
+            .AndReturn([raw])
+        archived.search_results([], mox.IgnoreArg(), ' ').AndReturn(['a'])
+        raw.search_results(['a'], mox.IgnoreArg(), ' ').AndReturn(['a', 'b'])
+        keyset.cursor(raw).AndReturn('next')
+        self.mox.ReplayAll()
+
+        resp = stacky_server.do_uuid(fake_request)
+
+        self.assertEqual(json.loads(resp.content), ['a', 'b'])
+        self.assertEqual(resp['X-Next-Cursor'], 'next')
+        self.mox.VerifyAll()
+
     def test_do_watch_for_glance(self):
         fake_request = self.mox.CreateMockAnything()
         fake_request.GET = {'service': 'glance'}
@@ -1118,6 +1331,30 @@ class StackyServerTestCase(StacktachBaseTestCase):
         self._assert_on_search_nova(json_resp, raw)
         self.mox.VerifyAll()
 
+    def test_search_streamed(self):
+        titles = ["#", "?", "When", "Deployment", "Event", "Host",
+                  "State", "State'", "Task'"]
+        row = [1, " ", "2013-07-17 10:16:10.717219", "deployment",
+               "test.start", "example.com", "active", None, None]
+        fake_request = self.mox.CreateMockAnything()
+        fake_request.GET = {'field': 'tenant', 'value': 'tenant',
+                            'stream': 'json'}
+        models.RawData.objects.model = models.RawData
+        models.RawData.result_titles = [titles]
+        raw = self._create_raw()
+        results = self.mox.CreateMockAnything()
+        models.RawData.objects.filter(tenant='tenant').AndReturn(results)
+        results.order_by('-when').AndReturn([raw])
+        raw.search_row(mox.IgnoreArg(), ' ').AndReturn(row)
+        self.mox.ReplayAll()
+
+        resp = stacky_server.search(fake_request)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(json.loads(''.join(resp.streaming_content)),
+                         [titles, row])
+        self.mox.VerifyAll()
+
     def test_search_by_field_for_nova_when_filters(self):
         search_result = [["#", "?", "When", "Deployment", "Event", "Host",
                           "State", "State'", "Task'"], [1, " ",
@@ -1283,6 +1520,43 @@ class StackyServerTestCase(StacktachBaseTestCase):
         self.mox.VerifyAll()
 
 
+    def test_model_search_cursor(self):
+        fake_request = self.mox.CreateMockAnything()
+        fake_request.GET = {'cursor': 'abc'}
+        fake_model = self.mox.CreateMockAnything()
+        fake_model.model = models.RawData
+        filters = {'field': 'value'}
+        results = self.mox.CreateMockAnything()
+        fake_model.filter(**filters).AndReturn(results)
+        results.order_by('-when').AndReturn(results)
+        self.mox.StubOutWithMock(cursors, 'page')
+        page = self.mox.CreateMockAnything()
+        cursors.page(results, models.RawData, '-when', 'abc', 50)\
+            .AndReturn(page)
+        self.mox.ReplayAll()
+        actual_results = stacky_server.model_search(fake_request, fake_model,
+                                                    filters,
+                                                    order_by='-when')
+        self.assertEqual(actual_results, page)
+        self.mox.VerifyAll()
+
+    def test_page_rsp(self):
+        keyset = self.mox.CreateMockAnything()
+        page = cursors.Page([], keyset, 1)
+        page.last = self.mox.CreateMockAnything()
+        page.count = 1
+        keyset.cursor(page.last).AndReturn('next')
+        self.mox.ReplayAll()
+
+        resp = stacky_server.page_rsp([['#']], page)
+        self.assertEqual(json.loads(resp.content), [['#']])
+        self.assertEqual(resp['X-Next-Cursor'], 'next')
+        self.mox.VerifyAll()
+
+    def test_page_rsp_without_cursor(self):
+        resp = stacky_server.page_rsp([['#']], [])
+        self.assertFalse(resp.has_header('X-Next-Cursor'))
+
 class JsonReportsSearchAPI(StacktachBaseTestCase):
     def setUp(self):
         self.mox = mox.Mox()
@@ -14,14 +14,20 @@
 # KIND, either express or implied.  See the License for the
 # specific language governing permissions and limitations
 # under the License.
+import datetime
 import json
+import Queue
 
 import kombu
 import mox
 
+from stacktach import datetime_to_decimal as dt
 from stacktach import db, stacklog
+from stacktach import metrics
+from stacktach import utils
 from stacktach import views
 import worker.worker as worker
+from worker import pipeline
 from tests.unit import StacktachBaseTestCase
 
 
@@ -124,6 +130,7 @@ class ConsumerTestCase(StacktachBaseTestCase):
     def test_process(self):
         deployment = self.mox.CreateMockAnything()
         raw = self.mox.CreateMockAnything()
+        raw.when = None
         raw.get_name().AndReturn('RawData')
         message = self.mox.CreateMockAnything()
 
@@ -138,7 +145,7 @@ class ConsumerTestCase(StacktachBaseTestCase):
         mock_notification = self.mox.CreateMockAnything()
         mock_post_process_method = self.mox.CreateMockAnything()
         mock_post_process_method(raw, mock_notification)
-        old_handler = worker.POST_PROCESS_METHODS
+        old_handler = worker.POST_PROCESS_METHODS["RawData"]
         worker.POST_PROCESS_METHODS["RawData"] = mock_post_process_method
 
         self.mox.StubOutWithMock(views, 'process_raw_data',
@@ -157,6 +164,370 @@ class ConsumerTestCase(StacktachBaseTestCase):
         self.mox.VerifyAll()
         worker.POST_PROCESS_METHODS["RawData"] = old_handler
 
+    def test_process_duplicate(self):
+        deployment = self.mox.CreateMockAnything()
+        message = self.mox.CreateMockAnything()
+        exchange = 'nova'
+        consumer = worker.Consumer('test', None, deployment, True, {},
+                                   exchange, self._test_topics())
+        routing_key = 'monitor.info'
+        message.delivery_info = {'routing_key': routing_key}
+        body_dict = {u'key': u'value'}
+        message.body = json.dumps(body_dict)
+        mock_notification = self.mox.CreateMockAnything()
+        self.mox.StubOutWithMock(views, 'process_raw_data',
+                                 use_mock_anything=True)
+        args = (routing_key, body_dict)
+        views.process_raw_data(deployment, args, json.dumps(args), exchange) \
+            .AndReturn((None, mock_notification))
+        message.ack()
+        self.mox.StubOutWithMock(consumer, '_post_process',
+                                 use_mock_anything=True)
+        self.mox.StubOutWithMock(consumer, '_check_memory',
+                                 use_mock_anything=True)
+        consumer._check_memory()
+        self.mox.ReplayAll()
+
+        consumer._process(message)
+
+        self.assertEqual(consumer.processed, 1)
+        self.mox.VerifyAll()
+
+    def test_count_queries_over_budget(self):
+        self.mox.StubOutWithMock(worker, 'db_connection')
+        worker.db_connection.use_debug_cursor = True
+        worker.db_connection.queries = range(6)
+        self.mox.StubOutWithMock(metrics, 'observe')
+        self.mox.StubOutWithMock(metrics, 'incr')
+        consumer = worker.Consumer('test', None, None, True, {}, 'nova',
+                                   self._test_topics(),
+                                   query_budgets={'compute.instance.exists': 2,
+                                                  '*': 5})
+        exists = {'event': 'compute.instance.exists'}
+        update = {'event': 'compute.instance.update'}
+        metrics.observe('stacktach_worker_queries_per_message', 3.0, exists,
+                        buckets=metrics.COUNT_BUCKETS)
+        metrics.incr('stacktach_worker_query_budget_exceeded_total', exists)
+        metrics.observe('stacktach_worker_queries_per_message', 3.0, update,
+                        buckets=metrics.COUNT_BUCKETS)
+        mock_logger = self._setup_mock_logger()
+        self.mox.StubOutWithMock(mock_logger, 'warn')
+        mock_logger.warn("test: compute.instance.exists took 3.0 queries, "
+                         "over its budget of 2")
+        self.mox.ReplayAll()
+        consumer._count_queries(['compute.instance.exists',
+                                 'compute.instance.update'], 2)
+        self.mox.VerifyAll()
+
+    def test_record_queue_wait(self):
+        consumer = worker.Consumer('test', None, None, True, {}, 'nova',
+                                   self._test_topics(), lane='billing')
+        now = datetime.datetime.utcnow()
+        raw = self.mox.CreateMockAnything()
+        raw.when = dt.dt_to_decimal(now - datetime.timedelta(seconds=30))
+        ahead = self.mox.CreateMockAnything()
+        ahead.when = dt.dt_to_decimal(now + datetime.timedelta(seconds=5))
+        self.mox.StubOutWithMock(metrics, 'observe')
+        metrics.observe('stacktach_worker_queue_wait_seconds',
+                        mox.And(mox.IsA(float), mox.Func(lambda wait:
+                                                         30 <= wait < 40)),
+                        buckets=metrics.WAIT_BUCKETS)
+        metrics.observe('stacktach_worker_queue_wait_seconds', 0.0,
+                        buckets=metrics.WAIT_BUCKETS)
+        self.mox.ReplayAll()
+        consumer._record_queue_wait([raw, ahead])
+        self.assertEqual(consumer.queue_wait.count, 2)
+        self.mox.VerifyAll()
+
+    def test_topic_lanes(self):
+        topics = self._test_topics()
+        topics.append(dict(queue="queue3", routing_key="billing.info",
+                           lane="billing"))
+        self.assertEqual(worker.topic_lanes(topics), ['billing', 'default'])
+
+    def test_lane_config(self):
+        config = {'name': 'east', 'batch_size': 100, 'prefetch_count': 200,
+                  'lanes': {'billing': {'batch_size': 1}}}
+        billing = worker.lane_config(config, 'billing')
+        self.assertEqual(billing['batch_size'], 1)
+        self.assertEqual(billing['prefetch_count'], 200)
+        self.assertEqual(worker.lane_config(config, 'default')['batch_size'],
+                         100)
+
+    def test_process_with_post_processor(self):
+        deployment = self.mox.CreateMockAnything()
+        raw = self.mox.CreateMockAnything()
+        raw.when = None
+        post_processor = self.mox.CreateMockAnything()
+        exchange = 'nova'
+        consumer = worker.Consumer('test', None, deployment, True, {},
+                                   exchange, self._test_topics(),
+                                   post_processor=post_processor)
+        body_dict = {u'key': u'value'}
+        message = self._create_message('monitor.info', body_dict)
+        mock_notification = self.mox.CreateMockAnything()
+        self.mox.StubOutWithMock(views, 'process_raw_data',
+                                 use_mock_anything=True)
+        args = ('monitor.info', body_dict)
+        views.process_raw_data(deployment, args, json.dumps(args), exchange) \
+            .AndReturn((raw, mock_notification))
+        message.ack()
+        post_processor.submit(raw, mock_notification)
+        self.mox.StubOutWithMock(consumer, '_check_memory',
+                                 use_mock_anything=True)
+        consumer._check_memory()
+        self.mox.ReplayAll()
+        consumer._process(message)
+        self.assertEqual(consumer.processed, 1)
+        self.assertEqual(consumer.persist_stats.count, 1)
+        self.mox.VerifyAll()
+
+    def test_parse(self):
+        consumer = worker.Consumer('test', None, None, True, {}, 'nova',
+                                   self._test_topics())
+        body_dict = {u'key': u'value'}
+        message = self._create_message('monitor.info', body_dict)
+        self.mox.ReplayAll()
+        args, as_json = consumer._parse(message)
+        self.assertEqual(args, ('monitor.info', body_dict))
+        self.assertEqual(as_json, json.dumps(args))
+        self.mox.VerifyAll()
+
+    def test_parse_store_original_body(self):
+        consumer = worker.Consumer('test', None, None, True, {}, 'nova',
+                                   self._test_topics(),
+                                   store_original_body=True)
+        body_dict = {u'key': u'value'}
+        message = self._create_message('monitor.info', body_dict)
+        self.mox.ReplayAll()
+        args, as_json = consumer._parse(message)
+        self.assertEqual(args, ('monitor.info', body_dict))
+        self.assertEqual(as_json, message.body)
+        self.mox.VerifyAll()
+
+    def test_parse_compress_json(self):
+        consumer = worker.Consumer('test', None, None, True, {}, 'nova',
+                                   self._test_topics(), compress_json=True)
+        body_dict = {u'key': u'value'}
+        message = self._create_message('monitor.info', body_dict)
+        self.mox.ReplayAll()
+        args, as_json = consumer._parse(message)
+        self.assertEqual(args, ('monitor.info', body_dict))
+        self.assertEqual(as_json, utils.compress_raw_json(json.dumps(args)))
+        self.mox.VerifyAll()
+
+    def test_get_consumers_with_prefetch_count(self):
+        kombu_consumer = self.mox.CreateMockAnything()
+        kombu_consumer.qos(prefetch_count=100)
+        def Consumer(queues=None, callbacks=None):
+            return kombu_consumer
+        self.mox.StubOutWithMock(worker.Consumer, '_create_exchange')
+        self.mox.StubOutWithMock(worker.Consumer, '_create_queue')
+        consumer = worker.Consumer('test', None, None, True, {}, "nova",
+                                   self._test_topics(), prefetch_count=100)
+        exchange = self.mox.CreateMockAnything()
+        consumer._create_exchange('nova', 'topic').AndReturn(exchange)
+        consumer._create_queue('queue1', exchange, 'monitor.info')
+        consumer._create_queue('queue2', exchange, 'monitor.error')
+        self.mox.ReplayAll()
+        consumers = consumer.get_consumers(Consumer, None)
+        self.assertEqual(consumers, [kombu_consumer])
+        self.mox.VerifyAll()
+
+    def _create_message(self, routing_key, body_dict):
+        message = self.mox.CreateMockAnything()
+        message.delivery_info = {'routing_key': routing_key}
+        message.body = json.dumps(body_dict)
+        return message
+
+    def test_process_batch_waits_for_batch_size(self):
+        consumer = worker.Consumer('test', None, None, True, {}, 'nova',
+                                   self._test_topics(), batch_size=2)
+        message = self._create_message('monitor.info', {u'key': u'value'})
+        self.mox.StubOutWithMock(views, 'process_raw_data_batch',
+                                 use_mock_anything=True)
+        self.mox.ReplayAll()
+        consumer._process(message)
+        self.assertEqual(consumer.pending, [message])
+        self.assertEqual(consumer.processed, 0)
+        self.mox.VerifyAll()
+
+    def test_process_batch(self):
+        deployment = self.mox.CreateMockAnything()
+        exchange = 'nova'
+        consumer = worker.Consumer('test', None, deployment, True, {},
+                                   exchange, self._test_topics(),
+                                   batch_size=2)
+        routing_key = 'monitor.info'
+        body1 = {u'key': u'value1'}
+        body2 = {u'key': u'value2'}
+        message1 = self._create_message(routing_key, body1)
+        message2 = self._create_message(routing_key, body2)
+        raw1 = self.mox.CreateMockAnything()
+        raw1.when = None
+        raw2 = self.mox.CreateMockAnything()
+        raw2.when = None
+        notif1 = self.mox.CreateMockAnything()
+        notif2 = self.mox.CreateMockAnything()
+
+        self.mox.StubOutWithMock(views, 'process_raw_data_batch',
+                                 use_mock_anything=True)
+        args1 = (routing_key, body1)
+        args2 = (routing_key, body2)
+        parsed = [(args1, json.dumps(args1)), (args2, json.dumps(args2))]
+        views.process_raw_data_batch(deployment, parsed, exchange)\
+             .AndReturn([(raw1, notif1), (raw2, notif2)])
+        message1.ack()
+        message2.ack()
+        mock_post_process_method = self.mox.CreateMockAnything()
+        raw1.get_name().AndReturn('RawData')
+        mock_post_process_method(raw1, notif1)
+        raw2.get_name().AndReturn('RawData')
+        mock_post_process_method(raw2, notif2)
+        old_handler = worker.POST_PROCESS_METHODS["RawData"]
+        worker.POST_PROCESS_METHODS["RawData"] = mock_post_process_method
+        self.mox.StubOutWithMock(consumer, '_check_memory',
+                                 use_mock_anything=True)
+        consumer._check_memory()
+        self.mox.ReplayAll()
+
+        consumer._process(message1)
+        consumer._process(message2)
+        self.assertEqual(consumer.processed, 2)
+        self.assertEqual(consumer.pending, [])
+        self.mox.VerifyAll()
+        worker.POST_PROCESS_METHODS["RawData"] = old_handler
+
+    def test_on_iteration_flushes_after_batch_timeout(self):
+        consumer = worker.Consumer('test', None, None, True, {}, 'nova',
+                                   self._test_topics(), batch_size=10,
+                                   batch_timeout=500)
+        message = self.mox.CreateMockAnything()
+        consumer.pending = [message]
+        consumer.pending_since = (datetime.datetime.utcnow() -
+                                  datetime.timedelta(seconds=1))
+        self.mox.StubOutWithMock(consumer, '_flush', use_mock_anything=True)
+        consumer._flush()
+        self.mox.ReplayAll()
+        consumer.on_iteration()
+        self.mox.VerifyAll()
+
+    def test_on_iteration_before_batch_timeout(self):
+        consumer = worker.Consumer('test', None, None, True, {}, 'nova',
+                                   self._test_topics(), batch_size=10,
+                                   batch_timeout=60000)
+        message = self.mox.CreateMockAnything()
+        consumer.pending = [message]
+        consumer.pending_since = datetime.datetime.utcnow()
+        self.mox.StubOutWithMock(consumer, '_flush', use_mock_anything=True)
+        self.mox.ReplayAll()
+        consumer.on_iteration()
+        self.mox.VerifyAll()
+
+    def _create_dispatcher(self, exchange='nova', partitions=2):
+        inboxes = [Queue.Queue() for i in range(partitions)]
+        done = Queue.Queue()
+        dispatcher = worker.Dispatcher('test', None, None, True, {},
+                                       exchange, self._test_topics(),
+                                       inboxes, done)
+        return dispatcher, inboxes, done
+
+    def test_dispatcher_default_prefetch_count(self):
+        dispatcher, inboxes, done = self._create_dispatcher(partitions=3)
+        self.assertEqual(dispatcher.prefetch_count,
+                         3 * worker.DISPATCH_PREFETCH_PER_PARTITION)
+
+    def test_dispatcher_process(self):
+        dispatcher, inboxes, done = self._create_dispatcher()
+        body = {'event_type': 'compute.instance.update',
+                'publisher_id': 'compute.host',
+                'payload': {'instance_id': 'uuid-1'}}
+        message = self._create_message('monitor.info', body)
+        self.mox.StubOutWithMock(dispatcher, '_check_memory',
+                                 use_mock_anything=True)
+        dispatcher._check_memory()
+        self.mox.ReplayAll()
+        dispatcher._process(message)
+        partition = pipeline.partition_for('uuid-1', 2)
+        self.assertEqual(inboxes[partition].get_nowait(),
+                         (1, 'monitor.info', message.body))
+        self.assertTrue(inboxes[1 - partition].empty())
+        self.assertEqual(dispatcher.unacked, {1: message})
+        self.assertEqual(dispatcher.processed, 1)
+        self.mox.VerifyAll()
+
+    def test_dispatcher_glance_partition_key(self):
+        dispatcher, inboxes, done = self._create_dispatcher('glance')
+        body = {'event_type': 'image.upload',
+                'publisher_id': 'glance-api01',
+                'payload': {'id': 'image-1'}}
+        self.assertEqual(dispatcher._partition_key('monitor.info', body),
+                         'image-1')
+
+    def test_dispatcher_acks_done_messages(self):
+        dispatcher, inboxes, done = self._create_dispatcher()
+        message1 = self.mox.CreateMockAnything()
+        message2 = self.mox.CreateMockAnything()
+        dispatcher.unacked = {1: message1, 2: message2}
+        message2.ack()
+        self.mox.ReplayAll()
+        worker.PartitionMessage(2, 'monitor.info', '{}', done).ack()
+        # From before a reconnect, so there's nothing to ack.
+        worker.PartitionMessage(7, 'monitor.info', '{}', done).ack()
+        dispatcher.on_iteration()
+        self.assertEqual(dispatcher.unacked, {1: message1})
+        self.mox.VerifyAll()
+
+    def test_dispatcher_connection_revived(self):
+        dispatcher, inboxes, done = self._create_dispatcher()
+        dispatcher.unacked = {1: self.mox.CreateMockAnything()}
+        inboxes[0].put((1, 'monitor.info', '{}'))
+        inboxes[1].put((2, 'monitor.info', '{}'))
+        dispatcher.on_connection_revived()
+        self.assertEqual(dispatcher.unacked, {})
+        self.assertTrue(inboxes[0].empty())
+        self.assertTrue(inboxes[1].empty())
+
+    def test_run_partition(self):
+        mock_logger = self._setup_mock_logger()
+        self.mox.StubOutWithMock(mock_logger, 'info')
+        mock_logger.info('east_coast.prod.global[1]: nova partition')
+        mock_logger.info("Worker exiting.")
+        config = {
+            'name': 'east_coast.prod.global',
+            "topics": {"nova": self._test_topics()}
+        }
+        self.mox.StubOutWithMock(db, 'get_deployment')
+        deployment = self.mox.CreateMockAnything()
+        db.get_deployment(1).AndReturn(deployment)
+        stats = self.mox.CreateMockAnything()
+        self.mox.StubOutClassWithMocks(worker, 'Consumer')
+        consumer = worker.Consumer('east_coast.prod.global[1]', None,
+                                   deployment, None, None, 'nova', None,
+                                   stats=stats, post_processor=None,
+                                   batch_size=1, batch_timeout=1000,
+                                   store_original_body=False,
+                                   compress_json=False,
+                                   query_budgets={}, lane='default')
+        inbox = Queue.Queue()
+        inbox.put((5, 'monitor.info', '{}'))
+        done = Queue.Queue()
+        self.mox.StubOutWithMock(worker, "continue_running")
+        worker.continue_running().AndReturn(True)
+        consumer._process(mox.IsA(worker.PartitionMessage))
+        consumer.on_iteration()
+        worker.continue_running().AndReturn(False)
+        consumer.pending = []
+        self.mox.ReplayAll()
+        try:
+            worker.run_partition(config, 1, 'nova', 1, inbox, done, stats)
+            # Always, as a reconnect redelivers what's already saved.
+            self.assertEqual(views.RECENT_MESSAGES.max_size,
+                             worker.PARTITION_DEDUP_CACHE_SIZE)
+        finally:
+            views.enable_dedup(0)
+        self.mox.VerifyAll()
+
     def test_run(self):
         mock_logger = self._setup_mock_logger()
         self.mox.StubOutWithMock(mock_logger, 'info')
@@ -200,13 +571,64 @@ class ConsumerTestCase(StacktachBaseTestCase):
         exchange = 'nova'
         consumer = worker.Consumer(config['name'], conn, deployment,
                                    config['durable_queue'], {}, exchange,
-                                   self._test_topics(), stats=stats)
+                                   self._test_topics(), stats=stats,
+                                   batch_size=1, batch_timeout=1000,
+                                   prefetch_count=0,
+                                   post_processor=None,
+                                   store_original_body=False,
+                                   compress_json=False,
+                                   query_budgets={}, lane='default')
         consumer.run()
         worker.continue_running().AndReturn(False)
         self.mox.ReplayAll()
         worker.run(config, deployment.id, exchange, stats)
         self.mox.VerifyAll()
 
+    def test_run_lane(self):
+        mock_logger = self._setup_mock_logger()
+        self.mox.StubOutWithMock(mock_logger, 'info')
+        mock_logger.info('east/billing: nova 10.0.0.1 5672 rabbit /')
+        self.mox.StubOutWithMock(mock_logger, 'debug')
+        mock_logger.debug("Processing on 'east/billing nova'")
+        mock_logger.debug("Completed processing on 'east/billing nova'")
+        mock_logger.info("Worker exiting.")
+        billing = dict(queue="billing", routing_key="billing.info",
+                       lane="billing")
+        config = {
+            'name': 'east',
+            'rabbit_host': '10.0.0.1',
+            'prefetch_count': 200,
+            'lanes': {'billing': {'prefetch_count': 10}},
+            "topics": {"nova": self._test_topics() + [billing]}
+        }
+        self.mox.StubOutWithMock(db, 'get_deployment')
+        deployment = self.mox.CreateMockAnything()
+        db.get_deployment(1).AndReturn(deployment)
+        self.mox.StubOutWithMock(kombu.connection, 'BrokerConnection')
+        self.mox.StubOutWithMock(worker, "continue_running")
+        worker.continue_running().AndReturn(True)
+        conn = self.mox.CreateMockAnything()
+        kombu.connection.BrokerConnection(
+            hostname='10.0.0.1', port=5672, userid='rabbit',
+            password='rabbit', transport="librabbitmq",
+            virtual_host='/').AndReturn(conn)
+        conn.__enter__().AndReturn(conn)
+        conn.__exit__(None, None, None).AndReturn(None)
+        self.mox.StubOutClassWithMocks(worker, 'Consumer')
+        consumer = worker.Consumer('east/billing', conn, deployment, True,
+                                   {}, 'nova', [billing], stats=None,
+                                   batch_size=1, batch_timeout=1000,
+                                   prefetch_count=10,
+                                   post_processor=None,
+                                   store_original_body=False,
+                                   compress_json=False,
+                                   query_budgets={}, lane='billing')
+        consumer.run()
+        worker.continue_running().AndReturn(False)
+        self.mox.ReplayAll()
+        worker.run(config, 1, 'nova', lane='billing')
+        self.mox.VerifyAll()
+
     def test_run_queue_args(self):
         mock_logger = self._setup_mock_logger()
         self.mox.StubOutWithMock(mock_logger, 'info')
@@ -253,7 +675,13 @@ class ConsumerTestCase(StacktachBaseTestCase):
         consumer = worker.Consumer(config['name'], conn, deployment,
                                    config['durable_queue'],
                                    config['queue_arguments'], exchange,
-                                   self._test_topics(), stats=stats)
+                                   self._test_topics(), stats=stats,
+                                   batch_size=1, batch_timeout=1000,
+                                   prefetch_count=0,
+                                   post_processor=None,
+                                   store_original_body=False,
+                                   compress_json=False,
+                                   query_budgets={}, lane='default')
         consumer.run()
         worker.continue_running().AndReturn(False)
         self.mox.ReplayAll()
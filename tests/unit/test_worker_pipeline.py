@@ -0,0 +1,104 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+import mox
+
+from stacktach import stacklog
+from worker import pipeline
+from tests.unit import StacktachBaseTestCase
+
+
+class FakeRaw(object):
+    def __init__(self, id, uuid):
+        self.id = id
+        self.uuid = uuid
+
+    @staticmethod
+    def get_name():
+        return 'RawData'
+
+
+class PartitionForTestCase(StacktachBaseTestCase):
+    def test_partition_for_is_stable(self):
+        uuids = ['uuid-%d' % i for i in range(100)]
+        first = [pipeline.partition_for(uuid, 4) for uuid in uuids]
+        second = [pipeline.partition_for(uuid, 4) for uuid in uuids]
+        self.assertEqual(first, second)
+        self.assertEqual(set(first), set([0, 1, 2, 3]))
+
+    def test_partition_for_moves_few_keys(self):
+        uuids = ['uuid-%d' % i for i in range(1000)]
+        moved = [uuid for uuid in uuids
+                 if pipeline.partition_for(uuid, 4) !=
+                 pipeline.partition_for(uuid, 5)]
+        for uuid in moved:
+            self.assertEqual(pipeline.partition_for(uuid, 5), 4)
+        self.assertTrue(len(moved) < 300)
+
+    def test_partition_for_single_partition(self):
+        self.assertEqual(pipeline.partition_for(None, 1), 0)
+
+
+class PostProcessPoolTestCase(StacktachBaseTestCase):
+    def setUp(self):
+        self.mox = mox.Mox()
+
+    def tearDown(self):
+        self.mox.UnsetStubs()
+
+    def test_same_uuid_keeps_order(self):
+        processed = []
+
+        def post_process(raw, notif):
+            processed.append((raw.uuid, raw.id, notif))
+
+        pool = pipeline.PostProcessPool({'RawData': post_process}, 4)
+        pool.start()
+        for i in range(20):
+            pool.submit(FakeRaw(i, 'uuid-%d' % (i % 3)), i)
+        pool.stop()
+
+        self.assertEqual(len(processed), 20)
+        for uuid in ['uuid-0', 'uuid-1', 'uuid-2']:
+            ids = [raw_id for raw_uuid, raw_id, notif in processed
+                   if raw_uuid == uuid]
+            self.assertEqual(ids, sorted(ids))
+        stats = pool.stats.snapshot(pool.depth())
+        self.assertEqual(stats['count'], 20)
+        self.assertEqual(stats['depth'], 0)
+        self.assertEqual(pool.stats.count, 0)
+
+    def test_failure_does_not_stop_lane(self):
+        log = self.mox.CreateMockAnything()
+        self.mox.StubOutWithMock(stacklog, 'get_logger')
+        stacklog.get_logger('worker', is_parent=False).AndReturn(log)
+        log.exception("Post-processing failed for RawData 1: boom")
+        self.mox.ReplayAll()
+        processed = []
+
+        def post_process(raw, notif):
+            if raw.id == 1:
+                raise Exception("boom")
+            processed.append(raw.id)
+
+        pool = pipeline.PostProcessPool({'RawData': post_process}, 1)
+        pool.start()
+        pool.submit(FakeRaw(1, 'uuid'), None)
+        pool.submit(FakeRaw(2, 'uuid'), None)
+        pool.stop()
+        self.assertEqual(processed, [2])
+        self.mox.VerifyAll()
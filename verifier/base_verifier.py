@@ -37,6 +37,8 @@ from django.db import reset_queries
 from django.core import exceptions
 
 from verifier import WrongTypeException
+from stacktach import datetime_to_decimal as dt
+from stacktach import metrics
 from stacktach import stacklog
 
 stacklog.set_default_logger_name('verifier')
@@ -67,10 +69,13 @@ def _verify_simple_field(d1, d2, field1, field2=None):
 
 
 def _verify_date_field(d1, d2, same_second=False):
+    """Compares two times given as integer microseconds (see
+    models.timestamp_micros)."""
     if d1 and d2:
         if d1 == d2:
             return True
-        elif same_second and int(d1) == int(d2):
+        elif same_second and \
+                d1 // dt.MICROSECONDS == d2 // dt.MICROSECONDS:
             return True
     return False
 
@@ -116,6 +121,7 @@ class Verifier(object):
         self.enable_notifications = config.enable_notifications()
         self.reconciler = reconciler
         self.results = []
+        self.submitted = {}
         self.failed = []
         self.batchsize = config.batchsize()
         if stats is None:
@@ -126,6 +132,10 @@ class Verifier(object):
         self.next_update = datetime.datetime.utcnow() + self.update_interval
         self._do_run = True
 
+    def add_result(self, result):
+        self.results.append(result)
+        self.submitted[result] = time.time()
+
     def clean_results(self):
         pending = []
         finished = 0
@@ -134,6 +144,10 @@ class Verifier(object):
         for result in self.results:
             if result.ready():
                 finished += 1
+                submitted = self.submitted.pop(result, None)
+                if submitted is not None:
+                    metrics.observe('stacktach_verifier_verify_seconds',
+                                    time.time() - submitted)
                 if result.successful():
                     (verified, exists) = result.get()
                     if self.reconciler and not verified:
@@ -144,6 +158,9 @@ class Verifier(object):
 
         self.results = pending
         errored = finished - successful
+        metrics.incr('stacktach_verifier_successful_total', value=successful)
+        metrics.incr('stacktach_verifier_errored_total', value=errored)
+        metrics.set('stacktach_verifier_pending', len(self.results))
         return len(self.results), successful, errored
 
     def check_results(self, new_added, force=False):
@@ -153,6 +170,7 @@ class Verifier(object):
             values = ((self.exchange(), new_added,) + self.clean_results())
             msg = "%s: N: %s, P: %s, S: %s, E: %s" % values
             _get_child_logger().info(msg)
+            self.stats['metrics'] = metrics.snapshot()
             while len(self.results) > (self.batchsize * 0.75):
                 msg = "%s: Waiting on event processing. Pending: %s" % (
                       self.exchange(), len(self.results))
@@ -194,6 +212,8 @@ class Verifier(object):
                 kwargs = {settle_units: settle_time}
                 ending_max = now - datetime.timedelta(**kwargs)
                 new = self.verify_for_range(ending_max, callback=callback)
+                metrics.incr('stacktach_verifier_queued_total',
+                             value=new or 0)
                 self.check_results(new, force=True)
                 if self.reconciler:
                     self.reconcile_failed()
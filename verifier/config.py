@@ -70,6 +70,10 @@ def process_timeout(default=0):
     return config.get('process_timeout', default)
 
 
+def stats_file():
+    return config.get('stats_file')
+
+
 def durable_queue():
     return config['rabbit']['durable_queue']
 
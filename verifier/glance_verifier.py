@@ -14,7 +14,6 @@
 # KIND, either express or implied.  See the License for the
 # specific language governing permissions and limitations
 # under the License.
-import json
 
 import os
 import sys
@@ -36,6 +35,7 @@ from verifier import NotFound
 from stacktach import datetime_to_decimal as dt
 from stacktach import stacklog
 from stacktach import message_service
+from stacktach import utils
 import datetime
 
 stacklog.set_default_logger_name('verifier')
@@ -47,7 +47,9 @@ def _get_child_logger():
 
 def _verify_field_mismatch(exists, usage):
     if not base_verifier._verify_date_field(
-            usage.created_at, exists.created_at, same_second=True):
+            models.timestamp_micros(usage, 'created_at'),
+            models.timestamp_micros(exists, 'created_at'),
+            same_second=True):
         raise FieldMismatch(
             'created_at',
             {'name': 'exists', 'value': exists.created_at},
@@ -129,7 +131,9 @@ def _verify_for_delete(exist, delete=None):
 
     if delete:
         if not base_verifier._verify_date_field(
-                delete.deleted_at, exist.deleted_at, same_second=True):
+                models.timestamp_micros(delete, 'deleted_at'),
+                models.timestamp_micros(exist, 'deleted_at'),
+                same_second=True):
             raise FieldMismatch(
                 'deleted_at',
                 {'name': 'exists', 'value': exist.deleted_at},
@@ -169,7 +173,7 @@ class GlanceVerifier(Verifier):
                 exist.save()
             result = self.pool.apply_async(_verify, args=(exists,),
                                            callback=callback)
-            self.results.append(result)
+            self.add_result(result)
             added += 1
             self.check_results(added)
         return count
@@ -199,8 +203,8 @@ class GlanceVerifier(Verifier):
         # from before it was serialized. We don't want to use them as
         # they could have been lost somewhere in the process forking.
         # So, grab a new InstanceExists object from the database and use it.
-        body = models.ImageExists.objects.get(id=exist.id).raw.json
-        json_body = json.loads(body)
+        raw = models.ImageExists.objects.get(id=exist.id).raw
+        json_body = list(utils.load_raw_json(raw.json, raw.routing_key))
         json_body[1]['event_type'] = self.config.glance_event_type()
         json_body[1]['original_message_id'] = json_body[1]['message_id']
         json_body[1]['message_id'] = str(uuid.uuid4())
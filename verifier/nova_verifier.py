@@ -15,7 +15,6 @@
 # specific language governing permissions and limitations
 # under the License.
 import datetime
-import json
 import os
 import sys
 import uuid
@@ -37,6 +36,7 @@ from verifier import AmbiguousResults
 from verifier import NotFound
 from verifier import VerificationException
 from stacktach import message_service
+from stacktach import utils
 
 stacklog.set_default_logger_name('verifier')
 
@@ -48,7 +48,9 @@ def _get_child_logger():
 def _verify_field_mismatch(exists, launch):
     flavor_field_name = config.flavor_field_name()
     if not base_verifier._verify_date_field(
-            launch.launched_at, exists.launched_at, same_second=True):
+            models.timestamp_micros(launch, 'launched_at'),
+            models.timestamp_micros(exists, 'launched_at'),
+            same_second=True):
         raise FieldMismatch(
             'launched_at',
             {'name': 'exists', 'value': exists.launched_at},
@@ -161,7 +163,9 @@ def _verify_for_delete(exist, delete=None,
 
     if delete:
         if not base_verifier._verify_date_field(
-                delete.launched_at, exist.launched_at, same_second=True):
+                models.timestamp_micros(delete, 'launched_at'),
+                models.timestamp_micros(exist, 'launched_at'),
+                same_second=True):
             raise FieldMismatch(
                 'launched_at',
                 {'name': 'exists', 'value': exist.launched_at},
@@ -169,7 +173,9 @@ def _verify_for_delete(exist, delete=None,
                 exist.instance)
 
         if not base_verifier._verify_date_field(
-                delete.deleted_at, exist.deleted_at, same_second=True):
+                models.timestamp_micros(delete, 'deleted_at'),
+                models.timestamp_micros(exist, 'deleted_at'),
+                same_second=True):
             raise FieldMismatch(
                 'deleted_at',
                 {'name': 'exists', 'value': exist.deleted_at},
@@ -306,8 +312,8 @@ class NovaVerifier(base_verifier.Verifier):
         # from before it was serialized. We don't want to use them as
         # they could have been lost somewhere in the process forking.
         # So, grab a new InstanceExists object from the database and use it.
-        body = models.InstanceExists.objects.get(id=exist.id).raw.json
-        json_body = json.loads(body)
+        raw = models.InstanceExists.objects.get(id=exist.id).raw
+        json_body = list(utils.load_raw_json(raw.json, raw.routing_key))
         json_body[1]['event_type'] = self.config.nova_event_type()
         json_body[1]['original_message_id'] = json_body[1]['message_id']
         json_body[1]['message_id'] = str(uuid.uuid4())
@@ -330,7 +336,7 @@ class NovaVerifier(base_verifier.Verifier):
             result = self.pool.apply_async(
                 _verify, args=(exist, validation_level),
                 callback=callback)
-            self.results.append(result)
+            self.add_result(result)
             added += 1
             self.check_results(added)
         return count
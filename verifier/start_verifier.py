@@ -28,6 +28,7 @@ POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
                                    os.pardir, os.pardir))
 if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'stacktach')):
     sys.path.insert(0, POSSIBLE_TOPDIR)
+from stacktach import metrics
 from stacktach import stacklog
 from stacktach import reconciler
 from verifier import nova_verifier
@@ -155,6 +156,32 @@ def stop_all():
         processes[pname]['pid'] = 0
 
 
+def write_stats_file():
+    """Writes every verifier's metrics to the configured stats_file,
+    labelled by exchange."""
+    filename = verifier_config.stats_file()
+    if not filename:
+        return
+    now = datetime.datetime.utcnow()
+    snapshots = []
+    for exchange in sorted(processes.keys()):
+        stats = processes[exchange]['stats']
+        age = now - stats.get('timestamp', now)
+        snapshot = list(stats.get('metrics', []))
+        snapshot.append((metrics.GAUGE,
+                         'stacktach_verifier_heartbeat_age_seconds', (),
+                         age.seconds + age.days * 86400))
+        snapshot.append((metrics.COUNTER,
+                         'stacktach_verifier_processed_total', (),
+                         stats.get('total_processed', 0)))
+        snapshots.append(({'exchange': exchange}, snapshot))
+    try:
+        metrics.write_stats_file(filename, snapshots)
+    except IOError, e:
+        _get_parent_logger().warning("Unable to write stats file %s: %s" %
+                                     (filename, e))
+
+
 def signal_all(signal_number):
     procs = sorted(processes.keys())
     for pname in procs:
@@ -189,6 +216,7 @@ if __name__ == '__main__':
     logger.info("Starting Verifiers...")
     while RUNNING:
         check_or_start_all()
+        write_stats_file()
         time.sleep(30)
     logger.info("Verifiers Shutting down...")
 
@@ -0,0 +1,145 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+# Second stage of the worker: post-processing raws which have already
+# been saved and acked. Each lane is a thread with a bounded queue, so a
+# slow lane backs up into the consumer instead of growing forever.
+
+import Queue
+import threading
+import time
+import zlib
+
+from django.db import connection as db_connection
+
+from stacktach import metrics
+from stacktach import stacklog
+
+_STOP = object()
+
+
+def _get_child_logger():
+    return stacklog.get_logger('worker', is_parent=False)
+
+
+def partition_for(key, partitions):
+    """Maps key (an instance or image uuid) to one of partitions
+    buckets with a jump consistent hash. The result is the same in
+    every process, and only 1/n of the keys move when a bucket is added.
+    """
+    key = zlib.crc32(str(key)) & 0xffffffff
+    bucket, jump = -1, 0
+    while jump < partitions:
+        bucket = jump
+        key = (key * 2862933555777941757 + 1) & 0xffffffffffffffff
+        jump = int((bucket + 1) * (float(1 << 31) / float((key >> 33) + 1)))
+    return bucket
+
+
+class StageStats(object):
+    """Counts and timings for one stage, reset each time they're read."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.count = 0
+        self.wait = 0.0
+        self.max_wait = 0.0
+        self.run = 0.0
+        self.max_run = 0.0
+
+    def record(self, count, wait, run):
+        with self._lock:
+            self.count += count
+            self.wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            self.run += run
+            self.max_run = max(self.max_run, run)
+
+    def snapshot(self, depth=0):
+        with self._lock:
+            count = self.count or 1
+            snapshot = {'count': self.count,
+                        'depth': depth,
+                        'avg_wait': self.wait / count,
+                        'max_wait': self.max_wait,
+                        'avg_run': self.run / count,
+                        'max_run': self.max_run}
+            self._reset()
+        return snapshot
+
+
+class PostProcessPool(object):
+    """Runs post-processing on a fixed number of lanes. Raws for the
+    same instance or image uuid always go to the same lane, so they are
+    still processed in the order they were received.
+    """
+
+    def __init__(self, methods, lanes, queue_size=1000):
+        self.methods = methods
+        self.stats = StageStats()
+        self.queues = [Queue.Queue(queue_size) for i in range(lanes)]
+        self.threads = []
+        for queue in self.queues:
+            thread = threading.Thread(target=self._run, args=(queue,))
+            thread.daemon = True
+            self.threads.append(thread)
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        for queue in self.queues:
+            queue.put(_STOP)
+        for thread in self.threads:
+            thread.join()
+
+    def depth(self):
+        return sum(queue.qsize() for queue in self.queues)
+
+    def submit(self, raw, notif):
+        lane = partition_for(raw.uuid, len(self.queues))
+        # Blocks when the lane is full, which stops the consumer taking
+        # more messages until post-processing catches up.
+        self.queues[lane].put((time.time(), raw, notif))
+
+    def _run(self, queue):
+        try:
+            while True:
+                item = queue.get()
+                if item is _STOP:
+                    return
+                queued_at, raw, notif = item
+                started = time.time()
+                try:
+                    self.methods[raw.get_name()](raw, notif)
+                except Exception, e:
+                    _get_child_logger().exception(
+                        "Post-processing failed for %s %s: %s" %
+                        (raw.get_name(), raw.id, e))
+                finished = time.time()
+                self.stats.record(1, started - queued_at, finished - started)
+                metrics.observe('stacktach_worker_post_process_wait_seconds',
+                                started - queued_at)
+                metrics.observe('stacktach_worker_post_process_seconds',
+                                finished - started)
+        finally:
+            # Each thread gets its own connection from django.
+            db_connection.close()
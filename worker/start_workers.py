@@ -4,14 +4,14 @@ import signal
 import sys
 import time
 
-from multiprocessing import Process, Manager
+from multiprocessing import Process, Manager, Queue
 
 POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
                                    os.pardir, os.pardir))
 if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'stacktach')):
     sys.path.insert(0, POSSIBLE_TOPDIR)
 
-from stacktach import db, stacklog
+from stacktach import db, metrics, stacklog
 from django.db import close_connection
 
 import worker.worker as worker
@@ -33,15 +33,35 @@ def create_proc_table(manager):
         if deployment.get('enabled', True):
             name = deployment['name']
             db_deployment, new = db.get_or_create_deployment(name)
-            for exchange in deployment.get('topics').keys():
-                stats = manager.dict()
-                proc_info = dict(process=None,
-                                 pid=0,
-                                 deployment=deployment,
-                                 deploy_id=db_deployment.id,
-                                 exchange=exchange,
-                                 stats=stats)
-                processes[(name, exchange)] = proc_info
+            for exchange, topics in deployment.get('topics').items():
+                # Each lane of an exchange's queues is consumed by its
+                # own process(es).
+                for lane in worker.topic_lanes(topics):
+                    lane_config = worker.lane_config(deployment, lane)
+                    partitions = lane_config.get('partitions', 1)
+                    if partitions < 2:
+                        partitions = 0
+                    stats = manager.dict()
+                    proc_info = dict(process=None,
+                                     pid=0,
+                                     deployment=deployment,
+                                     deploy_id=db_deployment.id,
+                                     exchange=exchange,
+                                     lane=lane,
+                                     stats=stats,
+                                     partitions=[])
+                    # A partitioned lane has a dispatcher (proc_info)
+                    # consuming from rabbit plus one process per
+                    # partition.
+                    for partition in range(partitions):
+                        proc_info['partitions'].append(
+                            dict(process=None, pid=0, stats=manager.dict()))
+                    processes[(name, exchange, lane)] = proc_info
+
+
+def _describe(proc_info):
+    return "%s %s %s" % (proc_info['deployment']['name'],
+                         proc_info['exchange'], proc_info['lane'])
 
 
 def is_alive(proc_info):
@@ -62,31 +82,106 @@ def needs_restart(proc_info):
     return False
 
 
+def _reset_stats(stats):
+    stats['timestamp'] = datetime.datetime.utcnow()
+    stats['total_processed'] = 0
+    stats['processed'] = 0
+
+
+def _spawn(info, target, args):
+    process = Process(target=target, args=args)
+    process.daemon = True
+    process.start()
+    info['pid'] = process.pid
+    info['process'] = process
+
+
 def start_proc(proc_info):
     logger = _get_parent_logger()
+    if proc_info['partitions']:
+        return start_partitioned_procs(proc_info)
     if is_alive(proc_info):
         if needs_restart(proc_info):
-            logger.warning("Child process %s (%s %s) terminated due to "
+            logger.warning("Child process %s (%s) terminated due to "
                 "heartbeat timeout. Restarting..." % (proc_info['pid'],
-                proc_info['deployment']['name'], proc_info['exchange']))
+                _describe(proc_info)))
         else:
             return False
     stats = proc_info['stats']
-    stats['timestamp'] = datetime.datetime.utcnow()
-    stats['total_processed'] = 0
-    stats['processed'] = 0
+    _reset_stats(stats)
     args = (proc_info['deployment'], proc_info['deploy_id'],
-            proc_info['exchange'], stats)
-    process = Process(target=worker.run, args=args)
-    process.daemon = True
-    process.start()
-    proc_info['pid'] = process.pid
-    proc_info['process'] = process
-    logger.info("Started child process %s (%s %s)" % (proc_info['pid'],
-        proc_info['deployment']['name'], proc_info['exchange']))
+            proc_info['exchange'], stats, None, proc_info['lane'])
+    _spawn(proc_info, worker.run, args)
+    logger.info("Started child process %s (%s)" % (proc_info['pid'],
+        _describe(proc_info)))
     return True
 
 
+def start_partitioned_procs(proc_info):
+    """The dispatcher and its partitions are (re)started together,
+    so messages a dead partition never finished are redelivered by
+    the broker when the dispatcher's connection goes away. Partitions
+    may have saved some of those before their acks got back to the
+    dispatcher; run_partition's dedup drops them the second time."""
+    logger = _get_parent_logger()
+    exchange = proc_info['exchange']
+    lane = proc_info['lane']
+    group = [proc_info] + proc_info['partitions']
+    if all(is_alive(info) for info in group):
+        stale = [info for info in group if needs_restart(info)]
+        if not stale:
+            return False
+        logger.warning("Child process(es) %s (%s) terminated due to "
+                       "heartbeat timeout. Restarting partitions..." %
+                       (", ".join(str(info['pid']) for info in stale),
+                        _describe(proc_info)))
+    for info in group:
+        if is_alive(info):
+            info['process'].terminate()
+            info['process'].join()
+
+    deployment = proc_info['deployment']
+    deploy_id = proc_info['deploy_id']
+    inboxes = []
+    done = Queue()
+    for partition, info in enumerate(proc_info['partitions']):
+        inbox = Queue()
+        inboxes.append(inbox)
+        _reset_stats(info['stats'])
+        args = (deployment, deploy_id, exchange, partition, inbox, done,
+                info['stats'], lane)
+        _spawn(info, worker.run_partition, args)
+
+    _reset_stats(proc_info['stats'])
+    args = (deployment, deploy_id, exchange, proc_info['stats'],
+            (inboxes, done), lane)
+    _spawn(proc_info, worker.run, args)
+    logger.info("Started child process %s (%s) with partitions %s" %
+                (proc_info['pid'], _describe(proc_info),
+                 ", ".join(str(info['pid'])
+                           for info in proc_info['partitions'])))
+    return True
+
+
+def report_partitions():
+    """Logs each partition's heartbeat and throughput."""
+    logger = _get_parent_logger()
+    now = datetime.datetime.utcnow()
+    for proc_name in sorted(processes.keys()):
+        proc_info = processes[proc_name]
+        for partition, info in enumerate(proc_info['partitions']):
+            stats = info['stats']
+            if 'timestamp' not in stats:
+                continue
+            age = now - stats['timestamp']
+            logger.info("%s partition %d (pid %s): heartbeat %ds ago, "
+                        "%d msgs last interval, %d total" %
+                        (_describe(proc_info), partition, info['pid'],
+                         age.seconds + age.days * 86400,
+                         stats.get('processed', 0),
+                         stats.get('total_processed', 0)))
+
+
 def check_or_start_all():
     for proc_name in sorted(processes.keys()):
         if RUNNING:
@@ -95,16 +190,56 @@ def check_or_start_all():
 
 def stop_all():
     procs = sorted(processes.keys())
+    infos = []
     for pname in procs:
-        process = processes[pname]['process']
+        infos.append(processes[pname])
+        infos.extend(processes[pname]['partitions'])
+    for info in infos:
+        process = info['process']
         if process is not None:
             process.terminate()
-    for pname in procs:
-        process = processes[pname]['process']
+    for info in infos:
+        process = info['process']
         if process is not None:
             process.join()
-        processes[pname]['process'] = None
-        processes[pname]['pid'] = 0
+        info['process'] = None
+        info['pid'] = 0
+
+
+def _process_snapshot(stats, now):
+    age = now - stats.get('timestamp', now)
+    snapshot = list(stats.get('metrics', []))
+    snapshot.append((metrics.GAUGE, 'stacktach_worker_heartbeat_age_seconds',
+                     (), age.seconds + age.days * 86400))
+    snapshot.append((metrics.COUNTER, 'stacktach_worker_processed_total',
+                     (), stats.get('total_processed', 0)))
+    return snapshot
+
+
+def write_stats_file():
+    """Writes every child's metrics to the stats_file in the workers
+    config, labelled by deployment, exchange, lane and partition."""
+    filename = config.workers().get('stats_file')
+    if not filename:
+        return
+    now = datetime.datetime.utcnow()
+    snapshots = []
+    for (name, exchange, lane) in sorted(processes.keys()):
+        proc_info = processes[(name, exchange, lane)]
+        labels = {'deployment': name, 'exchange': exchange, 'lane': lane}
+        if proc_info['partitions']:
+            labels['partition'] = 'dispatcher'
+        snapshots.append((labels,
+                          _process_snapshot(proc_info['stats'], now)))
+        for partition, info in enumerate(proc_info['partitions']):
+            labels = {'deployment': name, 'exchange': exchange,
+                      'lane': lane, 'partition': partition}
+            snapshots.append((labels, _process_snapshot(info['stats'], now)))
+    try:
+        metrics.write_stats_file(filename, snapshots)
+    except IOError, e:
+        _get_parent_logger().warning("Unable to write stats file %s: %s" %
+                                     (filename, e))
 
 
 def kill_time(signal, frame):
@@ -133,6 +268,8 @@ if __name__ == '__main__':
     logger.info("Starting Workers...")
     while RUNNING:
         check_or_start_all()
+        report_partitions()
+        write_stats_file()
         time.sleep(30)
     logger.info("Workers Shutting down...")
 
@@ -16,7 +16,10 @@
 # This is the worker you run in your OpenStack environment. You need
 # to set TENANT_ID and URL to point to your StackTach web server.
 
+from __future__ import absolute_import
+
 import datetime
+import Queue
 import sys
 import time
 import signal
@@ -36,14 +39,22 @@ except ImportError:
 from pympler.process import ProcessMemoryInfo
 
 from django.db import connection as db_connection
+from stacktach import datetime_to_decimal as dt
 from stacktach import db
 from stacktach import message_service
+from stacktach import metrics
+from stacktach import notification
 from stacktach import stacklog
+from stacktach import utils
 from stacktach import views
+from worker import pipeline
 
 stacklog.set_default_logger_name('worker')
 shutdown_soon = False
 
+# The lane of topics that don't name one, see lane_config.
+DEFAULT_LANE = 'default'
+
 
 def _get_child_logger():
     return stacklog.get_logger('worker', is_parent=False)
@@ -51,7 +62,11 @@ def _get_child_logger():
 
 class Consumer(kombu.mixins.ConsumerMixin):
     def __init__(self, name, connection, deployment, durable, queue_arguments,
-                 exchange, topics, connect_max_retries=10, stats=None):
+                 exchange, topics, connect_max_retries=10, stats=None,
+                 batch_size=1, batch_timeout=1000, prefetch_count=0,
+                 store_original_body=False, compress_json=False,
+                 post_processor=None, query_budgets=None,
+                 lane=DEFAULT_LANE):
         self.connect_max_retries = connect_max_retries
         self.retry_attempts = 0
         self.connection = connection
@@ -65,6 +80,23 @@ class Consumer(kombu.mixins.ConsumerMixin):
         self.total_processed = 0
         self.topics = topics
         self.exchange = exchange
+        # batch_size of 1 persists and acks each message as it arrives.
+        self.batch_size = batch_size
+        self.batch_timeout = datetime.timedelta(milliseconds=batch_timeout)
+        self.prefetch_count = prefetch_count
+        # Keep the message body as it arrived instead of re-encoding it
+        # alongside the routing key, which has its own column anyway.
+        self.store_original_body = store_original_body
+        self.compress_json = compress_json
+        self.pending = []
+        self.pending_since = None
+        # When set, raws are handed to this pool to be post-processed
+        # after they're acked, rather than post-processed inline.
+        self.post_processor = post_processor
+        self.persist_stats = pipeline.StageStats()
+        self.lane = lane
+        self.queue_wait = pipeline.StageStats()
+        self.query_budget = metrics.QueryBudget(query_budgets)
         if stats is not None:
             self.stats = stats
         else:
@@ -91,24 +123,134 @@ class Consumer(kombu.mixins.ConsumerMixin):
                                      topic['routing_key'])
                   for topic in self.topics]
 
-        return [Consumer(queues=queues, callbacks=[self.on_nova])]
+        consumer = Consumer(queues=queues, callbacks=[self.on_nova])
+        if self.prefetch_count:
+            consumer.qos(prefetch_count=self.prefetch_count)
+        return [consumer]
+
+    def _parse(self, message):
+        with metrics.timer('stacktach_worker_parse_seconds'):
+            routing_key = message.delivery_info['routing_key']
+
+            body = str(message.body)
+            args = (routing_key, json.loads(body))
+            if self.store_original_body:
+                asJson = body
+            else:
+                asJson = json.dumps(args)
+            if self.compress_json:
+                asJson = utils.compress_raw_json(asJson)
+        return args, asJson
+
+    def _count_queries(self, events, messages):
+        """Charges each message an equal share of the queries since
+        process_raw_data started, by event type. events has those that
+        weren't duplicates."""
+        # Django only keeps the queries when the debug cursor is on,
+        # see the count_queries setting.
+        if not db_connection.use_debug_cursor:
+            return
+        queries = len(db_connection.queries) / float(messages)
+        for event in events:
+            labels = {'event': event}
+            metrics.observe('stacktach_worker_queries_per_message', queries,
+                            labels, buckets=metrics.COUNT_BUCKETS)
+            if self.query_budget.over(event, queries):
+                metrics.incr('stacktach_worker_query_budget_exceeded_total',
+                             labels)
+                _get_child_logger().warn(
+                    "%s: %s took %.1f queries, over its budget of %s" %
+                    (self.name, event, queries,
+                     self.query_budget.limit(event)))
+
+    def _record_queue_wait(self, raws):
+        """Observes how long each raw's notification took to get from
+        the service that sent it to being saved. The supervisor labels
+        each process's metrics with its lane."""
+        now = dt.dt_to_decimal(datetime.datetime.utcnow())
+        for raw in raws:
+            if raw.when is None:
+                continue
+            # The services' clocks can be a little ahead of ours.
+            wait = max(float(now - raw.when), 0.0)
+            self.queue_wait.record(1, wait, 0.0)
+            metrics.observe('stacktach_worker_queue_wait_seconds', wait,
+                            buckets=metrics.WAIT_BUCKETS)
 
     def _process(self, message):
-        routing_key = message.delivery_info['routing_key']
+        if self.batch_size > 1:
+            self._queue(message)
+            return
 
-        body = str(message.body)
-        args = (routing_key, json.loads(body))
-        asJson = json.dumps(args)
+        started = time.time()
+        args, asJson = self._parse(message)
         # save raw and ack the message
-        raw, notif = views.process_raw_data(
-            self.deployment, args, asJson, self.exchange)
+        with metrics.timer('stacktach_worker_save_seconds'):
+            raw, notif = views.process_raw_data(
+                self.deployment, args, asJson, self.exchange)
 
         self.processed += 1
+        metrics.incr('stacktach_worker_messages_total')
         message.ack()
-        POST_PROCESS_METHODS[raw.get_name()](raw, notif)
+        self.persist_stats.record(1, 0.0, time.time() - started)
+        # raw is None for a notification that was already saved.
+        if raw is not None:
+            self._record_queue_wait([raw])
+            self._post_process(raw, notif)
+            self._count_queries([raw.event], 1)
 
         self._check_memory()
 
+    def _post_process(self, raw, notif):
+        if self.post_processor is not None:
+            self.post_processor.submit(raw, notif)
+        else:
+            with metrics.timer('stacktach_worker_post_process_seconds'):
+                POST_PROCESS_METHODS[raw.get_name()](raw, notif)
+
+    def _queue(self, message):
+        if not self.pending:
+            self.pending_since = datetime.datetime.utcnow()
+        self.pending.append(message)
+        if len(self.pending) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        messages = self.pending
+        pending_since = self.pending_since
+        self.pending = []
+        self.pending_since = None
+        started = time.time()
+
+        # save the raws in one transaction and only ack once it's committed
+        parsed = [self._parse(message) for message in messages]
+        with metrics.timer('stacktach_worker_batch_save_seconds'):
+            results = views.process_raw_data_batch(
+                self.deployment, parsed, self.exchange)
+
+        self.processed += len(messages)
+        metrics.incr('stacktach_worker_messages_total', value=len(messages))
+        for message in messages:
+            message.ack()
+        waited = datetime.datetime.utcnow() - pending_since
+        self.persist_stats.record(len(messages),
+                                  waited.seconds + waited.microseconds / 1e6,
+                                  time.time() - started)
+        self._record_queue_wait([raw for raw, notif in results])
+        for raw, notif in results:
+            self._post_process(raw, notif)
+        self._count_queries([raw.event for raw, notif in results],
+                            len(messages))
+
+        self._check_memory()
+
+    def on_iteration(self):
+        if self.pending:
+            age = datetime.datetime.utcnow() - self.pending_since
+            if age >= self.batch_timeout:
+                self._flush()
+        views.flush_rollups()
+
     def _check_memory(self):
         if not self.pmi:
             self.pmi = ProcessMemoryInfo()
@@ -137,9 +279,51 @@ class Consumer(kombu.mixins.ConsumerMixin):
             self.stats['timestamp'] = utc
             self.stats['total_processed'] = self.total_processed
             self.stats['processed'] = self.processed
+            self.stats['metrics'] = metrics.snapshot()
+            self._report_stages()
+            if views.LIFECYCLE_CACHE is not None:
+                cache_stats = views.LIFECYCLE_CACHE.stats()
+                _get_child_logger().debug(
+                    "%20s %20s lifecycle cache: %d/%d, %d hits, "
+                    "%d misses, %d evictions" %
+                    (self.name, self.exchange, cache_stats['size'],
+                     cache_stats['max_size'], cache_stats['hits'],
+                     cache_stats['misses'], cache_stats['evictions']))
+                self.stats['lifecycle_cache'] = cache_stats
+            if views.KPI_INDEX is not None:
+                index_stats = views.KPI_INDEX.stats()
+                _get_child_logger().debug(
+                    "%20s %20s kpi index: %d request_ids, %d hits, "
+                    "%d misses" %
+                    (self.name, self.exchange, index_stats['size'],
+                     index_stats['hits'], index_stats['misses']))
+                self.stats['kpi_index'] = index_stats
             self.last_vsz = self.pmi.vsz
             self.processed = 0
 
+    def _report_stages(self):
+        stages = [('persist', self.persist_stats, len(self.pending))]
+        if self.post_processor is not None:
+            stages.append(('post_process', self.post_processor.stats,
+                           self.post_processor.depth()))
+        for stage, stage_stats, depth in stages:
+            snapshot = stage_stats.snapshot(depth)
+            _get_child_logger().debug(
+                "%20s %20s %s: %d msgs, depth %d, "
+                "wait %.3fs avg/%.3fs max, run %.3fs avg/%.3fs max" %
+                (self.name, self.exchange, stage, snapshot['count'],
+                 depth, snapshot['avg_wait'], snapshot['max_wait'],
+                 snapshot['avg_run'], snapshot['max_run']))
+            self.stats[stage] = snapshot
+            metrics.set('stacktach_worker_stage_depth', depth,
+                        {'stage': stage})
+        snapshot = self.queue_wait.snapshot()
+        _get_child_logger().debug(
+            "%20s %20s %s lane: %d msgs, queue wait %.3fs avg/%.3fs max" %
+            (self.name, self.exchange, self.lane, snapshot['count'],
+             snapshot['avg_wait'], snapshot['max_wait']))
+        self.stats['queue_wait'] = snapshot
+
     def on_nova(self, body, message):
         try:
             self._process(message)
@@ -172,6 +356,101 @@ class Consumer(kombu.mixins.ConsumerMixin):
         # do NOT call message.ack(), otherwise the message will be lost
 
 
+class PartitionMessage(object):
+    """A message handed from a Dispatcher to one of its partitions.
+    Acking it tells the dispatcher to ack the original."""
+
+    def __init__(self, seq, routing_key, body, done):
+        self.seq = seq
+        self.delivery_info = {'routing_key': routing_key}
+        self.body = body
+        self.done = done
+
+    def ack(self):
+        self.done.put(self.seq)
+
+
+class Dispatcher(Consumer):
+    """Consumes from RabbitMQ and hands each message to a partition
+    process picked by its instance (or image) uuid, so events for one
+    instance are always saved in order by the same process.
+
+    Messages are acked once their partition has saved them. The broker's
+    prefetch count bounds how many are in flight.
+    """
+
+    def __init__(self, name, connection, deployment, durable,
+                 queue_arguments, exchange, topics, inboxes, done,
+                 connect_max_retries=10, stats=None, prefetch_count=0):
+        if not prefetch_count:
+            prefetch_count = DISPATCH_PREFETCH_PER_PARTITION * len(inboxes)
+        super(Dispatcher, self).__init__(
+            name, connection, deployment, durable, queue_arguments,
+            exchange, topics, connect_max_retries=connect_max_retries,
+            stats=stats, prefetch_count=prefetch_count)
+        self.inboxes = inboxes
+        self.done = done
+        self.seq = 0
+        self.unacked = {}
+
+    def _partition_key(self, routing_key, body):
+        notif = notification.notification_factory(body, None, routing_key,
+                                                  None, self.exchange)
+        return getattr(notif, 'uuid', None) or notif.instance
+
+    def _process(self, message):
+        routing_key = message.delivery_info['routing_key']
+        body = str(message.body)
+        key = self._partition_key(routing_key, json.loads(body))
+        partition = pipeline.partition_for(key, len(self.inboxes))
+
+        # Our own sequence number rather than the delivery tag, which
+        # starts over when we reconnect.
+        self.seq += 1
+        self.unacked[self.seq] = message
+        self.inboxes[partition].put((self.seq, routing_key, body))
+
+        self.processed += 1
+        metrics.incr('stacktach_worker_dispatched_total')
+        self._ack_done()
+        self._check_memory()
+
+    def _ack_done(self):
+        while True:
+            try:
+                seq = self.done.get_nowait()
+            except Queue.Empty:
+                return
+            message = self.unacked.pop(seq, None)
+            if message is not None:
+                message.ack()
+
+    def on_iteration(self):
+        self._ack_done()
+
+    def on_connection_revived(self):
+        # Anything unacked will be redelivered on the new channel, so
+        # the messages still waiting in the inboxes are dropped rather
+        # than saved twice. Those a partition has already taken may be
+        # saved before their redelivered copies arrive; the partitions
+        # always dedup by message_id, which drops the copies.
+        for inbox in self.inboxes:
+            while True:
+                try:
+                    inbox.get_nowait()
+                except Queue.Empty:
+                    break
+        self.unacked.clear()
+        super(Dispatcher, self).on_connection_revived()
+
+    def _report_stages(self):
+        _get_child_logger().debug("%20s %20s dispatcher: %d in flight" %
+                                  (self.name, self.exchange,
+                                   len(self.unacked)))
+        self.stats['in_flight'] = len(self.unacked)
+        metrics.set('stacktach_worker_in_flight', len(self.unacked))
+
+
 def continue_running():
     return not shutdown_soon
 
@@ -184,8 +463,69 @@ def exit_or_sleep(exit=False):
     time.sleep(5)
 
 
-def run(deployment_config, deployment_id, exchange, stats=None):
-    name = deployment_config['name']
+def topic_lanes(topics):
+    """The lanes an exchange's topics are consumed in."""
+    return sorted(set(topic.get('lane', DEFAULT_LANE) for topic in topics))
+
+
+def lane_config(deployment_config, lane):
+    """The settings for the processes consuming a deployment's lane:
+    the deployment's own, with those in its lanes section for the lane
+    on top. Each lane has its own connection and processes, so a backlog
+    in one never holds up another."""
+    config = dict(deployment_config)
+    config.update(deployment_config.get('lanes', {}).get(lane, {}))
+    return config
+
+
+def _lane_name(name, lane):
+    if lane == DEFAULT_LANE:
+        return name
+    return "%s/%s" % (name, lane)
+
+
+def _start_processing(deployment_config):
+    """Sets up the caches and post-processing lanes for a process which
+    saves raws. Returns the post-processing pool, if there is one."""
+    views.enable_lifecycle_cache(
+        deployment_config.get('lifecycle_cache_size', 0))
+    views.enable_kpi_index(deployment_config.get('kpi_index_ttl', 0))
+    views.enable_dedup(deployment_config.get('dedup_cache_size', 0))
+    db.set_ingest_backend(deployment_config.get('ingest_backend', 'orm'))
+    views.enable_ingest_policy(deployment_config.get('ingest_policy', {}),
+                               deployment_config.get('coalesce_window', 60))
+    if deployment_config.get('count_queries', False):
+        db_connection.use_debug_cursor = True
+
+    post_process_lanes = deployment_config.get('post_process_lanes', 0)
+    if post_process_lanes <= 0:
+        return None
+    post_process_queue_size = deployment_config.get(
+        'post_process_queue_size', 1000)
+    post_processor = pipeline.PostProcessPool(POST_PROCESS_METHODS,
+                                              post_process_lanes,
+                                              post_process_queue_size)
+    post_processor.start()
+    return post_processor
+
+
+def _consumer_options(deployment_config):
+    return dict(batch_size=deployment_config.get('batch_size', 1),
+                batch_timeout=deployment_config.get('batch_timeout_ms', 1000),
+                store_original_body=deployment_config.get(
+                    'store_original_body', False),
+                compress_json=deployment_config.get('compress_json', False),
+                query_budgets=deployment_config.get('query_budgets', {}))
+
+
+def run(deployment_config, deployment_id, exchange, stats=None,
+        partitions=None, lane=DEFAULT_LANE):
+    """Consumes and saves notifications from the queues in one lane of
+    an exchange. When partitions is given, as a list of inbox queues and
+    a done queue, the messages are handed to partition processes
+    instead."""
+    deployment_config = lane_config(deployment_config, lane)
+    name = _lane_name(deployment_config['name'], lane)
     host = deployment_config.get('rabbit_host', 'localhost')
     port = deployment_config.get('rabbit_port', 5672)
     user_id = deployment_config.get('rabbit_userid', 'rabbit')
@@ -194,9 +534,16 @@ def run(deployment_config, deployment_id, exchange, stats=None):
     durable = deployment_config.get('durable_queue', True)
     queue_arguments = deployment_config.get('queue_arguments', {})
     exit_on_exception = deployment_config.get('exit_on_exception', False)
-    topics = deployment_config.get('topics', {})
+    topics = [topic for topic in deployment_config.get('topics', {})[exchange]
+              if topic.get('lane', DEFAULT_LANE) == lane]
+    prefetch_count = deployment_config.get('prefetch_count', 0)
     logger = _get_child_logger()
 
+    post_processor = None
+    if partitions is None:
+        post_processor = _start_processing(deployment_config)
+        options = _consumer_options(deployment_config)
+
     deployment = db.get_deployment(deployment_id)
 
     print "Starting worker for '%s %s'" % (name, exchange)
@@ -216,9 +563,20 @@ def run(deployment_config, deployment_id, exchange, stats=None):
             logger.debug("Processing on '%s %s'" % (name, exchange))
             with kombu.connection.BrokerConnection(**params) as conn:
                 try:
-                    consumer = Consumer(name, conn, deployment, durable,
-                                        queue_arguments, exchange,
-                                        topics[exchange], stats=stats)
+                    if partitions is None:
+                        consumer = Consumer(name, conn, deployment, durable,
+                                            queue_arguments, exchange,
+                                            topics, stats=stats,
+                                            prefetch_count=prefetch_count,
+                                            post_processor=post_processor,
+                                            lane=lane, **options)
+                    else:
+                        inboxes, done = partitions
+                        consumer = Dispatcher(name, conn, deployment,
+                                              durable, queue_arguments,
+                                              exchange, topics,
+                                              inboxes, done, stats=stats,
+                                              prefetch_count=prefetch_count)
                     consumer.run()
                 except Exception as e:
                     logger.error("!!!!Exception!!!!")
@@ -235,13 +593,65 @@ def run(deployment_config, deployment_id, exchange, stats=None):
                   "exception=%s. Retrying in 5s"
             logger.exception(msg % (name, exchange, e))
             exit_or_sleep(exit_on_exception)
+    if post_processor is not None:
+        post_processor.stop()
+    views.flush_rollups(force=True)
+    logger.info("Worker exiting.")
+
+
+def run_partition(deployment_config, deployment_id, exchange, partition,
+                  inbox, done, stats=None, lane=DEFAULT_LANE):
+    """Saves the notifications a Dispatcher hands to this partition.
+    Any failure ends the process, so the supervisor can restart the
+    dispatcher and its partitions and the broker redelivers whatever
+    wasn't acked. Some of that may already have been saved, so
+    partitions always drop notifications by message_id, with a
+    dedup_cache_size of PARTITION_DEDUP_CACHE_SIZE if none is set."""
+    deployment_config = lane_config(deployment_config, lane)
+    if not deployment_config.get('dedup_cache_size'):
+        deployment_config['dedup_cache_size'] = PARTITION_DEDUP_CACHE_SIZE
+    name = "%s[%d]" % (_lane_name(deployment_config['name'], lane),
+                       partition)
+    logger = _get_child_logger()
+
+    post_processor = _start_processing(deployment_config)
+    deployment = db.get_deployment(deployment_id)
+    consumer = Consumer(name, None, deployment, None, None, exchange, None,
+                        stats=stats, post_processor=post_processor,
+                        lane=lane, **_consumer_options(deployment_config))
+
+    print "Starting worker for '%s %s'" % (name, exchange)
+    logger.info("%s: %s partition" % (name, exchange))
+
+    while continue_running():
+        try:
+            seq, routing_key, body = inbox.get(timeout=1)
+        except Queue.Empty:
+            pass
+        else:
+            message = PartitionMessage(seq, routing_key, body, done)
+            try:
+                consumer._process(message)
+            except Exception, e:
+                logger.exception("name=%s, exchange=%s, exception=%s. "
+                                 "Exiting." % (name, exchange, e))
+                raise
+        consumer.on_iteration()
+    if consumer.pending:
+        consumer._flush()
+    if post_processor is not None:
+        post_processor.stop()
+    views.flush_rollups(force=True)
     logger.info("Worker exiting.")
 
 signal.signal(signal.SIGINT, signal.SIG_IGN)
 signal.signal(signal.SIGTERM, signal.SIG_IGN)
 
-POST_PROCESS_METHODS = {
-    'RawData': views.post_process_rawdata,
-    'GlanceRawData': views.post_process_glancerawdata,
-    'GenericRawData': views.post_process_genericrawdata
-}
+# Messages each partition may have in flight when no prefetch_count
+# is configured for a partitioned deployment.
+DISPATCH_PREFETCH_PER_PARTITION = 100
+
+# The dedup_cache_size of partitions whose deployment doesn't set one.
+PARTITION_DEDUP_CACHE_SIZE = 10000
+
+POST_PROCESS_METHODS = views.POST_PROCESS_METHODS